@@ -0,0 +1,2 @@
+""" Benchmarks for the heavy rscommons and tool functions on synthetic watersheds
+"""
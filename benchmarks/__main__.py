@@ -0,0 +1,62 @@
+""" Run the benchmark suite against a synthetic watershed
+
+    python -m benchmarks --size small --baseline benchmarks/baseline_small.json
+    python -m benchmarks --size small --save-baseline benchmarks/baseline_small.json
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+from rscommons import Logger
+
+from benchmarks.runner import compare_to_baseline, load_json, run_benchmarks, write_json
+from benchmarks.synthetic import SIZES, generate_watershed
+
+
+def main():
+    """Generate the inputs, run the benchmarks and compare them to a baseline
+    """
+    parser = argparse.ArgumentParser(description='Riverscapes tools benchmarks on synthetic watersheds')
+    parser.add_argument('--size', help='synthetic watershed size', choices=list(SIZES.keys()), default='small')
+    parser.add_argument('--seed', help='random seed for the synthetic inputs', type=int, default=42)
+    parser.add_argument('--repeat', help='runs of each benchmark (the fastest is reported)', type=int, default=3)
+    parser.add_argument('--filter', help='only run benchmarks whose names start with these', nargs='*', default=None)
+    parser.add_argument('--workdir', help='folder for the synthetic inputs and memory logs (defaults to a temporary folder)', type=str, default=None)
+    parser.add_argument('--output', help='write the results JSON here', type=str, default=None)
+    parser.add_argument('--baseline', help='compare against this baseline JSON', type=str, default=None)
+    parser.add_argument('--save-baseline', help='write the results as a new baseline JSON', type=str, default=None)
+    parser.add_argument('--tolerance', help='allowed fractional slowdown before a benchmark counts as a regression', type=float, default=0.25)
+    parser.add_argument('--verbose', help='(optional) a little extra logging ', action='store_true', default=False)
+    args = parser.parse_args()
+
+    workdir = args.workdir if args.workdir is not None else tempfile.mkdtemp(prefix='rs_benchmarks_')
+    os.makedirs(workdir, exist_ok=True)
+
+    log = Logger('Benchmarks')
+    log.setup(logPath=os.path.join(workdir, 'benchmarks.log'), verbose=args.verbose)
+    log.title(f'Benchmarks on a {args.size} synthetic watershed')
+
+    log.info(f'Generating synthetic inputs in {workdir}')
+    watershed = generate_watershed(os.path.join(workdir, 'inputs'), args.size, args.seed)
+
+    results = run_benchmarks(watershed, workdir, args.repeat, args.filter)
+
+    for path in [args.output, args.save_baseline]:
+        if path is not None:
+            write_json(path, results)
+            log.info(f'Results written to {path}')
+
+    if args.baseline is not None:
+        regressions = compare_to_baseline(results, load_json(args.baseline), args.tolerance)
+        for regression in regressions:
+            log.error(regression)
+        if len(regressions) > 0:
+            sys.exit(1)
+        log.info('No regressions against the baseline')
+
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+""" Benchmark runner
+
+    Purpose:  Times each registered benchmark with rscommons Timer, records peak memory with
+              MemoryMonitor and compares the results against a stored baseline JSON.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import gc
+import json
+import os
+import platform
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List
+
+from rscommons import Logger, Timer
+from rscommons.debug import MemoryMonitor
+
+from benchmarks.suites import BENCHMARKS, SkipBenchmark
+
+# Slowdowns (seconds) and memory growth (Mb) below these are treated as noise when comparing against a baseline
+TIME_NOISE_SECONDS = 0.05
+MEMORY_NOISE_MB = 20.0
+
+
+def measure(func, repeat: int, memlogfile: str, loop_delay: float = 0.1) -> Dict:
+    """Time a function and sample the process memory while it runs
+
+    Args:
+        func: zero argument function to time
+        repeat (int): number of times to run it. The fastest run is reported
+        memlogfile (str): csv file for the MemoryMonitor samples
+        loop_delay (float, optional): seconds between memory samples. Defaults to 0.1.
+
+    Returns:
+        Dict: {'seconds', 'runs', 'peak_rss_mb', 'rss_delta_mb'}
+    """
+    gc.collect()
+    memmon = MemoryMonitor(memlogfile, loop_delay)
+    start_rss = memmon.process.memory_info().rss / float(2 ** 20)
+    runs = []
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        mem_thread = executor.submit(memmon.measure_usage)
+        try:
+            for _run in range(repeat):
+                timer = Timer()
+                func()
+                runs.append(timer.ellapsed())
+        finally:
+            memmon.keep_measuring = False
+            max_stats = mem_thread.result()
+    # Catch anything allocated after the last sample
+    memmon.getstats()
+
+    return {
+        'seconds': min(runs),
+        'runs': runs,
+        'peak_rss_mb': max_stats.rss,
+        'rss_delta_mb': max(0.0, max_stats.rss - start_rss),
+    }
+
+
+def run_benchmarks(watershed: Dict, workdir: str, repeat: int = 3, names: List[str] = None) -> Dict:
+    """Run the registered benchmarks against a synthetic watershed
+
+    Args:
+        watershed (Dict): output of benchmarks.synthetic.generate_watershed
+        workdir (str): folder for the memory logs
+        repeat (int, optional): runs of each benchmark. Defaults to 3.
+        names (List[str], optional): only run benchmarks whose name starts with one of these. Defaults to None.
+
+    Returns:
+        Dict: results document ready to be written as JSON
+    """
+    log = Logger('Benchmarks')
+
+    results = {}
+    for name, setup in BENCHMARKS:
+        if names and not any(name.startswith(prefix) for prefix in names):
+            continue
+        try:
+            func = setup(watershed)
+        except SkipBenchmark as err:
+            log.warning(f'Skipping {name}: {err}')
+            continue
+        results[name] = measure(func, repeat, os.path.join(workdir, f'{name}_memory.csv'))
+        log.info(f"{name}: {results[name]['seconds']:.3f}s  peak {results[name]['peak_rss_mb']:.0f}Mb (+{results[name]['rss_delta_mb']:.0f}Mb)")
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'size': watershed['size'],
+        'machine': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'benchmarks': results,
+    }
+
+
+def compare_to_baseline(results: Dict, baseline: Dict, tolerance: float = 0.25) -> List[str]:
+    """Benchmarks that are slower or use more memory than the baseline allows
+
+    Args:
+        results (Dict): output of run_benchmarks
+        baseline (Dict): a previous output of run_benchmarks
+        tolerance (float, optional): allowed fractional increase. Defaults to 0.25.
+
+    Returns:
+        List[str]: one message per regression (empty when everything is within tolerance)
+    """
+    log = Logger('Benchmarks')
+
+    if baseline.get('size') != results.get('size'):
+        log.warning(f"Baseline is for a {baseline.get('size')} watershed but these results are for {results.get('size')}")
+
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        if name not in baseline.get('benchmarks', {}):
+            log.info(f'{name}: no baseline')
+            continue
+        base = baseline['benchmarks'][name]
+        ratio = result['seconds'] / base['seconds'] if base['seconds'] > 0 else 1.0
+        log.info(f"{name}: {result['seconds']:.3f}s vs {base['seconds']:.3f}s ({ratio:.2f}x)")
+        if ratio > 1 + tolerance and result['seconds'] - base['seconds'] > TIME_NOISE_SECONDS:
+            regressions.append(f"{name} took {result['seconds']:.3f}s, {ratio:.2f}x the baseline {base['seconds']:.3f}s")
+        memory_growth = result['rss_delta_mb'] - base['rss_delta_mb']
+        if memory_growth > MEMORY_NOISE_MB and result['rss_delta_mb'] > base['rss_delta_mb'] * (1 + tolerance):
+            regressions.append(f"{name} used {result['rss_delta_mb']:.0f}Mb, up from {base['rss_delta_mb']:.0f}Mb")
+
+    return regressions
+
+
+def load_json(path: str) -> Dict:
+    """Read a results or baseline document
+    """
+    with open(path, encoding='utf-8') as json_file:
+        return json.load(json_file)
+
+
+def write_json(path: str, results: Dict):
+    """Write a results or baseline document
+    """
+    with open(path, 'w', encoding='utf-8') as json_file:
+        json.dump(results, json_file, indent=2)
@@ -0,0 +1,358 @@
+""" Benchmark suites
+
+    Purpose:  Each benchmark is registered with @benchmark and receives the synthetic watershed.
+              It does its (untimed) setup and returns the function to be timed. Benchmarks for
+              tool packages that are not installed are skipped rather than failing the run.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import os
+import sqlite3
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+import rasterio
+from shapely.geometry import CAP_STYLE, Point
+from shapely.ops import substring
+
+from benchmarks.synthetic import CELL_SIZE, EPSG, OWNERS, level_path_lines, reach_geometry
+
+# (name, setup function) in registration order
+BENCHMARKS: List[Tuple[str, Callable[[Dict], Callable[[], None]]]] = []
+
+
+class SkipBenchmark(Exception):
+    """Raised by a benchmark setup when something it needs is unavailable
+    """
+
+
+def benchmark(name: str):
+    """Register a benchmark setup function under a name
+
+    Args:
+        name (str): benchmark name used in results and baselines
+    """
+    def register(setup: Callable[[Dict], Callable[[], None]]):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+def reach_buffers(watershed: Dict, distance: float = 100.0) -> Dict:
+    """Buffered flowline polygons keyed by NHDPlusID, the zones used by the vegetation summaries
+    """
+    return {reach['NHDPlusID']: reach_geometry(reach).buffer(distance) for reach in watershed['reaches']}
+
+
+def synthetic_dgos(watershed: Dict, spacing: float = 100.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """DGO level paths, distances and ids every spacing metres along each level path
+    """
+    lengths = {}
+    for reach in watershed['reaches']:
+        lengths[reach['LevelPathI']] = lengths.get(reach['LevelPathI'], 0.0) + reach_geometry(reach).length
+    level_paths = []
+    distances = []
+    for level_path, length in lengths.items():
+        dists = np.arange(0, length, spacing)
+        level_paths.append(np.full(len(dists), level_path, dtype=np.float64))
+        distances.append(dists)
+    level_paths = np.concatenate(level_paths)
+    distances = np.concatenate(distances)
+    return level_paths, distances, np.arange(1, len(distances) + 1)
+
+
+def synthetic_windows(watershed: Dict, spacing: float = 100.0, window: float = 400.0) -> Tuple[np.ndarray, Dict[int, List[int]]]:
+    """DGO ids every spacing metres along each level path and the {igoid: [dgoids]} moving windows around them
+    """
+    from rscommons.moving_window import LevelPathIndex
+
+    level_paths, distances, fids = synthetic_dgos(watershed, spacing)
+    index = LevelPathIndex(level_paths, distances, fids)
+    starts, ends = index.query(level_paths, distances, np.full(len(distances), window))
+    return fids, {int(fid): index.dgo_ids(start, end) for fid, start, end in zip(index.fids.tolist(), starts.tolist(), ends.tolist())}
+
+
+@benchmark('rscommons.zonal_statistics')
+def zonal_statistics_dem(watershed: Dict) -> Callable[[], None]:
+    from rscommons.zonal_stats import zonal_statistics
+
+    zones = reach_buffers(watershed)
+    return lambda: zonal_statistics(watershed['dem'], zones)
+
+
+@benchmark('rscommons.zonal_histogram')
+def zonal_histogram_vegetation(watershed: Dict) -> Callable[[], None]:
+    from rscommons.zonal_stats import zonal_histogram
+
+    zones = reach_buffers(watershed)
+    return lambda: zonal_histogram(watershed['vegetation'], zones)
+
+
+@benchmark('rscommons.reclassify')
+def reclassify_vegetation(watershed: Dict) -> Callable[[], None]:
+    from rscommons.reclassify import LookupTable, valid_cells
+
+    with rasterio.open(watershed['vegetation']) as src:
+        veg = src.read(1)
+        nodata = src.nodata
+    codes = np.unique(veg[veg != nodata])
+    lut = LookupTable({int(code): float(idx % 5) for idx, code in enumerate(codes)}, dtype=np.float32)
+    return lambda: lut.apply(veg, valid_cells(veg, nodata))
+
+
+@benchmark('rscommons.moving_window')
+def moving_window_index(watershed: Dict) -> Callable[[], None]:
+    from rscommons.moving_window import LevelPathIndex
+
+    # 10 m DGOs give enough windows for the search to dominate
+    level_paths, distances, fids = synthetic_dgos(watershed, CELL_SIZE)
+    sizes = np.tile(np.array([200.0, 400.0, 1200.0]), (len(distances), 1))
+
+    def run():
+        index = LevelPathIndex(level_paths, distances, fids)
+        index.query(level_paths, distances, sizes)
+    return run
+
+
+@benchmark('rscommons.window_aggregation')
+def window_weighted_mean(watershed: Dict) -> Callable[[], None]:
+    from rscommons.window_aggregation import WindowIndex
+
+    fids, windows = synthetic_windows(watershed, CELL_SIZE)
+    rng = np.random.default_rng(1)
+    values = rng.uniform(0, 1, len(fids))
+    areas = rng.uniform(100, 1000, len(fids))
+
+    def run():
+        window_index = WindowIndex(windows, fids)
+        window_index.weighted_mean(values, areas)
+    return run
+
+
+@benchmark('brat.vegetation_fis')
+def brat_vegetation_fis(watershed: Dict) -> Callable[[], None]:
+    try:
+        from sqlbrat.utils.vegetation_fis import calculate_vegegtation_fis
+    except ImportError as err:
+        raise SkipBenchmark(f'BRAT is not installed: {err}')
+
+    rng = np.random.default_rng(2)
+    # Around one reach every 100 m of channel like a segmented BRAT network
+    count = max(100, int(watershed['channels'].sum() * CELL_SIZE / 100))
+    features = {reachid: {'iVeg100EX': float(rng.uniform(0, 4)), 'iVeg_30EX': float(rng.uniform(0, 4))} for reachid in range(1, count + 1)}
+    return lambda: calculate_vegegtation_fis(features, 'iVeg_30EX', 'iVeg100EX', 'oVC_EX')
+
+
+@benchmark('brat.admin_agency')
+def brat_admin_agency(watershed: Dict) -> Callable[[], None]:
+    try:
+        from sqlbrat.utils.conflict_attributes import admin_agency
+    except ImportError as err:
+        raise SkipBenchmark(f'BRAT is not installed: {err}')
+
+    database = os.path.join(os.path.dirname(watershed['dem']), 'agencies.sqlite')
+    with sqlite3.connect(database) as conn:
+        conn.execute('DROP TABLE IF EXISTS Agencies')
+        conn.execute('CREATE TABLE Agencies (AgencyID INTEGER PRIMARY KEY, Name TEXT, Abbreviation TEXT)')
+        conn.executemany('INSERT INTO Agencies (Name, Abbreviation) VALUES (?, ?)', [(owner, owner) for owner in OWNERS])
+    reaches = {idx: reach_geometry(reach) for idx, reach in enumerate(watershed['reaches'], 1)}
+    return lambda: admin_agency(database, reaches, watershed['ownership'], {})
+
+
+@benchmark('rcat.window_aggregation')
+def rcat_window_aggregation(watershed: Dict) -> Callable[[], None]:
+    try:
+        from rcat.lib.rcat_attributes import CONVERSION_TYPES, cell_fractions
+    except ImportError as err:
+        raise SkipBenchmark(f'RCAT is not installed: {err}')
+    from rscommons.window_aggregation import WindowIndex
+
+    # Cell counts of each category in every 100 m DGO like the RCAT zonal summaries
+    dgo_ids, windows = synthetic_windows(watershed)
+    rng = np.random.default_rng(4)
+    tables = {
+        'DGOFPAccess': ('AccessVal', 'CellCount', [0, 1]),
+        'DGOConv': ('ConvVal', 'ConvCellCount', list(CONVERSION_TYPES.values()) + [-100]),
+        'DGOExRiparian': ('ExRipVal', 'ExRipCellCount', [0, 1]),
+        'DGOHRiparian': ('HRipVal', 'HRipCellCount', [0, 1]),
+    }
+    database = os.path.join(os.path.dirname(watershed['dem']), 'rcat.sqlite')
+    with sqlite3.connect(database) as conn:
+        for table, (value_field, count_field, categories) in tables.items():
+            conn.execute(f'DROP TABLE IF EXISTS {table}')
+            conn.execute(f'CREATE TABLE {table} (DGOID INTEGER, {value_field} INTEGER, {count_field} INTEGER)')
+            rows = [(dgoid, category, int(rng.integers(1, 500))) for dgoid in dgo_ids.tolist() for category in categories if rng.random() < 0.6]
+            conn.executemany(f'INSERT INTO {table} VALUES (?, ?, ?)', rows)
+    dgo_areas = rng.uniform(5000, 50000, len(dgo_ids))
+
+    def run():
+        fractions = cell_fractions(database, 'DGO', 'DGOID')
+        index = WindowIndex(windows, dgo_ids)
+        for ids, values in fractions.values():
+            index.weighted_mean(index.align(ids, values), dgo_areas)
+    return run
+
+
+@benchmark('rcat.fis_condition')
+def rcat_fis_condition(watershed: Dict) -> Callable[[], None]:
+    try:
+        from rcat.lib.rcat_fis import fis_condition
+    except ImportError as err:
+        raise SkipBenchmark(f'RCAT is not installed: {err}')
+
+    # One set of inputs per 100 m DGO
+    count = len(synthetic_dgos(watershed)[0])
+    rng = np.random.default_rng(5)
+    rvd = rng.uniform(0, 1, count)
+    lui = rng.uniform(0, 100, count)
+    fpaccess = rng.uniform(0, 1, count)
+    return lambda: fis_condition(rvd, lui, fpaccess)
+
+
+@benchmark('rme.metric_context')
+def rme_metric_context(watershed: Dict) -> Callable[[], None]:
+    try:
+        from rme.metric_context import SEGMENT_FIELDS, MetricContext
+    except ImportError as err:
+        raise SkipBenchmark(f'RME is not installed: {err}')
+    from osgeo import ogr
+    from rscommons import GeopackageLayer
+    from rscommons.gpkg_writer import write_features
+    from rscommons.vbet_network import join_attributes
+
+    # The line network is the flowlines joined to their VAA table, as the metric engine builds it
+    inputs_gpkg = os.path.dirname(watershed['flowlines'])
+    line_network = join_attributes(inputs_gpkg, 'vw_flowlines_vaa', 'flowlines', 'flowlines_vaa', 'NHDPlusID', ['DnLevelPat', 'UpLevelPat', 'Divergence', 'STARTFLAG'], EPSG)
+
+    # 100 m vbet segments: flat ended buffers of each level path, with area fields
+    gpkg = os.path.join(os.path.dirname(watershed['dem']), 'rme.gpkg')
+    segments = os.path.join(gpkg, 'vbet_segments')
+    with GeopackageLayer(segments, delete_dataset=True) as lyr:
+        lyr.create_layer(ogr.wkbPolygon, epsg=EPSG, fields={'LevelPathI': ogr.OFTReal, 'seg_distance': ogr.OFTReal, **{field: ogr.OFTReal for field in SEGMENT_FIELDS}})
+    for name, geom_type in [('centerlines', ogr.wkbLineString), ('junctions', ogr.wkbPoint), ('ecoregions', ogr.wkbMultiPolygon)]:
+        with GeopackageLayer(os.path.join(gpkg, name), write=True) as lyr:
+            lyr.create_layer(geom_type, epsg=EPSG)
+
+    geoms = []
+    attributes = {'LevelPathI': [], 'seg_distance': []}
+    for level_path, line in level_path_lines(watershed).items():
+        for start in np.arange(0, line.length, 100.0).tolist():
+            geoms.append(substring(line, start, start + 100.0).buffer(50.0, cap_style=CAP_STYLE.flat))
+            attributes['LevelPathI'].append(level_path)
+            attributes['seg_distance'].append(start + 50.0)
+    rng = np.random.default_rng(6)
+    for field in SEGMENT_FIELDS:
+        attributes[field] = [geom.area * rng.uniform(0.2, 1.0) for geom in geoms]
+    write_features(gpkg, 'vbet_segments', geoms, attributes)
+
+    def run():
+        with MetricContext(line_network, segments, os.path.join(gpkg, 'centerlines'), os.path.join(gpkg, 'junctions'), os.path.join(gpkg, 'ecoregions')) as context:
+            for level_path, distance in zip(attributes['LevelPathI'], attributes['seg_distance']):
+                if level_path != context.level_path:
+                    context.set_level_path(level_path)
+                    context.linestring(line_network, f'LevelPathI = {level_path}')
+                for window in [200.0, 400.0, 1200.0]:
+                    geom_window = context.window(level_path, window, distance)
+                    context.network_features(geom_window)
+                    context.sum_window_attributes(level_path, window, distance, ['segment_area', 'active_floodplain_area'])
+    return run
+
+
+@benchmark('vbet.raster2line')
+def vbet_raster2line(watershed: Dict) -> Callable[[], None]:
+    try:
+        from vbet.lib.raster2line import array2geom
+    except ImportError as err:
+        raise SkipBenchmark(f'VBET is not installed: {err}')
+
+    array = watershed['channels'].astype(np.uint8)
+    return lambda: array2geom(array, watershed['channel_raster'], 1)
+
+
+# A million points, the scale of the IGO and DGO layers of a large HUC
+BULK_POINTS = 1000000
+
+
+def bulk_point_layer(watershed: Dict, name: str) -> Tuple[str, List, Dict]:
+    """A GeoPackage layer path plus random points and attribute columns to write into it
+    """
+    rng = np.random.default_rng(3)
+    coords = rng.uniform(0, watershed['cells'] * CELL_SIZE, (BULK_POINTS, 2))
+    points = [Point(x, y) for x, y in coords.tolist()]
+    columns = {'LevelPathI': rng.integers(1, 100, BULK_POINTS), 'seg_distance': coords[:, 0]}
+    return os.path.join(os.path.dirname(watershed['dem']), f'{name}.gpkg'), points, columns
+
+
+def create_point_layer(gpkg: str):
+    from osgeo import ogr
+    from rscommons import GeopackageLayer
+
+    with GeopackageLayer(gpkg, 'points', delete_dataset=True) as lyr:
+        lyr.create_layer(ogr.wkbPoint, epsg=EPSG, fields={'LevelPathI': ogr.OFTInteger, 'seg_distance': ogr.OFTReal})
+
+
+@benchmark('rscommons.gpkg_create_feature')
+def gpkg_create_feature(watershed: Dict) -> Callable[[], None]:
+    from rscommons import GeopackageLayer
+
+    gpkg, points, columns = bulk_point_layer(watershed, 'create_feature')
+    rows = [dict(zip(columns.keys(), values)) for values in zip(*[column.tolist() for column in columns.values()])]
+
+    def run():
+        create_point_layer(gpkg)
+        with GeopackageLayer(gpkg, 'points', write=True) as lyr:
+            lyr.ogr_layer.StartTransaction()
+            for point, attributes in zip(points, rows):
+                lyr.create_feature(point, attributes)
+            lyr.ogr_layer.CommitTransaction()
+    return run
+
+
+@benchmark('rscommons.gpkg_write_features')
+def gpkg_write_features(watershed: Dict) -> Callable[[], None]:
+    from rscommons.gpkg_writer import write_features
+
+    gpkg, points, columns = bulk_point_layer(watershed, 'write_features')
+
+    def run():
+        create_point_layer(gpkg)
+        write_features(gpkg, 'points', points, columns)
+    return run
+
+
+def written_point_layer(watershed: Dict, name: str) -> str:
+    """The million point layer written to a GeoPackage, for the readers
+    """
+    from rscommons.gpkg_writer import write_features
+
+    gpkg, points, columns = bulk_point_layer(watershed, name)
+    create_point_layer(gpkg)
+    write_features(gpkg, 'points', points, columns)
+    return os.path.join(gpkg, 'points')
+
+
+@benchmark('rscommons.iterate_features')
+def gpkg_iterate_features(watershed: Dict) -> Callable[[], None]:
+    from rscommons import GeopackageLayer, VectorBase
+
+    layer = written_point_layer(watershed, 'iterate_features')
+
+    def run():
+        with GeopackageLayer(layer) as lyr:
+            for feature, _counter, _progbar in lyr.iterate_features(attribute_filter='LevelPathI < 50'):
+                VectorBase.ogr2shapely(feature)
+                feature.GetField('seg_distance')
+    return run
+
+
+@benchmark('rscommons.read_columns')
+def gpkg_read_columns(watershed: Dict) -> Callable[[], None]:
+    from rscommons import GeopackageLayer
+
+    layer = written_point_layer(watershed, 'read_columns')
+
+    def run():
+        with GeopackageLayer(layer) as lyr:
+            lyr.read_columns(fields=['seg_distance'], attribute_filter='LevelPathI < 50')
+    return run
@@ -0,0 +1,316 @@
+""" Synthetic watersheds for benchmarking
+
+    Purpose:  Generates HUC-like inputs entirely offline: a DEM with an incised channel network,
+              NHD-style flowlines with a value added attribute (VAA) table, a vegetation raster and
+              land ownership polygons. Everything is deterministic for a given size and seed so
+              that timings are comparable between runs.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import os
+import sqlite3
+from typing import Dict, List
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from scipy import ndimage
+from shapely.geometry import LineString, box
+from shapely.ops import linemerge
+
+# Projected (UTM 12N) so that cell sizes and buffers are in metres
+EPSG = 26912
+ORIGIN = (400000.0, 4600000.0)
+CELL_SIZE = 10.0
+NODATA = -9999.0
+
+# rows / cols of the DEM and number of tributaries joining the main stem
+SIZES = {
+    'small': {'cells': 500, 'tributaries': 8},
+    'medium': {'cells': 2000, 'tributaries': 30},
+    'large': {'cells': 5000, 'tributaries': 80},
+}
+
+# LANDFIRE-like existing vegetation type codes
+RIPARIAN_CODES = [9009, 9018, 9021]
+UPLAND_CODES = [7011, 7080, 7125, 7303]
+DEVELOPED_CODES = [7296, 7297]
+AGRICULTURE_CODES = [7960, 7961]
+
+OWNERS = ['BLM', 'USFS', 'PVT', 'NPS', 'STATE']
+
+
+def synthetic_network(cells: int, tributaries: int, rng: np.random.Generator) -> List[Dict]:
+    """A main stem running from the top to the bottom of the grid with tributaries joining from either side.
+    The main stem is split into reaches at every confluence like NHD flowlines.
+
+    Args:
+        cells (int): number of rows and columns in the grid
+        tributaries (int): number of tributaries
+        rng (np.random.Generator): random generator
+
+    Returns:
+        List[Dict]: one dict per reach with the pixel 'rows' and 'cols' of its path (upstream to downstream)
+            and its NHD and VAA attributes
+    """
+    margin = max(2, cells // 20)
+
+    # Main stem meanders down the grid one row at a time
+    steps = rng.choice([-1, 0, 0, 1], cells)
+    main_cols = np.clip(cells // 2 + np.cumsum(steps), margin, cells - margin - 1)
+    main_rows = np.arange(cells)
+
+    # Tributaries leave from a side of the grid and walk across to the main stem
+    join_rows = np.sort(rng.choice(np.arange(margin, cells - margin), tributaries, replace=False))
+    reaches = []
+    trib_area = []
+    for idx, join_row in enumerate(join_rows.tolist()):
+        side = -1 if idx % 2 == 0 else 1
+        target_col = int(main_cols[join_row])
+        start_col = margin if side < 0 else cells - margin - 1
+        cols = np.arange(start_col, target_col, 1 if target_col > start_col else -1)
+        if len(cols) == 0:
+            continue
+        # Drift towards the confluence row from somewhere upstream of it
+        drift = np.clip(np.cumsum(rng.choice([0, 0, 1], len(cols))), 0, join_row)
+        rows = np.clip(join_row - drift[::-1], 0, cells - 1)
+        length_km = len(cols) * CELL_SIZE / 1000
+        trib_area.append((join_row, length_km * 2.0))
+        reaches.append({
+            'rows': rows, 'cols': cols,
+            'LevelPathI': 2 + idx, 'StreamOrde': 1, 'TotDASqKm': length_km * 2.0, 'STARTFLAG': 1,
+        })
+
+    # Main stem reaches between consecutive confluences
+    breaks = [0] + join_rows.tolist() + [cells - 1]
+    base_area = 5.0
+    for start, end in zip(breaks[:-1], breaks[1:]):
+        if end <= start:
+            continue
+        upstream = base_area + sum(area for row, area in trib_area if row <= start) + (start * CELL_SIZE / 1000) * 2.0
+        reaches.append({
+            'rows': main_rows[start:end + 1], 'cols': main_cols[start:end + 1],
+            'LevelPathI': 1, 'StreamOrde': 2 if start > breaks[1] else 1, 'TotDASqKm': upstream, 'STARTFLAG': 1 if start == 0 else 0,
+        })
+
+    # Hydrosequence increases upstream like NHDPlus so sort by the downstream end of each reach
+    reaches.sort(key=lambda reach: (-int(reach['rows'][-1]), reach['LevelPathI']))
+    for idx, reach in enumerate(reaches):
+        reach['NHDPlusID'] = 10000000000000 + idx
+        reach['HydroSeq'] = 10000000000000 + idx
+        reach['FCode'] = 46006
+        reach['DivDASqKm'] = reach['TotDASqKm']
+        # Every level path drains into the main stem and there are no diversions
+        reach['DnLevelPat'] = 1
+        reach['UpLevelPat'] = reach['LevelPathI']
+        reach['Divergence'] = 0
+
+    return reaches
+
+
+def channel_mask(cells: int, reaches: List[Dict]) -> np.ndarray:
+    """Boolean grid of the cells the network passes through
+
+    Args:
+        cells (int): number of rows and columns in the grid
+        reaches (List[Dict]): reaches from synthetic_network
+
+    Returns:
+        np.ndarray: True for channel cells
+    """
+    mask = np.zeros((cells, cells), dtype=bool)
+    for reach in reaches:
+        mask[reach['rows'], reach['cols']] = True
+    return mask
+
+
+def synthetic_dem(channels: np.ndarray, rng: np.random.Generator, incision: float = 3.0) -> np.ndarray:
+    """Elevation falling towards the outlet and rising away from the channels, with the channels incised
+
+    Args:
+        channels (np.ndarray): channel mask from channel_mask
+        rng (np.random.Generator): random generator
+        incision (float, optional): depth of the channels below the valley floor (m). Defaults to 3.0.
+
+    Returns:
+        np.ndarray: float32 elevations with a nodata border
+    """
+    rows, _cols = channels.shape
+    distance = ndimage.distance_transform_edt(~channels) * CELL_SIZE
+    downstream = (rows - 1 - np.arange(rows, dtype=np.float64))[:, None] * CELL_SIZE
+    dem = 1500.0 + downstream * 0.01 + distance * 0.08 + 10.0 * np.log1p(distance / 100.0)
+    dem += ndimage.gaussian_filter(rng.normal(0, 1.0, channels.shape), 3)
+    dem[channels] -= incision
+    dem[0, :] = dem[-1, :] = dem[:, 0] = dem[:, -1] = NODATA
+    return dem.astype(np.float32)
+
+
+def synthetic_vegetation(channels: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Vegetation types with riparian classes along the channels and a patchy upland mosaic
+
+    Args:
+        channels (np.ndarray): channel mask from channel_mask
+        rng (np.random.Generator): random generator
+
+    Returns:
+        np.ndarray: int16 vegetation codes (0 is nodata)
+    """
+    distance = ndimage.distance_transform_edt(~channels) * CELL_SIZE
+    # Smooth noise gives contiguous patches rather than salt and pepper
+    patches = ndimage.gaussian_filter(rng.normal(0, 1, channels.shape), 8)
+    upland = np.array(UPLAND_CODES + DEVELOPED_CODES + AGRICULTURE_CODES, dtype=np.int16)
+    bins = np.quantile(patches, np.linspace(0, 1, len(upland) + 1)[1:-1])
+    veg = upland[np.digitize(patches, bins)]
+    riparian = np.array(RIPARIAN_CODES, dtype=np.int16)
+    veg[distance <= 30] = riparian[rng.integers(0, len(riparian), int((distance <= 30).sum()))]
+    veg[0, :] = veg[-1, :] = veg[:, 0] = veg[:, -1] = 0
+    return veg
+
+
+def reach_geometry(reach: Dict) -> LineString:
+    """Line through the cell centres of a reach
+
+    Args:
+        reach (Dict): reach from synthetic_network
+
+    Returns:
+        LineString: reach geometry in map coordinates
+    """
+    x = ORIGIN[0] + (np.asarray(reach['cols']) + 0.5) * CELL_SIZE
+    y = ORIGIN[1] - (np.asarray(reach['rows']) + 0.5) * CELL_SIZE
+    if len(x) == 1:
+        x = np.append(x, x[0] + CELL_SIZE / 2)
+        y = np.append(y, y[0])
+    return LineString(np.column_stack([x, y]))
+
+
+def level_path_lines(watershed: Dict) -> Dict[int, LineString]:
+    """The reaches of each level path merged into one line from upstream to downstream
+
+    Args:
+        watershed (Dict): output of generate_watershed
+
+    Returns:
+        Dict[int, LineString]: {LevelPathI: line}
+    """
+    lines = {}
+    for reach in watershed['reaches']:
+        lines.setdefault(reach['LevelPathI'], []).append(reach_geometry(reach))
+    return {level_path: linemerge(reach_lines) for level_path, reach_lines in lines.items()}
+
+
+def ownership_polygons(cells: int) -> List[Dict]:
+    """Vertical strips of land ownership across the extent
+
+    Args:
+        cells (int): number of rows and columns in the grid
+
+    Returns:
+        List[Dict]: {'geometry': polygon, 'ADMIN_AGEN': owner}
+    """
+    width = cells * CELL_SIZE
+    strip = width / (2 * len(OWNERS))
+    polygons = []
+    for idx in range(2 * len(OWNERS)):
+        minx = ORIGIN[0] + idx * strip
+        polygons.append({'geometry': box(minx, ORIGIN[1] - width, minx + strip, ORIGIN[1]), 'ADMIN_AGEN': OWNERS[idx % len(OWNERS)]})
+    return polygons
+
+
+def write_raster(path: str, array: np.ndarray, nodata) -> str:
+    """Write a single band GeoTIFF on the synthetic grid
+
+    Args:
+        path (str): output path
+        array (np.ndarray): raster values
+        nodata: nodata value
+
+    Returns:
+        str: the path
+    """
+    profile = {
+        'driver': 'GTiff', 'height': array.shape[0], 'width': array.shape[1], 'count': 1, 'dtype': array.dtype.name,
+        'crs': f'EPSG:{EPSG}', 'transform': from_origin(ORIGIN[0], ORIGIN[1], CELL_SIZE, CELL_SIZE), 'nodata': nodata,
+        'compress': 'deflate', 'tiled': True,
+    }
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(array, 1)
+    return path
+
+
+def write_vectors(gpkg: str, reaches: List[Dict], owners: List[Dict]) -> Dict[str, str]:
+    """Write the flowlines, their VAA table and the ownership polygons to a GeoPackage
+
+    Args:
+        gpkg (str): output GeoPackage (replaced if it exists)
+        reaches (List[Dict]): reaches from synthetic_network
+        owners (List[Dict]): polygons from ownership_polygons
+
+    Returns:
+        Dict[str, str]: {'flowlines', 'flowlines_vaa', 'ownership'} layer paths
+    """
+    # Imported here so the raster and array generators work without GDAL
+    from osgeo import ogr
+    from rscommons import GeopackageLayer
+
+    flowlines = os.path.join(gpkg, 'flowlines')
+    ownership = os.path.join(gpkg, 'ownership')
+    vaa_fields = ['NHDPlusID', 'LevelPathI', 'HydroSeq', 'StreamOrde', 'TotDASqKm', 'DivDASqKm', 'DnLevelPat', 'UpLevelPat', 'Divergence', 'STARTFLAG']
+
+    with GeopackageLayer(flowlines, delete_dataset=True) as lyr:
+        lyr.create_layer(ogr.wkbLineString, epsg=EPSG, fields={
+            'NHDPlusID': ogr.OFTReal, 'FCode': ogr.OFTInteger, 'StreamOrde': ogr.OFTInteger,
+            'TotDASqKm': ogr.OFTReal, 'DivDASqKm': ogr.OFTReal, 'LevelPathI': ogr.OFTReal,
+        })
+        lyr.ogr_layer.StartTransaction()
+        for reach in reaches:
+            lyr.create_feature(reach_geometry(reach), {field: reach[field] for field in ['NHDPlusID', 'FCode', 'StreamOrde', 'TotDASqKm', 'DivDASqKm', 'LevelPathI']})
+        lyr.ogr_layer.CommitTransaction()
+
+    with GeopackageLayer(ownership, write=True) as lyr:
+        lyr.create_layer(ogr.wkbPolygon, epsg=EPSG, fields={'ADMIN_AGEN': ogr.OFTString})
+        for owner in owners:
+            lyr.create_feature(owner['geometry'], {'ADMIN_AGEN': owner['ADMIN_AGEN']})
+
+    with sqlite3.connect(gpkg) as conn:
+        curs = conn.cursor()
+        curs.execute(f"CREATE TABLE flowlines_vaa ({', '.join(f'{field} REAL' for field in vaa_fields)})")
+        curs.executemany(f"INSERT INTO flowlines_vaa VALUES ({', '.join('?' * len(vaa_fields))})", [[reach[field] for field in vaa_fields] for reach in reaches])
+        curs.execute("INSERT INTO gpkg_contents (table_name, data_type) VALUES ('flowlines_vaa', 'attributes')")
+        conn.commit()
+
+    return {'flowlines': flowlines, 'flowlines_vaa': os.path.join(gpkg, 'flowlines_vaa'), 'ownership': ownership}
+
+
+def generate_watershed(folder: str, size: str = 'small', seed: int = 42, vectors: bool = True) -> Dict:
+    """Generate every synthetic input for a watershed of the requested size
+
+    Args:
+        folder (str): output folder (created if needed)
+        size (str, optional): one of SIZES. Defaults to 'small'.
+        seed (int, optional): random seed. Defaults to 42.
+        vectors (bool, optional): also write the GeoPackage (needs GDAL). Defaults to True.
+
+    Returns:
+        Dict: paths of the outputs plus the in memory 'reaches', 'channels' and 'owners'
+    """
+    if size not in SIZES:
+        raise ValueError(f'Unknown watershed size "{size}". Choose one of {", ".join(SIZES.keys())}')
+
+    os.makedirs(folder, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    cells = SIZES[size]['cells']
+
+    reaches = synthetic_network(cells, SIZES[size]['tributaries'], rng)
+    channels = channel_mask(cells, reaches)
+    owners = ownership_polygons(cells)
+
+    watershed = {'size': size, 'cells': cells, 'reaches': reaches, 'channels': channels, 'owners': owners}
+    watershed['dem'] = write_raster(os.path.join(folder, 'dem.tif'), synthetic_dem(channels, rng), NODATA)
+    watershed['vegetation'] = write_raster(os.path.join(folder, 'vegetation.tif'), synthetic_vegetation(channels, rng), 0)
+    watershed['channel_raster'] = write_raster(os.path.join(folder, 'channels.tif'), channels.astype(np.uint8), 0)
+    if vectors:
+        watershed.update(write_vectors(os.path.join(folder, 'inputs.gpkg'), reaches, owners))
+
+    return watershed
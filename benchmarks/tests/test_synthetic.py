@@ -0,0 +1,123 @@
+""" Testing for the synthetic watershed generator
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+
+from benchmarks.synthetic import CELL_SIZE, EPSG, NODATA, RIPARIAN_CODES, channel_mask, generate_watershed, level_path_lines, reach_geometry
+
+
+def read_raster(path: str):
+    """Values, nodata and profile of a single band raster
+    """
+    with rasterio.open(path) as src:
+        return src.read(1), src.nodata, src.profile
+
+
+class SyntheticWatershedTest(unittest.TestCase):
+    """The generated inputs are deterministic and look like a watershed
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.watershed = generate_watershed(os.path.join(self.tmp_dir, 'a'), 'small', 7, vectors=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_deterministic(self):
+        """The same seed gives the same inputs and a different seed does not
+        """
+        again = generate_watershed(os.path.join(self.tmp_dir, 'b'), 'small', 7, vectors=False)
+        other = generate_watershed(os.path.join(self.tmp_dir, 'c'), 'small', 8, vectors=False)
+        for key in ['dem', 'vegetation', 'channel_raster']:
+            np.testing.assert_array_equal(read_raster(self.watershed[key])[0], read_raster(again[key])[0])
+        self.assertEqual([reach_geometry(reach).wkt for reach in self.watershed['reaches']], [reach_geometry(reach).wkt for reach in again['reaches']])
+        self.assertFalse(np.array_equal(self.watershed['channels'], other['channels']))
+
+        with self.assertRaises(ValueError):
+            generate_watershed(os.path.join(self.tmp_dir, 'd'), 'huge', vectors=False)
+
+    def test_rasters(self):
+        """Every raster is on the grid with a nodata border, the channels are incised and lined with riparian vegetation
+        """
+        cells = self.watershed['cells']
+        channels = self.watershed['channels']
+        for key in ['dem', 'vegetation', 'channel_raster']:
+            values, nodata, profile = read_raster(self.watershed[key])
+            self.assertEqual(values.shape, (cells, cells))
+            self.assertEqual(profile['crs'].to_epsg(), EPSG)
+            self.assertEqual(profile['transform'].a, CELL_SIZE)
+            if key != 'channel_raster':
+                for edge in [values[0, :], values[-1, :], values[:, 0], values[:, -1]]:
+                    self.assertTrue(np.all(edge == nodata))
+
+        np.testing.assert_array_equal(read_raster(self.watershed['channel_raster'])[0], channels.astype(np.uint8))
+
+        # Each interior channel cell is below all of its valid non channel neighbours
+        dem = read_raster(self.watershed['dem'])[0].astype(np.float64)
+        dem[dem == NODATA] = np.nan
+        neighbours = np.full(dem.shape, np.inf)
+        for shift, axis in [(1, 0), (-1, 0), (1, 1), (-1, 1)]:
+            shifted = np.where(np.roll(channels, shift, axis) | np.isnan(np.roll(dem, shift, axis)), np.inf, np.roll(dem, shift, axis))
+            neighbours = np.minimum(neighbours, shifted)
+        interior = channels.copy()
+        interior[0, :] = interior[-1, :] = interior[:, 0] = interior[:, -1] = False
+        checked = interior & np.isfinite(neighbours)
+        self.assertGreater(checked.sum(), cells)
+        self.assertTrue(np.all(dem[checked] < neighbours[checked]))
+
+        vegetation = read_raster(self.watershed['vegetation'])[0]
+        self.assertTrue(np.all(np.isin(vegetation[interior], RIPARIAN_CODES)))
+
+    def test_network(self):
+        """Reaches cover the channel mask, carry unique NHD ids and join the main stem
+        """
+        reaches = self.watershed['reaches']
+        cells = self.watershed['cells']
+        np.testing.assert_array_equal(channel_mask(cells, reaches), self.watershed['channels'])
+        self.assertEqual(len({reach['NHDPlusID'] for reach in reaches}), len(reaches))
+        self.assertEqual(len({reach['HydroSeq'] for reach in reaches}), len(reaches))
+
+        main_stem = channel_mask(cells, [reach for reach in reaches if reach['LevelPathI'] == 1])
+        for reach in reaches:
+            self.assertEqual(reach['DnLevelPat'], 1)
+            self.assertEqual(reach['UpLevelPat'], reach['LevelPathI'])
+            self.assertEqual(reach['DivDASqKm'], reach['TotDASqKm'])
+            row, col = int(reach['rows'][-1]), int(reach['cols'][-1])
+            if reach['LevelPathI'] == 1:
+                # The main stem runs top to bottom and only its first reach is a headwater
+                self.assertEqual(reach['STARTFLAG'], 1 if reach['rows'][0] == 0 else 0)
+            else:
+                self.assertEqual(reach['STARTFLAG'], 1)
+                self.assertTrue(main_stem[row - 1:row + 2, col - 1:col + 2].any())
+
+        # HydroSeq increases upstream along the main stem
+        main_reaches = sorted([reach for reach in reaches if reach['LevelPathI'] == 1], key=lambda reach: reach['HydroSeq'])
+        self.assertEqual(int(main_reaches[0]['rows'][-1]), cells - 1)
+        self.assertEqual([int(reach['rows'][0]) for reach in main_reaches[:-1]], [int(reach['rows'][-1]) for reach in main_reaches[1:]])
+
+        lines = level_path_lines(self.watershed)
+        self.assertEqual(sorted(lines.keys()), sorted({reach['LevelPathI'] for reach in reaches}))
+        for level_path, line in lines.items():
+            self.assertEqual(line.geom_type, 'LineString')
+            self.assertAlmostEqual(line.length, sum(reach_geometry(reach).length for reach in reaches if reach['LevelPathI'] == level_path))
+
+    def test_ownership(self):
+        """The ownership strips tile the extent without overlapping
+        """
+        owners = self.watershed['owners']
+        extent = (self.watershed['cells'] * CELL_SIZE) ** 2
+        self.assertAlmostEqual(sum(owner['geometry'].area for owner in owners), extent)
+        for idx, owner in enumerate(owners):
+            for other in owners[idx + 1:]:
+                self.assertEqual(owner['geometry'].intersection(other['geometry']).area, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
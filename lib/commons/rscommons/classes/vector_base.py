@@ -5,14 +5,24 @@ import os
 import math
 import re
 from enum import Enum
-from typing import Union, List, Tuple
+from typing import Union, List, Tuple, Dict, Iterator
+import numpy as np
 from osgeo import ogr, gdal, osr
 from shapely.wkb import loads as wkbload, dumps as wkbdumps
 from shapely.geometry.base import BaseGeometry
 from shapely.geometry import Point
+from shapely.ops import transform as shapely_ops_transform
 from rscommons import Logger, ProgressBar, Raster
 from rscommons.util import safe_makedirs
 from rscommons.classes.vector_datasource import DatasetRegistry
+from rscommons.srs_cache import cached_transform, epsg_spatial_ref, raster_spatial_ref
+
+try:
+    # Shapely 2 builds whole arrays of geometries at once
+    from shapely import from_wkb, get_coordinate_dimension, force_2d, transform as shapely_transform
+except ImportError:
+    from_wkb = None
+    shapely_transform = None
 
 # NO_UI = os.environ.get('NO_UI') is not None
 
@@ -511,12 +521,57 @@ class VectorBase():
 
         counter = 0
 
+        filters = self._set_filters(attribute_filter, clip_shape, clip_rect)
+
+        # For sql-based datasets we use transactions to optimize writing to the file
+        VectorBase.__start_transaction(write_layers)
+
+        # Initialize the progress bar. Only count the features when we need to because with
+        # a filter set GetFeatureCount has to scan the whole layer
+        progbar = None
+        if name is not None:
+            progbar = ProgressBar(self.ogr_layer.GetFeatureCount(), 50, name)
+
+        # Loop over every filtered feature
+        for feature in self.ogr_layer:
+            counter += 1
+            if progbar is not None:
+                progbar.update(counter)
+            yield (feature, counter, progbar)
+
+            # Write to the file only every N times using transactions
+            if counter % commit_thresh == 0:
+                VectorBase.__commit_transaction(write_layers)
+                VectorBase.__start_transaction(write_layers)
+
+        # If there's anything left to write at the end then write it
+        VectorBase.__commit_transaction(write_layers)
+
+        self._clear_filters(*filters)
+
+        # Finalize the progress bar
+        if progbar is not None:
+            progbar.finish()
+
+    def _set_filters(self, attribute_filter: str = None, clip_shape: Union[BaseGeometry, ogr.Feature, ogr.Geometry] = None, clip_rect: List[float, float, float, float] = None) -> Tuple[bool, bool]:
+        """Set the attribute and spatial filters used by iterate_features and iterate_columns
+
+        Args:
+            attribute_filter (str, optional): Attribute Query like "HUC = 17060104". Defaults to None.
+            clip_shape (BaseGeometry, optional): Limit the features to those that intersect a Shapely-ish geometry. Defaults to None.
+            clip_rect (List[double minx, double miny, double maxx, double maxy)]): Limit the features to those that intersect a rectangle. Defaults to None.
+
+        Returns:
+            Tuple[bool, bool]: whether the attribute filter and the spatial filter were set. Pass them to _clear_filters
+        """
+        if clip_shape is not None and clip_rect is not None:
+            raise VectorBaseException('You can only use clip_geom OR clip_rect, not both')
+
         # If there's a clip geometry provided then limit the features copied to
         # those that intersect (partially or entirely) by this clip feature.
         # Note that this makes the subsequent intersection process a lot more
         # performant because the SetSaptialFilter() uses the ShapeFile's spatial
         # index which is much faster than manually checking if all pairs of features intersect.
-        clip_geom = None
         if clip_shape:
             if isinstance(clip_shape, BaseGeometry):
                 clip_geom = self.shapely2ogr(clip_shape)
@@ -533,42 +588,151 @@ class VectorBase():
             # https://gdal.org/python/osgeo.ogr.Layer-class.html#SetAttributeFilter
             self.ogr_layer.SetAttributeFilter(attribute_filter)
 
-        # For sql-based datasets we use transactions to optimize writing to the file
-        VectorBase.__start_transaction(write_layers)
-
-        # Get an accurate feature count after clipping and filtering
-        fcount = self.ogr_layer.GetFeatureCount()
+        return bool(attribute_filter), bool(clip_shape) or bool(clip_rect)
 
-        # Initialize the progress bar
-        progbar = None
-        if name is not None:
-            progbar = ProgressBar(fcount, 50, name)
+    def _clear_filters(self, attribute_filter: bool, spatial_filter: bool):
+        """Reset the filters that _set_filters set. Filters that callers set on ogr_layer themselves are left alone
 
-        # Loop over every filtered feature
-        for feature in self.ogr_layer:
-            counter += 1
-            if progbar is not None:
-                progbar.update(counter)
-            yield (feature, counter, progbar)
+        Args:
+            attribute_filter (bool): reset the attribute filter
+            spatial_filter (bool): reset the spatial filter
+        """
+        if attribute_filter:
+            self.ogr_layer.SetAttributeFilter('')
+        if spatial_filter:
+            self.ogr_layer.SetSpatialFilter(None)
 
-            # Write to the file only every N times using transactions
-            if counter % commit_thresh == 0:
-                VectorBase.__commit_transaction(write_layers)
-                VectorBase.__start_transaction(write_layers)
+    def read_columns(self, fields: List[str] = None, geometry: bool = True, attribute_filter: str = None,
+                     clip_shape: Union[BaseGeometry, ogr.Feature, ogr.Geometry] = None, clip_rect: List[float, float, float, float] = None) -> Dict[str, np.ndarray]:
+        """Read the whole (filtered) layer at once as columns. See iterate_columns
 
-        # If there's anything left to write at the end then write it
-        VectorBase.__commit_transaction(write_layers)
+        Returns:
+            Dict[str, np.ndarray]: {'fid': int64 array, 'geometry': array of shapely geometries, 'field name': values}
+        """
+        chunks = list(self.iterate_columns(None, fields, geometry, attribute_filter, clip_shape, clip_rect))
+        if len(chunks) == 1:
+            return chunks[0]
+
+        columns = {'fid': np.empty(0, dtype=np.int64)}
+        if geometry:
+            columns['geometry'] = np.empty(0, dtype=object)
+        columns.update({field: np.empty(0, dtype=object) for field in self._column_fields(fields)})
+        if len(chunks) == 0:
+            return columns
+        return {key: np.concatenate([chunk[key] for chunk in chunks]) for key in columns}
+
+    def iterate_columns(self, chunk_size: int = 65536, fields: List[str] = None, geometry: bool = True, attribute_filter: str = None,
+                        clip_shape: Union[BaseGeometry, ogr.Feature, ogr.Geometry] = None, clip_rect: List[float, float, float, float] = None) -> Iterator[Dict[str, np.ndarray]]:
+        """Read the features in chunks of columns instead of one feature at a time
+
+        Uses GDAL's Arrow stream (GDAL >= 3.6) where it is available. Geometries are flattened
+        to 2D like ogr2shapely. Fields with nulls come back as float arrays with NaN (real fields)
+        or object arrays with None (everything else).
 
-        # Reset the attribute filter
-        if attribute_filter:
-            self.ogr_layer.SetAttributeFilter('')
+        Args:
+            chunk_size (int, optional): Features per chunk. None for the whole layer in one chunk. Defaults to 65536.
+            fields (List[str], optional): Fields to read. Defaults to None (all of them).
+            geometry (bool, optional): Read the geometries as well. Defaults to True.
+            attribute_filter (str, optional): Attribute Query like "HUC = 17060104". Defaults to None.
+            clip_shape (BaseGeometry, optional): Limit the features to those that intersect a Shapely-ish geometry. Defaults to None.
+            clip_rect (List[double minx, double miny, double maxx, double maxy)]): Limit the features to those that intersect a rectangle. Defaults to None.
 
-        if clip_geom:
-            self.ogr_layer.SetSpatialFilter(None)
+        Yields:
+            Dict[str, np.ndarray]: {'fid': int64 array, 'geometry': array of shapely geometries, 'field name': values}
+        """
+        if self.ogr_layer_def is None:
+            raise VectorBaseException('iterate_columns: Layer not initialized. No ogr_layer found')
 
-        # Finalize the progress bar
-        if progbar is not None:
-            progbar.finish()
+        fields = self._column_fields(fields)
+        filters = self._set_filters(attribute_filter, clip_shape, clip_rect)
+        try:
+            if hasattr(self.ogr_layer, 'GetArrowStreamAsNumPy'):
+                chunks = self.__arrow_chunks(chunk_size, fields, geometry)
+            else:
+                chunks = self.__feature_chunks(chunk_size, fields, geometry)
+            for chunk in chunks:
+                yield chunk
+        finally:
+            self._clear_filters(*filters)
+
+    def _column_fields(self, fields: List[str] = None) -> List[str]:
+        if fields is None:
+            return [self.ogr_layer_def.GetFieldDefn(i).GetName() for i in range(self.ogr_layer_def.GetFieldCount())]
+        return [self.verify_field(field) for field in fields]
+
+    def __arrow_chunks(self, chunk_size: int, fields: List[str], geometry: bool) -> Iterator[Dict[str, np.ndarray]]:
+        ignored = [name for name in self._column_fields() if name not in fields]
+        if not geometry:
+            ignored.append('OGR_GEOMETRY')
+        self.ogr_layer.SetIgnoredFields(ignored)
+
+        options = ['INCLUDE_FID=YES']
+        if chunk_size is not None:
+            options.append('MAX_FEATURES_IN_BATCH={}'.format(chunk_size))
+        fid_column = self.ogr_layer.GetFIDColumn() or 'OGC_FID'
+        geom_column = self.ogr_layer.GetGeometryColumn() or 'wkb_geometry'
+
+        try:
+            stream = self.ogr_layer.GetArrowStreamAsNumPy(options)
+            pending = []
+            for batch in stream:
+                # The arrays point into the Arrow buffers, which are only valid until the next batch
+                pending.append(self.__arrow_columns(batch, fid_column, geom_column, fields, geometry))
+                if chunk_size is not None:
+                    yield pending.pop()
+            if len(pending) > 0:
+                yield {key: np.concatenate([chunk[key] for chunk in pending]) for key in pending[0]}
+        finally:
+            self.ogr_layer.SetIgnoredFields([])
+
+    def __arrow_columns(self, batch: dict, fid_column: str, geom_column: str, fields: List[str], geometry: bool) -> Dict[str, np.ndarray]:
+        columns = {'fid': np.array(batch[fid_column], dtype=np.int64)}
+        if geometry:
+            columns['geometry'] = self.wkb2shapely_array(batch[geom_column])
+        for field in fields:
+            values = batch[field]
+            # Fields with nulls come back as masked arrays
+            if np.ma.isMaskedArray(values):
+                if values.dtype.kind == 'f':
+                    values = values.filled(np.nan)
+                else:
+                    mask = np.ma.getmaskarray(values)
+                    values = values.data.astype(object)
+                    values[mask] = None
+            if values.dtype.kind in 'OS':
+                values = np.array([value.decode('utf-8') if isinstance(value, bytes) else value for value in values.tolist()], dtype=object)
+            columns[field] = np.array(values)
+        return columns
+
+    def __feature_chunks(self, chunk_size: int, fields: List[str], geometry: bool) -> Iterator[Dict[str, np.ndarray]]:
+        field_idx = [self.ogr_layer_def.GetFieldIndex(field) for field in fields]
+        field_defs = [self.ogr_layer_def.GetFieldDefn(idx) for idx in field_idx]
+        self.ogr_layer.ResetReading()
+        feature = self.ogr_layer.GetNextFeature()
+        while feature is not None:
+            fids = []
+            wkbs = []
+            values = [[] for _field in fields]
+            while feature is not None and (chunk_size is None or len(fids) < chunk_size):
+                fids.append(feature.GetFID())
+                if geometry:
+                    geom = feature.GetGeometryRef()
+                    wkbs.append(bytes(geom.ExportToWkb()) if geom is not None else None)
+                for idx, field_values in zip(field_idx, values):
+                    field_values.append(feature.GetField(idx))
+                feature = self.ogr_layer.GetNextFeature()
+
+            columns = {'fid': np.array(fids, dtype=np.int64)}
+            if geometry:
+                columns['geometry'] = self.wkb2shapely_array(wkbs)
+            for field_def, field_values in zip(field_defs, values):
+                if field_def.GetType() == ogr.OFTReal:
+                    columns[field_def.GetName()] = np.array(field_values, dtype=np.float64)
+                elif field_def.GetType() in [ogr.OFTInteger, ogr.OFTInteger64] and None not in field_values:
+                    columns[field_def.GetName()] = np.array(field_values, dtype=np.int64)
+                else:
+                    columns[field_def.GetName()] = np.array(field_values, dtype=object)
+            yield columns
 
     @staticmethod
     def __start_transaction(write_layers: list):
@@ -622,7 +786,9 @@ class VectorBase():
 
     @staticmethod
     def get_transform(in_srs: osr.SpatialReference, out_srs: osr.SpatialReference) -> osr.CoordinateTransformation:
-        """[summary]
+        """Get a transform between two spatial references
+
+        Transforms are cached for the process (see rscommons.srs_cache) so this is cheap to call in a loop
 
         Args:
             in_srs ([type]): input SRS
@@ -639,16 +805,15 @@ class VectorBase():
         elif out_srs is None:
             raise VectorBaseException('No output spatial ref found. Has this layer been created or loaded?')
 
-        in_proj4, in_ax_strategy = VectorBase.get_srs_debug(in_srs)
-        out_proj4, out_ax_strategy = VectorBase.get_srs_debug(out_srs)
-
-        if in_ax_strategy != out_ax_strategy:
-            raise VectorBaseException('ERROR: Axis mapping strategy mismatch from "{}" to "{}". This will cause strange x and y coordinates to be transposed.')
+        if in_srs.GetAxisMappingStrategy() != out_srs.GetAxisMappingStrategy():
+            _in_proj4, in_ax_strategy = VectorBase.get_srs_debug(in_srs)
+            _out_proj4, out_ax_strategy = VectorBase.get_srs_debug(out_srs)
+            raise VectorBaseException('ERROR: Axis mapping strategy mismatch from "{}" to "{}". This will cause strange x and y coordinates to be transposed.'.format(in_ax_strategy, out_ax_strategy))
 
-        # VectorBase.log.debug('Input spatial reference is "{}"  Axis Strategy: "{}"'.format(in_proj4, in_ax_strategy))
-        # VectorBase.log.debug('Output spatial reference is "{}"  Axis Strategy: "{}"'.format(out_proj4, out_ax_strategy))
+        # VectorBase.log.debug('Input spatial reference is "{}"  Axis Strategy: "{}"'.format(*VectorBase.get_srs_debug(in_srs)))
+        # VectorBase.log.debug('Output spatial reference is "{}"  Axis Strategy: "{}"'.format(*VectorBase.get_srs_debug(out_srs)))
 
-        transform = osr.CoordinateTransformation(in_srs, out_srs)
+        transform = cached_transform(in_srs, out_srs)
 
         return transform
 
@@ -675,9 +840,6 @@ class VectorBase():
         # Set the axis mapping to be the same as the input. This might prove problematic in cases where the input is
         out_spatial_ref.SetAxisMappingStrategy(in_srs.GetAxisMappingStrategy())
 
-        in_proj4, in_ax_strategy = VectorBase.get_srs_debug(in_srs)
-        out_proj4, out_ax_strategy = VectorBase.get_srs_debug(out_spatial_ref)
-
         # VectorBase.log.debug('Input spatial reference is "{}"  Axis Strategy: "{}"'.format(in_proj4, in_ax_strategy))
         # VectorBase.log.debug('Output spatial reference is "{}"  Axis Strategy: "{}"'.format(out_proj4, out_ax_strategy))
 
@@ -702,12 +864,8 @@ class VectorBase():
         if in_srs is None:
             raise VectorBaseException('No input spatial ref found. Has this layer been created or loaded?')
 
-        out_ds = gdal.Open(raster_path)
-        out_spatial_ref = osr.SpatialReference()
-        out_spatial_ref.ImportFromWkt(out_ds.GetProjectionRef())
-
-        in_proj4, in_ax_strategy = VectorBase.get_srs_debug(in_srs)
-        out_proj4, out_ax_strategy = VectorBase.get_srs_debug(out_spatial_ref)
+        # Cached by path and modification time so the raster isn't reopened for every call
+        out_spatial_ref = raster_spatial_ref(raster_path)
 
         # https://github.com/OSGeo/gdal/issues/1546
         out_spatial_ref.SetAxisMappingStrategy(in_srs.GetAxisMappingStrategy())
@@ -723,8 +881,7 @@ class VectorBase():
 
     @staticmethod
     def get_srs_from_epsg(epsg: int) -> osr.SpatialReference:
-        out_spatial_ref = osr.SpatialReference()
-        out_spatial_ref.ImportFromEPSG(int(epsg))
+        out_spatial_ref = epsg_spatial_ref(epsg)
 
         out_spatial_ref.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
 
@@ -826,14 +983,12 @@ class VectorBase():
         utm_epsg = get_utm_zone_epsg(extent_centroid.GetX())
         in_spatial_ref.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
 
-        out_spatial_ref = osr.SpatialReference()
-        out_spatial_ref.ImportFromEPSG(int(utm_epsg))
-        out_spatial_ref.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+        out_spatial_ref = VectorBase.get_srs_from_epsg(utm_epsg)
 
         # VectorBase.log.debug('Original spatial reference is : \n       {0} (AxisMappingStrategy:{1})'.format(*VectorBase.get_srs_debug(in_spatial_ref)))
         # VectorBase.log.debug('Transform spatial reference is : \n       {0} (AxisMappingStrategy:{1})'.format(*VectorBase.get_srs_debug(out_spatial_ref)))
 
-        transform_forward = osr.CoordinateTransformation(in_spatial_ref, out_spatial_ref)
+        transform_forward = cached_transform(in_spatial_ref, out_spatial_ref)
 
         pt1_ogr = VectorBase.shapely2ogr(pt1_orig, transform_forward)
         pt2_ogr = VectorBase.shapely2ogr(pt2_orig, transform_forward)
@@ -905,6 +1060,67 @@ class VectorBase():
 
         return geom
 
+    @staticmethod
+    def wkb2shapely_array(wkbs: List[bytes], flatten_to_2D=True) -> np.ndarray:
+        """Shapely geometries for a whole column of WKB at once
+
+        Args:
+            wkbs (List[bytes]): WKB of each geometry, None where there isn't one
+            flatten_to_2D (bool, optional): Drop Z and M like ogr2shapely. Defaults to True.
+
+        Returns:
+            np.ndarray: object array of shapely geometries (None where the WKB was None)
+        """
+        if from_wkb is not None:
+            geoms = from_wkb(np.asarray(wkbs, dtype=object))
+            if flatten_to_2D and np.any(get_coordinate_dimension(geoms) > 2):
+                geoms = force_2d(geoms)
+            return geoms
+
+        geoms = np.empty(len(wkbs), dtype=object)
+        for idx, wkb in enumerate(wkbs):
+            if wkb is None:
+                continue
+            geom = wkbload(bytes(wkb))
+            if flatten_to_2D and geom.has_z:
+                # Shapely hack for flattening
+                geom = wkbload(wkbdumps(geom, output_dimension=2))
+            geoms[idx] = geom
+        return geoms
+
+    @staticmethod
+    def transform_shapely_array(geoms: np.ndarray, transform: osr.CoordinateTransformation) -> np.ndarray:
+        """Transform a whole column of 2D shapely geometries with TransformPoints instead of one OGR geometry at a time
+
+        With Shapely 2 the coordinates of every geometry go through a single TransformPoints call.
+        Shapely 1.8 makes one call per line or ring.
+
+        Args:
+            geoms (np.ndarray): object array of shapely geometries (None where there isn't one)
+            transform (osr.CoordinateTransformation): the transformation
+
+        Returns:
+            np.ndarray: object array of transformed shapely geometries
+        """
+        def transform_coords(coords: np.ndarray) -> np.ndarray:
+            if len(coords) == 0:
+                return np.zeros((0, 2))
+            points = transform.TransformPoints(np.asarray(coords, dtype=np.float64)[:, :2].tolist())
+            return np.array(points, dtype=np.float64)[:, :2]
+
+        if shapely_transform is not None:
+            return shapely_transform(np.asarray(geoms, dtype=object), transform_coords)
+
+        def transform_xy(x, y, z=None):
+            points = transform_coords(np.column_stack([x, y]))
+            return points[:, 0], points[:, 1]
+
+        transformed = np.empty(len(geoms), dtype=object)
+        for idx, geom in enumerate(geoms):
+            if geom is not None:
+                transformed[idx] = geom if geom.is_empty else shapely_ops_transform(transform_xy, geom)
+        return transformed
+
     def verify_raster_spatial_ref(self, raster_path: str):
         """Make sure our raster's spatial ref matches this layer's ref
 
@@ -5,11 +5,21 @@ from __future__ import annotations
 import os
 import glob
 import csv
-from typing import Dict
+import threading
+from typing import Dict, List, Tuple
 import sqlite3
+import numpy as np
 from osgeo import ogr, osr
 from rscommons import Logger, VectorBase
 
+# Bytes of envelope in a GeoPackage geometry blob for each envelope indicator (flags bits 1-3)
+GPKG_ENVELOPE_SIZES = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}
+GPKG_EMPTY_FLAG = 0x10
+
+# Read connections shared by the loaders: {(absolute path, thread): ((st_dev, st_ino), connection)}
+_CONNECTIONS = {}
+_CONNECTIONS_LOCK = threading.Lock()
+
 
 class SQLiteCon():
     """This is just a loose mapping class to allow us to use Python's 'with' keyword.
@@ -186,6 +196,59 @@ def load_lookup_data(db_path, csv_dir):
     conn.commit()
 
 
+def get_connection(database: str) -> sqlite3.Connection:
+    """Shared connection for reading a database, one per thread
+
+    Loaders that are called many times per run reuse it instead of connecting every
+    time. A database that has been deleted and recreated gets a new connection.
+
+    Args:
+        database (str): path to the SQLite database or GeoPackage
+
+    Returns:
+        sqlite3.Connection: connection (don't close it, use close_connections)
+    """
+    path = os.path.abspath(database)
+    stat = os.stat(path)
+    file_id = (stat.st_dev, stat.st_ino)
+    key = (path, threading.get_ident())
+    with _CONNECTIONS_LOCK:
+        cached = _CONNECTIONS.get(key)
+        if cached is not None and cached[0] == file_id:
+            return cached[1]
+
+    # check_same_thread is off only so that close_connections can close it from any thread
+    conn = sqlite3.connect(path, check_same_thread=False)
+    with _CONNECTIONS_LOCK:
+        if cached is not None:
+            cached[1].close()
+        _CONNECTIONS[key] = (file_id, conn)
+    return conn
+
+
+def close_connections(database: str = None):
+    """Close the shared read connections, e.g. before deleting a database
+
+    Args:
+        database (str, optional): only the connections to this database. Defaults to None (all of them).
+    """
+    path = os.path.abspath(database) if database is not None else None
+    with _CONNECTIONS_LOCK:
+        for key in [key for key in _CONNECTIONS if path is None or key[0] == path]:
+            _CONNECTIONS.pop(key)[1].close()
+
+
+def _forget_connections():
+    global _CONNECTIONS_LOCK
+    _CONNECTIONS_LOCK = threading.Lock()
+    _CONNECTIONS.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    # SQLite connections must not be used across a fork. Drop the parent's without closing them
+    os.register_at_fork(after_in_child=_forget_connections)
+
+
 def get_db_srs(database):
     meta = get_metadata(database)
     dbRef = osr.SpatialReference()
@@ -194,165 +257,245 @@ def get_db_srs(database):
     return dbRef
 
 
-def load_geometries(database, target_srs=None, where_clause=None):
+def gpkg_wkb(blob: bytes) -> bytes:
+    """WKB inside a GeoPackage geometry blob
 
-    transform = None
-    if target_srs:
-        db_srs = get_db_srs(database)
-        # https://github.com/OSGeo/gdal/issues/1546
-        target_srs.SetAxisMappingStrategy(db_srs.GetAxisMappingStrategy())
-        transform = osr.CoordinateTransformation(db_srs, target_srs)
+    Args:
+        blob (bytes): GeoPackage binary geometry
 
-    conn = sqlite3.connect(database)
-    curs = conn.execute('SELECT ReachID, Geometry FROM Reaches {}'.format('WHERE {}'.format(where_clause) if where_clause else ''))
-    reaches = {}
+    Returns:
+        bytes: WKB, or None for a NULL or empty geometry
+    """
+    if blob is None or blob[3] & GPKG_EMPTY_FLAG:
+        return None
+    return bytes(blob[8 + GPKG_ENVELOPE_SIZES[(blob[3] >> 1) & 0x07]:])
 
-    for row in curs.fetchall():
-        geom = ogr.CreateGeometryFromJson(row[1])
-        if transform:
-            geom.Transform(transform)
-        reaches[row[0]] = VectorBase.ogr2shapely(geom)
-    return reaches
 
+def column_array(values: list) -> np.ndarray:
+    """Numpy array for a column of SQLite values
 
-def load_attributes(database, fields, where_clause=None):
+    Args:
+        values (list): values of one column
 
-    conn = sqlite3.connect(database)
-    conn.row_factory = dict_factory
-    curs = conn.execute('SELECT ReachID, {} FROM vwReaches {}'.format(','.join(fields), 'WHERE {}'.format(where_clause) if where_clause else ''))
-    reaches = {}
-    for row in curs.fetchall():
-        reaches[row['ReachID']] = {}
-        for field in fields:
-            reaches[row['ReachID']][field] = row[field]
+    Returns:
+        np.ndarray: int64 for whole numbers, float64 (with NaN for NULL) for other numbers and object for anything else
+    """
+    if all(value is None or isinstance(value, (int, float)) for value in values):
+        if any(value is None or isinstance(value, float) for value in values):
+            return np.array(values, dtype=np.float64)
+        return np.array(values, dtype=np.int64)
+    return np.array(values, dtype=object)
 
-    return reaches
 
+def query_filter(id_field: str, where_clause: str = None, ids: List[int] = None) -> str:
+    """WHERE clause for a where_clause and/or a list of IDs
 
-def load_igo_attributes(database, fields, where_clause=None):
+    Args:
+        id_field (str): ID column
+        where_clause (str, optional): SQL filter. Defaults to None.
+        ids (List[int], optional): only these IDs. Defaults to None.
 
-    conn = sqlite3.connect(database)
-    conn.row_factory = dict_factory
-    curs = conn.execute('SELECT IGOID, {} FROM vwIgos {}'.format(','.join(fields), 'WHERE {}'.format(where_clause) if where_clause else ''))
-    igos = {}
-    for row in curs.fetchall():
-        igos[row['IGOID']] = {}
-        for field in fields:
-            igos[row['IGOID']][field] = row[field]
+    Returns:
+        str: the WHERE clause (or an empty string)
+    """
+    clauses = []
+    if where_clause:
+        clauses.append('({})'.format(where_clause))
+    if ids is not None:
+        # IDs are integers, so they are safe to put in the SQL and there's no limit on how many
+        clauses.append('{} IN ({})'.format(id_field, ','.join(str(int(fid)) for fid in ids)))
+    return 'WHERE {}'.format(' AND '.join(clauses)) if len(clauses) > 0 else ''
 
-    return igos
 
+def load_rows(database: str, table: str, id_field: str, fields: List[str], where_clause: str = None, ids: List[int] = None, params: list = None) -> List[tuple]:
+    """(ID, field, field...) rows from a table or view with one query on the shared connection
 
-def load_dgo_attributes(database, fields, where_clause=None):
+    Args:
+        database (str): path to the database
+        table (str): table or view, e.g. vwReaches
+        id_field (str): ID column, e.g. ReachID
+        fields (List[str]): columns to load
+        where_clause (str, optional): SQL filter, with ? placeholders for params. Defaults to None.
+        ids (List[int], optional): only these IDs. Defaults to None.
+        params (list, optional): values for the where_clause placeholders. Defaults to None.
 
-    conn = sqlite3.connect(database)
-    conn.row_factory = dict_factory
-    curs = conn.execute('SELECT DGOID, {} FROM vwDgos {}'.format(','.join(fields), 'WHERE {}'.format(where_clause) if where_clause else ''))
-    dgos = {}
-    for row in curs.fetchall():
-        dgos[row['DGOID']] = {}
-        for field in fields:
-            dgos[row['DGOID']][field] = row[field]
+    Returns:
+        List[tuple]: rows
+    """
+    sql = 'SELECT {} FROM {} {}'.format(', '.join([id_field] + list(fields)), table, query_filter(id_field, where_clause, ids))
+    return get_connection(database).execute(sql, params if params is not None else []).fetchall()
 
-    return dgos
 
+def load_table_columns(database: str, table: str, id_field: str, fields: List[str], where_clause: str = None, ids: List[int] = None, params: list = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """Columns of a table or view as numpy arrays (see load_rows for the arguments)
 
-def write_db_attributes(database, reaches, fields, set_null_first=True, summarize=True):
+    Returns:
+        Tuple[np.ndarray, Dict[str, np.ndarray]]: the IDs and {field: values}, in the same order as the IDs
+    """
+    rows = load_rows(database, table, id_field, fields, where_clause, ids, params)
+    columns = list(zip(*rows)) if len(rows) > 0 else [[] for _field in range(len(fields) + 1)]
+    return column_array(list(columns[0])), {field: column_array(list(values)) for field, values in zip(fields, columns[1:])}
 
-    if len(reaches) < 1:
-        return
 
-    conn = sqlite3.connect(database)
-    conn.execute('pragma foreign_keys=ON')
-    curs = conn.cursor()
+def load_geometry_column(database: str, table: str, id_field: str = 'fid', geom_field: str = 'geom', where_clause: str = None, ids: List[int] = None, params: list = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Geometries of a GeoPackage feature table decoded straight from the blobs (see load_rows for the arguments)
 
-    # Optionally clear all the values in the fields first
-    if set_null_first is True:
-        [curs.execute('UPDATE ReachAttributes SET {} = NULL'.format(field)) for field in fields]
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the IDs and an object array of shapely geometries (None for NULL or empty)
+    """
+    rows = load_rows(database, table, id_field, [geom_field], where_clause, ids, params)
+    return column_array([row[0] for row in rows]), VectorBase.wkb2shapely_array([gpkg_wkb(row[1]) for row in rows])
 
-    results = []
-    for reachid, values in reaches.items():
-        results.append([values[field] if field in values else None for field in fields])
-        results[-1].append(reachid)
 
-    sql = 'UPDATE ReachAttributes SET {} WHERE ReachID = ?'.format(','.join(['{}=?'.format(field) for field in fields]))
-    curs.executemany(sql, results)
-    conn.commit()
+def load_geometries(database, target_srs=None, where_clause=None):
 
-    if summarize is True:
-        [summarize_reaches(database, field) for field in fields]
+    transform = None
+    if target_srs:
+        db_srs = get_db_srs(database)
+        # https://github.com/OSGeo/gdal/issues/1546
+        target_srs.SetAxisMappingStrategy(db_srs.GetAxisMappingStrategy())
+        transform = osr.CoordinateTransformation(db_srs, target_srs)
 
+    rows = load_rows(database, 'Reaches', 'ReachID', ['Geometry'], where_clause)
 
-def write_db_igo_attributes(database, features, fields, set_null_first=True, summarize=True):
+    # GeoPackage blobs without a transform can be decoded all at once
+    if transform is None and all(row[1] is None or isinstance(row[1], bytes) for row in rows):
+        geoms = VectorBase.wkb2shapely_array([gpkg_wkb(row[1]) for row in rows])
+        return {row[0]: geom for row, geom in zip(rows, geoms)}
 
-    if len(features) < 1:
-        return
+    reaches = {}
+    for reachid, value in rows:
+        geom = ogr.CreateGeometryFromWkb(gpkg_wkb(value)) if isinstance(value, bytes) else ogr.CreateGeometryFromJson(value)
+        if transform:
+            geom.Transform(transform)
+        reaches[reachid] = VectorBase.ogr2shapely(geom)
+    return reaches
 
-    conn = sqlite3.connect(database)
-    conn.execute('pragma foreign_keys=ON')
-    curs = conn.cursor()
 
-    # Optionally clear all the values in the fields first
-    if set_null_first is True:
-        [curs.execute('UPDATE IGOAttributes SET {} = NULL'.format(field)) for field in fields]
+def load_feature_attributes(database: str, table: str, id_field: str, fields: List[str], where_clause: str = None, ids: List[int] = None) -> Dict[int, Dict]:
+    """{ID: {field: value}} for every row of a table or view (see load_rows for the arguments)
+    """
+    return {row[0]: dict(zip(fields, row[1:])) for row in load_rows(database, table, id_field, fields, where_clause, ids)}
 
-    results = []
-    for reachid, values in features.items():
-        results.append([values[field] if field in values else None for field in fields])
-        results[-1].append(reachid)
 
-    sql = 'UPDATE IGOAttributes SET {} WHERE IGOID = ?'.format(','.join(['{}=?'.format(field) for field in fields]))
-    curs.executemany(sql, results)
-    conn.commit()
+def load_attributes(database, fields, where_clause=None):
+    return load_feature_attributes(database, 'vwReaches', 'ReachID', fields, where_clause)
 
-    if summarize is True:
-        [summarize_reaches(database, field) for field in fields]
 
+def load_igo_attributes(database, fields, where_clause=None):
+    return load_feature_attributes(database, 'vwIgos', 'IGOID', fields, where_clause)
 
-def write_db_dgo_attributes(database, features, fields, set_null_first=True, summarize=True):
 
-    if len(features) < 1:
-        return
+def load_dgo_attributes(database, fields, where_clause=None):
+    return load_feature_attributes(database, 'vwDgos', 'DGOID', fields, where_clause)
 
-    conn = sqlite3.connect(database)
-    conn.execute('pragma foreign_keys=ON')
-    curs = conn.cursor()
 
-    # Optionally clear all the values in the fields first
-    if set_null_first is True:
-        [curs.execute('UPDATE DGOAttributes SET {} = NULL'.format(field)) for field in fields]
+# Pragmas for the duration of a bulk write: rollback journal in memory, no fsync, 64 MB page cache
+WRITE_PRAGMAS = {'journal_mode': 'MEMORY', 'synchronous': 'OFF', 'cache_size': -65536}
 
-    results = []
-    for reachid, values in features.items():
-        results.append([values[field] if field in values else None for field in fields])
-        results[-1].append(reachid)
 
-    sql = 'UPDATE DGOAttributes SET {} WHERE DGOID = ?'.format(','.join(['{}=?'.format(field) for field in fields]))
-    curs.executemany(sql, results)
-    conn.commit()
+def write_db_attributes(database, reaches, fields, set_null_first=True, summarize=True):
+    write_attributes(database, 'ReachAttributes', 'ReachID', reaches, fields, set_null_first, summarize)
 
-    if summarize is True:
-        [summarize_reaches(database, field) for field in fields]
 
+def write_db_igo_attributes(database, features, fields, set_null_first=True, summarize=True):
+    write_attributes(database, 'IGOAttributes', 'IGOID', features, fields, set_null_first, summarize)
 
-def summarize_reaches(database, field):
 
+def write_db_dgo_attributes(database, features, fields, set_null_first=True, summarize=True):
+    write_attributes(database, 'DGOAttributes', 'DGOID', features, fields, set_null_first, summarize)
+
+
+def write_attributes(database: str, table: str, id_field: str, features: Dict[int, Dict], fields: List[str], set_null_first: bool = True, summarize: bool = True):
+    """Write attribute values for many features with a few set-based statements
+
+    The values are loaded into a temporary table and every field is updated with one
+    UPDATE ... FROM join, so each row is only rewritten once.
+
+    Args:
+        database (str): path to the database
+        table (str): attribute table, e.g. ReachAttributes
+        id_field (str): ID column, e.g. ReachID
+        features (Dict[int, Dict]): {ID: {field: value}}. Missing fields are written as NULL
+        fields (List[str]): fields to write
+        set_null_first (bool, optional): NULL the fields of the rows that aren't in features. Defaults to True.
+        summarize (bool, optional): log statistics for the fields afterwards. Defaults to True.
+    """
+    if len(features) < 1:
+        return
+
+    conn = sqlite3.connect(database, isolation_level=None)
+    try:
+        conn.execute('PRAGMA foreign_keys = ON')
+        original = {pragma: conn.execute('PRAGMA {}'.format(pragma)).fetchone()[0] for pragma in WRITE_PRAGMAS}
+        if original['journal_mode'].lower() == 'wal':
+            # Leaving WAL is a persistent change that needs exclusive access, so keep it
+            del original['journal_mode']
+        for pragma, value in WRITE_PRAGMAS.items():
+            if pragma not in original:
+                continue
+            conn.execute('PRAGMA {} = {}'.format(pragma, value))
+
+        try:
+            conn.execute('BEGIN')
+            conn.execute('CREATE TEMP TABLE write_values (_id INTEGER PRIMARY KEY, {})'.format(', '.join('"{}"'.format(field) for field in fields)))
+            conn.executemany('INSERT INTO write_values VALUES ({})'.format(', '.join('?' * (len(fields) + 1))),
+                             ([fid] + [values[field] if field in values else None for field in fields] for fid, values in features.items()))
+
+            if set_null_first is True:
+                conn.execute('UPDATE {} SET {} WHERE {} NOT IN (SELECT _id FROM write_values)'.format(
+                    table, ', '.join('{} = NULL'.format(field) for field in fields), id_field))
+
+            if sqlite3.sqlite_version_info >= (3, 33, 0):
+                conn.execute('UPDATE {0} SET {1} FROM write_values WHERE {0}.{2} = write_values._id'.format(
+                    table, ', '.join('{0} = write_values."{0}"'.format(field) for field in fields), id_field))
+            else:
+                # UPDATE ... FROM needs SQLite 3.33. Row values (3.15) still do it in one statement
+                conn.execute('UPDATE {0} SET ({1}) = (SELECT {2} FROM write_values WHERE _id = {0}.{3}) WHERE {3} IN (SELECT _id FROM write_values)'.format(
+                    table, ', '.join(fields), ', '.join('"{}"'.format(field) for field in fields), id_field))
+
+            conn.execute('DROP TABLE write_values')
+            conn.execute('COMMIT')
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            for pragma, value in original.items():
+                conn.execute('PRAGMA {} = {}'.format(pragma, value))
+
+        if summarize is True:
+            summarize_fields(conn, table, fields)
+    finally:
+        conn.close()
+
+
+def summarize_fields(database, table: str, fields: List[str]):
+    """Log the max, min, average and number of nulls of fields with one query
+
+    Args:
+        database (str or sqlite3.Connection): path to the database or an open connection
+        table (str): table with the fields
+        fields (List[str]): numeric fields
+    """
     log = Logger('Database')
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
+    conn = database if isinstance(database, sqlite3.Connection) else get_connection(database)
 
-    curs.execute('SELECT Max({0}), Min({0}), Avg({0}), Count({0}) FROM ReachAttributes WHERE ({0} IS NOT NULL)'.format(field))
-    row = curs.fetchone()
-    if row and row[3] > 0:
-        msg = '{}, max: {:.2f}, min: {:.2f}, avg: {:.2f}'.format(field, row[0], row[1], row[2])
-    else:
-        msg = "0 non null values"
+    stats = ', '.join('Max({0}), Min({0}), Avg({0}), Count({0}), Count(*) - Count({0})'.format(field) for field in fields)
+    row = conn.execute('SELECT {} FROM {}'.format(stats, table)).fetchone()
 
-    curs.execute('SELECT Count(*) FROM ReachAttributes WHERE {0} IS NULL'.format(field))
-    row = curs.fetchone()
-    msg += ', nulls: {:,}'.format(row[0])
+    for idx, field in enumerate(fields):
+        max_value, min_value, avg_value, count, nulls = row[idx * 5:idx * 5 + 5]
+        if count > 0:
+            msg = '{}, max: {:.2f}, min: {:.2f}, avg: {:.2f}'.format(field, max_value, min_value, avg_value)
+        else:
+            msg = "0 non null values"
+        msg += ', nulls: {:,}'.format(nulls)
+        log.info(msg)
 
-    log.info(msg)
+
+def summarize_reaches(database, field):
+    summarize_fields(database, 'ReachAttributes', [field])
 
 
 def set_reach_fields_null(database, fields):
@@ -390,9 +533,7 @@ def get_metadata(database):
     log = Logger('Database')
     log.debug('Retrieving metadata')
 
-    conn = sqlite3.connect(database)
-    curs = conn.cursor()
-    curs.execute('SELECT KeyInfo, ValueInfo FROM MetaData')
+    curs = get_connection(database).execute('SELECT KeyInfo, ValueInfo FROM MetaData')
     meta = {}
     for row in curs.fetchall():
         meta[row[0]] = row[1]
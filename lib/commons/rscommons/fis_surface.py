@@ -0,0 +1,227 @@
+""" Precomputed response surfaces for scikit-fuzzy control systems
+
+    Purpose:  Running ControlSystemSimulation.compute() once per reach dominates the run time of the
+              BRAT and RCAT FIS steps. A FIS maps a handful of inputs onto one output so the whole
+              response can be sampled once onto a grid (using skfuzzy's array inputs), cached on disk
+              and then every reach answered with vectorized multilinear interpolation.
+
+              The grid for each input includes every breakpoint of that input's membership functions
+              but min/max rule aggregation still puts kinks in the surface between them, so interpolated
+              values are an approximation. Use validate() to report the maximum error against exact
+              compute() results. compute_fis() is the exact alternative: skfuzzy's array inputs
+              evaluated in batches, which gives the same answer as the per-reach loop much faster.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import os
+import hashlib
+import tempfile
+from typing import Dict
+
+import numpy as np
+from scipy.interpolate import RegularGridInterpolator
+from skfuzzy import control as ctrl
+
+from rscommons import Logger
+
+# Environment variable that can point the surface cache somewhere permanent
+FIS_CACHE_ENV = 'RS_FIS_CACHE'
+# Number of equal steps that every gap between membership function breakpoints is split into
+DEFAULT_SEGMENTS = 4
+# Inputs per exact skfuzzy array computation. Bounds memory, which grows with inputs x output universe
+COMPUTE_BATCH = 5000
+
+
+def fis_axis(antecedent: ctrl.Antecedent, segments: int = DEFAULT_SEGMENTS) -> np.ndarray:
+    """Sample points for one FIS input: the ends of the universe, every membership function breakpoint
+    and evenly spaced points in between.
+
+    Args:
+        antecedent (ctrl.Antecedent): skfuzzy input variable with its terms defined
+        segments (int, optional): steps between consecutive breakpoints. Defaults to DEFAULT_SEGMENTS.
+
+    Returns:
+        np.ndarray: sorted, unique axis values
+    """
+    universe = antecedent.universe
+    knots = {universe[0], universe[-1]}
+    for term in antecedent.terms.values():
+        # Breakpoints are wherever the sampled membership function changes slope
+        slope_change = np.flatnonzero(np.abs(np.diff(term.mf, 2)) > 1e-9) + 1
+        knots.update(universe[slope_change].tolist())
+
+    knots = np.array(sorted(knots))
+    axis = [np.linspace(start, end, segments + 1)[:-1] for start, end in zip(knots[:-1], knots[1:])]
+    axis.append(knots[-1:])
+    return np.unique(np.concatenate(axis))
+
+
+def compute_fis(control_system: ctrl.ControlSystem, inputs: Dict[str, np.ndarray], output: str) -> np.ndarray:
+    """Exact FIS output for arrays of inputs using skfuzzy's array inputs, in batches.
+    Gives the same values as setting scalar inputs and calling compute() once per element.
+
+    Args:
+        control_system (ctrl.ControlSystem): the control system
+        inputs (Dict[str, np.ndarray]): {antecedent label: array of input values}
+        output (str): label of the consequent
+
+    Returns:
+        np.ndarray: FIS output for each element
+    """
+    labels = list(inputs.keys())
+    count = len(inputs[labels[0]]) if len(labels) > 0 else 0
+    results = np.zeros(count)
+    sim = ctrl.ControlSystemSimulation(control_system)
+    for start in range(0, count, COMPUTE_BATCH):
+        for label in labels:
+            sim.input[label] = np.asarray(inputs[label][start:start + COMPUTE_BATCH], dtype=np.float64)
+        sim.compute()
+        results[start:start + COMPUTE_BATCH] = sim.output[output]
+    return results
+
+
+def evaluate_fis(control_system: ctrl.ControlSystem, inputs: Dict[str, np.ndarray], output: str, name: str, surface: bool = False, validate: bool = False) -> np.ndarray:
+    """Evaluate a FIS for arrays of inputs, either exactly or from its cached response surface
+
+    Args:
+        control_system (ctrl.ControlSystem): the control system
+        inputs (Dict[str, np.ndarray]): {antecedent label: array of input values}
+        output (str): label of the consequent
+        name (str): name of the FIS, used for the surface cache file
+        surface (bool, optional): interpolate from the response surface instead of computing exactly. Defaults to False.
+        validate (bool, optional): log the maximum surface error against exact results. Defaults to False.
+
+    Returns:
+        np.ndarray: FIS output for each element
+    """
+    if not surface:
+        return compute_fis(control_system, inputs, output)
+
+    fis_surface = FISSurface(control_system, output, name)
+    if validate:
+        fis_surface.validate(inputs)
+    return fis_surface.evaluate(inputs)
+
+
+class FISSurface():
+    """Response surface of a skfuzzy control system
+
+        surface = FISSurface(veg_ctrl, 'result', name='brat_vegetation')
+        result = surface.evaluate({'input1': riparian_array, 'input2': streamside_array})
+    """
+
+    def __init__(self, control_system: ctrl.ControlSystem, output: str, name: str, segments: int = DEFAULT_SEGMENTS, cache_folder: str = None):
+        """
+        Args:
+            control_system (ctrl.ControlSystem): the control system (rules and membership functions)
+            output (str): label of the consequent to sample
+            name (str): used to name the cache file
+            segments (int, optional): grid steps between membership function breakpoints. Defaults to DEFAULT_SEGMENTS.
+            cache_folder (str, optional): where to cache the sampled grid. Defaults to the RS_FIS_CACHE
+                environment variable or the system temp folder.
+        """
+        self.log = Logger('FIS Surface')
+        self.control_system = control_system
+        self.output = output
+        self.antecedents = sorted(control_system.antecedents, key=lambda ant: ant.label)
+        self.labels = [ant.label for ant in self.antecedents]
+        self.bounds = [(ant.universe[0], ant.universe[-1]) for ant in self.antecedents]
+        self.axes = [fis_axis(ant, segments) for ant in self.antecedents]
+
+        if cache_folder is None:
+            cache_folder = os.environ[FIS_CACHE_ENV] if FIS_CACHE_ENV in os.environ else os.path.join(tempfile.gettempdir(), 'rs_fis_cache')
+        self.cache_path = os.path.join(cache_folder, f'{name}_{self._signature()}.npy')
+
+        values = self._load_or_sample()
+        self.interpolator = RegularGridInterpolator(self.axes, values, method='linear')
+
+    def _signature(self) -> str:
+        """Hash of everything that affects the surface so that a changed FIS never reuses a stale cache
+        """
+        sha = hashlib.sha1()
+        for var in self.antecedents + sorted(self.control_system.consequents, key=lambda con: con.label):
+            sha.update(var.label.encode())
+            sha.update(np.ascontiguousarray(var.universe, dtype=np.float64).tobytes())
+            for term_label, term in var.terms.items():
+                sha.update(term_label.encode())
+                sha.update(np.ascontiguousarray(term.mf, dtype=np.float64).tobytes())
+        for rule in self.control_system.rules:
+            sha.update(str(rule).encode())
+        sha.update(self.output.encode())
+        for axis in self.axes:
+            sha.update(axis.tobytes())
+        return sha.hexdigest()[:16]
+
+    def _load_or_sample(self) -> np.ndarray:
+        """Load the sampled grid from the cache or compute and cache it
+        """
+        shape = tuple(len(axis) for axis in self.axes)
+        if os.path.isfile(self.cache_path):
+            values = np.load(self.cache_path)
+            if values.shape == shape:
+                self.log.debug(f'Loaded FIS surface from {self.cache_path}')
+                return values
+
+        self.log.info(f'Sampling FIS response surface on a {" x ".join(str(dim) for dim in shape)} grid')
+        mesh = np.meshgrid(*self.axes, indexing='ij')
+        values = self.compute_exact({label: grid.ravel() for label, grid in zip(self.labels, mesh)}).reshape(shape)
+
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            # Write then rename so a concurrent run never reads a half written file
+            tmp_path = f'{self.cache_path}.{os.getpid()}.npy'
+            np.save(tmp_path, values)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as ex:
+            self.log.warning(f'Unable to cache FIS surface at {self.cache_path}: {ex}')
+
+        return values
+
+    def _stack_inputs(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        """Inputs as an (n, inputs) array in axis order, clipped to each universe like compute() does
+        """
+        columns = [np.clip(np.asarray(inputs[label], dtype=np.float64), low, high) for label, (low, high) in zip(self.labels, self.bounds)]
+        return np.column_stack(columns) if len(columns[0]) > 0 else np.zeros((0, len(columns)))
+
+    def evaluate(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        """Interpolate the FIS output for arrays of inputs
+
+        Args:
+            inputs (Dict[str, np.ndarray]): {antecedent label: array of input values}
+
+        Returns:
+            np.ndarray: FIS output for each element
+        """
+        points = self._stack_inputs(inputs)
+        if len(points) == 0:
+            return np.zeros(0)
+        return self.interpolator(points)
+
+    def compute_exact(self, inputs: Dict[str, np.ndarray]) -> np.ndarray:
+        """Exact FIS output for arrays of inputs
+
+        Args:
+            inputs (Dict[str, np.ndarray]): {antecedent label: array of input values}
+
+        Returns:
+            np.ndarray: FIS output for each element
+        """
+        return compute_fis(self.control_system, inputs, self.output)
+
+    def validate(self, inputs: Dict[str, np.ndarray]) -> float:
+        """Compare the interpolated surface against exact compute() results and log the maximum error
+
+        Args:
+            inputs (Dict[str, np.ndarray]): {antecedent label: array of input values}
+
+        Returns:
+            float: maximum absolute difference
+        """
+        if len(self._stack_inputs(inputs)) == 0:
+            return 0.0
+        error = np.abs(self.evaluate(inputs) - self.compute_exact(inputs))
+        worst = int(np.argmax(error))
+        self.log.info(f'FIS surface validation: max error {error[worst]:.6f}, mean error {error.mean():.6f} over {len(error):,} inputs')
+        self.log.info('Largest error at ' + ', '.join(f'{label}={inputs[label][worst]}' for label in self.labels))
+        return float(error[worst])
@@ -0,0 +1,203 @@
+""" Bulk feature writer for GeoPackage layers
+
+    Purpose:  VectorBase.create_feature builds one OGR feature at a time, so writing millions
+              of IGOs, DGOs or segments is dominated by per-feature overhead. write_features
+              takes a sequence of shapely geometries plus attributes by column and inserts them
+              into an existing GeoPackage layer with batched SQLite inserts of GeoPackage
+              geometry blobs.
+
+              The R-tree and feature count triggers are dropped for the duration of the insert.
+              The spatial index, feature count and layer extent are then updated once for the
+              whole batch and the triggers restored, all in a single transaction.
+
+              Create the layer (and its fields) with GeopackageLayer first and close it: the
+              GeoPackage must not be open for writing through OGR at the same time.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import sqlite3
+import struct
+from typing import Dict, List, Sequence, Tuple
+
+from shapely.geometry.base import BaseGeometry
+
+try:
+    # Shapely 2 converts whole arrays of geometries at once
+    from shapely import to_wkb
+    import numpy as np
+except ImportError:
+    to_wkb = None
+    from shapely.geos import WKBWriter, lgeos
+
+# GeoPackage geometry header: magic 'GP', version 0, flags then the srs_id
+GPKG_MAGIC = b'GP\x00'
+# Flags: little endian, with or without a [minx, maxx, miny, maxy] envelope
+FLAGS_NO_ENVELOPE = 0x01
+FLAGS_XY_ENVELOPE = 0x03
+
+HEADER = struct.Struct('<3sBi')
+ENVELOPE = struct.Struct('<4d')
+WKB_POINT = 1
+
+
+class GeopackageWriterException(Exception):
+    """Special exceptions for the bulk writer
+    """
+    pass
+
+
+def geometry_wkb(geometries: Sequence[BaseGeometry]) -> List[bytes]:
+    """2D WKB of each geometry, flattened the same way as VectorBase.shapely2ogr
+
+    Args:
+        geometries (Sequence[BaseGeometry]): shapely geometries
+
+    Returns:
+        List[bytes]: WKB, or None for a missing or empty geometry
+    """
+    if to_wkb is not None:
+        wkbs = to_wkb(np.asarray(geometries, dtype=object), output_dimension=2).tolist()
+        return [None if wkb is None or geom.is_empty else wkb for geom, wkb in zip(geometries, wkbs)]
+
+    # One writer for the whole list. shapely.wkb.dumps builds a new one for every geometry
+    writer = WKBWriter(lgeos, output_dimension=2)
+    return [None if geom is None or geom.is_empty else writer.write(geom) for geom in geometries]
+
+
+def gpkg_blobs(geometries: Sequence[BaseGeometry], srs_id: int) -> Tuple[List[bytes], List[Tuple[int, float, float, float, float]]]:
+    """GeoPackage binary geometries (header, envelope and 2D WKB) for shapely geometries
+
+    Points are written without an envelope, like GDAL does.
+
+    Args:
+        geometries (Sequence[BaseGeometry]): shapely geometries
+        srs_id (int): srs_id of the layer in gpkg_spatial_ref_sys
+
+    Returns:
+        Tuple[List[bytes], List[Tuple]]: one blob per geometry (None for a missing or empty geometry,
+        written as NULL) and the (index, minx, maxx, miny, maxy) boxes of the others
+    """
+    blobs = []
+    boxes = []
+    for idx, wkb in enumerate(geometry_wkb(geometries)):
+        if wkb is None:
+            blobs.append(None)
+            continue
+
+        byte_order = '<' if wkb[0] == 1 else '>'
+        if struct.unpack_from(byte_order + 'I', wkb, 1)[0] == WKB_POINT:
+            # Reading the point back out of the WKB is much quicker than asking shapely for its bounds
+            x, y = struct.unpack_from(byte_order + '2d', wkb, 5)
+            blobs.append(HEADER.pack(GPKG_MAGIC, FLAGS_NO_ENVELOPE, srs_id) + wkb)
+            boxes.append((idx, x, x, y, y))
+        else:
+            minx, miny, maxx, maxy = geometries[idx].bounds
+            blobs.append(HEADER.pack(GPKG_MAGIC, FLAGS_XY_ENVELOPE, srs_id) + ENVELOPE.pack(minx, maxx, miny, maxy) + wkb)
+            boxes.append((idx, minx, maxx, miny, maxy))
+
+    return blobs, boxes
+
+
+def write_features(gpkg_path: str, layer_name: str, geometries: Sequence[BaseGeometry], attributes: Dict[str, Sequence] = None, batch_size: int = 100000) -> List[int]:
+    """Append features to an existing GeoPackage layer in bulk
+
+    Args:
+        gpkg_path (str): path to the GeoPackage
+        layer_name (str): existing layer (created with GeopackageLayer.create_layer)
+        geometries (Sequence[BaseGeometry]): one shapely geometry per feature (None for no geometry)
+        attributes (Dict[str, Sequence], optional): {'field name': values} with one value per feature. Defaults to None.
+        batch_size (int, optional): features per executemany call. Defaults to 100000.
+
+    Raises:
+        GeopackageWriterException: the layer or a field is missing or the columns are the wrong length
+
+    Returns:
+        List[int]: FIDs of the new features, in the order of the geometries
+    """
+    attributes = attributes if attributes is not None else {}
+    count = len(geometries)
+    columns = {}
+    for field, values in attributes.items():
+        # Numpy integers can't be bound by sqlite3
+        columns[field] = values.tolist() if hasattr(values, 'tolist') else list(values)
+        if len(columns[field]) != count:
+            raise GeopackageWriterException('Field {} has {} values for {} geometries'.format(field, len(columns[field]), count))
+
+    conn = sqlite3.connect(gpkg_path, isolation_level=None)
+    try:
+        # A bigger page cache (64 MB) keeps more of the R-tree in memory while it grows
+        conn.execute('PRAGMA cache_size = -65536')
+        curs = conn.cursor()
+        curs.execute('BEGIN IMMEDIATE')
+
+        curs.execute('SELECT table_name, column_name, srs_id FROM gpkg_geometry_columns WHERE lower(table_name) = lower(?)', [layer_name])
+        row = curs.fetchone()
+        if row is None:
+            raise GeopackageWriterException('Layer {} not found in {}'.format(layer_name, gpkg_path))
+        table, geom_col, srs_id = row
+
+        table_fields = {info[1].lower(): info for info in curs.execute('PRAGMA table_info("{}")'.format(table)).fetchall()}
+        fid_col = next(info[1] for info in table_fields.values() if info[5] == 1)
+        for field in columns:
+            if field.lower() not in table_fields:
+                raise GeopackageWriterException('Missing field {} in {}'.format(field, layer_name))
+
+        # Explicit FIDs so that the spatial index can be filled without reading the rows back
+        curs.execute('SELECT MAX("{}") FROM "{}"'.format(fid_col, table))
+        start_fid = curs.fetchone()[0] or 0
+        if curs.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_sequence'").fetchone() is not None:
+            seq = curs.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', [table]).fetchone()
+            start_fid = max(start_fid, seq[0] if seq is not None else 0)
+        fids = list(range(start_fid + 1, start_fid + 1 + count))
+
+        rtree = 'rtree_{}_{}'.format(table, geom_col)
+        has_rtree = curs.execute('SELECT 1 FROM sqlite_master WHERE name = ?', [rtree]).fetchone() is not None
+        has_counts = curs.execute("SELECT 1 FROM sqlite_master WHERE name = 'gpkg_ogr_contents'").fetchone() is not None
+
+        # The insert triggers call GDAL's ST_ functions, which don't exist outside of GDAL
+        triggers = curs.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN (?, ?)",
+                                ['{}_insert'.format(rtree), 'trigger_insert_feature_count_{}'.format(table)]).fetchall()
+        for name, _sql in triggers:
+            curs.execute('DROP TRIGGER "{}"'.format(name))
+
+        field_names = list(columns.keys())
+        insert_sql = 'INSERT INTO "{}" ("{}", "{}"{}) VALUES (?, ?{})'.format(
+            table, fid_col, geom_col, ''.join(', "{}"'.format(field) for field in field_names), ', ?' * len(field_names))
+
+        extent = [None, None, None, None]
+        for start in range(0, count, batch_size):
+            end = min(start + batch_size, count)
+            blobs, boxes = gpkg_blobs(geometries[start:end], srs_id)
+            curs.executemany(insert_sql, ([fids[idx], blobs[idx - start]] + [columns[field][idx] for field in field_names] for idx in range(start, end)))
+            if len(boxes) == 0:
+                continue
+
+            boxes = [(fids[start + idx], minx, maxx, miny, maxy) for idx, minx, maxx, miny, maxy in boxes]
+            if has_rtree:
+                curs.executemany('INSERT INTO "{}" (id, minx, maxx, miny, maxy) VALUES (?, ?, ?, ?, ?)'.format(rtree), boxes)
+            batch_extent = [min(box[1] for box in boxes), min(box[3] for box in boxes), max(box[2] for box in boxes), max(box[4] for box in boxes)]
+            extent = [batch_extent[i] if extent[i] is None else (min if i < 2 else max)(extent[i], batch_extent[i]) for i in range(4)]
+
+        if has_counts:
+            curs.execute('UPDATE gpkg_ogr_contents SET feature_count = feature_count + ? WHERE lower(table_name) = lower(?)', [count, table])
+
+        if extent[0] is not None:
+            curs.execute("""UPDATE gpkg_contents SET
+                min_x = min(coalesce(min_x, :minx), :minx), min_y = min(coalesce(min_y, :miny), :miny),
+                max_x = max(coalesce(max_x, :maxx), :maxx), max_y = max(coalesce(max_y, :maxy), :maxy)
+                WHERE lower(table_name) = lower(:table)""", {'minx': extent[0], 'miny': extent[1], 'maxx': extent[2], 'maxy': extent[3], 'table': table})
+        curs.execute("UPDATE gpkg_contents SET last_change = strftime('%Y-%m-%dT%H:%M:%fZ', 'now') WHERE lower(table_name) = lower(?)", [table])
+
+        for _name, sql in triggers:
+            curs.execute(sql)
+
+        curs.execute('COMMIT')
+    except BaseException:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+
+    return fids
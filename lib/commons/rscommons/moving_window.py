@@ -1,61 +1,235 @@
 """Creates a dictionary of the form {igoid: [window_length, window shapely object]}
 for each igo in the input dataset.
+
+The DGOs are read once into a LevelPathIndex sorted by level path and segment distance
+so that every window is answered with np.searchsorted instead of an attribute query.
 """
+from typing import Dict, List, Tuple
 
+import numpy as np
 from osgeo import ogr
 
 from rscommons import GeopackageLayer, VectorBase
 
 
-def get_moving_windows(igo: str, dgo: str, level_paths: list, distance: dict):
+class LevelPathIndex():
+    """DGOs sorted by (LevelPathI, seg_distance) for fast moving window lookups
 
-    windows = {}
+        index = LevelPathIndex.from_layer(dgo_path)
+        start, end = index.query(level_paths, distances, window_sizes)
+        dgoids = index.dgo_ids(start[0], end[0])
+    """
 
-    with GeopackageLayer(igo) as lyr_igo, GeopackageLayer(dgo) as lyr_dgo:
-        for level_path in level_paths:
-            for feat_seg_pt, *_, in lyr_igo.iterate_features(f'Finding windows on {level_path}', attribute_filter=f"LevelPathI = {level_path}"):
-                window_distance = distance[str(feat_seg_pt.GetField('stream_size'))]
-                dist = feat_seg_pt.GetField('seg_distance')
-                min_dist = dist - 0.5 * window_distance
-                max_dist = dist + 0.5 * window_distance
-                # sql_seg_poly = f"LevelPathI = {level_path} and seg_distance >= {min_dist} and seg_distance <= {max_dist}"
-                geom_window_sections = ogr.Geometry(ogr.wkbMultiPolygon)
-                window_length = 0.0
-                window_area = 0.0
-                for feat_seg_poly, *_ in lyr_dgo.iterate_features(attribute_filter=f"LevelPathI = {int(level_path)} and seg_distance >= {int(min_dist)} and seg_distance <= {int(max_dist)}"):
-                    window_length += feat_seg_poly.GetField('centerline_length')
-                    window_area += feat_seg_poly.GetField('segment_area')
-                    geom = feat_seg_poly.GetGeometryRef()
-                    if geom.GetGeometryName() in ['MULTIPOLYGON', 'GEOMETRYCOLLECTION']:
-                        for i in range(0, geom.GetGeometryCount()):
-                            geo = geom.GetGeometryRef(i)
-                            if geo.GetGeometryName() == 'POLYGON':
-                                geom_window_sections.AddGeometry(geo)
-                    else:
-                        geom_window_sections.AddGeometry(geom)
-
-                if not geom_window_sections.IsValid():
-                    geom_window_sections = geom_window_sections.MakeValid()
-                windows[feat_seg_pt.GetFID()] = [VectorBase.ogr2shapely(geom_window_sections), window_length, window_area]
+    def __init__(self, level_paths: np.ndarray, distances: np.ndarray, fids: np.ndarray, values: Dict[str, list] = None, geoms: list = None):
+        """
+        Args:
+            level_paths (np.ndarray): LevelPathI of each DGO
+            distances (np.ndarray): seg_distance of each DGO
+            fids (np.ndarray): feature id of each DGO
+            values (Dict[str, list], optional): {field: value for each DGO}. Defaults to None.
+            geoms (list, optional): geometry (WKB) of each DGO. Defaults to None.
+        """
+        level_paths = np.asarray(level_paths, dtype=np.float64)
+        distances = np.asarray(distances, dtype=np.float64)
+        order = np.lexsort((distances, level_paths))
+        positions = order.tolist()
 
-    return windows
+        self.level_paths = level_paths[order]
+        self.distances = distances[order]
+        self.fids = np.asarray(fids, dtype=np.int64)[order]
+        self._fid_list = self.fids.tolist()
+        self.values = {field: [vals[idx] for idx in positions] for field, vals in values.items()} if values is not None else {}
+        self.geoms = [geoms[idx] for idx in positions] if geoms is not None else None
+
+        # Start and end of each level path in the sorted arrays
+        self.unique_level_paths, self.starts = np.unique(self.level_paths, return_index=True)
+        self.ends = np.append(self.starts[1:], len(self.level_paths))
+
+    @classmethod
+    def from_layer(cls, dgo: str, fields: List[str] = None, geometry: bool = False) -> 'LevelPathIndex':
+        """Read the DGO layer once and index it
+
+        Args:
+            dgo (str): path to the DGO polygon layer
+            fields (List[str], optional): extra fields to load (e.g. segment_area). Defaults to None.
+            geometry (bool, optional): keep the DGO geometries (as WKB) in memory. Defaults to False.
+
+        Returns:
+            LevelPathIndex: the index
+        """
+        fields = fields if fields is not None else []
+        level_paths = []
+        distances = []
+        fids = []
+        values = {field: [] for field in fields}
+        geoms = []
+
+        with GeopackageLayer(dgo) as lyr_dgo:
+            for feat, *_ in lyr_dgo.iterate_features('Indexing DGOs by level path'):
+                level_path = feat.GetField('LevelPathI')
+                distance = feat.GetField('seg_distance')
+                if level_path is None or distance is None:
+                    continue
+                level_paths.append(level_path)
+                distances.append(distance)
+                fids.append(feat.GetFID())
+                for field in fields:
+                    values[field].append(feat.GetField(field))
+                if geometry:
+                    geom = feat.GetGeometryRef()
+                    geoms.append(bytes(geom.ExportToWkb()) if geom is not None else None)
+
+        return cls(level_paths, distances, fids, values, geoms if geometry else None)
+
+    def query(self, level_paths: np.ndarray, distances: np.ndarray, window_sizes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Range of DGOs in the sorted arrays that fall in each window. Windows select DGOs on the same level path
+        with int(distance - size / 2) <= seg_distance <= int(distance + size / 2).
+
+        Args:
+            level_paths (np.ndarray): level path of each window centre
+            distances (np.ndarray): seg_distance of each window centre
+            window_sizes (np.ndarray): window length for each centre. Pass an (n, k) array to get k window sizes
+                for every centre in a single sweep
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: start and end positions with the same shape as window_sizes
+        """
+        level_paths = np.asarray(level_paths, dtype=np.float64)
+        distances = np.asarray(distances, dtype=np.float64)
+        window_sizes = np.asarray(window_sizes, dtype=np.float64)
+        centres = distances.reshape(distances.shape + (1,) * (window_sizes.ndim - distances.ndim))
+        # The attribute queries this replaces truncated the limits to integers
+        min_dist = np.trunc(centres - 0.5 * window_sizes)
+        max_dist = np.trunc(centres + 0.5 * window_sizes)
+
+        group = np.searchsorted(self.unique_level_paths, level_paths)
+        found = group < len(self.unique_level_paths)
+        found[found] = self.unique_level_paths[group[found]] == level_paths[found]
+        group = np.where(found, group, 0).reshape(centres.shape)
+        found = np.broadcast_to(found.reshape(centres.shape), min_dist.shape).copy()
+
+        # The limits are whole numbers, so comparing them against floor(seg_distance) for the lower limit and
+        # ceil(seg_distance) for the upper one is exact. That turns (level path, distance) into one integer
+        # key and every window is answered with a single searchsorted
+        found &= np.isfinite(min_dist) & np.isfinite(max_dist)
+        min_dist = np.where(found, min_dist, 0).astype(np.int64)
+        max_dist = np.where(found, max_dist, 0).astype(np.int64)
+        lower = np.floor(self.distances).astype(np.int64)
+        upper = np.ceil(self.distances).astype(np.int64)
+        offset = min(lower.min(initial=0), min_dist.min(initial=0))
+        stride = max(upper.max(initial=0), max_dist.max(initial=0)) - offset + 1
+        dgo_groups = np.repeat(np.arange(len(self.unique_level_paths), dtype=np.int64), self.ends - self.starts) * stride - offset
+        start = _sorted_search(dgo_groups + lower, group * stride - offset + min_dist, 'left')
+        end = _sorted_search(dgo_groups + upper, group * stride - offset + max_dist, 'right')
+        start = np.where(found, start, 0)
+        end = np.where(found, end, 0)
+
+        return start, np.maximum(start, end)
+
+    def dgo_ids(self, start: int, end: int) -> List[int]:
+        """DGO ids in a range returned by query(), in FID order
+
+        Args:
+            start (int): start position
+            end (int): end position
+
+        Returns:
+            List[int]: DGO feature ids
+        """
+        return sorted(self._fid_list[start:end])
 
+    def positions(self, start: int, end: int) -> List[int]:
+        """Positions in the sorted arrays of the DGOs in a range, in FID order
 
-def moving_window_dgo_ids(igo: str, dgo: str, level_paths: list, distance: dict):
+        Args:
+            start (int): start position
+            end (int): end position
+
+        Returns:
+            List[int]: positions into fids, values and geoms
+        """
+        return sorted(range(start, end), key=self._fid_list.__getitem__)
+
+
+def _sorted_search(keys: np.ndarray, values: np.ndarray, side: str) -> np.ndarray:
+    """np.searchsorted with the values sorted first, which is far quicker for millions of random lookups
+    """
+    flat = values.ravel()
+    order = np.argsort(flat)
+    result = np.empty(flat.shape, dtype=np.int64)
+    result[order] = np.searchsorted(keys, flat[order], side=side)
+    return result.reshape(values.shape)
+
+
+def load_igo_windows(igo: str, level_paths: list, distance: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Read the IGO points on the requested level paths once
+
+    Args:
+        igo (str): path to the IGO point layer
+        level_paths (list): level paths to include, in processing order
+        distance (dict): {stream_size: window length}
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: IGO ids, level paths, seg_distances and window sizes,
+            ordered by level path (in level_paths order) and then FID
+    """
+    order = {}
+    for level_path in level_paths:
+        order.setdefault(float(level_path), len(order))
+
+    rows = []
+    with GeopackageLayer(igo) as lyr_igo:
+        for feat, *_ in lyr_igo.iterate_features('Finding windows'):
+            level_path = feat.GetField('LevelPathI')
+            if level_path is None or float(level_path) not in order:
+                continue
+            window_distance = distance[str(feat.GetField('stream_size'))]
+            rows.append((order[float(level_path)], feat.GetFID(), float(level_path), feat.GetField('seg_distance'), window_distance))
+
+    rows.sort(key=lambda row: (row[0], row[1]))
+    igo_ids = np.array([row[1] for row in rows], dtype=np.int64)
+    igo_level_paths = np.array([row[2] for row in rows], dtype=np.float64)
+    igo_distances = np.array([row[3] for row in rows], dtype=np.float64)
+    window_sizes = np.array([row[4] for row in rows], dtype=np.float64)
+
+    return igo_ids, igo_level_paths, igo_distances, window_sizes
+
+
+def get_moving_windows(igo: str, dgo: str, level_paths: list, distance: dict):
 
     windows = {}
 
-    with GeopackageLayer(igo) as lyr_igo, GeopackageLayer(dgo) as lyr_dgo:
-        for level_path in level_paths:
-            for feat_seg_pt, *_, in lyr_igo.iterate_features(f'Finding windows on {level_path}', attribute_filter=f"LevelPathI = {level_path}"):
-                window_distance = distance[str(feat_seg_pt.GetField('stream_size'))]
-                dist = feat_seg_pt.GetField('seg_distance')
-                min_dist = dist - 0.5 * window_distance
-                max_dist = dist + 0.5 * window_distance
+    index = LevelPathIndex.from_layer(dgo, ['centerline_length', 'segment_area'], geometry=True)
+    igo_ids, igo_level_paths, igo_distances, window_sizes = load_igo_windows(igo, level_paths, distance)
+    starts, ends = index.query(igo_level_paths, igo_distances, window_sizes)
+
+    for igoid, start, end in zip(igo_ids.tolist(), starts.tolist(), ends.tolist()):
+        geom_window_sections = ogr.Geometry(ogr.wkbMultiPolygon)
+        window_length = 0.0
+        window_area = 0.0
+        for pos in index.positions(start, end):
+            window_length += index.values['centerline_length'][pos]
+            window_area += index.values['segment_area'][pos]
+            geom = ogr.CreateGeometryFromWkb(index.geoms[pos])
+            if geom.GetGeometryName() in ['MULTIPOLYGON', 'GEOMETRYCOLLECTION']:
+                for i in range(0, geom.GetGeometryCount()):
+                    geo = geom.GetGeometryRef(i)
+                    if geo.GetGeometryName() == 'POLYGON':
+                        geom_window_sections.AddGeometry(geo)
+            else:
+                geom_window_sections.AddGeometry(geom)
 
-                dgoids = []
-                for feat_seg_poly, *_ in lyr_dgo.iterate_features(attribute_filter=f"LevelPathI = {int(level_path)} and seg_distance >= {int(min_dist)} and seg_distance <= {int(max_dist)}"):
-                    dgoids.append(feat_seg_poly.GetFID())
-                windows[feat_seg_pt.GetFID()] = dgoids
+        if not geom_window_sections.IsValid():
+            geom_window_sections = geom_window_sections.MakeValid()
+        windows[igoid] = [VectorBase.ogr2shapely(geom_window_sections), window_length, window_area]
 
     return windows
+
+
+def moving_window_dgo_ids(igo: str, dgo: str, level_paths: list, distance: dict) -> Dict[int, List[int]]:
+
+    index = LevelPathIndex.from_layer(dgo)
+    igo_ids, igo_level_paths, igo_distances, window_sizes = load_igo_windows(igo, level_paths, distance)
+    starts, ends = index.query(igo_level_paths, igo_distances, window_sizes)
+
+    return {igoid: index.dgo_ids(start, end) for igoid, start, end in zip(igo_ids.tolist(), starts.tolist(), ends.tolist())}
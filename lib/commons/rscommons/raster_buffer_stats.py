@@ -15,14 +15,12 @@
 #           Rasterio projection and shapes not intersecting raster
 #           https://gis.stackexchange.com/questions/303089/masking-geotiff-file-after-geojson-through-rasterio-input-shapes-do-not-overl
 # -------------------------------------------------------------------------------
-import rasterio
 from osgeo import gdal
 from shapely.geometry import shape
 from osgeo import ogr
 from osgeo import osr
-from rscommons import ProgressBar, Logger
-from rasterio.mask import mask
-import numpy as np
+from rscommons import Logger
+from rscommons.zonal_stats import zonal_statistics
 
 
 # def raster_buffer_stats(network, raster, buffer_dist, lookup, lookupcol, outputcol):
@@ -117,41 +115,21 @@ import numpy as np
 
 
 def raster_buffer_stats2(polygons, raster):
+    """ Mean, maximum, minimum, count and sum of the raster values within each polygon
+
+    Args:
+        polygons (dict): {id: shapely polygon} in the raster's spatial reference
+        raster (str): path to the raster
+
+    Returns:
+        dict: {id: {'Mean', 'Maximum', 'Minimum', 'Count', 'Sum'}} with None values where a polygon covers no valid cells
+    """
 
     log = Logger('Buffer Stats')
+    log.info('Summarizing raster values within {:,} polygon features...'.format(len(polygons)))
+
+    # All the polygons are labelled and summarized in a handful of windowed reads
+    results = zonal_statistics(raster, polygons)
 
-    # Open the raster and then loop over all polyline features
-    results = {}
-    with rasterio.open(raster) as src:
-        log.info('Looping over {:,} polygon features...'.format(len(polygons)))
-
-        progbar = ProgressBar(len(polygons), 50, "Buffer Stats")
-        counter = 0
-
-        for reach_id, polygon in polygons.items():
-            counter += 1
-            progbar.update(counter)
-            # print('ReachID {}'.format(feature.GetField('ReachID')))
-
-            # retrieve an array for the cells under the polygon
-            raw_raster, _out_transform = mask(src, [polygon], crop=True)
-            mask_raster = np.ma.masked_values(raw_raster, src.nodata)
-            # print(mask_raster)
-
-            mean = None
-            maximum = None
-            minimum = None
-            count = None
-            rsum = None
-
-            if not mask_raster.mask.all():
-                mean = float(mask_raster.mean())
-                maximum = float(mask_raster.max())
-                minimum = float(mask_raster.min())
-                count = int(mask_raster.count())
-                rsum = float(mask_raster.sum())
-
-            results[reach_id] = {'Mean': mean, 'Maximum': maximum, 'Minimum': minimum, 'Count': count, 'Sum': rsum}
-        progbar.finish()
     log.info('Process completed successfully.')
     return results
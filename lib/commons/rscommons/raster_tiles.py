@@ -0,0 +1,338 @@
+""" Tiled raster I/O within a memory budget
+
+    Purpose:  Whole-raster numpy arrays are allocated against a memory budget and spill over to
+              memory mapped scratch files once it is used up, so that peak RSS stays bounded on
+              large (e.g. 1m LiDAR) HUCs. Rasters are streamed in tiles of whole rows, optionally
+              with a halo of extra rows so that neighbourhood operations (morphology, filters)
+              give exactly the same result as on the whole raster.
+
+              The budget applies to the whole process: every function here defaults to the one
+              RasterMemory returned by process_memory(), so nested and concurrent users share it.
+
+              memory = process_memory()
+              array = read_array(raster_path, memory)
+              closed = memory.allocate(array.shape, bool)
+              apply_tiles(lambda tile: binary_closing(tile, iterations=2), closed, array, halo=4, memory=memory)
+              write_array(out_path, raster_path, closed, 'uint8')
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+from __future__ import annotations
+import atexit
+import mmap
+import os
+import tempfile
+import threading
+import weakref
+from typing import Callable, Iterator, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from rscommons import Logger
+
+# Environment variable (Mb) that overrides the default memory budget
+RASTER_MEMORY_ENV = 'RS_RASTER_MEMORY_MB'
+DEFAULT_MEMORY_MB = 2048
+
+# Fraction of the budget used by the tiles that are streamed through memory at any one time
+TILE_SHARE = 0.1
+
+
+class RasterMemory():
+    """Allocates whole-raster arrays within a memory budget
+
+    Arrays that fit in what is left of the budget are ordinary numpy arrays. Anything bigger is a
+    numpy memmap on a scratch file that is unlinked straight away (so it disappears with the array).
+    Memory is given back to the budget when an in-memory array is garbage collected.
+
+    Use process_memory() for the budget shared by the whole process. Separate instances are only
+    for tests and tools that need their own limit.
+    """
+
+    def __init__(self, budget_mb: float = None, scratch_dir: str = None):
+        """
+        Args:
+            budget_mb (float, optional): memory budget. Defaults to the RS_RASTER_MEMORY_MB environment variable or 2048Mb.
+            scratch_dir (str, optional): folder for the memory mapped scratch files. Defaults to the system temp folder.
+        """
+        if budget_mb is None:
+            budget_mb = float(os.environ.get(RASTER_MEMORY_ENV, DEFAULT_MEMORY_MB))
+        self.budget = int(budget_mb * 2 ** 20)
+        self.scratch_dir = scratch_dir
+        self.in_memory = 0
+        self.scratch_files = []
+        self.log = Logger('Raster Memory')
+        # Re-entrant because garbage collection can release an array while this thread holds the lock
+        self.lock = threading.RLock()
+
+    def __enter__(self) -> RasterMemory:
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self.close()
+
+    def close(self):
+        """Remove any scratch files that could not be unlinked while they were mapped (Windows)
+        """
+        for scratch_path in self.scratch_files:
+            try:
+                os.remove(scratch_path)
+            except OSError as err:
+                self.log.warning(f'Error cleaning up scratch file: {scratch_path} {err}')
+        self.scratch_files = []
+
+    def allocate(self, shape: Tuple[int, ...], dtype, fill=None) -> np.ndarray:
+        """A new array, in memory if the budget allows or memory mapped to a scratch file if not
+
+        Args:
+            shape (Tuple[int, ...]): array shape
+            dtype: numpy dtype
+            fill (optional): value to fill the array with. Defaults to None (uninitialised).
+
+        Returns:
+            np.ndarray: the array (a np.memmap when it is backed by a scratch file)
+        """
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with self.lock:
+            in_memory = self.in_memory + nbytes <= self.budget
+            if in_memory:
+                self.in_memory += nbytes
+
+        if in_memory:
+            try:
+                array = np.empty(shape, dtype=dtype)
+            except BaseException:
+                self._release(nbytes)
+                raise
+            weakref.finalize(array, self._release, nbytes)
+        else:
+            array = self._scratch_array(shape, dtype, nbytes)
+
+        if fill is not None:
+            for rows in iter_rows(shape[0], self.tile_rows(array)):
+                array[rows] = fill
+                self.trim(array, rows)
+        return array
+
+    def tile_rows(self, *arrays, halo: int = 0) -> int:
+        """Rows per tile so that one tile (plus halo) of each of these arrays fits in the tile share of the budget
+
+        Args:
+            arrays: arrays, or (width, dtype) tuples for rasters that are not in memory
+            halo (int, optional): extra rows read above and below each tile. Defaults to 0.
+
+        Returns:
+            int: rows per tile (at least 1)
+        """
+        row_bytes = 0
+        for array in arrays:
+            if isinstance(array, np.ndarray):
+                row_bytes += int(np.prod(array.shape[1:])) * array.dtype.itemsize
+            else:
+                row_bytes += array[0] * np.dtype(array[1]).itemsize
+        rows = int(self.budget * TILE_SHARE / max(1, row_bytes)) - 2 * halo
+        return max(1, rows)
+
+    def trim(self, array: np.ndarray, rows: slice):
+        """Write these rows of a scratch backed array out to disk and drop them from RSS
+
+        Does nothing for in-memory arrays.
+
+        Args:
+            array (np.ndarray): array returned by allocate
+            rows (slice): rows that have just been written
+        """
+        if not isinstance(array, np.memmap) or getattr(array, '_mmap', None) is None or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        row_bytes = int(np.prod(array.shape[1:])) * array.dtype.itemsize
+        start = (rows.start * row_bytes) // mmap.PAGESIZE * mmap.PAGESIZE
+        stop = rows.stop * row_bytes
+        array._mmap.flush(start, stop - start)
+        array._mmap.madvise(mmap.MADV_DONTNEED, start, stop - start)
+
+    def _scratch_array(self, shape, dtype, nbytes) -> np.memmap:
+        handle, scratch_path = tempfile.mkstemp(prefix='rstools_raster_memory_', suffix='.dat', dir=self.scratch_dir)
+        os.close(handle)
+        self.log.debug(f'Memory mapping {nbytes / 2 ** 20:,.0f}Mb array to {scratch_path}')
+        array = np.memmap(scratch_path, dtype=dtype, mode='w+', shape=shape)
+        try:
+            os.remove(scratch_path)
+        except OSError:
+            self.scratch_files.append(scratch_path)
+        return array
+
+    def _release(self, nbytes: int):
+        with self.lock:
+            self.in_memory -= nbytes
+
+
+_PROCESS_MEMORY = None
+_PROCESS_MEMORY_LOCK = threading.Lock()
+
+
+def process_memory() -> RasterMemory:
+    """The memory budget shared by every raster operation in this process
+
+    Created on first use from the RS_RASTER_MEMORY_MB environment variable. Worker processes
+    get their own budget.
+
+    Returns:
+        RasterMemory: the process memory budget
+    """
+    global _PROCESS_MEMORY
+    with _PROCESS_MEMORY_LOCK:
+        if _PROCESS_MEMORY is None:
+            _PROCESS_MEMORY = RasterMemory()
+            atexit.register(_PROCESS_MEMORY.close)
+        return _PROCESS_MEMORY
+
+
+def iter_rows(height: int, rows: int) -> Iterator[slice]:
+    """Slices of consecutive rows covering a raster
+
+    Args:
+        height (int): raster rows
+        rows (int): rows per tile
+
+    Yields:
+        slice: rows of the tile
+    """
+    for start in range(0, height, rows):
+        yield slice(start, min(height, start + rows))
+
+
+def iter_tiles(height: int, rows: int, halo: int = 0) -> Iterator[Tuple[slice, slice, slice]]:
+    """Tiles of whole rows with a halo of extra rows above and below (clipped to the raster)
+
+    Args:
+        height (int): raster rows
+        rows (int): rows per tile
+        halo (int, optional): extra rows to read around each tile. Defaults to 0.
+
+    Yields:
+        Tuple[slice, slice, slice]: (tile rows, rows to read including the halo, tile rows within the read rows)
+    """
+    for tile in iter_rows(height, rows):
+        read = slice(max(0, tile.start - halo), min(height, tile.stop + halo))
+        yield tile, read, slice(tile.start - read.start, tile.stop - read.start)
+
+
+def read_array(raster_path: str, memory: RasterMemory = None, band: int = 1, dtype=None) -> np.ndarray:
+    """Read a whole raster band into an array allocated within the memory budget, one tile at a time
+
+    Args:
+        raster_path (str): raster to read
+        memory (RasterMemory, optional): memory budget. Defaults to process_memory().
+        band (int, optional): band to read. Defaults to 1.
+        dtype (optional): dtype of the array. Defaults to the raster dtype.
+
+    Returns:
+        np.ndarray: raw band values (nodata is not masked)
+    """
+    memory = memory if memory is not None else process_memory()
+    with rasterio.open(raster_path) as src:
+        dtype = dtype if dtype is not None else src.dtypes[band - 1]
+        array = memory.allocate((src.height, src.width), dtype)
+        for rows in iter_rows(src.height, memory.tile_rows(array)):
+            array[rows] = src.read(band, window=Window(0, rows.start, src.width, rows.stop - rows.start))
+            memory.trim(array, rows)
+    return array
+
+
+def iter_raster_tiles(raster_path: str, rows: int, halo: int = 0, band: int = 1) -> Iterator[Tuple[slice, np.ndarray, slice]]:
+    """Stream a raster band in tiles of whole rows without reading it all
+
+    Args:
+        raster_path (str): raster to read
+        rows (int): rows per tile
+        halo (int, optional): extra rows to read around each tile. Defaults to 0.
+        band (int, optional): band to read. Defaults to 1.
+
+    Yields:
+        Tuple[slice, np.ndarray, slice]: (tile rows, values including the halo, tile rows within the values)
+    """
+    with rasterio.open(raster_path) as src:
+        for tile, read, core in iter_tiles(src.height, rows, halo):
+            yield tile, src.read(band, window=Window(0, read.start, src.width, read.stop - read.start)), core
+
+
+def open_raster_like(raster_path: str, template_path: str, dtype, nodata=None, compress: bool = True):
+    """Open a new single band GeoTiff for writing with the same grid as a template raster
+
+    Args:
+        raster_path (str): output raster
+        template_path (str): raster to copy the size, transform and projection from
+        dtype: output dtype
+        nodata (optional): output nodata value. Defaults to None.
+        compress (bool, optional): deflate compression. Defaults to True.
+
+    Returns:
+        rasterio.io.DatasetWriter: open raster (close it or use it in a with statement)
+    """
+    with rasterio.open(template_path) as template:
+        profile = {'driver': 'GTiff', 'count': 1, 'dtype': np.dtype(dtype).name, 'width': template.width, 'height': template.height,
+                   'crs': template.crs, 'transform': template.transform, 'nodata': nodata}
+    if compress is True:
+        profile['compress'] = 'deflate'
+    return rasterio.open(raster_path, 'w', **profile)
+
+
+def write_array(raster_path: str, template_path: str, array: np.ndarray, dtype, nodata=None, memory: RasterMemory = None):
+    """Write a whole-raster array to a new GeoTiff one tile at a time
+
+    Args:
+        raster_path (str): output raster
+        template_path (str): raster with the same grid as the array
+        array (np.ndarray): values to write. Each tile is cast to dtype as it is written
+        dtype: output dtype
+        nodata (optional): output nodata value. Defaults to None.
+        memory (RasterMemory, optional): memory budget (sets the tile size). Defaults to process_memory().
+    """
+    memory = memory if memory is not None else process_memory()
+    with open_raster_like(raster_path, template_path, dtype, nodata) as dst:
+        for rows in iter_rows(array.shape[0], memory.tile_rows(array, (array.shape[1], dtype))):
+            dst.write(np.asarray(array[rows]).astype(dtype, copy=False), 1, window=Window(0, rows.start, dst.width, rows.stop - rows.start))
+
+
+def iter_array_tiles(*arrays: np.ndarray, halo: int = 0, memory: RasterMemory = None) -> Iterator[Tuple[slice, list, slice]]:
+    """Iterate over whole-raster arrays one tile (plus halo) at a time
+
+    Args:
+        arrays (np.ndarray): whole-raster arrays of the same shape
+        halo (int, optional): extra rows around each tile. Defaults to 0.
+        memory (RasterMemory, optional): memory budget (sets the tile size). Defaults to process_memory().
+
+    Yields:
+        Tuple[slice, list, slice]: (tile rows, tile of each array including the halo, tile rows within those tiles)
+    """
+    memory = memory if memory is not None else process_memory()
+    for tile, read, core in iter_tiles(arrays[0].shape[0], memory.tile_rows(*arrays, halo=halo), halo):
+        yield tile, [array[read] for array in arrays], core
+
+
+def apply_tiles(func: Callable[..., np.ndarray], out: np.ndarray, *arrays: np.ndarray, halo: int = 0, memory: RasterMemory = None) -> np.ndarray:
+    """Apply a function to the arrays one tile (plus halo) at a time
+
+    The function receives the tile of each array including the halo rows and returns an array of
+    the same shape. Only the tile rows of the result are kept, so a neighbourhood operation that
+    reaches no further than the halo gives the same answer as on the whole arrays.
+
+    Args:
+        func (Callable[..., np.ndarray]): function of one tile of each array
+        out (np.ndarray): whole-raster array to store the results in (may be one of the input arrays
+            when halo is 0)
+        arrays (np.ndarray): whole-raster arrays of the same shape
+        halo (int, optional): extra rows passed to func around each tile. Defaults to 0.
+        memory (RasterMemory, optional): memory budget (sets the tile size). Defaults to process_memory().
+
+    Returns:
+        np.ndarray: out
+    """
+    memory = memory if memory is not None else process_memory()
+    for tile, tiles, core in iter_array_tiles(*arrays, out, halo=halo, memory=memory):
+        out[tile] = func(*tiles[:-1])[core]
+        memory.trim(out, tile)
+    return out
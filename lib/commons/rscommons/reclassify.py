@@ -0,0 +1,189 @@
+""" Raster reclassification with numpy lookup tables
+
+    Purpose:  Reclassify categorical rasters (LANDFIRE vegetation codes etc.) without a python call
+              per cell. A value mapping is compiled once into a dense numpy array indexed by the
+              raster value (or a sorted key array for sparse codes) and then applied to whole blocks
+              at a time with fancy indexing. Several output rasters can be produced from a single
+              windowed read of the inputs.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+from typing import Callable, Dict, List
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from rscommons import Logger, ProgressBar
+
+# Dense lookup tables are used as long as the code range is no bigger than this
+MAX_DENSE_LUT = 2 ** 20
+# Rough upper bound on the number of cells read from each input at one time
+DEFAULT_MAX_CELLS = 2 ** 22
+
+
+class ReclassError(Exception):
+    """Raised when a raster value is not in the mapping and there is no default
+    """
+
+
+class LookupTable():
+    """A value mapping compiled into numpy arrays
+
+        lut = LookupTable({11: 1, 12: 0, 7292: 1}, default=-1, dtype='int16')
+        out = lut.apply(block, valid)
+    """
+
+    def __init__(self, mapping: Dict, default=None, dtype=np.float64):
+        """
+        Args:
+            mapping (Dict): {raster value: new value}. None values are treated as unmapped
+            default (optional): value for cells not in the mapping. None means raise a ReclassError. Defaults to None.
+            dtype (optional): numpy data type of the reclassified values. Defaults to np.float64.
+        """
+        self.default = default
+        self.dtype = np.dtype(dtype)
+        items = sorted((k, v) for k, v in mapping.items() if k is not None and v is not None)
+        self.keys = np.array([k for k, _v in items])
+        values = np.array([v for _k, v in items], dtype=self.dtype)
+
+        self.dense = len(items) > 0 and np.issubdtype(self.keys.dtype, np.integer) and int(self.keys[-1]) - int(self.keys[0]) < MAX_DENSE_LUT
+        if self.dense:
+            # Index straight into an array spanning min_key..max_key
+            self.offset = int(self.keys[0])
+            size = int(self.keys[-1]) - self.offset + 1
+            self.table = np.zeros(size, dtype=self.dtype)
+            self.known = np.zeros(size, dtype=bool)
+            self.table[self.keys - self.offset] = values
+            self.known[self.keys - self.offset] = True
+        else:
+            self.table = values
+
+    def lookup(self, values: np.ndarray):
+        """Look up an array of raster values
+
+        Args:
+            values (np.ndarray): raster values
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: reclassified values and a boolean array of which values were in the mapping
+        """
+        values = np.asarray(values)
+        if len(self.keys) == 0:
+            return np.zeros(values.shape, dtype=self.dtype), np.zeros(values.shape, dtype=bool)
+
+        if self.dense:
+            with np.errstate(invalid='ignore'):
+                idx = values.astype(np.int64) - self.offset
+            in_range = (idx >= 0) & (idx < len(self.table))
+            if np.issubdtype(values.dtype, np.floating):
+                # Non-integer codes can never be in an integer mapping
+                in_range &= values == np.floor(values)
+            idx = np.where(in_range, idx, 0)
+            return self.table[idx], in_range & self.known[idx]
+
+        # Sparse codes: binary search the sorted keys
+        idx = np.clip(np.searchsorted(self.keys, values), 0, len(self.keys) - 1)
+        found = self.keys[idx] == values
+        return self.table[idx], found
+
+    def apply(self, values: np.ndarray, valid: np.ndarray = None, fill=0) -> np.ndarray:
+        """Reclassify an array of raster values
+
+        Args:
+            values (np.ndarray): raster values
+            valid (np.ndarray, optional): boolean array of cells to reclassify. Defaults to every cell.
+            fill (optional): value for cells that are not valid. Defaults to 0.
+
+        Raises:
+            ReclassError: when a valid cell is not in the mapping and there is no default
+
+        Returns:
+            np.ndarray: reclassified values
+        """
+        out, found = self.lookup(values)
+        if valid is None:
+            valid = np.ones(out.shape, dtype=bool)
+
+        missing = valid & ~found
+        if missing.any():
+            if self.default is None:
+                raise ReclassError(f'Raster values missing from the reclassification: {np.unique(np.asarray(values)[missing]).tolist()}')
+            out[missing] = self.default
+        out[~valid] = fill
+        return out
+
+    def missing_values(self, values: np.ndarray, valid: np.ndarray = None) -> List:
+        """Unique raster values that are not in the mapping
+
+        Args:
+            values (np.ndarray): raster values
+            valid (np.ndarray, optional): boolean array of cells to consider. Defaults to every cell.
+
+        Returns:
+            List: the missing values
+        """
+        _out, found = self.lookup(values)
+        missing = ~found if valid is None else valid & ~found
+        return np.unique(np.asarray(values)[missing]).tolist()
+
+
+def valid_cells(data: np.ndarray, nodata) -> np.ndarray:
+    """Boolean array of the cells that are not nodata
+
+    Args:
+        data (np.ndarray): raster block
+        nodata: raster nodata value (may be None)
+
+    Returns:
+        np.ndarray: True where the cell holds data
+    """
+    if nodata is None:
+        return np.ones(data.shape, dtype=bool)
+    if np.isnan(nodata):
+        return ~np.isnan(data)
+    return data != nodata
+
+
+def reclassify_rasters(in_rasters: List[str], outputs: Dict[str, Callable], profile_updates: Dict = None, label: str = 'Reclassifying', max_cells: int = DEFAULT_MAX_CELLS):
+    """Write one or more output rasters from a single windowed pass over one or more input rasters.
+
+    Every output is produced by a function that receives the list of input blocks (in the order of in_rasters)
+    and returns the output block. The inputs must share the same grid.
+
+    Args:
+        in_rasters (List[str]): paths to the input rasters. The first one provides the output profile
+        outputs (Dict[str, Callable]): {output raster path: func(blocks) -> np.ndarray}
+        profile_updates (Dict, optional): changes to the output profile (dtype, nodata etc.). Defaults to None.
+        label (str, optional): progress bar label. Defaults to 'Reclassifying'.
+        max_cells (int, optional): cells to read from each input at one time. Defaults to DEFAULT_MAX_CELLS.
+    """
+
+    log = Logger('Reclassify')
+    sources = [rasterio.open(path) for path in in_rasters]
+    dests = []
+    try:
+        profile = sources[0].profile
+        if profile_updates is not None:
+            profile.update(profile_updates)
+        for src in sources[1:]:
+            if src.shape != sources[0].shape:
+                raise Exception(f'Raster {src.name} does not have the same dimensions as {sources[0].name}')
+
+        dests = [rasterio.open(path, 'w', **profile) for path in outputs.keys()]
+        height, width = sources[0].shape
+        strip_rows = max(1, max_cells // max(width, 1))
+        log.info(f'Writing {len(outputs)} raster(s) from {len(sources)} input(s) in {int(np.ceil(height / strip_rows))} window(s)')
+
+        progbar = ProgressBar(height, 50, label)
+        for row in range(0, height, strip_rows):
+            progbar.update(row)
+            window = Window(0, row, width, min(strip_rows, height - row))
+            blocks = [src.read(1, window=window) for src in sources]
+            for dest, func in zip(dests, outputs.values()):
+                dest.write(np.asarray(func(blocks)).astype(profile['dtype'], copy=False), 1, window=window)
+        progbar.finish()
+    finally:
+        for dataset in dests + sources:
+            dataset.close()
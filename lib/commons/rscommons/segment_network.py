@@ -16,7 +16,7 @@ import argparse
 import os
 import sys
 import traceback
-from osgeo import ogr, osr
+from osgeo import ogr
 from shapely.geometry import LineString, Point
 from rscommons import Logger, ProgressBar, initGDALOGRErrors, dotenv, get_shp_or_gpkg, VectorBase
 from rscommons.classes.vector_base import get_utm_zone_epsg
@@ -90,7 +90,7 @@ def segment_network(inpath: str, outpath: str, interval: float, minimum: float,
         transform_ref, transform = VectorBase.get_transform_from_epsg(in_lyr.spatial_ref, utm_epsg)
 
         # IN order to get accurate lengths we are going to need to project into some coordinate system
-        transform_back = osr.CoordinateTransformation(transform_ref, srs)
+        transform_back = VectorBase.get_transform(transform_ref, srs)
 
         # Create the output shapefile
         if create_layer is True:
@@ -21,6 +21,7 @@ from shapely.ops import unary_union
 from shapely.geometry import shape, mapping, Point, MultiPoint, LineString, MultiLineString, GeometryCollection, Polygon, MultiPolygon
 from rscommons import Logger, Raster, ProgressBar
 from rscommons.util import safe_makedirs, sizeof_fmt, get_obj_size
+from rscommons.srs_cache import cached_transform, epsg_spatial_ref
 
 NO_UI = os.environ.get('NO_UI') is not None
 
@@ -48,15 +49,14 @@ def get_transform_from_epsg(inSpatialRef, epsg):
         [type]: [description]
     """
     log = Logger('get_transform_from_epsg')
-    outSpatialRef = osr.SpatialReference()
-    outSpatialRef.ImportFromEPSG(int(epsg))
+    outSpatialRef = epsg_spatial_ref(epsg)
 
     # https://github.com/OSGeo/gdal/issues/1546
     outSpatialRef.SetAxisMappingStrategy(inSpatialRef.GetAxisMappingStrategy())
 
     log.info('Input spatial reference is {0}'.format(inSpatialRef.ExportToProj4()))
     log.info('Output spatial reference is {0}'.format(outSpatialRef.ExportToProj4()))
-    transform = osr.CoordinateTransformation(inSpatialRef, outSpatialRef)
+    transform = cached_transform(inSpatialRef, outSpatialRef)
     return outSpatialRef, transform
 
 
@@ -0,0 +1,71 @@
+""" Spatial Index
+
+    Purpose:  STRtree over a list of shapely geometries that answers queries with indexes into the list
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import warnings
+from typing import Iterable, List
+
+from shapely.errors import ShapelyDeprecationWarning
+from shapely.geometry.base import BaseGeometry
+from shapely.strtree import STRtree
+
+# Shapely 1.8 queries return geometries (or the items stored with them). Shapely 2 returns indexes into the tree
+SHAPELY_ITEMS = hasattr(STRtree, 'query_items')
+
+
+class IndexedSTRtree():
+    """STRtree whose queries give indexes into the geometries it was built from, in list order
+
+    None and empty geometries are left out of the tree and are never returned.
+
+        index = IndexedSTRtree(geometries)
+        for idx in index.intersecting(window):
+            ...
+    """
+
+    def __init__(self, geometries: Iterable[BaseGeometry]):
+        """
+        Args:
+            geometries (Iterable[BaseGeometry]): shapely geometries (None allowed)
+        """
+        self.geometries = list(geometries)
+        self._items = [idx for idx, geom in enumerate(self.geometries) if geom is not None and not geom.is_empty]
+        valid = [self.geometries[idx] for idx in self._items]
+
+        if len(valid) == 0:
+            self.tree = None
+        elif SHAPELY_ITEMS:
+            # Only 1.8 gets here so its warning that items go away in 2.0 doesn't apply
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', ShapelyDeprecationWarning)
+                self.tree = STRtree(valid, self._items)
+        else:
+            self.tree = STRtree(valid)
+
+    def query(self, geom: BaseGeometry) -> List[int]:
+        """Indexes of the geometries whose envelopes intersect the envelope of geom
+
+        Args:
+            geom (BaseGeometry): query geometry
+
+        Returns:
+            List[int]: sorted geometry indexes
+        """
+        if self.tree is None or geom is None or geom.is_empty:
+            return []
+        if SHAPELY_ITEMS:
+            return sorted(self.tree.query_items(geom))
+        return sorted(self._items[pos] for pos in self.tree.query(geom))
+
+    def intersecting(self, geom: BaseGeometry) -> List[int]:
+        """Indexes of the geometries that intersect geom
+
+        Args:
+            geom (BaseGeometry): query geometry
+
+        Returns:
+            List[int]: sorted geometry indexes
+        """
+        return [idx for idx in self.query(geom) if self.geometries[idx].intersects(geom)]
@@ -0,0 +1,161 @@
+""" Process-wide cache of coordinate transformations and spatial references
+
+    Purpose:  Building an osr.CoordinateTransformation means PROJ has to find and instantiate a
+              pipeline, and reading a raster's spatial reference means opening it with GDAL. The
+              VectorBase helpers that do both are called inside per-feature and per-DGO loops, so
+              the results are cached here:
+
+              - transforms by the source and target SRS (WKT2 plus axis mapping), per thread
+                because OSR transformations must not be shared between threads
+              - raster spatial references by absolute path and modification time
+              - EPSG spatial references by code
+
+              Spatial references are handed out as clones so callers are free to change their
+              axis mapping strategy. Forked child processes start with an empty cache.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import os
+import threading
+from typing import Dict
+
+from osgeo import gdal, osr
+
+
+class SRSCache():
+    """Thread safe cache of transforms and spatial references with hit and miss counters
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Empty the cache and zero the counters
+        """
+        self._lock = threading.Lock()
+        self._transforms = {}
+        self._rasters = {}
+        self._epsg = {}
+        self.stats = {'transform_hits': 0, 'transform_misses': 0, 'raster_hits': 0, 'raster_misses': 0, 'epsg_hits': 0, 'epsg_misses': 0}
+
+    def transform(self, in_srs: osr.SpatialReference, out_srs: osr.SpatialReference) -> osr.CoordinateTransformation:
+        """Transformation between two spatial references
+
+        Args:
+            in_srs (osr.SpatialReference): source SRS
+            out_srs (osr.SpatialReference): target SRS
+
+        Returns:
+            osr.CoordinateTransformation: transform (shared by every caller on this thread)
+        """
+        key = (threading.get_ident(), srs_key(in_srs), srs_key(out_srs))
+        with self._lock:
+            transform = self._transforms.get(key)
+            if transform is not None:
+                self.stats['transform_hits'] += 1
+                return transform
+            self.stats['transform_misses'] += 1
+
+        transform = osr.CoordinateTransformation(in_srs, out_srs)
+        with self._lock:
+            return self._transforms.setdefault(key, transform)
+
+    def raster_srs(self, raster_path: str) -> osr.SpatialReference:
+        """Spatial reference of a raster. Rewriting the raster invalidates the cached copy
+
+        Args:
+            raster_path (str): path to the raster
+
+        Returns:
+            osr.SpatialReference: a new copy of the raster's SRS
+        """
+        path = os.path.abspath(raster_path)
+        mtime = os.stat(path).st_mtime_ns
+        with self._lock:
+            cached = self._rasters.get(path)
+            if cached is not None and cached[0] == mtime:
+                self.stats['raster_hits'] += 1
+                return cached[1].Clone()
+            self.stats['raster_misses'] += 1
+
+        spatial_ref = osr.SpatialReference()
+        spatial_ref.ImportFromWkt(gdal.Open(path).GetProjectionRef())
+        with self._lock:
+            # Only the latest version of each raster is kept
+            self._rasters[path] = (mtime, spatial_ref)
+            return spatial_ref.Clone()
+
+    def epsg_srs(self, epsg: int) -> osr.SpatialReference:
+        """Spatial reference for an EPSG code
+
+        Args:
+            epsg (int): EPSG code
+
+        Returns:
+            osr.SpatialReference: a new copy of the SRS (with the default axis mapping strategy)
+        """
+        epsg = int(epsg)
+        with self._lock:
+            cached = self._epsg.get(epsg)
+            if cached is not None:
+                self.stats['epsg_hits'] += 1
+                return cached.Clone()
+            self.stats['epsg_misses'] += 1
+
+        spatial_ref = osr.SpatialReference()
+        spatial_ref.ImportFromEPSG(epsg)
+        with self._lock:
+            return self._epsg.setdefault(epsg, spatial_ref).Clone()
+
+
+def srs_key(spatial_ref: osr.SpatialReference) -> tuple:
+    """Hashable identity of a spatial reference including how it maps data axes
+
+    Args:
+        spatial_ref (osr.SpatialReference): spatial reference
+
+    Returns:
+        tuple: (WKT2, axis mapping strategy, data axis to SRS axis mapping)
+    """
+    return spatial_ref.ExportToWkt(['FORMAT=WKT2_2018']), spatial_ref.GetAxisMappingStrategy(), tuple(spatial_ref.GetDataAxisToSRSAxisMapping())
+
+
+_CACHE = SRSCache()
+if hasattr(os, 'register_at_fork'):
+    # Locks and OSR objects inherited from the parent can't be trusted in a forked child
+    os.register_at_fork(after_in_child=_CACHE.reset)
+
+
+def cached_transform(in_srs: osr.SpatialReference, out_srs: osr.SpatialReference) -> osr.CoordinateTransformation:
+    """Cached osr.CoordinateTransformation between two spatial references (see SRSCache.transform)
+    """
+    return _CACHE.transform(in_srs, out_srs)
+
+
+def raster_spatial_ref(raster_path: str) -> osr.SpatialReference:
+    """Cached spatial reference of a raster (see SRSCache.raster_srs)
+    """
+    return _CACHE.raster_srs(raster_path)
+
+
+def epsg_spatial_ref(epsg: int) -> osr.SpatialReference:
+    """Cached spatial reference for an EPSG code (see SRSCache.epsg_srs)
+    """
+    return _CACHE.epsg_srs(epsg)
+
+
+def srs_cache_stats() -> Dict[str, int]:
+    """Hit and miss counters for profiling
+
+    Returns:
+        Dict[str, int]: transform, raster and epsg hits and misses
+    """
+    with _CACHE._lock:
+        return dict(_CACHE.stats)
+
+
+def clear_srs_cache():
+    """Empty the cache and zero the counters
+    """
+    _CACHE.reset()
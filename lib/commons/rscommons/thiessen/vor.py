@@ -47,6 +47,8 @@ class NARVoronoi:
 
         # bake in region adjacency (I have no idea why it's not in by default)
         self.region_neighbour = []
+        self.neighbour_ids = np.zeros(0, dtype=np.int64)
+        self.neighbour_offsets = np.zeros(1, dtype=np.int64)
 
         # Transform everything back to where it was (with some minor floating point rounding problems)
         # Note that we will use the following and NOT anything from inside _vor
@@ -59,20 +61,27 @@ class NARVoronoi:
         self.point_region = self._vor.point_region
 
     def calculate_neighbours(self):
-        self.region_neighbour = []
-        # Find which regions are next to which other regions
-        progbar = ProgressBar(len(self._vor.regions), 50, "baking in region adjacency")
-        counter = 0
-        for idx, reg in enumerate(self._vor.regions):
-            counter += 1
-            progbar.update(counter)
-            adj = []
-            for idy, reg2 in enumerate(self._vor.regions):
-                # Adjacent if we have two matching vertices (neighbours share a wall)
-                if idx != idy and len(set(reg) - (set(reg) - set(reg2))) >= 2:
-                    adj.append(idy)
-            self.region_neighbour.append(adj)
-        progbar.finish()
+        """Find which regions share a wall, straight from the Voronoi ridges
+
+        Every ridge separates the regions of the two input points in ridge_points so the adjacency
+        comes from one pass over the ridges rather than comparing every region with every other one.
+
+        The neighbours of region i are neighbour_ids[neighbour_offsets[i]:neighbour_offsets[i + 1]]
+        (ascending) and region_neighbour[i] is the same slice.
+        """
+        num_regions = len(self._vor.regions)
+        self.log.info('baking in region adjacency')
+
+        # Both directions of every ridge, as (region, neighbour) pairs
+        ridge_regions = self._vor.point_region[self._vor.ridge_points]
+        pairs = np.concatenate([ridge_regions, ridge_regions[:, ::-1]])
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        pairs = np.unique(pairs, axis=0)
+
+        self.neighbour_ids = pairs[:, 1]
+        self.neighbour_offsets = np.zeros(num_regions + 1, dtype=np.int64)
+        np.cumsum(np.bincount(pairs[:, 0], minlength=num_regions), out=self.neighbour_offsets[1:])
+        self.region_neighbour = np.split(self.neighbour_ids, self.neighbour_offsets[1:-1])
 
     def collectCenterLines(self, rivershape, flipIsland=None):
         """
@@ -88,6 +97,11 @@ class NARVoronoi:
         regions = []
         if len(self.region_neighbour) == 0:
             self.log.warning('Neighbours are empty. Have you run calculate_neighbours() before collectCenterLines?')
+
+        # First point in each region (-1 for none). Reversed so the lowest point index wins
+        region_point = np.full(len(self._vor.regions), -1, dtype=np.int64)
+        region_point[self._vor.point_region[::-1]] = np.arange(len(self._vor.point_region))[::-1]
+
         for idx, reg in enumerate(self.region_neighbour):
             # obj will have everything we need to know.
             obj = {
@@ -95,9 +109,8 @@ class NARVoronoi:
                 "side": 1,
                 "adjacents": reg
             }
-            lookupregion = np.where(self._vor.point_region == idx)
-            if len(lookupregion[0]) > 0:
-                ptidx = lookupregion[0][0]
+            if region_point[idx] >= 0:
+                ptidx = region_point[idx]
                 point = self.points[int(ptidx)]
                 if flipIsland is not None and point.island == flipIsland:
                     obj["side"] = point.side * -1
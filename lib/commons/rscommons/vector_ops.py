@@ -8,6 +8,7 @@
 # Date:     Nov 16, 2020
 # -------------------------------------------------------------------------------
 import os
+import math
 import sqlite3
 from collections import Counter
 from copy import copy
@@ -409,34 +410,34 @@ def load_attributes(in_layer_path: str, id_field: str, fields: list) -> dict:
         # [networkLr.SetAttributeFilter('{} is not null'.format(field)) for field in [veg_field, drain_field, hydq2_field, hydlow_field, length_field, slope_field]]
         # layer.SetAttributeFilter("iGeo_Slope > 0 and iGeo_DA > 0")
 
-        print('{:,} features in polygon ShapeFile {}'.format(in_layer.ogr_layer.GetFeatureCount(), in_layer.filepath))
+        columns = in_layer.read_columns(fields=[id_field] + fields, geometry=False)
+        print('{:,} features in polygon ShapeFile {}'.format(len(columns['fid']), in_layer.filepath))
 
-        feature_values = {}
-
-        for feature, _counter, _progbar in in_layer.iterate_features("loading attributes"):
-            reach = feature.GetField(id_field)
-            feature_values[reach] = {}
-
-            for field in fields:
-                feature_values[reach][field] = feature.GetField(field)
+        # verify_field gives us the names as they are in the layer
+        ids = columns[in_layer.verify_field(id_field)].tolist()
+        # Null reals come back as NaN but callers expect None, like feature.GetField()
+        values = {field: [None if isinstance(value, float) and math.isnan(value) else value for value in columns[in_layer.verify_field(field)].tolist()] for field in fields}
+        feature_values = {reach: {field: values[field][idx] for field in fields} for idx, reach in enumerate(ids)}
 
     return feature_values
 
 
 def load_geometries(in_layer_path: str, id_field: str = None, epsg: int = None, spatial_ref: osr.SpatialReference = None) -> dict:
-    """[summary]
+    """Load the geometries of a layer into a dictionary keyed by FID or id_field
+
+    Empty, invalid, zero length and zero area geometries are skipped with a warning.
 
     Args:
-        in_layer_path (str): [description]
-        id_field (str, optional): [description]. Defaults to None.
-        epsg (int, optional): [description]. Defaults to None.
-        spatial_ref (osr.SpatialReference, optional): [description]. Defaults to None.
+        in_layer_path (str): path to the layer
+        id_field (str, optional): field to key the geometries by. Defaults to None (the FID).
+        epsg (int, optional): transform the geometries to this EPSG. Defaults to None.
+        spatial_ref (osr.SpatialReference, optional): transform the geometries to this spatial reference. Defaults to None.
 
     Raises:
-        VectorBaseException: [description]
+        VectorBaseException: when both epsg and spatial_ref are given
 
     Returns:
-        dict: [description]
+        dict: {id: shapely geometry}
     """
     log = Logger('load_geometries')
 
@@ -451,36 +452,28 @@ def load_geometries(in_layer_path: str, id_field: str = None, epsg: int = None,
         elif spatial_ref is not None:
             transform = in_layer.get_transform(in_layer.spatial_ref, spatial_ref)
 
-        features = {}
-
-        for feature, _counter, progbar in in_layer.iterate_features("Loading features"):
-
-            if id_field is None:
-                reach = feature.GetFID()
-            else:
-                reach = feature.GetField(id_field)
-
-            geom = feature.GetGeometryRef()
-            geo_type = geom.GetGeometryType()
-
-            new_geom = VectorBase.ogr2shapely(geom, transform=transform)
-
-            if new_geom.is_empty:
-                progbar.erase()  # get around the progressbar
-                log.warning('Empty feature with FID={} cannot be unioned and will be ignored'.format(feature.GetFID()))
-            elif not new_geom.is_valid:
-                progbar.erase()  # get around the progressbar
-                log.warning('Invalid feature with FID={} cannot be unioned and will be ignored'.format(feature.GetFID()))
-            # Filter out zero-length lines
-            elif geo_type in VectorBase.LINE_TYPES and new_geom.length == 0:
-                progbar.erase()  # get around the progressbar
-                log.warning('Zero Length for feature with FID={}'.format(feature.GetFID()))
-            # Filter out zero-area polys
-            elif geo_type in VectorBase.POLY_TYPES and new_geom.area == 0:
-                progbar.erase()  # get around the progressbar
-                log.warning('Zero Area for feature with FID={}'.format(feature.GetFID()))
-            else:
-                features[reach] = new_geom
+        # Read every geometry (and the ID field) at once then transform them all together
+        columns = in_layer.read_columns(fields=[id_field] if id_field is not None else [])
+        geoms = columns['geometry']
+        if transform is not None:
+            geoms = VectorBase.transform_shapely_array(geoms, transform)
+        fids = columns['fid'].tolist()
+        ids = columns[in_layer.verify_field(id_field)].tolist() if id_field is not None else fids
+
+    features = {}
+    for fid, reach, new_geom in zip(fids, ids, geoms):
+        if new_geom is None or new_geom.is_empty:
+            log.warning('Empty feature with FID={} cannot be unioned and will be ignored'.format(fid))
+        elif not new_geom.is_valid:
+            log.warning('Invalid feature with FID={} cannot be unioned and will be ignored'.format(fid))
+        # Filter out zero-length lines
+        elif new_geom.geom_type in ['LineString', 'MultiLineString'] and new_geom.length == 0:
+            log.warning('Zero Length for feature with FID={}'.format(fid))
+        # Filter out zero-area polys
+        elif new_geom.geom_type in ['Polygon', 'MultiPolygon'] and new_geom.area == 0:
+            log.warning('Zero Area for feature with FID={}'.format(fid))
+        else:
+            features[reach] = new_geom
 
     return features
 
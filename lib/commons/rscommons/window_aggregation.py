@@ -0,0 +1,161 @@
+""" Set-based aggregation of DGO metrics onto IGO moving windows
+
+    Purpose:  The moving windows built by rscommons.moving_window map every IGO onto a list of DGOs.
+              Instead of looking DGO values up one row at a time for every window, the windows are
+              flattened once into an array of DGO positions plus the window each one belongs to, so
+              sums and area weighted means for all IGOs become single numpy group-bys. Results are
+              written back with one executemany per table.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import sqlite3
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+class WindowIndex():
+    """Flattened moving windows
+
+        index = WindowIndex(windows, dgo_ids)
+        igo_means = index.weighted_mean(dgo_values, dgo_areas)
+    """
+
+    def __init__(self, windows: Dict[int, List[int]], dgo_ids: Sequence[int]):
+        """
+        Args:
+            windows (Dict[int, List[int]]): {igoid: [dgoids]} as returned by moving_window_dgo_ids
+            dgo_ids (Sequence[int]): DGO ids in the order of every DGO value array passed to this index
+
+        Raises:
+            KeyError: when a window refers to a DGO that is not in dgo_ids
+        """
+        self.igo_ids = np.array(list(windows.keys()), dtype=np.int64)
+        self.dgo_ids = np.asarray(dgo_ids, dtype=np.int64)
+
+        position = {dgoid: idx for idx, dgoid in enumerate(self.dgo_ids.tolist())}
+        counts = [len(dgoids) for dgoids in windows.values()]
+        # Position of every window member in the DGO arrays and the window it belongs to
+        self.members = np.fromiter((position[dgoid] for dgoids in windows.values() for dgoid in dgoids), dtype=np.int64, count=sum(counts))
+        self.groups = np.repeat(np.arange(len(self.igo_ids)), counts)
+        self.sizes = np.array(counts, dtype=np.int64)
+
+    def align(self, ids: Sequence[int], values: Sequence[float], missing: float = 0.0) -> np.ndarray:
+        """Arrange values keyed by DGO id into the order of the index's DGO arrays
+
+        Args:
+            ids (Sequence[int]): DGO ids of the values
+            values (Sequence[float]): one value per id
+            missing (float, optional): value for DGOs without one. Defaults to 0.0.
+
+        Returns:
+            np.ndarray: one value per DGO in dgo_ids order
+        """
+        return align_values(self.dgo_ids, ids, values, missing)
+
+    def sum(self, values: np.ndarray) -> np.ndarray:
+        """Sum of the DGO values in each window
+
+        Args:
+            values (np.ndarray): one value per DGO in dgo_ids order
+
+        Returns:
+            np.ndarray: one sum per IGO in igo_ids order (0 for empty windows)
+        """
+        return np.bincount(self.groups, weights=np.asarray(values, dtype=np.float64)[self.members], minlength=len(self.igo_ids))
+
+    def weighted_mean(self, values: np.ndarray, weights: np.ndarray) -> np.ndarray:
+        """Weighted mean of the DGO values in each window, typically weighted by DGO area
+
+        Args:
+            values (np.ndarray): one value per DGO in dgo_ids order
+            weights (np.ndarray): one weight per DGO in dgo_ids order
+
+        Returns:
+            np.ndarray: one mean per IGO in igo_ids order (0 for empty windows, NaN where the weights
+                of a window sum to zero)
+        """
+        weights = np.asarray(weights, dtype=np.float64)[self.members]
+        totals = np.bincount(self.groups, weights=weights, minlength=len(self.igo_ids))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            terms = np.asarray(values, dtype=np.float64)[self.members] * (weights / totals[self.groups])
+            means = np.bincount(self.groups, weights=terms, minlength=len(self.igo_ids))
+        means[(totals == 0) & (self.sizes > 0)] = np.nan
+        return means
+
+    def any(self, mask: np.ndarray) -> np.ndarray:
+        """Whether any DGO in each window is flagged
+
+        Args:
+            mask (np.ndarray): one boolean per DGO in dgo_ids order
+
+        Returns:
+            np.ndarray: one boolean per IGO in igo_ids order
+        """
+        return np.bincount(self.groups, weights=np.asarray(mask, dtype=np.float64)[self.members], minlength=len(self.igo_ids)) > 0
+
+
+def align_values(target_ids: np.ndarray, ids: Sequence[int], values: Sequence[float], missing: float = 0.0) -> np.ndarray:
+    """Arrange values keyed by id into the order of target_ids
+
+    Args:
+        target_ids (np.ndarray): the ids to produce values for
+        ids (Sequence[int]): ids of the values
+        values (Sequence[float]): one value per id
+        missing (float, optional): value for target ids without one. Defaults to 0.0.
+
+    Returns:
+        np.ndarray: one value per target id
+    """
+    target_ids = np.asarray(target_ids, dtype=np.int64)
+    ids = np.asarray(ids, dtype=np.int64)
+    out = np.full(len(target_ids), missing, dtype=np.float64)
+    if len(ids) == 0 or len(target_ids) == 0:
+        return out
+
+    sorter = np.argsort(ids, kind='stable')
+    pos = np.clip(np.searchsorted(ids, target_ids, sorter=sorter), 0, len(ids) - 1)
+    found = ids[sorter[pos]] == target_ids
+    out[found] = np.asarray(values, dtype=np.float64)[sorter[pos[found]]]
+    return out
+
+
+def category_fractions(ids: np.ndarray, categories: np.ndarray, counts: np.ndarray, selected: Sequence, exclude: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+    """Fraction of each feature's cells that fall in a set of categories, from a table of
+    (feature id, category, cell count) rows such as DGOConv or ReachFPAccess.
+
+    Args:
+        ids (np.ndarray): feature id of each row
+        categories (np.ndarray): category value of each row
+        counts (np.ndarray): cell count of each row
+        selected (Sequence): the categories to count
+        exclude (bool, optional): count every category except the selected ones. Defaults to False.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the ids that have at least one row in the selection and their fractions
+    """
+    unique_ids, inverse = np.unique(np.asarray(ids, dtype=np.int64), return_inverse=True)
+    counts = np.asarray(counts, dtype=np.float64)
+    in_selection = np.isin(categories, selected, invert=exclude)
+    totals = np.bincount(inverse, weights=counts, minlength=len(unique_ids))
+    selected_counts = np.bincount(inverse, weights=np.where(in_selection, counts, 0), minlength=len(unique_ids))
+    has_rows = np.bincount(inverse, weights=in_selection, minlength=len(unique_ids)) > 0
+    return unique_ids[has_rows], selected_counts[has_rows] / totals[has_rows]
+
+
+def update_values(curs: sqlite3.Cursor, table: str, id_field: str, ids: Sequence[int], columns: Dict[str, Sequence]):
+    """Write one or more columns of values back to a table with a single executemany.
+    NaN values are written as NULL.
+
+    Args:
+        curs (sqlite3.Cursor): database cursor
+        table (str): table to update
+        id_field (str): primary key field of the table
+        ids (Sequence[int]): id of each row to update
+        columns (Dict[str, Sequence]): {field name: one value per id}
+    """
+    fields = list(columns.keys())
+    sql = 'UPDATE {} SET {} WHERE {} = ?'.format(table, ', '.join(f'{field} = ?' for field in fields), id_field)
+    values = [np.asarray(columns[field]).tolist() for field in fields]
+    curs.executemany(sql, zip(*values, np.asarray(ids).tolist()))
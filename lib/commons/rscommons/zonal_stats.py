@@ -0,0 +1,212 @@
+""" Zonal statistics for many polygons over a single raster
+
+    Purpose:  Rather than calling rasterio.mask once per polygon this rasterizes the zones into a
+              label array and reads the raster one window at a time, accumulating the statistics
+              for every zone in that window with numpy bincounts. Polygons that overlap each other
+              (buffers, moving windows) are split into batches of non-overlapping zones so that
+              every cell can only carry one label per pass.
+
+    The results match the old masked approach: a cell belongs to a zone when its centre falls
+    inside the polygon (rasterio's default, all_touched=False) and nodata cells are ignored.
+
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+from typing import Any, Dict, Hashable, Iterator, List, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.features import rasterize
+from rasterio.windows import Window
+from shapely.geometry.base import BaseGeometry
+
+from rscommons import Logger
+from rscommons.spatial_index import IndexedSTRtree
+
+# Rough upper bound on the number of cells read (and labelled) at any one time
+DEFAULT_MAX_CELLS = 2 ** 22
+
+
+def zonal_statistics(raster_path: str, zones: Dict[Hashable, BaseGeometry], max_cells: int = DEFAULT_MAX_CELLS) -> Dict[Hashable, Dict[str, Any]]:
+    """Continuous statistics of a raster within each zone
+
+    Args:
+        raster_path (str): path to the raster. The zones must be in the raster's spatial reference
+        zones (Dict[Hashable, BaseGeometry]): {zone id: shapely polygon}
+        max_cells (int, optional): cells to read in each window. Defaults to DEFAULT_MAX_CELLS.
+
+    Returns:
+        Dict[Hashable, Dict[str, Any]]: {zone id: {'Mean', 'Maximum', 'Minimum', 'Count', 'Sum'}}. The values are None
+            for zones that do not cover any valid cells
+    """
+
+    keys = list(zones.keys())
+    count = np.zeros(len(keys), dtype=np.int64)
+    total = np.zeros(len(keys), dtype=np.float64)
+    minimum = np.full(len(keys), np.inf)
+    maximum = np.full(len(keys), -np.inf)
+
+    for zone_idx, labels, values in _iterate_zone_cells(raster_path, zones, max_cells):
+        # zone_idx maps the labels in this block (1..n) back to the position in keys
+        block_count = np.bincount(labels, minlength=len(zone_idx) + 1)[1:]
+        block_sum = np.bincount(labels, weights=values, minlength=len(zone_idx) + 1)[1:]
+        count[zone_idx] += block_count
+        total[zone_idx] += block_sum
+
+        # Min and max by sorting the cells by label and reducing each run
+        order = np.argsort(labels, kind='stable')
+        sorted_labels = labels[order]
+        sorted_values = values[order].astype(np.float64)
+        starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+        present = zone_idx[sorted_labels[starts] - 1]
+        minimum[present] = np.minimum(minimum[present], np.minimum.reduceat(sorted_values, starts))
+        maximum[present] = np.maximum(maximum[present], np.maximum.reduceat(sorted_values, starts))
+
+    results = {}
+    for idx, key in enumerate(keys):
+        if count[idx] > 0:
+            results[key] = {
+                'Mean': float(total[idx] / count[idx]),
+                'Maximum': float(maximum[idx]),
+                'Minimum': float(minimum[idx]),
+                'Count': int(count[idx]),
+                'Sum': float(total[idx])
+            }
+        else:
+            results[key] = {'Mean': None, 'Maximum': None, 'Minimum': None, 'Count': None, 'Sum': None}
+
+    return results
+
+
+def zonal_histogram(raster_path: str, zones: Dict[Hashable, BaseGeometry], max_cells: int = DEFAULT_MAX_CELLS) -> Dict[Hashable, Dict[Any, int]]:
+    """Cell count of every categorical raster value within each zone
+
+    Args:
+        raster_path (str): path to the raster. The zones must be in the raster's spatial reference
+        zones (Dict[Hashable, BaseGeometry]): {zone id: shapely polygon}
+        max_cells (int, optional): cells to read in each window. Defaults to DEFAULT_MAX_CELLS.
+
+    Returns:
+        Dict[Hashable, Dict[Any, int]]: {zone id: {raster value: cell count}} with the values in ascending order.
+            Raster values are numpy scalars of the raster data type.
+    """
+
+    keys = list(zones.keys())
+    histograms = [{} for _ in keys]
+
+    for zone_idx, labels, values in _iterate_zone_cells(raster_path, zones, max_cells):
+        # Encode (label, value) pairs into one integer so a single bincount does the whole block
+        unique_values, value_idx = np.unique(values, return_inverse=True)
+        codes = labels.astype(np.int64) * len(unique_values) + value_idx.ravel()
+        counts = np.bincount(codes)
+        for code in np.flatnonzero(counts):
+            label, val = divmod(int(code), len(unique_values))
+            hist = histograms[zone_idx[label - 1]]
+            raster_val = unique_values[val]
+            hist[raster_val] = hist.get(raster_val, 0) + int(counts[code])
+
+    return {key: dict(sorted(histograms[idx].items())) for idx, key in enumerate(keys)}
+
+
+def non_overlapping_batches(geometries: List[BaseGeometry]) -> List[List[int]]:
+    """Split geometries into batches where no two geometries in a batch share any interior area.
+
+    Greedy colouring: every geometry goes into the first batch that none of its overlapping
+    neighbours are already in. Zones that only touch along an edge can share a batch.
+
+    Args:
+        geometries (List[BaseGeometry]): shapely geometries
+
+    Returns:
+        List[List[int]]: batches of indexes into geometries
+    """
+
+    batch_of = [None] * len(geometries)
+    batches = []
+    index = IndexedSTRtree(geometries)
+
+    for idx, geom in enumerate(geometries):
+        taken = set()
+        for other_idx in index.query(geom):
+            other = geometries[other_idx]
+            if other_idx == idx or batch_of[other_idx] is None or batch_of[other_idx] in taken:
+                continue
+            if geom.intersects(other) and not geom.touches(other):
+                taken.add(batch_of[other_idx])
+        batch = next((b for b in range(len(batches)) if b not in taken), len(batches))
+        if batch == len(batches):
+            batches.append([])
+        batches[batch].append(idx)
+        batch_of[idx] = batch
+
+    return batches
+
+
+def _iterate_zone_cells(raster_path: str, zones: Dict[Hashable, BaseGeometry], max_cells: int) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+    """Walk the raster in row strips and yield the valid cells of each zone
+
+    Yields:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: (zone_idx, labels, values) where labels are 1..len(zone_idx),
+            zone_idx maps label - 1 back to the position of the zone in the zones dict and values are the
+            raster values of the labelled, non-nodata cells
+    """
+
+    log = Logger('Zonal Stats')
+    geometries = list(zones.values())
+
+    with rasterio.open(raster_path) as src:
+        inv_transform = ~src.transform
+        nodata = src.nodata
+        is_float = np.issubdtype(np.dtype(src.dtypes[0]), np.floating)
+
+        # Pixel extents of every zone, clipped to the raster
+        extents = np.zeros((len(geometries), 4), dtype=np.int64)  # row_min, row_max, col_min, col_max (exclusive max)
+        for idx, geom in enumerate(geometries):
+            if geom is None or geom.is_empty:
+                continue
+            minx, miny, maxx, maxy = geom.bounds
+            cols, rows = zip(*[inv_transform * (x, y) for x, y in ((minx, miny), (minx, maxy), (maxx, miny), (maxx, maxy))])
+            extents[idx] = [
+                max(0, int(np.floor(min(rows)))), min(src.height, int(np.ceil(max(rows)))),
+                max(0, int(np.floor(min(cols)))), min(src.width, int(np.ceil(max(cols))))
+            ]
+        has_cells = (extents[:, 1] > extents[:, 0]) & (extents[:, 3] > extents[:, 2])
+
+        batches = non_overlapping_batches(geometries)
+        if len(batches) > 1:
+            log.debug(f'{len(zones):,} overlapping zones split into {len(batches):,} batches')
+
+        for batch in batches:
+            batch = np.array([idx for idx in batch if has_cells[idx]], dtype=np.int64)
+            if len(batch) == 0:
+                continue
+            batch_extents = extents[batch]
+            col_off = int(batch_extents[:, 2].min())
+            width = int(batch_extents[:, 3].max()) - col_off
+            strip_rows = max(1, max_cells // max(width, 1))
+
+            row = int(batch_extents[:, 0].min())
+            row_end = int(batch_extents[:, 1].max())
+            while row < row_end:
+                strip_end = min(row + strip_rows, row_end)
+                in_strip = batch[(batch_extents[:, 0] < strip_end) & (batch_extents[:, 1] > row)]
+                if len(in_strip) > 0:
+                    strip_col = int(extents[in_strip, 2].min())
+                    window = Window(strip_col, row, int(extents[in_strip, 3].max()) - strip_col, strip_end - row)
+                    labels = rasterize(
+                        ((geometries[idx], label) for label, idx in enumerate(in_strip, start=1)),
+                        out_shape=(int(window.height), int(window.width)),
+                        transform=src.window_transform(window),
+                        fill=0,
+                        dtype='int32'
+                    )
+                    valid = labels > 0
+                    if valid.any():
+                        data = src.read(1, window=window)
+                        if nodata is not None:
+                            valid &= ~np.isclose(data, nodata) if is_float else data != nodata
+                        if is_float:
+                            valid &= ~np.isnan(data)
+                        if valid.any():
+                            yield in_strip, labels[valid], data[valid]
+                row = strip_end
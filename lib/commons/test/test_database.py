@@ -0,0 +1,120 @@
+""" Testing for the database loaders and writers
+
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+from shapely.geometry import LineString, Point
+
+from rscommons.database import close_connections, get_connection, load_attributes, load_table_columns, load_geometry_column, write_db_attributes
+from rscommons.gpkg_writer import gpkg_blobs
+
+
+def create_database(path: str):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE ReachAttributes (ReachID INTEGER PRIMARY KEY, iGeo_Slope REAL, iGeo_Len REAL, FCode INTEGER, Name TEXT)')
+    conn.execute('CREATE VIEW vwReaches AS SELECT * FROM ReachAttributes')
+    conn.executemany('INSERT INTO ReachAttributes VALUES (?, ?, ?, ?, ?)', [
+        (1, 0.01, 100.0, 46006, 'one'),
+        (2, None, 200.0, 46003, 'two'),
+        (3, 0.03, 300.0, 46006, None),
+        (4, 0.04, 400.0, 33600, 'four'),
+    ])
+    geoms = [LineString([(0, 0), (1, 1)]), None, Point(5, 6), LineString([(2, 2), (3, 3)])]
+    blobs, _boxes = gpkg_blobs(geoms, 4326)
+    conn.execute('CREATE TABLE ReachGeometry (fid INTEGER PRIMARY KEY, geom BLOB)')
+    conn.executemany('INSERT INTO ReachGeometry VALUES (?, ?)', enumerate(blobs, 1))
+    conn.commit()
+    conn.close()
+
+
+class DatabaseTest(unittest.TestCase):
+    """Loaders on the shared connection and the set-based writers
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.database = os.path.join(self.tmp_dir, 'outputs.gpkg')
+        create_database(self.database)
+
+    def tearDown(self):
+        close_connections()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_load_columns(self):
+        """Column arrays in ID order with the filters in the SQL
+        """
+        ids, columns = load_table_columns(self.database, 'vwReaches', 'ReachID', ['iGeo_Slope', 'FCode', 'Name'])
+        self.assertEqual(ids.tolist(), [1, 2, 3, 4])
+        np.testing.assert_array_equal(columns['iGeo_Slope'], [0.01, np.nan, 0.03, 0.04])
+        self.assertEqual(columns['FCode'].dtype, np.int64)
+        self.assertEqual(columns['Name'].tolist(), ['one', 'two', None, 'four'])
+
+        ids, columns = load_table_columns(self.database, 'vwReaches', 'ReachID', ['iGeo_Len'], 'FCode = ?', ids=[1, 2, 3], params=[46006])
+        self.assertEqual(ids.tolist(), [1, 3])
+        self.assertEqual(columns['iGeo_Len'].tolist(), [100.0, 300.0])
+
+        ids, columns = load_table_columns(self.database, 'vwReaches', 'ReachID', ['iGeo_Len'], ids=[])
+        self.assertEqual((len(ids), len(columns['iGeo_Len'])), (0, 0))
+
+    def test_load_attributes(self):
+        """The dictionary loaders still give {ID: {field: value}}
+        """
+        self.assertEqual(load_attributes(self.database, ['iGeo_Slope', 'Name'], 'iGeo_Slope IS NOT NULL'), {
+            1: {'iGeo_Slope': 0.01, 'Name': 'one'},
+            3: {'iGeo_Slope': 0.03, 'Name': None},
+            4: {'iGeo_Slope': 0.04, 'Name': 'four'},
+        })
+
+    def test_load_geometry_column(self):
+        """GeoPackage blobs decode to shapely geometries
+        """
+        ids, geoms = load_geometry_column(self.database, 'ReachGeometry', ids=[1, 2, 3])
+        self.assertEqual(ids.tolist(), [1, 2, 3])
+        self.assertEqual(geoms[0].wkt, 'LINESTRING (0 0, 1 1)')
+        self.assertIsNone(geoms[1])
+        self.assertEqual(geoms[2].wkt, 'POINT (5 6)')
+
+    def test_connection_reuse(self):
+        """One connection per database until the file is replaced
+        """
+        conn = get_connection(self.database)
+        load_table_columns(self.database, 'vwReaches', 'ReachID', ['FCode'])
+        self.assertIs(get_connection(self.database), conn)
+
+        # Writes through other connections are seen
+        with sqlite3.connect(self.database) as writer:
+            writer.execute('UPDATE ReachAttributes SET FCode = 1 WHERE ReachID = 1')
+        self.assertEqual(load_table_columns(self.database, 'vwReaches', 'ReachID', ['FCode'], ids=[1])[1]['FCode'].tolist(), [1])
+
+        # Replacing the file means a new connection. Keep the old file so its inode can't be reused
+        os.rename(self.database, self.database + '.old')
+        create_database(self.database)
+        self.assertIsNot(get_connection(self.database), conn)
+        self.assertEqual(load_table_columns(self.database, 'vwReaches', 'ReachID', ['FCode'], ids=[1])[1]['FCode'].tolist(), [46006])
+
+    def test_write_attributes(self):
+        """Every field written with one join, optionally clearing the rows that aren't written
+        """
+        write_db_attributes(self.database, {1: {'iGeo_Slope': 0.5, 'FCode': 1}, 3: {'FCode': 3}, 99: {'FCode': 99}}, ['iGeo_Slope', 'FCode'])
+        ids, columns = load_table_columns(self.database, 'vwReaches', 'ReachID', ['iGeo_Slope', 'FCode', 'iGeo_Len'])
+        self.assertEqual(ids.tolist(), [1, 2, 3, 4])
+        np.testing.assert_array_equal(columns['iGeo_Slope'], [0.5, np.nan, np.nan, np.nan])
+        np.testing.assert_array_equal(columns['FCode'], [1, np.nan, 3, np.nan])
+        self.assertEqual(columns['iGeo_Len'].tolist(), [100.0, 200.0, 300.0, 400.0])
+
+        write_db_attributes(self.database, {2: {'iGeo_Len': 20.0}}, ['iGeo_Len'], set_null_first=False, summarize=False)
+        self.assertEqual(load_table_columns(self.database, 'vwReaches', 'ReachID', ['iGeo_Len'])[1]['iGeo_Len'].tolist(), [100.0, 20.0, 300.0, 400.0])
+
+        # The write pragmas only last for the write
+        conn = sqlite3.connect(self.database)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+""" Testing for the FIS response surfaces
+
+"""
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import skfuzzy as fuzz
+from skfuzzy import control as ctrl
+
+from rscommons.fis_surface import FISSurface, compute_fis, fis_axis
+
+
+def build_fis():
+    """Small two input control system
+    """
+    input1 = ctrl.Antecedent(np.arange(0, 1, 0.01), 'input1')
+    input2 = ctrl.Antecedent(np.arange(0, 10, 0.1), 'input2')
+    result = ctrl.Consequent(np.arange(0, 1, 0.01), 'result')
+
+    input1['low'] = fuzz.trapmf(input1.universe, [0, 0, 0.3, 0.6])
+    input1['high'] = fuzz.trapmf(input1.universe, [0.3, 0.6, 1, 1])
+    input2['low'] = fuzz.trapmf(input2.universe, [0, 0, 4, 6])
+    input2['high'] = fuzz.trapmf(input2.universe, [4, 6, 10, 10])
+    result['poor'] = fuzz.trimf(result.universe, [0, 0, 0.5])
+    result['good'] = fuzz.trimf(result.universe, [0.5, 1, 1])
+
+    return ctrl.ControlSystem([
+        ctrl.Rule(input1['low'] | input2['low'], result['poor']),
+        ctrl.Rule(input1['high'] & input2['high'], result['good'])
+    ])
+
+
+class FISSurfaceTest(unittest.TestCase):
+    """Exact array evaluation and the interpolated surface
+    """
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.fis = build_fis()
+        rng = np.random.default_rng(11)
+        self.inputs = {'input1': rng.uniform(-0.2, 1.2, 200), 'input2': rng.uniform(0, 12, 200)}
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_axis(self):
+        """Axes include every membership function breakpoint
+        """
+        input1 = [ant for ant in self.fis.antecedents if ant.label == 'input1'][0]
+        axis = fis_axis(input1, 2)
+        for knot in [0, 0.3, 0.6, 0.99]:
+            self.assertTrue(np.any(np.isclose(axis, knot)), knot)
+        self.assertTrue(np.all(np.diff(axis) > 0))
+
+    def test_compute_fis(self):
+        """Batched array evaluation matches compute() one element at a time
+        """
+        results = compute_fis(self.fis, self.inputs, 'result')
+        sim = ctrl.ControlSystemSimulation(self.fis)
+        for idx in range(0, 200, 20):
+            sim.input['input1'] = self.inputs['input1'][idx]
+            sim.input['input2'] = self.inputs['input2'][idx]
+            sim.compute()
+            self.assertEqual(results[idx], sim.output['result'])
+
+    def test_surface(self):
+        """The surface is exact on its grid, close in between and reused from the cache
+        """
+        surface = FISSurface(self.fis, 'result', 'test', segments=4, cache_folder=self.cache_dir)
+        mesh = np.meshgrid(*surface.axes, indexing='ij')
+        grid_inputs = {label: grid.ravel() for label, grid in zip(surface.labels, mesh)}
+        np.testing.assert_allclose(surface.evaluate(grid_inputs), surface.compute_exact(grid_inputs))
+
+        self.assertLess(surface.validate(self.inputs), 0.1)
+
+        cached = FISSurface(self.fis, 'result', 'test', segments=4, cache_folder=self.cache_dir)
+        self.assertEqual(cached.cache_path, surface.cache_path)
+        np.testing.assert_array_equal(cached.evaluate(self.inputs), surface.evaluate(self.inputs))
+
+
+if __name__ == '__main__':
+    unittest.main()
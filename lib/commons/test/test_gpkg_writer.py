@@ -0,0 +1,85 @@
+""" Testing for the bulk GeoPackage feature writer
+
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import ogr
+from shapely.geometry import LineString, Point, Polygon
+
+from rscommons import GeopackageLayer, VectorBase
+from rscommons.gpkg_writer import GeopackageWriterException, write_features
+
+
+class GeopackageWriterTest(unittest.TestCase):
+    """Bulk written features read back through OGR like ones written with create_feature
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.gpkg = os.path.join(self.tmp_dir, 'outputs.gpkg')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_layer(self, layer_name: str, geom_type: int):
+        with GeopackageLayer(self.gpkg, layer_name, write=True) as lyr:
+            lyr.create_layer(geom_type, epsg=26912, fields={'Name': ogr.OFTString, 'Value': ogr.OFTReal, 'Count': ogr.OFTInteger})
+            lyr.create_feature(Point(-10, -10) if geom_type == ogr.wkbPoint else LineString([(-10, -10), (-9, -9)]), {'Name': 'existing'})
+
+    def test_points(self):
+        """Points, attributes, the spatial index and the layer extent
+        """
+        self.create_layer('points', ogr.wkbPoint)
+        geoms = [Point(x, x * 2, 7) for x in range(100)] + [None]
+        fids = write_features(self.gpkg, 'points', geoms, {'Name': ['p{}'.format(x) for x in range(101)], 'Count': np.arange(101)}, batch_size=30)
+        self.assertEqual(fids, list(range(2, 103)))
+
+        with GeopackageLayer(self.gpkg, 'points') as lyr:
+            self.assertEqual(lyr.ogr_layer.GetFeatureCount(), 102)
+            self.assertEqual(lyr.ogr_layer.GetExtent(), (-10, 99, -10, 198))
+
+            feature = lyr.ogr_layer.GetFeature(12)
+            self.assertEqual(feature.GetField('Name'), 'p10')
+            self.assertEqual(feature.GetField('Count'), 10)
+            self.assertIsNone(feature.GetField('Value'))
+            # Flattened to 2D like create_feature
+            self.assertEqual(VectorBase.ogr2shapely(feature).wkt, 'POINT (10 20)')
+            self.assertIsNone(lyr.ogr_layer.GetFeature(102).GetGeometryRef())
+
+            # The spatial index finds the new features
+            lyr.ogr_layer.SetSpatialFilterRect(9.5, 18.5, 11.5, 22.5)
+            self.assertEqual(sorted(feature.GetFID() for feature in lyr.ogr_layer), [12, 13])
+
+        # The triggers are back so OGR keeps the index up to date afterwards
+        with GeopackageLayer(self.gpkg, 'points', write=True) as lyr:
+            lyr.create_feature(Point(500, 500))
+        with sqlite3.connect(self.gpkg) as conn:
+            self.assertEqual(conn.execute('SELECT id FROM rtree_points_geom WHERE minx > 400').fetchall(), [(103,)])
+
+    def test_lines(self):
+        """Lines are written with envelopes, and bad input leaves the layer untouched
+        """
+        self.create_layer('lines', ogr.wkbLineString)
+        lines = [LineString([(0, 0), (3, 4)]), Polygon([(0, 0), (10, 0), (10, -5)]).exterior]
+        write_features(self.gpkg, 'lines', lines, {'Value': [1.5, 2.5]})
+
+        with GeopackageLayer(self.gpkg, 'lines') as lyr:
+            lengths = {feature.GetFID(): (feature.GetGeometryRef().Length(), feature.GetField('Value')) for feature in lyr.ogr_layer}
+        self.assertEqual(lengths[2], (5, 1.5))
+        self.assertAlmostEqual(lengths[3][0], lines[1].length)
+
+        self.assertRaises(GeopackageWriterException, lambda: write_features(self.gpkg, 'lines', lines, {'Missing': [1, 2]}))
+        self.assertRaises(GeopackageWriterException, lambda: write_features(self.gpkg, 'lines', lines, {'Value': [1]}))
+        self.assertRaises(GeopackageWriterException, lambda: write_features(self.gpkg, 'nope', lines))
+        self.assertRaises(sqlite3.Error, lambda: write_features(self.gpkg, 'lines', lines, {'Name': [object(), 'b']}))
+        with GeopackageLayer(self.gpkg, 'lines') as lyr:
+            self.assertEqual(lyr.ogr_layer.GetFeatureCount(), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
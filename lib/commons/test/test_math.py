@@ -2,7 +2,8 @@
 
 """
 import unittest
-from rscommons.math import safe_eval, EquationError
+import numpy as np
+from rscommons.math import safe_eval, compile_equation, EquationError
 
 
 class MathTest(unittest.TestCase):
@@ -37,3 +38,50 @@ class MathTest(unittest.TestCase):
         with self.assertRaises(EquationError) as ctx:
             safe_eval("0.177 * (a ** 0.397) * (p ** 0.453)", {"a": 1})
         self.assertTrue("Equation produced non-numeric result" in ctx.exception.args[0])
+
+    def test_strict_equation(self):
+        """Strict compiled equations match safe_eval for each feature
+        """
+        eval_fn = "0.177 * (a ** 0.397) * (p ** 0.453)"
+        areas = np.array([0.0, 0.5, 12.0, 3500.0, 250000.0])
+        results = compile_equation(eval_fn, strict=True)({"a": areas, "p": 45})
+        self.assertEqual(results.shape, areas.shape)
+        self.assertEqual(results.dtype, np.float64)
+        for area, result in zip(areas, results):
+            self.assertAlmostEqual(result, safe_eval(eval_fn, {"a": area, "p": 45.0}), 10)
+
+        # Constant equations are broadcast to the length of the columns
+        np.testing.assert_array_equal(compile_equation("2 * p", strict=True)({"a": areas, "p": 3}), np.full(5, 6.0))
+
+        # Problems that safe_eval would report are raised so callers can fall back to it
+        with self.assertRaises(EquationError):
+            compile_equation("1 / a", strict=True)({"a": areas})
+        with self.assertRaises(EquationError):
+            compile_equation("a ** 0.5", strict=True)({"a": -areas})
+        with self.assertRaises(EquationError):
+            compile_equation("(0 - 1) ** 0.5", strict=True)({"a": areas})
+        with self.assertRaises(EquationError):
+            compile_equation(eval_fn, strict=True)({"a": areas})
+        with self.assertRaises(EquationError):
+            compile_equation("1+((a", strict=True)
+        with self.assertRaises(EquationError):
+            compile_equation("sqrt(a)", strict=True)
+        with self.assertRaises(EquationError):
+            compile_equation("a + b", strict=True)({"a": areas, "b": np.ones(3)})
+
+    def test_compile_equation(self):
+        """Compiled equations give the same values and dtype as eval
+        """
+        values = np.linspace(-5, 50, 200, dtype=np.float32)
+        for equation in ["2.71828**(-0.12*a)", "1/(1+2.71828**(-3.653 + 1.04*a))", "-a + +2 * (a - 1) ** 2", "3.5"]:
+            expected = eval(equation, {'__builtins__': None}, {'a': values})
+            actual = compile_equation(equation)({'a': values})
+            np.testing.assert_array_equal(actual, expected)
+            self.assertEqual(np.asarray(actual).dtype, np.asarray(expected).dtype)
+
+        # Only arithmetic is allowed
+        for equation in ["a.clip(0, 1)", "abs(a)", "a[0]", "a if a else 1", "'a'", "a % 2"]:
+            with self.assertRaises(ValueError):
+                compile_equation(equation)
+        with self.assertRaises(NameError):
+            compile_equation("a * b")({'a': values})
@@ -0,0 +1,61 @@
+""" Testing for the level path index behind the moving windows
+
+"""
+import unittest
+
+import numpy as np
+
+from rscommons.moving_window import LevelPathIndex
+
+
+class LevelPathIndexTest(unittest.TestCase):
+    """Compare searchsorted windows against filtering every DGO
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(9)
+        self.level_paths = rng.choice([70000400012345.0, 70000400012346.0, 3.0], 500)
+        # Plenty of whole number distances to land exactly on the window limits
+        self.distances = rng.integers(0, 5000, 500) + rng.choice([0, 0, 0.3, 0.5], 500)
+        self.fids = rng.permutation(np.arange(1, 501))
+        self.index = LevelPathIndex(self.level_paths, self.distances, self.fids, {'area': list(self.fids * 10)})
+
+    def brute_force(self, level_path, distance, size):
+        """The attribute query that the index replaces
+        """
+        min_dist = int(distance - 0.5 * size)
+        max_dist = int(distance + 0.5 * size)
+        keep = (self.level_paths == level_path) & (self.distances >= min_dist) & (self.distances <= max_dist)
+        return sorted(self.fids[keep].tolist())
+
+    def test_query(self):
+        """Single window size per centre, including a level path with no DGOs
+        """
+        rng = np.random.default_rng(4)
+        centres = rng.choice([70000400012345.0, 70000400012346.0, 3.0, 12.0], 200)
+        distances = rng.integers(-300, 5300, 200) + rng.choice([0, 0.5, 0.7], 200)
+        sizes = rng.choice([200, 400, 1200], 200)
+
+        starts, ends = self.index.query(centres, distances, sizes)
+        for idx in range(200):
+            self.assertEqual(self.index.dgo_ids(starts[idx], ends[idx]), self.brute_force(centres[idx], distances[idx], sizes[idx]))
+
+    def test_multiple_sizes(self):
+        """Several window sizes for every centre in one sweep
+        """
+        centres = np.array([70000400012345.0, 3.0])
+        distances = np.array([2500.5, 100.0])
+        sizes = np.array([[200, 400, 1200], [200, 400, 1200]])
+
+        starts, ends = self.index.query(centres, distances, sizes)
+        self.assertEqual(starts.shape, (2, 3))
+        for row in range(2):
+            for col in range(3):
+                self.assertEqual(self.index.dgo_ids(starts[row, col], ends[row, col]), self.brute_force(centres[row], distances[row], sizes[row, col]))
+
+        positions = self.index.positions(starts[0, 2], ends[0, 2])
+        self.assertEqual([self.index.values['area'][pos] for pos in positions], [fid * 10 for fid in self.brute_force(centres[0], distances[0], 1200)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+""" Testing for the tiled raster I/O
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from scipy.ndimage import binary_closing, uniform_filter
+
+from rscommons.raster_tiles import RasterMemory, apply_tiles, iter_raster_tiles, process_memory, read_array, write_array
+
+
+class RasterTilesTest(unittest.TestCase):
+    """Tiled reads, writes and neighbourhood operations match the whole-raster versions
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(11)
+        self.data = rng.random((301, 257)).astype(np.float32)
+        self.raster = os.path.join(self.tmp_dir, 'data.tif')
+        with rasterio.open(self.raster, 'w', driver='GTiff', height=self.data.shape[0], width=self.data.shape[1], count=1,
+                           dtype='float32', transform=from_origin(500, 1000, 2, 2), crs='EPSG:26912', nodata=-9999) as dst:
+            dst.write(self.data, 1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_budget(self):
+        """Arrays spill to scratch files once the budget is used up and give it back when freed
+        """
+        memory = RasterMemory(budget_mb=1, scratch_dir=self.tmp_dir)
+        in_memory = memory.allocate((512, 256), np.float64, fill=3)
+        self.assertNotIsInstance(in_memory, np.memmap)
+        self.assertEqual(memory.in_memory, 2 ** 20)
+
+        scratch = memory.allocate((10, 10), np.uint8, fill=1)
+        self.assertIsInstance(scratch, np.memmap)
+        self.assertEqual(int(scratch.sum()), 100)
+        # The scratch file is unlinked as soon as it is mapped
+        self.assertEqual(os.listdir(self.tmp_dir), ['data.tif'])
+
+        in_memory = None
+        self.assertEqual(memory.in_memory, 0)
+        self.assertNotIsInstance(memory.allocate((10, 10), np.uint8), np.memmap)
+
+        # Tiles get smaller as the halo grows but never run out
+        self.assertGreater(memory.tile_rows(self.data), memory.tile_rows(self.data, halo=10))
+        self.assertEqual(memory.tile_rows((10 ** 9, np.float64)), 1)
+
+    def test_process_memory(self):
+        """Arrays read without a budget all count against the one process budget
+        """
+        memory = process_memory()
+        self.assertIs(process_memory(), memory)
+
+        before = memory.in_memory
+        arrays = [read_array(self.raster) for _i in range(2)]
+        self.assertEqual(memory.in_memory - before, 2 * self.data.nbytes)
+        del arrays
+        self.assertEqual(memory.in_memory, before)
+
+    def test_read_write(self):
+        """Reading and writing a tile at a time round trips the raster
+        """
+        for budget in [0.05, 100]:
+            memory = RasterMemory(budget_mb=budget)
+            array = read_array(self.raster, memory)
+            np.testing.assert_array_equal(array, self.data)
+
+            out_path = os.path.join(self.tmp_dir, f'out_{budget}.tif')
+            write_array(out_path, self.raster, array > 0.5, np.int32, memory=memory)
+            with rasterio.open(out_path) as src:
+                self.assertEqual(src.dtypes[0], 'int32')
+                self.assertEqual(src.transform, from_origin(500, 1000, 2, 2))
+                np.testing.assert_array_equal(src.read(1), (self.data > 0.5).astype(np.int32))
+
+            tiles = list(iter_raster_tiles(self.raster, 7, halo=2))
+            self.assertEqual(len(tiles), 43)
+            np.testing.assert_array_equal(np.concatenate([values[core] for _tile, values, core in tiles]), self.data)
+
+    def test_apply_tiles(self):
+        """Neighbourhood operations with a big enough halo match the whole array
+        """
+        mask = self.data > 0.6
+        memory = RasterMemory(budget_mb=0.05)
+
+        closed = memory.allocate(mask.shape, bool)
+        apply_tiles(lambda tile: binary_closing(tile, iterations=2), closed, mask, halo=4, memory=memory)
+        np.testing.assert_array_equal(closed, binary_closing(mask, iterations=2))
+
+        smoothed = memory.allocate(self.data.shape, np.float32)
+        apply_tiles(lambda tile: uniform_filter(tile, size=5, mode='nearest'), smoothed, self.data, halo=2, memory=memory)
+        np.testing.assert_array_equal(smoothed, uniform_filter(self.data, size=5, mode='nearest'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+""" Testing for the columnar feature reader
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import ogr
+from shapely.geometry import Point, box
+
+from rscommons import GeopackageLayer, VectorBase
+from rscommons.gpkg_writer import write_features
+from rscommons.vector_ops import load_geometries
+
+
+class ReadColumnsTest(unittest.TestCase):
+    """Columns match what iterate_features gives one feature at a time
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.layer = os.path.join(self.tmp_dir, 'outputs.gpkg', 'points')
+        with GeopackageLayer(self.layer, write=True) as lyr:
+            lyr.create_layer(ogr.wkbPoint, epsg=26912, fields={'Name': ogr.OFTString, 'Value': ogr.OFTReal, 'Count': ogr.OFTInteger})
+
+        geoms = [Point(x, x % 10, 3) for x in range(1000)]
+        write_features(os.path.join(self.tmp_dir, 'outputs.gpkg'), 'points', geoms, {
+            'Name': ['p{}'.format(x) if x % 100 else None for x in range(1000)],
+            'Value': [x / 2 if x % 7 else None for x in range(1000)],
+            'Count': np.arange(1000)
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_read_columns(self):
+        """The whole layer and its nulls
+        """
+        with GeopackageLayer(self.layer) as lyr:
+            columns = lyr.read_columns()
+            expected = [(feature.GetFID(), VectorBase.ogr2shapely(feature).wkt, feature.GetField('Name'), feature.GetField('Value'), feature.GetField('Count'))
+                        for feature, _counter, _progbar in lyr.iterate_features()]
+
+        self.assertEqual(sorted(columns.keys()), ['Count', 'Name', 'Value', 'fid', 'geometry'])
+        self.assertEqual(columns['fid'].tolist(), [row[0] for row in expected])
+        self.assertEqual([geom.wkt for geom in columns['geometry']], [row[1] for row in expected])
+        self.assertEqual(columns['Name'].tolist(), [row[2] for row in expected])
+        np.testing.assert_array_equal(columns['Value'], np.array([row[3] for row in expected], dtype=np.float64))
+        self.assertEqual(columns['Count'].tolist(), [row[4] for row in expected])
+
+    def test_filters_and_chunks(self):
+        """Attribute and spatial filters, a subset of fields and chunks
+        """
+        with GeopackageLayer(self.layer) as lyr:
+            chunks = list(lyr.iterate_columns(50, fields=['count'], geometry=False, attribute_filter='Count >= 100', clip_shape=box(0, 0, 499.5, 4.5)))
+            self.assertEqual([len(chunk['fid']) for chunk in chunks], [50, 50, 50, 50])
+            self.assertEqual(list(chunks[0].keys()), ['fid', 'Count'])
+            counts = np.concatenate([chunk['Count'] for chunk in chunks])
+            self.assertEqual(counts.tolist(), [x for x in range(100, 500) if x % 10 < 5])
+
+            # The filters are cleared afterwards
+            self.assertEqual(len(lyr.read_columns(geometry=False, clip_rect=[0, 0, 10, 10])['fid']), 11)
+            self.assertEqual(len(lyr.read_columns(fields=[])['geometry']), 1000)
+            self.assertEqual(len(lyr.read_columns(attribute_filter='Count < 0')['fid']), 0)
+
+    def test_caller_filters(self):
+        """Filters set on ogr_layer by the caller are left alone
+        """
+        with GeopackageLayer(self.layer) as lyr:
+            lyr.ogr_layer.SetAttributeFilter('Count < 10')
+            self.assertEqual(len(lyr.read_columns(clip_rect=[0, 0, 4.5, 10])['fid']), 5)
+            self.assertEqual(lyr.ogr_layer.GetFeatureCount(), 10)
+
+            lyr.ogr_layer.SetAttributeFilter('')
+            lyr.ogr_layer.SetSpatialFilterRect(0, 0, 99.5, 10)
+            self.assertEqual(len([feature for feature, _counter, _progbar in lyr.iterate_features(attribute_filter='Count >= 50')]), 50)
+            self.assertEqual(lyr.ogr_layer.GetFeatureCount(), 100)
+
+    def test_load_geometries(self):
+        """Bulk loaded and transformed geometries match transforming each feature
+        """
+        with GeopackageLayer(self.layer) as lyr:
+            _out_ref, transform = VectorBase.get_transform_from_epsg(lyr.spatial_ref, 4326)
+            expected = {feature.GetField('Count'): VectorBase.ogr2shapely(feature, transform=transform) for feature, _counter, _progbar in lyr.iterate_features()}
+
+        geoms = load_geometries(self.layer, 'Count', epsg=4326)
+        self.assertEqual(sorted(geoms.keys()), sorted(expected.keys()))
+        for count, geom in expected.items():
+            self.assertAlmostEqual(geoms[count].x, geom.x, places=9)
+            self.assertAlmostEqual(geoms[count].y, geom.y, places=9)
+
+        self.assertEqual(load_geometries(self.layer)[11].wkt, 'POINT (10 0)')
+
+
+if __name__ == '__main__':
+    unittest.main()
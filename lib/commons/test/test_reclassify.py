@@ -0,0 +1,92 @@
+""" Testing for the lookup table reclassification
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+
+from rscommons.reclassify import LookupTable, ReclassError, reclassify_rasters, valid_cells
+
+
+class ReclassifyTest(unittest.TestCase):
+    """Compare the numpy lookup tables against a plain dictionary lookup
+    """
+
+    def test_dense_lookup(self):
+        """Integer codes with a small range use a dense table
+        """
+        mapping = {11: 1, 12: 0, 7292: 2, 3001: None}
+        lut = LookupTable(mapping, default=-1, dtype='int16')
+        self.assertTrue(lut.dense)
+
+        values = np.array([[11, 12, 7292], [5, 3001, -9999]])
+        valid = valid_cells(values, -9999)
+        out = lut.apply(values, valid, fill=-9999)
+        np.testing.assert_array_equal(out, [[1, 0, 2], [-1, -1, -9999]])
+        self.assertEqual(out.dtype, np.int16)
+        self.assertEqual(lut.missing_values(values, valid), [5, 3001])
+
+    def test_sparse_lookup(self):
+        """Codes spanning a huge range fall back to a sorted search
+        """
+        rng = np.random.default_rng(7)
+        keys = rng.choice(10 ** 9, 500, replace=False)
+        mapping = {int(k): float(v) for k, v in zip(keys, rng.random(500))}
+        lut = LookupTable(mapping)
+        self.assertFalse(lut.dense)
+
+        values = rng.choice(keys, (50, 40))
+        expected = np.vectorize(mapping.get)(values)
+        np.testing.assert_array_equal(lut.apply(values), expected)
+
+        with self.assertRaises(ReclassError):
+            lut.apply(np.array([keys[0], -1]))
+
+    def test_float_codes(self):
+        """Float rasters only match integer codes exactly
+        """
+        lut = LookupTable({1: 10, 2: 20}, default=0)
+        np.testing.assert_array_equal(lut.apply(np.array([1.0, 1.5, 2.0, np.nan])), [10, 0, 20, 0])
+
+    def test_reclassify_rasters(self):
+        """Several outputs from one windowed pass over two inputs
+        """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            rng = np.random.default_rng(3)
+            paths = []
+            for name in ['ex', 'hist']:
+                data = rng.integers(1, 5, (120, 90)).astype('int16')
+                data[rng.random(data.shape) < 0.1] = -9999
+                path = os.path.join(tmp_dir, f'{name}.tif')
+                with rasterio.open(path, 'w', driver='GTiff', height=120, width=90, count=1, dtype='int16',
+                                   transform=from_origin(0, 120, 1, 1), nodata=-9999) as dst:
+                    dst.write(data, 1)
+                paths.append(path)
+
+            lut = LookupTable({1: 5, 2: 6, 3: 7, 4: 8, -9999: -9999})
+            out_paths = [os.path.join(tmp_dir, 'out1.tif'), os.path.join(tmp_dir, 'out2.tif')]
+            reclassify_rasters(paths, {
+                out_paths[0]: lambda blocks: lut.apply(blocks[0], valid_cells(blocks[0], -9999), -9999),
+                out_paths[1]: lambda blocks: lut.apply(blocks[1]) - lut.apply(blocks[0])
+            }, max_cells=1000)
+
+            with rasterio.open(paths[0]) as ex, rasterio.open(paths[1]) as hist:
+                ex_data = ex.read(1)
+                hist_data = hist.read(1)
+            with rasterio.open(out_paths[0]) as out1, rasterio.open(out_paths[1]) as out2:
+                np.testing.assert_array_equal(out1.read(1), np.where(ex_data == -9999, -9999, ex_data + 4))
+                ex_val = np.where(ex_data == -9999, -9999, ex_data + 4)
+                hist_val = np.where(hist_data == -9999, -9999, hist_data + 4)
+                np.testing.assert_array_equal(out2.read(1), hist_val - ex_val)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
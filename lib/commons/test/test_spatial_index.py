@@ -0,0 +1,35 @@
+""" Testing for the indexed STRtree
+
+"""
+import unittest
+
+from shapely.geometry import Point, box
+
+from rscommons.spatial_index import IndexedSTRtree
+
+
+class SpatialIndexTest(unittest.TestCase):
+    """Queries give indexes into the original list, in order
+    """
+
+    def test_query(self):
+        """Envelope and intersection queries skip None and empty geometries
+        """
+        geometries = [box(0, 0, 1, 1), None, Point(5, 5).buffer(1), box(2, 2, 3, 3), Point(0, 0).buffer(0), box(0.5, 0.5, 2.5, 2.5)]
+        index = IndexedSTRtree(geometries)
+
+        self.assertEqual(index.query(box(0, 0, 10, 10)), [0, 2, 3, 5])
+        # The corner of the circle's envelope is outside the circle
+        self.assertEqual(index.query(box(5.8, 5.8, 6.5, 6.5)), [2])
+        self.assertEqual(index.intersecting(box(5.8, 5.8, 6.5, 6.5)), [])
+        self.assertEqual(index.intersecting(Point(0.75, 0.75)), [0, 5])
+        self.assertEqual(index.query(None), [])
+
+        # Identical geometries are still told apart
+        duplicates = IndexedSTRtree([box(0, 0, 1, 1)] * 3)
+        self.assertEqual(duplicates.intersecting(Point(0.5, 0.5)), [0, 1, 2])
+        self.assertEqual(IndexedSTRtree([None]).query(box(0, 0, 1, 1)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+""" Testing for the coordinate transformation and spatial reference cache
+
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from osgeo import gdal, osr
+
+from rscommons.srs_cache import cached_transform, clear_srs_cache, epsg_spatial_ref, raster_spatial_ref, srs_cache_stats
+
+
+def spatial_ref(epsg: int, axis_strategy=osr.OAMS_TRADITIONAL_GIS_ORDER) -> osr.SpatialReference:
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    srs.SetAxisMappingStrategy(axis_strategy)
+    return srs
+
+
+def other_strategy(axis_strategy):
+    return osr.OAMS_AUTHORITY_COMPLIANT if axis_strategy == osr.OAMS_TRADITIONAL_GIS_ORDER else osr.OAMS_TRADITIONAL_GIS_ORDER
+
+
+class SRSCacheTest(unittest.TestCase):
+    """Transforms and spatial references are only built once
+    """
+
+    def setUp(self):
+        clear_srs_cache()
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_transform(self):
+        """The same pair of spatial references gets the same transform, on the same thread only
+        """
+        transform = cached_transform(spatial_ref(4326), spatial_ref(26912))
+        self.assertIs(cached_transform(spatial_ref(4326), spatial_ref(26912)), transform)
+        self.assertEqual(srs_cache_stats()['transform_misses'], 1)
+        self.assertEqual(srs_cache_stats()['transform_hits'], 1)
+
+        expected = osr.CoordinateTransformation(spatial_ref(4326), spatial_ref(26912)).TransformPoint(-111.5, 41.7)
+        self.assertEqual(transform.TransformPoint(-111.5, 41.7), expected)
+
+        # A different axis mapping is a different transform
+        self.assertIsNot(cached_transform(spatial_ref(4326, osr.OAMS_AUTHORITY_COMPLIANT), spatial_ref(26912, osr.OAMS_AUTHORITY_COMPLIANT)), transform)
+
+        # OSR transforms are not shared between threads
+        other = []
+        thread = threading.Thread(target=lambda: other.append(cached_transform(spatial_ref(4326), spatial_ref(26912))))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], transform)
+        self.assertEqual(srs_cache_stats()['transform_misses'], 3)
+
+        # A thread that starts after another has finished (and may reuse its id) builds its own transform
+        for _thread in range(10):
+            thread = threading.Thread(target=lambda: cached_transform(spatial_ref(4326), spatial_ref(26912)))
+            thread.start()
+            thread.join()
+        self.assertEqual(srs_cache_stats()['transform_misses'], 13)
+        self.assertEqual(srs_cache_stats()['transform_hits'], 1)
+
+    def test_raster_srs(self):
+        """Raster spatial references are cached until the raster changes
+        """
+        raster = os.path.join(self.tmp_dir, 'raster.tif')
+        dataset = gdal.GetDriverByName('GTiff').Create(raster, 10, 10, 1, gdal.GDT_Byte)
+        dataset.SetProjection(spatial_ref(26912).ExportToWkt())
+        dataset = None
+
+        first = raster_spatial_ref(raster)
+        default_strategy = first.GetAxisMappingStrategy()
+        first.SetAxisMappingStrategy(other_strategy(default_strategy))
+        second = raster_spatial_ref(raster)
+        self.assertTrue(second.IsSame(spatial_ref(26912)))
+        # Callers get their own copy
+        self.assertEqual(second.GetAxisMappingStrategy(), default_strategy)
+        self.assertEqual((srs_cache_stats()['raster_misses'], srs_cache_stats()['raster_hits']), (1, 1))
+
+        dataset = gdal.Open(raster, gdal.GA_Update)
+        dataset.SetProjection(spatial_ref(26911).ExportToWkt())
+        dataset = None
+        os.utime(raster, ns=(os.stat(raster).st_atime_ns, os.stat(raster).st_mtime_ns + 10 ** 9))
+        self.assertTrue(raster_spatial_ref(raster).IsSame(spatial_ref(26911)))
+        self.assertEqual(srs_cache_stats()['raster_misses'], 2)
+
+    def test_epsg_srs(self):
+        """EPSG lookups are cached and handed out as copies
+        """
+        first = epsg_spatial_ref(26912)
+        default_strategy = first.GetAxisMappingStrategy()
+        first.SetAxisMappingStrategy(other_strategy(default_strategy))
+        second = epsg_spatial_ref('26912')
+        self.assertTrue(second.IsSame(first))
+        self.assertEqual(second.GetAxisMappingStrategy(), default_strategy)
+        self.assertEqual((srs_cache_stats()['epsg_misses'], srs_cache_stats()['epsg_hits']), (1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
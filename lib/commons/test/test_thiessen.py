@@ -0,0 +1,68 @@
+""" Testing for the Thiessen polygon neighbours
+
+"""
+import unittest
+
+import numpy as np
+from shapely.geometry import Point, Polygon
+
+from rscommons.thiessen.shapes import RiverPoint
+from rscommons.thiessen.vor import NARVoronoi
+
+
+def brute_force_neighbours(regions):
+    """The old pairwise comparison: regions are adjacent when they share at least two vertices
+    """
+    return [[idy for idy, reg2 in enumerate(regions) if idx != idy and len(set(reg) & set(reg2)) >= 2] for idx, reg in enumerate(regions)]
+
+
+class NARVoronoiTest(unittest.TestCase):
+    """Neighbours from the Voronoi ridges
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        # Two meandering banks of a channel with a scatter of interior points on either side
+        x = np.linspace(0, 1000, 120)
+        centre = 40 * np.sin(x / 90)
+        points = []
+        for side in [1, -1]:
+            for xval, yval in zip(x, centre + side * 20):
+                points.append(RiverPoint(Point(xval, yval), side=side))
+            for xval in rng.uniform(0, 1000, 40):
+                points.append(RiverPoint(Point(xval, 40 * np.sin(xval / 90) + side * rng.uniform(25, 60)), side=side))
+        self.points = points
+        self.rivershape = Polygon(list(zip(x, centre + 20)) + list(zip(x[::-1], centre[::-1] - 20)))
+
+    def test_neighbours(self):
+        """Every ridge neighbour is a brute force neighbour and the only brute force neighbours missing
+        are unbounded regions that merely share a vertex (and the infinite vertex -1)
+        """
+        vor = NARVoronoi(self.points)
+        vor.calculate_neighbours()
+        expected = brute_force_neighbours(vor.regions)
+
+        self.assertEqual(len(vor.region_neighbour), len(vor.regions))
+        for idx, neighbours in enumerate(vor.region_neighbour):
+            self.assertEqual(list(neighbours), sorted(neighbours))
+            self.assertTrue(set(neighbours.tolist()) <= set(expected[idx]))
+            for idy in set(expected[idx]) - set(neighbours.tolist()):
+                self.assertIn(-1, set(vor.regions[idx]) & set(vor.regions[idy]))
+            np.testing.assert_array_equal(vor.neighbour_ids[vor.neighbour_offsets[idx]:vor.neighbour_offsets[idx + 1]], neighbours)
+
+    def test_centerline(self):
+        """The centerline is the same as with the brute force neighbours
+        """
+        vor = NARVoronoi(self.points)
+        vor.calculate_neighbours()
+        centerline = vor.collectCenterLines(self.rivershape)
+
+        vor.region_neighbour = brute_force_neighbours(vor.regions)
+        expected = vor.collectCenterLines(self.rivershape)
+
+        self.assertTrue(centerline.equals(expected))
+        self.assertGreater(centerline.length, 900)
+
+
+if __name__ == '__main__':
+    unittest.main()
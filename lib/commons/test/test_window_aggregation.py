@@ -0,0 +1,90 @@
+""" Testing for the moving window aggregation
+
+"""
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+
+from rscommons.database import close_connections, load_table_columns
+from rscommons.window_aggregation import WindowIndex, align_values, category_fractions, update_values
+
+
+class WindowAggregationTest(unittest.TestCase):
+    """Compare the flattened windows against looping over each window
+    """
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.dgo_ids = rng.permutation(np.arange(1, 201))
+        self.areas = rng.uniform(1, 100, 200)
+        self.values = rng.uniform(0, 1, 200)
+        self.windows = {igoid: rng.choice(self.dgo_ids, rng.integers(1, 10), replace=False).tolist() for igoid in range(1, 51)}
+        self.windows[51] = []
+
+    def test_window_stats(self):
+        """Sums and area weighted means match a loop over each window
+        """
+        index = WindowIndex(self.windows, self.dgo_ids)
+        lookup = {dgoid: idx for idx, dgoid in enumerate(self.dgo_ids)}
+        sums = index.sum(self.values)
+        means = index.weighted_mean(self.values, self.areas)
+
+        for pos, (igoid, dgoids) in enumerate(self.windows.items()):
+            self.assertEqual(index.igo_ids[pos], igoid)
+            vals = [self.values[lookup[dgoid]] for dgoid in dgoids]
+            areas = [self.areas[lookup[dgoid]] for dgoid in dgoids]
+            self.assertAlmostEqual(sums[pos], sum(vals), 12)
+            self.assertAlmostEqual(means[pos], sum(val * area / sum(areas) for val, area in zip(vals, areas)), 12)
+
+        self.assertTrue(np.isnan(index.weighted_mean(self.values, np.zeros(200))[0]))
+        self.assertEqual(means[-1], 0)
+
+        with self.assertRaises(KeyError):
+            WindowIndex({1: [9999]}, self.dgo_ids)
+
+    def test_align_and_fractions(self):
+        """Values keyed by id and category fractions from a cell count table
+        """
+        np.testing.assert_array_equal(align_values([3, 1, 2, 7], [7, 2, 3], [0.7, 0.2, 0.3], missing=-1), [0.3, -1, 0.2, 0.7])
+
+        ids = np.array([1, 1, 1, 2, 2, 3])
+        categories = np.array([0, 80, 99, 80, 80, 5])
+        counts = np.array([2, 6, 2, 1, 3, 4])
+        fids, fractions = category_fractions(ids, categories, counts, [80])
+        np.testing.assert_array_equal(fids, [1, 2])
+        np.testing.assert_allclose(fractions, [0.6, 1.0])
+
+        fids, fractions = category_fractions(ids, categories, counts, [80, 99], exclude=True)
+        np.testing.assert_array_equal(fids, [1, 3])
+        np.testing.assert_allclose(fractions, [0.2, 1.0])
+
+    def test_database(self):
+        """Columns are written back in one executemany and read with the rscommons.database loader
+        """
+        tmp_dir = tempfile.mkdtemp()
+        database = os.path.join(tmp_dir, 'windows.sqlite')
+        try:
+            conn = sqlite3.connect(database)
+            curs = conn.cursor()
+            curs.execute('CREATE TABLE IGOAttributes (IGOID INTEGER PRIMARY KEY, Mean REAL, Total REAL)')
+            curs.executemany('INSERT INTO IGOAttributes (IGOID) VALUES (?)', [(igoid,) for igoid in range(1, 4)])
+
+            update_values(curs, 'IGOAttributes', 'IGOID', np.array([1, 3]), {'Mean': np.array([0.5, np.nan]), 'Total': [2, 4]})
+            conn.commit()
+            conn.close()
+
+            ids, columns = load_table_columns(database, 'IGOAttributes', 'IGOID', ['Mean', 'Total'])
+            np.testing.assert_array_equal(ids, [1, 2, 3])
+            np.testing.assert_array_equal(columns['Mean'], [0.5, np.nan, np.nan])
+            np.testing.assert_array_equal(columns['Total'], [2, np.nan, 4])
+        finally:
+            close_connections(database)
+            shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+""" Testing for the zonal statistics engine
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio.mask import mask
+from rasterio.transform import from_origin
+from shapely.geometry import Point, box
+
+from rscommons.zonal_stats import zonal_statistics, zonal_histogram, non_overlapping_batches
+
+
+class ZonalStatsTest(unittest.TestCase):
+    """Compare the labelled zone engine against one rasterio mask per polygon
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(42)
+
+        self.zones = {idx: Point(rng.uniform(480, 1100), rng.uniform(620, 1020)).buffer(rng.uniform(3, 60)) for idx in range(40)}
+        # Entirely off the raster
+        self.zones[99] = box(0, 0, 10, 10)
+
+        self.rasters = {}
+        for dtype, nodata in [('int16', -9999), ('float32', -9999.0)]:
+            data = rng.integers(0, 6, (200, 300)).astype(dtype)
+            data[rng.random(data.shape) < 0.1] = nodata
+            path = os.path.join(self.tmp_dir, f'{dtype}.tif')
+            with rasterio.open(path, 'w', driver='GTiff', height=data.shape[0], width=data.shape[1], count=1,
+                               dtype=dtype, transform=from_origin(500, 1000, 2, 2), nodata=nodata) as dst:
+                dst.write(data, 1)
+            self.rasters[dtype] = path
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_non_overlapping_batches(self):
+        """Overlapping zones can never share a batch but touching ones can
+        """
+        geoms = [box(0, 0, 10, 10), box(10, 0, 20, 10), box(5, 5, 15, 15), box(100, 100, 110, 110)]
+        batches = non_overlapping_batches(geoms)
+        self.assertEqual(batches, [[0, 1, 3], [2]])
+
+        batches = non_overlapping_batches(list(self.zones.values()))
+        for batch in batches:
+            for idx, first in enumerate(batch):
+                for second in batch[idx + 1:]:
+                    geom1 = self.zones[list(self.zones.keys())[first]]
+                    geom2 = self.zones[list(self.zones.keys())[second]]
+                    self.assertFalse(geom1.intersects(geom2) and not geom1.touches(geom2))
+
+    def test_zonal_statistics(self):
+        """Continuous stats match the masked array results, including with small windows
+        """
+        for path in self.rasters.values():
+            stats = zonal_statistics(path, self.zones, max_cells=5000)
+            with rasterio.open(path) as src:
+                for zone_id, polygon in self.zones.items():
+                    if zone_id == 99:
+                        self.assertIsNone(stats[zone_id]['Count'])
+                        continue
+                    masked = np.ma.masked_values(mask(src, [polygon], crop=True)[0], src.nodata)
+                    self.assertEqual(stats[zone_id]['Count'], int(masked.count()))
+                    self.assertAlmostEqual(stats[zone_id]['Sum'], float(masked.sum()), 3)
+                    self.assertAlmostEqual(stats[zone_id]['Mean'], float(masked.mean()), 5)
+                    self.assertEqual(stats[zone_id]['Minimum'], float(masked.min()))
+                    self.assertEqual(stats[zone_id]['Maximum'], float(masked.max()))
+
+    def test_zonal_histogram(self):
+        """Categorical counts match np.unique over the masked array
+        """
+        for path in self.rasters.values():
+            hist = zonal_histogram(path, self.zones, max_cells=7000)
+            with rasterio.open(path) as src:
+                for zone_id, polygon in self.zones.items():
+                    if zone_id == 99:
+                        self.assertEqual(hist[zone_id], {})
+                        continue
+                    masked = np.ma.masked_values(mask(src, [polygon], crop=True)[0], src.nodata)
+                    expected = {val: int(np.count_nonzero(masked == val)) for val in np.unique(masked) if val is not np.ma.masked}
+                    self.assertEqual(list(hist[zone_id].items()), list(expected.items()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,9 @@ import numpy as np
 from osgeo import ogr
 from rscommons import Logger, get_shp_or_gpkg, GeopackageLayer
 from rscommons.classes.vector_base import VectorBase, get_utm_zone_epsg
+from rscommons.database import load_table_columns
 from rscommons.vector_ops import get_geometry_unary_union
+from rscommons.window_aggregation import WindowIndex, update_values
 
 
 def infrastructure_attributes(windows: str, road: str, rail: str, canal: str, crossings: str, diversions: str,
@@ -111,53 +113,27 @@ def infrastructure_attributes(windows: str, road: str, rail: str, canal: str, cr
     conn = sqlite3.connect(out_gpkg_path)
     curs = conn.cursor()
 
-    for dgoid, vals in attribs.items():
-        curs.execute(f'UPDATE DGOAttributes SET Road_len = {vals["Road_len"]} WHERE DGOID = {dgoid}')
-        curs.execute(f'UPDATE DGOAttributes SET Rail_len = {vals["Rail_len"]} WHERE DGOID = {dgoid}')
-        curs.execute(f'UPDATE DGOAttributes SET Canal_len = {vals["Canal_len"]} WHERE DGOID = {dgoid}')
-        curs.execute(f'UPDATE DGOAttributes SET RoadX_ct = {vals["Roadx_ct"]} WHERE DGOID = {dgoid}')
-        curs.execute(f'UPDATE DGOAttributes SET DivPts_ct = {vals["DivPts_ct"]} WHERE DGOID = {dgoid}')
+    attrib_ids = list(attribs.keys())
+    dgo_values = {
+        'Road_len': [attribs[dgoid]['Road_len'] for dgoid in attrib_ids],
+        'Rail_len': [attribs[dgoid]['Rail_len'] for dgoid in attrib_ids],
+        'Canal_len': [attribs[dgoid]['Canal_len'] for dgoid in attrib_ids],
+        'RoadX_ct': [attribs[dgoid]['Roadx_ct'] for dgoid in attrib_ids],
+        'DivPts_ct': [attribs[dgoid]['DivPts_ct'] for dgoid in attrib_ids]
+    }
+    update_values(curs, 'DGOAttributes', 'DGOID', attrib_ids, dgo_values)
+    conn.commit()
 
     # summarize metrics from DGOs to IGOs using moving windows
-    for igoid, dgoids in windows.items():
-        road_len = 0
-        rail_len = 0
-        canal_len = 0
-        roadx_ct = 0
-        divpts_ct = 0
-        window_area = 0
-
-        for dgoid in dgoids:
-            road_len += curs.execute(f'SELECT Road_len FROM DGOAttributes WHERE DGOID = {dgoid}').fetchone()[0]
-            rail_len += curs.execute(f'SELECT Rail_len FROM DGOAttributes WHERE DGOID = {dgoid}').fetchone()[0]
-            canal_len += curs.execute(f'SELECT Canal_len FROM DGOAttributes WHERE DGOID = {dgoid}').fetchone()[0]
-            roadx_ct += curs.execute(f'SELECT RoadX_ct FROM DGOAttributes WHERE DGOID = {dgoid}').fetchone()[0]
-            divpts_ct += curs.execute(f'SELECT DivPts_ct FROM DGOAttributes WHERE DGOID = {dgoid}').fetchone()[0]
-            window_area += curs.execute(f'SELECT segment_area FROM DGOAttributes WHERE DGOID = {dgoid}').fetchone()[0]
-
-        if window_area == 0:
-            road_dens = 0
-            rail_dens = 0
-            canal_dens = 0
-            roadx_dens = 0
-            divpts_dens = 0
-        else:
-            road_dens = road_len / window_area
-            rail_dens = rail_len / window_area
-            canal_dens = canal_len / window_area
-            roadx_dens = roadx_ct / window_area
-            divpts_dens = divpts_ct / window_area
-
-        curs.execute(f'UPDATE IGOAttributes SET Road_len = {road_len} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET Rail_len = {rail_len} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET Canal_len = {canal_len} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET Roadx_ct = {roadx_ct} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET DivPts_ct = {divpts_ct} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET Road_dens = {road_dens} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET Rail_dens = {rail_dens} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET Canal_dens = {canal_dens} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET Roadx_dens = {roadx_dens} WHERE IGOID = {igoid}')
-        curs.execute(f'UPDATE IGOAttributes SET DivPts_dens = {divpts_dens} WHERE IGOID = {igoid}')
+    dgo_ids, dgo_columns = load_table_columns(out_gpkg_path, 'DGOAttributes', 'DGOID', ['segment_area'])
+    index = WindowIndex(windows, dgo_ids)
+    window_area = index.sum(dgo_columns['segment_area'])
+    igo_values = {}
+    for field, values in dgo_values.items():
+        igo_values[field] = index.sum(index.align(attrib_ids, values))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            igo_values[field.split('_')[0] + '_dens'] = np.where(window_area == 0, 0, igo_values[field] / window_area)
+    update_values(curs, 'IGOAttributes', 'IGOID', index.igo_ids, igo_values)
 
     conn.commit()
     conn.close()
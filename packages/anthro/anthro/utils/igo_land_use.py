@@ -5,7 +5,10 @@
     Dec 2022
 """
 import sqlite3
+import numpy as np
 from rscommons import Logger
+from rscommons.database import load_table_columns
+from rscommons.window_aggregation import WindowIndex, update_values
 
 
 def calculate_land_use(database: str, windows: dict):
@@ -23,26 +26,23 @@ def calculate_land_use(database: str, windows: dict):
                  ' INNER JOIN (SELECT DGOID, SUM(CellCount) AS TotalCells FROM DGOVegetation GROUP BY DGOID) AS RS ON DGOV.DGOID = RS.DGOID'
                  ' GROUP BY DGOV.DGOID')
 
-    results = {row[0]: {'LUI': row[1], 'Cumulative': 0.0} for row in curs.fetchall()}
-
-    for dgoid, lui in results.items():
-        luival = lui['LUI']
-        curs.execute(f'UPDATE DGOAttributes SET LUI = {luival} WHERE DGOID = {dgoid}')
-
-    for igoid, dgoids in windows.items():
-        lui_vals = []
-        areas = []
-        for dgoid in dgoids:
-            curs.execute(f"SELECT LUI, segment_area FROM DGOAttributes WHERE DGOID = {dgoid}")
-            res = curs.fetchone()
-            lui_vals.append(res[0])
-            areas.append(res[1])
-        if len(lui_vals) == len(areas) and None not in lui_vals and None not in areas:
-            igo_lui = sum([lui * (area / sum(areas)) for lui, area in zip(lui_vals, areas)])
-        else:
-            log.warning(f'Unable to calculate land use intensity for IGO ID {igoid}')  # vb too narrow to pick up veg cells
-            igo_lui = -9999
-        curs.execute(f'UPDATE IGOAttributes SET LUI = {igo_lui} WHERE IGOID = {igoid}')
+    dgo_lui = [(row[1], row[0]) for row in curs.fetchall()]
+    curs.executemany('UPDATE DGOAttributes SET LUI = ? WHERE DGOID = ?', dgo_lui)
+    conn.commit()
+
+    dgo_ids, columns = load_table_columns(database, 'DGOAttributes', 'DGOID', ['LUI', 'segment_area'])
+    index = WindowIndex(windows, dgo_ids)
+    # NULL values come back as NaN
+    luis = columns['LUI'].astype(np.float64)
+    areas = columns['segment_area'].astype(np.float64)
+
+    igo_lui = index.weighted_mean(luis, areas)
+    # vb too narrow to pick up veg cells
+    missing = index.any(np.isnan(luis) | np.isnan(areas))
+    for igoid in index.igo_ids[missing].tolist():
+        log.warning(f'Unable to calculate land use intensity for IGO ID {igoid}')
+    igo_lui[missing] = -9999
+    update_values(curs, 'IGOAttributes', 'IGOID', index.igo_ids, {'LUI': igo_lui})
 
     conn.commit()
     conn.close()
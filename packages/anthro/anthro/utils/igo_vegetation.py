@@ -5,13 +5,11 @@ Jordan Gilbert
 Dec 2022
 """
 import sqlite3
-import rasterio
-import numpy as np
 from osgeo import gdal
-from rasterio.mask import mask
 
 from rscommons import Logger, VectorBase, GeopackageLayer
 from rscommons.database import SQLiteCon
+from rscommons.zonal_stats import zonal_histogram
 
 
 def igo_vegetation(windows: dict, landuse_raster: str, out_gpkg_path: str):
@@ -25,26 +23,19 @@ def igo_vegetation(windows: dict, landuse_raster: str, out_gpkg_path: str):
     conversion_factor = VectorBase.rough_convert_metres_to_raster_units(landuse_raster, 1.0)
     cell_area = abs(geo_transform[1] * geo_transform[5]) / conversion_factor**2
 
-    with rasterio.open(landuse_raster) as src, \
-            GeopackageLayer(out_gpkg_path, 'DGOGeometry') as dgo_lyr:
-
-        veg_counts = []
+    dgo_geoms = {}
+    with GeopackageLayer(out_gpkg_path, 'DGOGeometry') as dgo_lyr:
         for dgo_ftr, *_ in dgo_lyr.iterate_features():
             dgoid = dgo_ftr.GetFID()
             dgo_ogr = dgo_ftr.GetGeometryRef()
             dgo_g = VectorBase.ogr2shapely(dgo_ogr)
-            dgo_geom = dgo_g.buffer(geo_transform[1] / 2)  # buffer by raster resolution to ensure we get all cells
-            try:
-                raw_raster = mask(src, [dgo_geom], crop=True)[0]
-                mask_raster = np.ma.masked_values(raw_raster, src.nodata)
+            dgo_geoms[dgoid] = dgo_g.buffer(geo_transform[1] / 2)  # buffer by raster resolution to ensure we get all cells
 
-                for oldvalue in np.unique(mask_raster):
-                    if oldvalue is not np.ma.masked:
-                        cell_count = np.count_nonzero(mask_raster == oldvalue)
-                        veg_counts.append([dgoid, int(oldvalue), cell_count * cell_area, cell_count])
-            except Exception as ex:
-                log.warning(f'Error obtaining land cover raster values for DGO ID {dgoid}')
-                log.warning(ex)
+    # The buffered DGOs overlap their neighbours so the zonal engine tallies them in non-overlapping batches
+    veg_counts = []
+    for dgoid, histogram in zonal_histogram(landuse_raster, dgo_geoms).items():
+        for value, cell_count in histogram.items():
+            veg_counts.append([dgoid, int(value), cell_count * cell_area, cell_count])
 
     with SQLiteCon(out_gpkg_path) as database:
         errs = 0
@@ -6,9 +6,9 @@ Dec 2022
 """
 import rasterio
 import sqlite3
-import numpy as np
 
 from rscommons import Logger
+from rscommons.reclassify import LookupTable, reclassify_rasters
 
 
 def lui_raster(existing_veg_raster, database, out_raster_path):
@@ -26,16 +26,13 @@ def lui_raster(existing_veg_raster, database, out_raster_path):
         results[row[0]] = row[1]
 
     with rasterio.open(existing_veg_raster) as src:
-        meta = src.profile
         ndval = src.nodata
-        veg_arr = src.read(1)
 
-    out_array = np.full(veg_arr.shape, ndval)
+    # Intensities are scaled to integers out of 100
+    intensity = LookupTable({veg_id: int(val * 100) for veg_id, val in results.items() if val is not None})
 
-    for j in range(veg_arr.shape[0]):
-        for i in range(veg_arr.shape[1]):
-            if veg_arr[j, i] != ndval and veg_arr[j, i] != -9999:
-                out_array[j, i] = int(results[veg_arr[j, i]] * 100)
+    def lui_block(blocks):
+        valid = (blocks[0] != ndval) & (blocks[0] != -9999)
+        return intensity.apply(blocks[0], valid, ndval)
 
-    with rasterio.open(out_raster_path, 'w', **meta) as dst:
-        dst.write(out_array, 1)
+    reclassify_rasters([existing_veg_raster], {out_raster_path: lui_block}, label='Land Use Intensity')
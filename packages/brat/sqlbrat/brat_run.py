@@ -55,7 +55,7 @@ Epochs = [
 ]
 
 
-def brat_run(project_root, csv_dir):
+def brat_run(project_root, csv_dir, fis_surface=False, validate_fis=False):
     """Run the BRAT model and calculat dam capacity
     as well as conservation and restoration.
 
@@ -64,6 +64,8 @@ def brat_run(project_root, csv_dir):
         csv_dir {str} -- Path to the directory containing the BRAT lookup CSV data files
         shapefile {str} -- Path to the existing BRAT reach segment ShapeFile
         project_root {str} -- (Optional) path to Riverscapes project directory
+        fis_surface {bool} -- (Optional) interpolate the FIS results from cached response surfaces
+        validate_fis {bool} -- (Optional) log the response surface error against the exact FIS
     """
 
     log = Logger('BRAT Run')
@@ -125,8 +127,8 @@ def brat_run(project_root, csv_dir):
         [vegetation_suitability(gpkg_path, buffer, prefix, ecoregion) for buffer in get_stream_buffers(gpkg_path)]
 
         # Run the vegetation and then combined FIS for this epoch
-        vegetation_fis(gpkg_path, epoch, prefix)
-        combined_fis(gpkg_path, epoch, prefix, max_drainage_area)
+        vegetation_fis(gpkg_path, epoch, prefix, fis_surface, validate_fis)
+        combined_fis(gpkg_path, epoch, prefix, max_drainage_area, fis_surface, validate_fis)
 
         orig_raster = os.path.join(project.project_dir, input_node.find('Raster[@id="{}"]/Path'.format(orig_id)).text)
         _veg_suit_raster_node, veg_suit_raster = project.add_project_raster(intermediate_node, LayerTypes[ltype], None, True)
@@ -244,6 +246,8 @@ def main():
     )
     parser.add_argument('project', help='Riverscapes project folder or project xml file', type=str, default=None)
     parser.add_argument('--csv_dir', help='(optional) directory where we can find updated lookup tables', action='store_true', default=False)
+    parser.add_argument('--fis_surface', help='(optional) interpolate the FIS from cached response surfaces instead of computing every reach exactly', action='store_true', default=False)
+    parser.add_argument('--validate_fis', help='(optional) log the largest response surface error against the exact FIS', action='store_true', default=False)
     parser.add_argument('--verbose', help='(optional) a little extra logging ', action='store_true', default=False)
     parser.add_argument('--debug', help='(optional) more output about things like memory usage. There is a performance cost', action='store_true', default=False)
 
@@ -264,10 +268,10 @@ def main():
         if args.debug is True:
             from rscommons.debug import ThreadRun
             memfile = os.path.join(logpath, 'brat_run_memusage.log')
-            retcode, max_obj = ThreadRun(brat_run, memfile, args.project, args.csv_dir)
+            retcode, max_obj = ThreadRun(brat_run, memfile, args.project, args.csv_dir, args.fis_surface, args.validate_fis)
             log.debug('Return code: {}, [Max process usage] {}'.format(retcode, max_obj))
         else:
-            brat_run(args.project, args.csv_dir)
+            brat_run(args.project, args.csv_dir, args.fis_surface, args.validate_fis)
 
     except Exception as e:
         log.error(e)
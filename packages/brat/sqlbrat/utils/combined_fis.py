@@ -14,16 +14,19 @@ import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
 from rscommons.database import load_attributes, write_db_attributes
-from rscommons import ProgressBar, Logger, dotenv
+from rscommons import Logger, dotenv
+from rscommons.fis_surface import evaluate_fis
 
 
-def combined_fis(database: str, label: str, veg_type: str, max_drainage_area: float):
+def combined_fis(database: str, label: str, veg_type: str, max_drainage_area: float, fis_surface: bool = False, validate_fis: bool = False):
     """
     Combined beaver dam capacity FIS
     :param network: Shapefile path containing necessary FIS inputs
     :param label: Plain English label identifying vegetation type ("Existing" or "Historical")
     :param veg_type: Vegetation type suffix added to end of output ShapeFile fields
     :param max_drainage_area: Max drainage above which features are not processed.
+    :param fis_surface: Interpolate the FIS from its cached response surface instead of computing it exactly
+    :param validate_fis: Log the maximum error of the response surface against the exact FIS
     :return: None
     """
 
@@ -37,13 +40,13 @@ def combined_fis(database: str, label: str, veg_type: str, max_drainage_area: fl
     fields = [veg_fis_field, 'iGeo_Slope', 'iGeo_DA', 'iHyd_SP2', 'iHyd_SPLow', 'iGeo_Len', 'ReachCode']
     reaches = load_attributes(database, fields, ' AND '.join(['({} IS NOT NULL)'.format(f) for f in fields]))
 
-    calculate_combined_fis(reaches, veg_fis_field, capacity_field, dam_count_field, max_drainage_area)
+    calculate_combined_fis(reaches, veg_fis_field, capacity_field, dam_count_field, max_drainage_area, fis_surface, validate_fis)
     write_db_attributes(database, reaches, [capacity_field, dam_count_field], log)
 
     log.info('Process completed successfully.')
 
 
-def calculate_combined_fis(feature_values: dict, veg_fis_field: str, capacity_field: str, dam_count_field: str, max_drainage_area: float):
+def calculate_combined_fis(feature_values: dict, veg_fis_field: str, capacity_field: str, dam_count_field: str, max_drainage_area: float, surface: bool = False, validate: bool = False):
     """
     Calculate dam capacity and density using combined FIS
     :param feature_values: Dictionary of features keyed by ReachID and values are dictionaries of attributes
@@ -51,6 +54,8 @@ def calculate_combined_fis(feature_values: dict, veg_fis_field: str, capacity_fi
     :param com_capacity_field: Attribute used to store the capacity result in feature_values
     :param com_density_field: Attribute used to store the capacity results in feature_values
     :param max_drainage_area: Reaches with drainage area greater than this threshold will have zero capacity
+    :param surface: Interpolate the FIS from its cached response surface instead of computing it exactly
+    :param validate: Log the maximum error of the response surface against the exact FIS
     :return: Insert the dam capacity and density values to the feature_values dictionary
     """
 
@@ -198,7 +203,6 @@ def calculate_combined_fis(feature_values: dict, veg_fis_field: str, capacity_fi
         ctrl.Rule(ovc['pervasive'] & sp2['blowout'] & splow['probably'] & slope['probably'], density['rare'])
     ])
 
-    comb_fis = ctrl.ControlSystemSimulation(comb_ctrl)
 
     # calculate defuzzified centroid value for density 'none' MF group
     # this will be used to re-classify output values that fall in this group
@@ -208,56 +212,35 @@ def calculate_combined_fis(feature_values: dict, veg_fis_field: str, capacity_fi
     mfx = fuzz.trimf(x_vals, [0, 0, 0.1])
     defuzz_centroid = round(fuzz.defuzz(x_vals, mfx, 'centroid'), 6)
 
-    progbar = ProgressBar(len(reachid_array), 50, "Combined FIS")
-    counter = 0
+    # Only compute FIS if the reach has less than user-defined max drainage area.
+    # this enforces a stream size threshold above which beaver dams won't persist and/or won't be built
+    # (reach code 33600 is always computed)
+    if max_drainage_area:
+        compute_mask = (drain_array < max_drainage_area) | (reachcode_array == 33600)
+    else:
+        compute_mask = np.ones(feature_count, dtype=bool)
+
+    log.info('Running combined FIS on {:,} of {:,} reaches'.format(int(compute_mask.sum()), feature_count))
+    capacity_array = np.zeros(feature_count, np.float64)
+    capacity_array[compute_mask] = evaluate_fis(comb_ctrl, {
+        'input1': veg_array[compute_mask],
+        'input2': hydq2_array[compute_mask],
+        'input3': hydlow_array[compute_mask],
+        'input4': slope_array[compute_mask]
+    }, 'result', 'brat_combined', surface, validate)
+
+    # Combined FIS result cannot be higher than limiting vegetation FIS result
+    capacity_array[compute_mask] = np.minimum(capacity_array[compute_mask], veg_array[compute_mask])
+    capacity_array[compute_mask & (np.round(capacity_array, 6) == defuzz_centroid)] = 0.0
 
     for i, reach_id in enumerate(reachid_array):
-
-        capacity = 0.0
-        # Only compute FIS if the reach has less than user-defined max drainage area.
-        # this enforces a stream size threshold above which beaver dams won't persist and/or won't be built
-        if not max_drainage_area or drain_array[i] < max_drainage_area:
-
-            comb_fis.input['input1'] = veg_array[i]
-            comb_fis.input['input2'] = hydq2_array[i]
-            comb_fis.input['input3'] = hydlow_array[i]
-            comb_fis.input['input4'] = slope_array[i]
-            comb_fis.compute()
-            capacity = comb_fis.output['result']
-
-            # Combined FIS result cannot be higher than limiting vegetation FIS result
-            if capacity > veg_array[i]:
-                capacity = veg_array[i]
-
-            if round(capacity, 6) == defuzz_centroid:
-                capacity = 0.0
-
-        elif drain_array[i] >= max_drainage_area and reachcode_array[i] == 33600:
-
-            comb_fis.input['input1'] = veg_array[i]
-            comb_fis.input['input2'] = hydq2_array[i]
-            comb_fis.input['input3'] = hydlow_array[i]
-            comb_fis.input['input4'] = slope_array[i]
-            comb_fis.compute()
-            capacity = comb_fis.output['result']
-
-            # Combined FIS result cannot be higher than limiting vegetation FIS result
-            if capacity > veg_array[i]:
-                capacity = veg_array[i]
-
-            if round(capacity, 6) == defuzz_centroid:
-                capacity = 0.0
-
+        capacity = capacity_array[i]
         count = capacity * (feature_values[reach_id]['iGeo_Len'] / 1000.0)
         count = 1.0 if 0 < count < 1 else count
 
-        feature_values[reach_id][capacity_field] = round(capacity, 2)
-        feature_values[reach_id][dam_count_field] = round(count, 2)
-
-        counter += 1
-        progbar.update(counter)
+        feature_values[reach_id][capacity_field] = float(round(capacity, 2))
+        feature_values[reach_id][dam_count_field] = float(round(count, 2))
 
-    progbar.finish()
     log.info('Done')
 
 
@@ -267,6 +250,8 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('database', help='BRAT SQLite database', type=argparse.FileType('r'))
     parser.add_argument('maxdrainage', help='Maximum drainage area', type=float)
+    parser.add_argument('--fis_surface', help='(optional) interpolate the FIS from cached response surfaces instead of computing every reach exactly', action='store_true', default=False)
+    parser.add_argument('--validate_fis', help='(optional) log the largest response surface error against the exact FIS', action='store_true', default=False)
     parser.add_argument('--verbose', help='(optional) verbose logging mode', action='store_true', default=False)
     args = dotenv.parse_args_env(parser)
 
@@ -276,7 +261,7 @@ def main():
     logg.setup(logPath=logfile, verbose=args.verbose)
 
     try:
-        combined_fis(args.database.name, 'existing', 'EX', args.maxdrainage)
+        combined_fis(args.database.name, 'existing', 'EX', args.maxdrainage, args.fis_surface, args.validate_fis)
         # combined_fis(args.network.name, 'historic', 'HPE', args.maxdrainage)
 
     except Exception as ex:
@@ -7,8 +7,10 @@ import argparse
 import os
 import sys
 import traceback
+import numpy as np
 from rscommons import Logger, dotenv
-from rscommons.database import write_db_attributes, SQLiteCon, load_attributes
+from rscommons.database import SQLiteCon, load_attributes, summarize_reaches
+from rscommons.math import compile_equation
 
 
 # This is the reach drainage area variable in the regional curve equations
@@ -40,11 +42,12 @@ def hydrology(gpkg_path: str, prefix: str, huc: str):
     with SQLiteCon(gpkg_path) as database:
         database.curs.execute('SELECT Q{} As Q FROM Watersheds WHERE WatershedID = ?'.format(prefix), [huc])
         equation = database.curs.fetchone()['Q']
-        equation = equation.replace('^', '**')
 
         if not equation:
             raise Exception('Missing {} hydrology formula for HUC {}'.format(prefix, huc))
 
+        equation = equation.replace('^', '**')
+
         log.info('Regional curve: {}'.format(equation))
 
         # Load the hydrology CONVERTED parameters for the HUC (the values will be in the same units as used in the regional equations)
@@ -65,56 +68,66 @@ def hydrology(gpkg_path: str, prefix: str, huc: str):
     results = calculate_hydrology(reaches, equation, params, drainage_conversion_factor, hydrology_field)
     log.info('{:,} reach hydrology values calculated.'.format(len(results)))
 
-    # Write the discharges to the database
-    write_db_attributes(gpkg_path, results, [hydrology_field])
-
-    # Convert discharges to stream power
+    # Write the discharges and convert them to stream power in a single transaction
     with SQLiteCon(gpkg_path) as database:
+        if len(results) > 0:
+            database.curs.execute('UPDATE ReachAttributes SET {} = NULL'.format(hydrology_field))
+            database.curs.executemany('UPDATE ReachAttributes SET {} = ? WHERE ReachID = ?'.format(hydrology_field),
+                                      [(values[hydrology_field], reachid) for reachid, values in results.items()])
         database.curs.execute('UPDATE ReachAttributes SET {0} = ROUND((1000 * 9.80665) * iGeo_Slope * ({1} * 0.028316846592), 2)'
                               ' WHERE ({1} IS NOT NULL) AND (iGeo_Slope IS NOT NULL)'.format(streampower_field, hydrology_field))
         database.conn.commit()
 
+    if len(results) > 0:
+        summarize_reaches(gpkg_path, hydrology_field)
+
     log.info('Hydrology calculation complete')
 
 
 def calculate_hydrology(reaches: dict, equation: str, params: dict, drainage_conversion_factor: float, field: str) -> dict:
     """ Perform the actual hydrology calculation
 
+    The equation is compiled once and evaluated over the drainage areas of all the reaches at once.
+    Division by zero and invalid operations (e.g. a negative number to a fractional power) raise
+    a FloatingPointError instead of producing inf or NaN discharges.
+
     Args:
-        reaches ([type]): [description]
-        equation ([type]): [description]
-        params ([type]): [description]
-        drainage_conversion_factor ([type]): [description]
-        field ([type]): [description]
+        reaches (dict): {reachid: {'iGeo_DA': drainage area}}
+        equation (str): regional curve equation using ** for powers
+        params (dict): {parameter: value} in the units of the equation
+        drainage_conversion_factor (float): converts reach drainage areas to the units of the equation
+        field (str): name of the discharge field in the results
 
     Raises:
-        ex: [description]
+        ex: when the equation is invalid or cannot be evaluated
 
     Returns:
-        [type]: [description]
+        dict: {reachid: {field: discharge}}
     """
 
-    results = {}
-
     log = Logger('Hydrology')
 
+    reach_ids = list(reaches.keys())
+    drainage = np.array([values['iGeo_DA'] for values in reaches.values()], dtype=np.float64)
+
     try:
-        # Loop over each reach
-        for reachid, values in reaches.items():
+        equation_fn = compile_equation(equation)
 
-            # Use the drainage area for the current reach and convert to the units used in the equation
-            params[DRNAREA_PARAM] = values['iGeo_DA'] * drainage_conversion_factor
+        # Use the drainage area for each reach and convert to the units used in the equation
+        columns = dict(params)
+        columns[DRNAREA_PARAM] = drainage * drainage_conversion_factor
 
-            # Execute the equation but restrict the use of all built-in functions
-            eval_result = eval(equation, {'__builtins__': None}, params)
-            results[reachid] = {field: eval_result}
+        with np.errstate(divide='raise', invalid='raise'):
+            discharges = np.broadcast_to(np.asarray(equation_fn(columns), dtype=np.float64), drainage.shape)
     except Exception as ex:
         [log.warning('{}: {}'.format(param, value)) for param, value in params.items()]
+        if len(drainage) > 0:
+            log.warning('{}: {} to {}'.format(DRNAREA_PARAM, drainage.min() * drainage_conversion_factor, drainage.max() * drainage_conversion_factor))
         log.warning('Hydrology formula failed: {}'.format(equation))
-        log.error('Error calculating {} hydrology')
+        log.error('Error calculating {} hydrology'.format(field))
         raise ex
 
-    return results
+    return {reachid: {field: discharge} for reachid, discharge in zip(reach_ids, discharges.tolist())}
 
 
 def main():
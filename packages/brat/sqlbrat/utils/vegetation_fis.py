@@ -13,12 +13,13 @@ import traceback
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
-from rscommons import Logger, ProgressBar, dotenv
+from rscommons import Logger, dotenv
 from rscommons.database import load_attributes
 from rscommons.database import write_db_attributes
+from rscommons.fis_surface import evaluate_fis
 
 
-def vegetation_fis(database: str, label: str, veg_type: str):
+def vegetation_fis(database: str, label: str, veg_type: str, fis_surface: bool = False, validate_fis: bool = False):
     """Calculate vegetation suitability for each reach in a BRAT
     SQLite database
 
@@ -26,6 +27,8 @@ def vegetation_fis(database: str, label: str, veg_type: str):
         database {str} -- Path to BRAT SQLite database
         label {str} -- Either 'historic' or 'existing'. Only used for lof messages.
         veg_type {str} -- Prefix either 'EX' for existing or 'HPE' for historic
+        fis_surface {bool} -- Interpolate the FIS from its cached response surface instead of computing it exactly
+        validate_fis {bool} -- Log the maximum error of the response surface against the exact FIS
     """
 
     log = Logger('Vegetation FIS')
@@ -36,18 +39,20 @@ def vegetation_fis(database: str, label: str, veg_type: str):
     out_field = 'oVC_{}'.format(veg_type)
 
     feature_values = load_attributes(database, [streamside_field, riparian_field], '({} IS NOT NULL) AND ({} IS NOT NULL)'.format(streamside_field, riparian_field))
-    calculate_vegegtation_fis(feature_values, streamside_field, riparian_field, out_field)
+    calculate_vegegtation_fis(feature_values, streamside_field, riparian_field, out_field, fis_surface, validate_fis)
     write_db_attributes(database, feature_values, [out_field])
 
     log.info('Process completed successfully.')
 
 
-def calculate_vegegtation_fis(feature_values: dict, streamside_field: str, riparian_field: str, out_field: str):
+def calculate_vegegtation_fis(feature_values: dict, streamside_field: str, riparian_field: str, out_field: str, surface: bool = False, validate: bool = False):
     """
     Beaver dam capacity vegetation FIS
     :param feature_values: Dictionary of features keyed by ReachID and values are dictionaries of attributes
     :param streamside_field: Name of the feature streamside vegetation attribute
     :param riparian_field: Name of the riparian vegetation attribute
+    :param surface: Interpolate the FIS from its cached response surface instead of computing it exactly
+    :param validate: Log the maximum error of the response surface against the exact FIS
     :return: Inserts 'FIS' key into feature dictionaries with the vegetation FIS values
     """
 
@@ -123,7 +128,6 @@ def calculate_vegegtation_fis(feature_values: dict, streamside_field: str, ripar
         ctrl.Rule(riparian['suitable'] & streamside['preferred'], density['pervasive']),
         ctrl.Rule(riparian['preferred'] & streamside['preferred'], density['pervasive'])
     ])
-    veg_fis = ctrl.ControlSystemSimulation(veg_ctrl)
 
     # calculate defuzzified centroid value for density 'none' MF group
     # this will be used to re-classify output values that fall in this group
@@ -136,28 +140,18 @@ def calculate_vegegtation_fis(feature_values: dict, streamside_field: str, ripar
     mfx_pervasive = fuzz.trapmf(x_vals, [12, 25, 45, 45])
     defuzz_pervasive = round(fuzz.defuzz(x_vals, mfx_pervasive, 'centroid'))
 
-    # run fuzzy inference system on inputs and defuzzify output
-    progbar = ProgressBar(len(reachid_array), 50, "Vegetation FIS")
-    counter = 0
-    for i, reach_id in enumerate(reachid_array):
-        veg_fis.input['input1'] = riparian_array[i]
-        veg_fis.input['input2'] = streamside_array[i]
-        veg_fis.compute()
-        result = veg_fis.output['result']
-
-        # set ovc_* to 0 if output falls fully in 'none' category and to 40 if falls fully in 'pervasive' category
-        if round(result, 6) == defuzz_centroid:
-            result = 0.0
+    # run fuzzy inference system on all the inputs at once and defuzzify output
+    log.info('Running vegetation FIS on {:,} reaches'.format(len(reachid_array)))
+    results = evaluate_fis(veg_ctrl, {'input1': riparian_array, 'input2': streamside_array}, 'result', 'brat_vegetation', surface, validate)
 
-        if round(result) >= defuzz_pervasive:
-            result = 40.0
+    # set ovc_* to 0 if output falls fully in 'none' category and to 40 if falls fully in 'pervasive' category
+    results[np.round(results, 6) == defuzz_centroid] = 0.0
+    results[np.round(results) >= defuzz_pervasive] = 40.0
+    results = np.round(results, 2)
 
-        feature_values[reach_id][out_field] = round(result, 2)
-
-        counter += 1
-        progbar.update(counter)
+    for i, reach_id in enumerate(reachid_array):
+        feature_values[reach_id][out_field] = float(results[i])
 
-    progbar.finish()
     log.info('Done')
 
 
@@ -166,6 +160,8 @@ def main():
     """
     parser = argparse.ArgumentParser()
     parser.add_argument('database', help='BRAT SQLite database', type=argparse.FileType('r'))
+    parser.add_argument('--fis_surface', help='(optional) interpolate the FIS from cached response surfaces instead of computing every reach exactly', action='store_true', default=False)
+    parser.add_argument('--validate_fis', help='(optional) log the largest response surface error against the exact FIS', action='store_true', default=False)
     parser.add_argument('--verbose', help='(optional) verbose logging mode', action='store_true', default=False)
     args = dotenv.parse_args_env(parser)
 
@@ -176,7 +172,7 @@ def main():
 
     try:
         # vegetation_fis(args.network.name, 'historic', 'HPE')
-        vegetation_fis(args.database.name, 'existing', 'EX')
+        vegetation_fis(args.database.name, 'existing', 'EX', args.fis_surface, args.validate_fis)
 
     except Exception as ex:
         logg.error(ex)
@@ -13,8 +13,9 @@ import sys
 import traceback
 import rasterio
 import numpy as np
-from rscommons import Logger, ProgressBar, dotenv
+from rscommons import Logger, dotenv
 from rscommons.database import write_db_attributes, SQLiteCon
+from rscommons.reclassify import LookupTable, reclassify_rasters, valid_cells
 
 
 def vegetation_suitability(gpkg_path: str, buffer: float, prefix: str, ecoregion: str):
@@ -115,36 +116,25 @@ def output_vegetation_raster(gpkg_path, raster_path, output_path, epoch, prefix,
                               'WHERE EpochID = ? AND EcoregionID = ?', [epochid, ecoregion])
         results = {row['VegetationID']: row['EffectiveSuitability'] for row in database.curs.fetchall()}
 
-    def translate_suit(in_val, in_nodata, out_nodata):
-        if in_val == in_nodata:
-            return out_nodata
-        elif in_val in results:
-            return results[in_val]
-        log.warning('Could not find {} VegetationID={}'.format(prefix, in_val))
-        return -1
-
-    vector = np.vectorize(translate_suit)
+    # Vegetation types missing from the lookup get -1, just like before
+    suitability = LookupTable(results, default=-1, dtype=np.int16)
+    missing = set()
 
     with rasterio.open(raster_path) as source_ds:
-        out_meta = source_ds.meta
-        out_meta['dtype'] = 'int16'
-        out_meta['nodata'] = -9999
-        out_meta['compress'] = 'deflate'
-
-        with rasterio.open(output_path, "w", **out_meta) as dest_ds:
-            progbar = ProgressBar(len(list(source_ds.block_windows(1))), 50, "Writing Vegetation Raster: {}".format(epoch))
-            counter = 0
-            for ji, window in dest_ds.block_windows(1):
-                progbar.update(counter)
-                counter += 1
-                in_data = source_ds.read(1, window=window, masked=True)
-
-                # Fill the masked values with the appropriate nodata vals
-                # Unthresholded in the base band (mostly for debugging)
-                out_data = vector(in_data, source_ds.meta['nodata'], out_meta['nodata'])
-                dest_ds.write(np.int16(out_data), window=window, indexes=1)
-
-            progbar.finish()
+        in_nodata = source_ds.nodata
+    out_nodata = -9999
+
+    def suitability_block(blocks):
+        valid = valid_cells(blocks[0], in_nodata)
+        missing.update(suitability.missing_values(blocks[0], valid))
+        return suitability.apply(blocks[0], valid, out_nodata)
+
+    reclassify_rasters([raster_path], {output_path: suitability_block},
+                       profile_updates={'dtype': 'int16', 'nodata': out_nodata, 'compress': 'deflate'},
+                       label='Writing Vegetation Raster: {}'.format(epoch))
+
+    for veg_id in sorted(missing):
+        log.warning('Could not find {} VegetationID={}'.format(prefix, veg_id))
 
 
 def main():
@@ -5,14 +5,12 @@
    28 Aug 2019
 """
 import os
-import numpy as np
 from osgeo import gdal, ogr
-import rasterio
 import sqlite3
-from rasterio.mask import mask
 from rscommons import GeopackageLayer, Logger
 from rscommons.database import SQLiteCon
 from rscommons.classes.vector_base import VectorBase
+from rscommons.zonal_stats import zonal_histogram
 from shapely.geometry.base import GEOMETRY_TYPES
 
 
@@ -40,10 +38,9 @@ def vegetation_summary(outputs_gpkg_path: str, label: str, veg_raster: str, buff
     conversion_factor = VectorBase.rough_convert_metres_to_raster_units(veg_raster, 1.0)
     cell_area = abs(geo_transform[1] * geo_transform[5]) / conversion_factor**2
 
-    # Open the raster and then loop over all polyline features
-    veg_counts = []
+    # Buffer all the polyline features first
     polygons = {}
-    with rasterio.open(veg_raster) as src, GeopackageLayer(os.path.join(outputs_gpkg_path, 'ReachGeometry')) as lyr:
+    with GeopackageLayer(os.path.join(outputs_gpkg_path, 'ReachGeometry')) as lyr:
         _srs, transform = VectorBase.get_transform_from_raster(lyr.spatial_ref, veg_raster)
         spatial_ref = lyr.spatial_ref
 
@@ -56,20 +53,11 @@ def vegetation_summary(outputs_gpkg_path: str, label: str, veg_raster: str, buff
             polygon = VectorBase.ogr2shapely(geom).buffer(raster_buffer)
             polygons[reach_id] = polygon
 
-            try:
-                # retrieve an array for the cells under the polygon
-                raw_raster = mask(src, [polygon], crop=True)[0]
-                mask_raster = np.ma.masked_values(raw_raster, src.nodata)
-                # print(mask_raster)
-
-                # Reclass the raster to dam suitability. Loop over present values for performance
-                for oldvalue in np.unique(mask_raster):
-                    if oldvalue is not np.ma.masked:
-                        cell_count = np.count_nonzero(mask_raster == oldvalue)
-                        veg_counts.append([reach_id, int(oldvalue), buffer, cell_count * cell_area, cell_count])
-            except Exception as ex:
-                log.warning('Error obtaining vegetation raster values for ReachID {}'.format(reach_id))
-                log.warning(ex)
+    # Then tally the vegetation cells under every buffer in one pass over the raster
+    veg_counts = []
+    for reach_id, histogram in zonal_histogram(veg_raster, polygons).items():
+        for value, cell_count in histogram.items():
+            veg_counts.append([reach_id, int(value), buffer, cell_count * cell_area, cell_count])
 
     # Write the reach vegetation values to the database
     # Because sqlite3 doesn't give us any feedback we do this in batches so that we can figure out what values
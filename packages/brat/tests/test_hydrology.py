@@ -0,0 +1,74 @@
+""" Testing for the compiled BRAT hydrology equations
+
+"""
+import csv
+import os
+import unittest
+
+import numpy as np
+
+from sqlbrat.utils.hydrology import DRNAREA_PARAM, calculate_hydrology, compile_equation
+
+WATERSHEDS_CSV = os.path.join(os.path.dirname(__file__), '..', 'database', 'data', 'Watersheds.csv')
+
+
+class HydrologyTest(unittest.TestCase):
+    """Compiled equations give the same discharges as eval()
+    """
+
+    def test_watershed_equations(self):
+        """Every regional curve in the Watersheds table matches eval() over a column of drainage areas
+        """
+        rng = np.random.default_rng(3)
+        drainage = rng.uniform(0.5, 5000, 50)
+
+        with open(WATERSHEDS_CSV, encoding='utf-8') as csv_file:
+            equations = {row[col] for row in csv.DictReader(csv_file) for col in ['Qlow', 'Q2'] if row[col]}
+        self.assertGreater(len(equations), 0)
+
+        for equation in equations:
+            equation = equation.replace('^', '**')
+            names = [name for name in compile(equation, '<string>', 'eval').co_names if name != DRNAREA_PARAM]
+            # Some curves offset temperatures (e.g. (MINANTEMP-20)) so keep the parameters in a realistic range
+            params = {name: float(value) for name, value in zip(names, rng.uniform(25, 60, len(names)))}
+
+            equation_fn = compile_equation(equation)
+            actual = equation_fn({**params, DRNAREA_PARAM: drainage})
+            expected = [eval(equation, {'__builtins__': {}}, {**params, DRNAREA_PARAM: value}) for value in drainage]
+            np.testing.assert_allclose(np.broadcast_to(actual, drainage.shape), expected, rtol=1e-12, err_msg=equation)
+
+    def test_calculate_hydrology(self):
+        """Discharges are returned per reach using the converted drainage area
+        """
+        reaches = {1: {'iGeo_DA': 10.0}, 2: {'iGeo_DA': 250.0}, 7: {'iGeo_DA': 0.0}}
+        results = calculate_hydrology(reaches, '0.5 * (DRNAREA ** 0.8) * PRECIP + 1', {'PRECIP': 20.0}, 0.386, 'iHyd_QLow')
+
+        self.assertEqual(list(results.keys()), [1, 2, 7])
+        for reachid, values in reaches.items():
+            self.assertAlmostEqual(results[reachid]['iHyd_QLow'], 0.5 * ((values['iGeo_DA'] * 0.386) ** 0.8) * 20.0 + 1)
+
+        # Constant equations still produce one discharge per reach
+        results = calculate_hydrology(reaches, '42', {}, 1.0, 'iHyd_Q2')
+        self.assertEqual(results, {reachid: {'iHyd_Q2': 42.0} for reachid in reaches})
+
+    def test_errors(self):
+        """Unsafe expressions, unknown parameters and invalid arithmetic are reported
+        """
+        for equation in ['__import__("os").system("ls")', 'DRNAREA.real', 'abs(DRNAREA)', '[DRNAREA]', 'DRNAREA if 1 else 2', 'DRNAREA // 2']:
+            with self.assertRaises(ValueError, msg=equation):
+                compile_equation(equation)
+
+        with self.assertRaises(SyntaxError):
+            compile_equation('DRNAREA *')
+
+        reaches = {1: {'iGeo_DA': 10.0}, 2: {'iGeo_DA': 0.0}}
+        with self.assertRaises(NameError):
+            calculate_hydrology(reaches, 'DRNAREA * PRECIP', {}, 1.0, 'iHyd_QLow')
+        with self.assertRaises(FloatingPointError):
+            calculate_hydrology(reaches, '10 / DRNAREA', {}, 1.0, 'iHyd_QLow')
+        with self.assertRaises(FloatingPointError):
+            calculate_hydrology(reaches, '(MINANTEMP - 20) ** 0.5', {'MINANTEMP': 12.0}, 1.0, 'iHyd_QLow')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,7 @@ import json
 from typing import List, Dict
 from venv import create
 
+import numpy as np
 from osgeo import ogr
 from rscommons.classes.rs_project import RSMeta, RSMetaTypes, RSMetaExt
 from rscommons.classes.vector_base import get_utm_zone_epsg
@@ -22,7 +23,7 @@ from rscommons.classes.vector_base import get_utm_zone_epsg
 from rscommons.util import safe_makedirs, parse_metadata, pretty_duration
 from rscommons import RSProject, RSLayer, ModelConfig, Logger, dotenv, initGDALOGRErrors
 from rscommons import GeopackageLayer, VectorBase, get_shp_or_gpkg
-from rscommons.math import safe_eval
+from rscommons.math import safe_eval, compile_equation, EquationError
 from rscommons.raster_buffer_stats import raster_buffer_stats2
 from rscommons.vector_ops import get_geometry_unary_union, buffer_by_field, copy_feature_class, merge_feature_classes, remove_holes_feature_class, difference
 from rscommons.vbet_network import vbet_network
@@ -264,31 +265,45 @@ def channel(huc: int,
 def calculate_bankfull(network_layer: Path, out_field: str, eval_fn: str, function_params: dict):
     """caluclate bankfull value for each feature in network layer
 
+    The equation is evaluated for all the features at once. Equations or values that cannot be
+    vectorized fall back to evaluating each feature with safe_eval so that errors are reported as before.
+
     Args:
         network_layer (Path): netowrk layer
         out_field (str): field to store bankfull values
         eval_fn (str): equation to use in eval function
         function_params (dict): parameters to use in eval function
     """
+    log = Logger('Bankfull')
+
     with GeopackageLayer(network_layer, write=True) as layer:
 
         layer.create_field(out_field, ogr.OFTReal)
 
+        # Read the fields used by the equation as columns
+        fids = []
+        field_values = {param: [] for param, value in function_params.items() if isinstance(value, str)}
+        for feat, *_ in layer.iterate_features("Reading bankfull parameters"):
+            fids.append(feat.GetFID())
+            for param in field_values:
+                field_value = feat.GetField(function_params[param])
+                field_values[param].append(field_value if field_value is not None else 0)
+
+        fn_columns = {param: np.array(field_values[param], dtype=np.float64) if param in field_values else value for param, value in function_params.items()}
+        try:
+            results = compile_equation(eval_fn, strict=True)(fn_columns) if len(fids) > 0 else []
+        except EquationError as err:
+            log.warning('Evaluating bankfull one feature at a time: {}'.format(err))
+            results = []
+            for idx in range(len(fids)):
+                fn_params = {param: field_values[param][idx] if param in field_values else value for param, value in function_params.items()}
+                results.append(safe_eval(eval_fn, fn_params))
+
         layer.ogr_layer.StartTransaction()
-        for feat, *_ in layer.iterate_features("Calculating bankfull"):
-
-            fn_params = {}
-            for param, value in function_params.items():
-                if isinstance(value, str):
-                    field_value = feat.GetField(value)
-                    fn_params[param] = field_value if field_value is not None else 0
-                else:
-                    fn_params[param] = value
-            # eval seems to mutate the fn_params object so we pass in a copy so that we can report on the errors if needed
-            result = safe_eval(eval_fn, fn_params)
-            feat.SetField(out_field, result)
+        for fid, result in zip(fids, results):
+            feat = layer.ogr_layer.GetFeature(fid)
+            feat.SetField(out_field, float(result))
             layer.ogr_layer.SetFeature(feat)
-
         layer.ogr_layer.CommitTransaction()
 
 
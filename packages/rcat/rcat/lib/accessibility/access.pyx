@@ -1,96 +1,265 @@
 cimport cython
+from cython.parallel cimport prange
+from libc.stdlib cimport malloc, realloc, free
 import numpy as np
 cimport numpy as np
 
 DTYPE = np.intc
 
+# Cell states while resolving flow paths
+cdef enum:
+    UNVISITED = 0
+    ON_PATH = 1
+    RESOLVED = 2
+
+# Value of a cell that is not the end of a flow path
+cdef int CONTINUE = -2147483647 - 1
+
+# Row and column offsets of TauDEM D8 flow directions 1 (east) to 8 (south east)
+cdef int[9] DROW = [0, 0, -1, -1, -1, 0, 1, 1, 1]
+cdef int[9] DCOL = [0, 1, 1, 0, -1, -1, -1, 0, 1]
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def access_algorithm(int[:, :] fdarray, int fd_nd, int[:, :] chan_a, int chan_nd, int[:, :] r_a, int road_nd,
-                     int[:, :] rr_a, int rail_nd, int[:, :] c_a, int canal_nd, int[:, :] vb_a, int vb_nd):
-    
-    cdef list subprocessed
+cdef inline int end_value(int[:, :] fdarray, int fd_nd, unsigned char[:, :] codes, unsigned char channel_code,
+                          unsigned char barrier_code, Py_ssize_t row, Py_ssize_t col) nogil:
+    """ Accessibility of a cell where the flow path stops, or CONTINUE if it carries on downstream
+
+    Barriers (0) take precedence over the channel (1). A flow path that runs into nodata stays nodata.
+    """
+    if codes[row, col] & barrier_code:
+        return 0
+    if codes[row, col] & channel_code:
+        return 1
+    if fdarray[row, col] == fd_nd:
+        return fd_nd
+    return CONTINUE
 
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef inline Py_ssize_t downstream(int[:, :] fdarray, Py_ssize_t row, Py_ssize_t col) nogil:
+    """ Flat index of the next cell down the flow path, -1 when it leaves the raster
+
+    Anything other than a D8 direction points back at the cell itself (a circular flow path).
+    """
+    cdef int direction = fdarray[row, col]
     cdef Py_ssize_t x_max = fdarray.shape[0]
     cdef Py_ssize_t y_max = fdarray.shape[1]
+    if direction < 1 or direction > 8:
+        return row * y_max + col
+    row = row + DROW[direction]
+    col = col + DCOL[direction]
+    if row < 0 or row >= x_max or col < 0 or col >= y_max:
+        return -1
+    return row * y_max + col
 
-    cdef int row, col
-    cdef int rowa, cola
 
-    out_array = np.full((x_max, y_max), fd_nd, dtype=DTYPE)
-    cdef int[:, :] out_view = out_array
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int resolve(int[:, :] fdarray, int fd_nd, unsigned char[:, :] codes, unsigned char valley_code, unsigned char channel_code,
+                 unsigned char barrier_code, int[:, :] out_view, unsigned char[:, :] state) nogil except -1:
+    """ Walk down the flow path from every valley bottom cell, resolving each cell once
+
+    The cells of a path are stacked until it reaches a channel, barrier, nodata, a cell that is
+    already resolved or itself (circular, 2), and then all of them take that value.
+    """
+    cdef Py_ssize_t x_max = fdarray.shape[0]
+    cdef Py_ssize_t y_max = fdarray.shape[1]
+    cdef Py_ssize_t capacity = 1024
+    cdef Py_ssize_t top, k, start, cell, row, col
+    cdef Py_ssize_t *stack = <Py_ssize_t *> malloc(capacity * sizeof(Py_ssize_t))
+    cdef Py_ssize_t *grown
+    cdef int value
+
+    if stack == NULL:
+        with gil:
+            raise MemoryError()
+
+    for start in range(x_max * y_max):
+        row = start // y_max
+        col = start % y_max
+        if not codes[row, col] & valley_code or state[row, col] != UNVISITED:
+            continue
+
+        top = 0
+        cell = start
+        while True:
+            row = cell // y_max
+            col = cell % y_max
+            if state[row, col] == RESOLVED:
+                value = out_view[row, col]
+                break
+            if state[row, col] == ON_PATH:
+                value = 2
+                break
+
+            if top == capacity:
+                capacity = capacity * 2
+                grown = <Py_ssize_t *> realloc(stack, capacity * sizeof(Py_ssize_t))
+                if grown == NULL:
+                    free(stack)
+                    with gil:
+                        raise MemoryError()
+                stack = grown
+            stack[top] = cell
+            top = top + 1
+            state[row, col] = ON_PATH
+
+            value = end_value(fdarray, fd_nd, codes, channel_code, barrier_code, row, col)
+            if value != CONTINUE:
+                break
+            cell = downstream(fdarray, row, col)
+            if cell < 0:
+                value = fd_nd
+                break
+
+        for k in range(top):
+            row = stack[k] // y_max
+            col = stack[k] % y_max
+            out_view[row, col] = value
+            state[row, col] = RESOLVED
+
+    free(stack)
+    return 0
+
 
-    for row in range(x_max):
-        for col in range(y_max):
-            if vb_a[row, col] == vb_nd:
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef int resolve_parallel(int[:, :] fdarray, int fd_nd, unsigned char[:, :] codes, unsigned char valley_code, unsigned char channel_code,
+                          unsigned char barrier_code, int[:, :] out_view, int threads) nogil except -1:
+    """ Partition the cells by the outlet their flow path ends at and resolve the partitions in parallel
+
+    Outlets are found by pointer jumping, so the value of every cell is known from its outlet. Each
+    thread then marks the cells downstream of the valley bottom cells of its own outlets, so no two
+    threads ever touch the same cell. Circular flow paths never reach an outlet and are all left to
+    the first thread.
+    """
+    cdef Py_ssize_t x_max = fdarray.shape[0]
+    cdef Py_ssize_t y_max = fdarray.shape[1]
+    cdef Py_ssize_t n = x_max * y_max
+    cdef Py_ssize_t cell, nxt, row, col, rounds, max_rounds
+    cdef int thread, changed, value
+    cdef Py_ssize_t *succ = <Py_ssize_t *> malloc(n * sizeof(Py_ssize_t))
+    cdef Py_ssize_t *outlet = <Py_ssize_t *> malloc(n * sizeof(Py_ssize_t))
+    cdef Py_ssize_t *jumped = <Py_ssize_t *> malloc(n * sizeof(Py_ssize_t))
+    cdef Py_ssize_t *swap
+    cdef int *outlet_value = <int *> malloc(n * sizeof(int))
+
+    if succ == NULL or outlet == NULL or jumped == NULL or outlet_value == NULL:
+        free(succ)
+        free(outlet)
+        free(jumped)
+        free(outlet_value)
+        with gil:
+            raise MemoryError()
+
+    # Next cell down each flow path (the cell itself at the end of a path) and the value at the ends
+    for cell in prange(n, num_threads=threads, schedule='static'):
+        row = cell // y_max
+        col = cell % y_max
+        value = end_value(fdarray, fd_nd, codes, channel_code, barrier_code, row, col)
+        if value == CONTINUE:
+            nxt = downstream(fdarray, row, col)
+            if nxt < 0:
+                value = fd_nd
+                nxt = cell
+            elif nxt == cell:
+                # Not a flow direction: circular
+                value = 2
+        else:
+            nxt = cell
+        succ[cell] = nxt
+        outlet[cell] = nxt
+        outlet_value[cell] = value
+
+    # Pointer jumping: after k rounds each cell points 2^k cells down its flow path (or at its outlet)
+    max_rounds = 1
+    while (<Py_ssize_t> 1) << max_rounds < n:
+        max_rounds = max_rounds + 1
+    for rounds in range(max_rounds + 1):
+        changed = 0
+        for cell in prange(n, num_threads=threads, schedule='static'):
+            jumped[cell] = outlet[outlet[cell]]
+            if jumped[cell] != outlet[cell]:
+                changed += 1
+        swap = outlet
+        outlet = jumped
+        jumped = swap
+        if changed == 0:
+            break
+
+    # Cells that never reach an outlet are on (or drain into) a circular flow path.
+    # jumped is reused to mark the cells that have been resolved
+    for cell in prange(n, num_threads=threads, schedule='static'):
+        if succ[outlet[cell]] != outlet[cell]:
+            outlet[cell] = -1
+        jumped[cell] = 0
+
+    for thread in prange(threads, num_threads=threads, schedule='static'):
+        for cell in range(n):
+            if outlet[cell] < 0:
+                if thread != 0:
+                    continue
+            elif outlet[cell] % threads != thread:
                 continue
-            if out_view[row, col] != fd_nd:
+            if not codes[cell // y_max, cell % y_max] & valley_code:
                 continue
-            else:
-                subprocessed = [[row, col]]
-
-                next_cell = fdarray[row, col]
-                rowa, cola = row, col
-                while next_cell is not None:
-                    if next_cell == fd_nd:
-                        # for coord in subprocessed:
-                        #     if coord not in processed:
-                        #         processed.append(coord)
-                        next_cell = None
-                    if out_view[rowa, cola] != fd_nd:
-                        for coord in subprocessed:
-                            out_view[coord[0], coord[1]] = out_view[rowa, cola]
-                        next_cell = None
-                    if chan_a[rowa, cola] != chan_nd:
-                        for coord in subprocessed:
-                            out_view[coord[0], coord[1]] = 1
-                        next_cell = None
-                    if r_a[rowa, cola] != road_nd:
-                        for coord in subprocessed:
-                            out_view[coord[0], coord[1]] = 0
-                        next_cell = None
-                    if rr_a[rowa, cola] != rail_nd:
-                        for coord in subprocessed:
-                            out_view[coord[0], coord[1]] = 0
-                        next_cell = None
-                    if c_a[rowa, cola] != canal_nd:
-                        for coord in subprocessed:
-                            out_view[coord[0], coord[1]] = 0
-                        next_cell = None
-
-                    if next_cell is not None:
-                        if next_cell == 1:
-                            rowa = rowa
-                            cola = cola + 1
-                        elif next_cell == 2:
-                            rowa = rowa - 1
-                            cola = cola + 1
-                        elif next_cell == 3:
-                            rowa = rowa - 1
-                            cola = cola
-                        elif next_cell == 4:
-                            rowa = rowa - 1
-                            cola = cola - 1
-                        elif next_cell == 5:
-                            rowa = rowa
-                            cola = cola - 1
-                        elif next_cell == 6:
-                            rowa = rowa + 1
-                            cola = cola - 1
-                        elif next_cell == 7:
-                            rowa = rowa + 1
-                            cola = cola
-                        elif next_cell == 8:
-                            rowa = rowa + 1
-                            cola = cola + 1
-                        if [rowa, cola] in subprocessed:
-                            print('circular flow path, could not resolve connectivity')
-                            for coord in subprocessed:
-                                out_view[coord[0], coord[1]] = 2
-                            next_cell = None
-                        else:
-                            subprocessed.append([rowa, cola])
-                            print(f'subprocessed {len(subprocessed)} cells')
-                            next_cell = fdarray[rowa, cola]
-
-    return out_array
\ No newline at end of file
+            nxt = cell
+            while jumped[nxt] == 0:
+                jumped[nxt] = 1
+                out_view[nxt // y_max, nxt % y_max] = outlet_value[outlet[nxt]] if outlet[nxt] >= 0 else 2
+                nxt = succ[nxt]
+
+    free(succ)
+    free(outlet)
+    free(jumped)
+    free(outlet_value)
+    return 0
+
+
+def access_codes(int[:, :] fdarray, int fd_nd, unsigned char[:, :] codes, unsigned char valley_code, unsigned char channel_code,
+                 unsigned char barrier_code, int threads=1):
+    """ Floodplain accessibility of the cells on the flow paths of valley bottom cells
+
+    Arguments:
+        fdarray: TauDEM D8 flow directions
+        fd_nd: flow direction nodata value (also the output nodata)
+        codes: coded infrastructure raster (bits for valley bottom, channel and barriers)
+        valley_code: valley bottom bit(s)
+        channel_code: channel bit(s)
+        barrier_code: road, rail and canal bits
+        threads: threads to partition the flow paths over by outlet. Defaults to 1 (serial)
+
+    Returns:
+        int32 array: 1 where the flow path reaches the channel, 0 where it reaches a barrier first,
+        2 for circular flow paths and fd_nd elsewhere
+    """
+
+    out_array = np.full((fdarray.shape[0], fdarray.shape[1]), fd_nd, dtype=DTYPE)
+    cdef int[:, :] out_view = out_array
+    cdef unsigned char[:, :] state
+
+    if threads > 1:
+        with nogil:
+            resolve_parallel(fdarray, fd_nd, codes, valley_code, channel_code, barrier_code, out_view, threads)
+    else:
+        state = np.zeros((fdarray.shape[0], fdarray.shape[1]), dtype=np.uint8)
+        with nogil:
+            resolve(fdarray, fd_nd, codes, valley_code, channel_code, barrier_code, out_view, state)
+
+    return out_array
+
+
+def access_algorithm(int[:, :] fdarray, int fd_nd, int[:, :] chan_a, int chan_nd, int[:, :] r_a, int road_nd,
+                     int[:, :] rr_a, int rail_nd, int[:, :] c_a, int canal_nd, int[:, :] vb_a, int vb_nd, int threads=1):
+    """ Floodplain accessibility from separate channel, road, rail, canal and valley bottom rasters (see access_codes)
+    """
+
+    codes = np.asarray(vb_a) != vb_nd
+    codes = codes.astype(np.uint8)
+    codes[np.asarray(chan_a) != chan_nd] |= 2
+    codes[(np.asarray(r_a) != road_nd) | (np.asarray(rr_a) != rail_nd) | (np.asarray(c_a) != canal_nd)] |= 4
+
+    return access_codes(fdarray, fd_nd, codes, 1, 2, 4, threads)
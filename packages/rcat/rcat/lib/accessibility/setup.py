@@ -1,8 +1,17 @@
-from setuptools import setup
+import sys
+from setuptools import setup, Extension
 from Cython.Build import cythonize
 import numpy
 
+# OpenMP for the parallel kernel. Without it (e.g. Apple clang) prange simply runs serially
+if sys.platform == 'win32':
+    OPENMP = ['/openmp']
+elif sys.platform == 'darwin':
+    OPENMP = []
+else:
+    OPENMP = ['-fopenmp']
+
 setup(
-    ext_modules=cythonize("access.pyx"),
+    ext_modules=cythonize(Extension('access', ['access.pyx'], extra_compile_args=OPENMP, extra_link_args=OPENMP)),
     include_dirs=[numpy.get_include()]
 )
@@ -7,13 +7,11 @@ Dec 2022
 import argparse
 import sqlite3
 import os
-import rasterio
-import numpy as np
 from osgeo import gdal
-from rasterio.mask import mask
 
 from rscommons import Logger, VectorBase, dotenv
 from rscommons.database import SQLiteCon
+from rscommons.zonal_stats import zonal_histogram
 
 
 def dgo_vegetation(raster: str, dgo: dict, out_gpkg_path: str):
@@ -34,21 +32,11 @@ def dgo_vegetation(raster: str, dgo: dict, out_gpkg_path: str):
     conversion_factor = VectorBase.rough_convert_metres_to_raster_units(raster, 1.0)
     cell_area = abs(geo_transform[1] * geo_transform[5]) / conversion_factor**2
 
-    with rasterio.open(raster) as src:
-
-        veg_counts = []
-        for dgoid, dgo_geom in dgo.items():
-            try:
-                raw_raster = mask(src, [dgo_geom], crop=True)[0]
-                mask_raster = np.ma.masked_values(raw_raster, src.nodata)
-
-                for oldvalue in np.unique(mask_raster):
-                    if oldvalue is not np.ma.masked:
-                        cell_count = np.count_nonzero(mask_raster == oldvalue)
-                        veg_counts.append([dgoid, int(oldvalue), cell_count * cell_area, cell_count])
-            except Exception as ex:
-                log.warning(f'Error obtaining land cover raster values for dgo ID {dgoid}')
-                log.warning(ex)
+    # Tally the raster values under every DGO in one pass over the raster
+    veg_counts = []
+    for dgoid, histogram in zonal_histogram(raster, dgo).items():
+        for value, cell_count in histogram.items():
+            veg_counts.append([dgoid, int(value), cell_count * cell_area, cell_count])
 
     with SQLiteCon(out_gpkg_path) as database:
         errs = 0
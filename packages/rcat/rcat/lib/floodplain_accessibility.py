@@ -8,24 +8,37 @@ Jordan Gilbert
 from rcat.lib.accessibility import access
 import datetime
 import argparse
+import shutil
 from rscommons.hand import run_subprocess
-from rscommons.util import safe_makedirs, safe_remove_dir
 from rscommons import Logger, dotenv
 from osgeo import gdal, ogr, osr
 import numpy as np
 import rasterio
 import os
 
+# Codes burned into the infrastructure raster. The valley bottom bit is added on top of the others
+VALLEY = 1
+CHANNEL = 2
+ROAD = 4
+RAIL = 8
+CANAL = 16
 
-def flooplain_access(filled_dem: str, valley: str, reaches: str, intermediates_path: str, outraster: str, road: str = None, rail: str = None, canal: str = None):
-    """ Generate a foodplain accessiblity raster where 0 is inaccessible and 1 is accessible
+
+def rasterize_infrastructure(inputs_gpkg: str, template_raster: str, out_raster: str, valley: str, reaches: str,
+                             road: str = None, rail: str = None, canal: str = None):
+    """ Burn the valley bottom, channel and road, rail and canal barriers into one coded uint8 raster
+
+    The barriers are buffered by the cell size in memory so that flow direction paths can't cross them
+    diagonally. The channel and barriers are burned in one pass with the barriers last, so a cell that is
+    both keeps the barrier code (barriers take precedence in the accessibility algorithm too). The
+    valley bottom is then added as its own bit.
 
     Arguments:
-        filled_dem (str): Path to a pit-filled DEM
+        inputs_gpkg (str): Path to the RCAT inputs geopackage
+        template_raster (str): Path to a raster with the output grid (e.g. the pit-filled DEM)
+        out_raster (str): Path to store the coded raster
         valley (str): Path to a valley bottom feature class
         reaches (str): Path to a stream network feature class
-        intermediates_path (str): Path to RCAT project intermediates folder
-        outraster (str): Path to store the output raster
         road (str): Path to a road feature class
         rail (str): Path to a railroad feature class
         canal (str): Path to a canal feature class
@@ -33,132 +46,119 @@ def flooplain_access(filled_dem: str, valley: str, reaches: str, intermediates_p
 
     log = Logger('Floodplain accessibility')
 
-    NCORES = os.environ['TAUDEM_CORES'] if 'TAUDEM_CORES' in os.environ else '2'
-
-    # create temp folder to store vector layers
-    safe_makedirs(os.path.join(intermediates_path, 'temp'))
-    temp_dir = os.path.join(intermediates_path, 'temp')
-
-    # buffer vector layers by dem resolution so that flow direction paths can't cross them diagonally
-    dataset = gdal.Open(filled_dem)
+    dataset = gdal.Open(template_raster)
     geo_transform = dataset.GetGeoTransform()
     cell_res = abs(geo_transform[1])
     srs = osr.SpatialReference()
     srs.ImportFromWkt(dataset.GetProjectionRef())
 
-    vec_lyrs = [[road, 'road.shp'], [rail, 'rail.shp'], [canal, 'canal.shp']]
-    vec_src = ogr.Open(os.path.join(os.path.dirname(intermediates_path), 'inputs/inputs.gpkg'))
-    for vec in vec_lyrs:
-        inlyr = vec_src.GetLayer(os.path.basename(vec[0]))
-        if inlyr is not None:
-
-            shpdriver = ogr.GetDriverByName('ESRI Shapefile')
-            if os.path.exists(os.path.join(temp_dir, vec[1])):
-                shpdriver.DeleteDataSource(os.path.join(temp_dir, vec[1]))
-            out_buffer_ds = shpdriver.CreateDataSource(os.path.join(temp_dir, vec[1]))
-            bufferlyr = out_buffer_ds.CreateLayer(os.path.basename(vec[0]), srs, geom_type=ogr.wkbPolygon)
-            ftr_defn = inlyr.GetLayerDefn()
-
-            for feature in inlyr:
-                ingeom = feature.GetGeometryRef()
-                geom_buffer = ingeom.Buffer(cell_res)
-                out_feature = ogr.Feature(ftr_defn)
-                out_feature.SetGeometry(geom_buffer)
-                bufferlyr.CreateFeature(out_feature)
-            out_buffer_ds = None
-            bufferlyr = None
+    inputs_ds = gdal.OpenEx(inputs_gpkg)
+    mem_ds = ogr.GetDriverByName('Memory').CreateDataSource('infrastructure')
 
-    # rasterize layers
-    log.info('Rasterizing vector layers')
-    inputs_ds = gdal.OpenEx(os.path.join(os.path.dirname(intermediates_path), 'inputs/inputs.gpkg'))
+    # channel first and barriers after so that the barriers are burned over the channel
+    log.info('Buffering infrastructure layers')
+    burn_lyr = mem_ds.CreateLayer('infrastructure', srs, geom_type=ogr.wkbUnknown)
+    burn_lyr.CreateField(ogr.FieldDefn('code', ogr.OFTInteger))
     chan_lyr = inputs_ds.GetLayer(os.path.basename(reaches))
     chan_lyr.SetAttributeFilter('ReachCode != 33600')
-    road_ds = gdal.OpenEx(os.path.join(temp_dir, 'road.shp'))
-    road_lyr = road_ds.GetLayer()
-    rail_ds = gdal.OpenEx(os.path.join(temp_dir, 'rail.shp'))
-    rail_lyr = rail_ds.GetLayer()
-    canal_ds = gdal.OpenEx(os.path.join(temp_dir, 'canal.shp'))
-    canal_lyr = canal_ds.GetLayer()
-    # vb_ds = gdal.OpenEx(valley)
+    burn_layers = [[chan_lyr, CHANNEL, None]]
+    for vec, code in [[road, ROAD], [rail, RAIL], [canal, CANAL]]:
+        inlyr = inputs_ds.GetLayer(os.path.basename(vec)) if vec is not None else None
+        if inlyr is None:
+            log.warning(f'No infrastructure layer found for {vec}')
+            continue
+        burn_layers.append([inlyr, code, cell_res])
+
+    for inlyr, code, buffer in burn_layers:
+        for feature in inlyr:
+            ingeom = feature.GetGeometryRef()
+            if ingeom is None:
+                continue
+            out_feature = ogr.Feature(burn_lyr.GetLayerDefn())
+            out_feature.SetGeometry(ingeom.Buffer(buffer) if buffer is not None else ingeom)
+            out_feature.SetField('code', code)
+            burn_lyr.CreateFeature(out_feature)
+
+    # the valley bottom is added to the codes so it has to be a single geometry that covers each cell once
     vb_lyr = inputs_ds.GetLayer(os.path.basename(valley))
+    vb_geom = ogr.Geometry(ogr.wkbMultiPolygon)
+    for feature in vb_lyr:
+        ingeom = feature.GetGeometryRef()
+        if ingeom is None:
+            continue
+        for part in ogr.ForceToMultiPolygon(ingeom.Clone()):
+            vb_geom.AddGeometry(part)
+    valley_lyr = mem_ds.CreateLayer('valley', srs, geom_type=ogr.wkbMultiPolygon)
+    valley_feature = ogr.Feature(valley_lyr.GetLayerDefn())
+    valley_feature.SetGeometry(vb_geom.UnionCascaded())
+    valley_lyr.CreateFeature(valley_feature)
+
+    log.info('Rasterizing infrastructure layers')
+    out_ds = gdal.GetDriverByName('GTiff').Create(out_raster, dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_Byte, ['COMPRESS=DEFLATE'])
+    out_ds.SetProjection(srs.ExportToWkt())
+    out_ds.SetGeoTransform(geo_transform)
+    gdal.RasterizeLayer(out_ds, [1], burn_lyr, options=['ATTRIBUTE=code'])
+    gdal.RasterizeLayer(out_ds, [1], valley_lyr, burn_values=[VALLEY], options=['MERGE_ALG=ADD'])
+    out_ds = None
+    mem_ds = None
+
+
+def flooplain_access(filled_dem: str, valley: str, reaches: str, intermediates_path: str, outraster: str, road: str = None, rail: str = None, canal: str = None,
+                     flow_dir: str = None, threads: int = 1):
+    """ Generate a foodplain accessiblity raster where 0 is inaccessible and 1 is accessible
+
+    Arguments:
+        filled_dem (str): Path to a pit-filled DEM
+        valley (str): Path to a valley bottom feature class
+        reaches (str): Path to a stream network feature class
+        intermediates_path (str): Path to RCAT project intermediates folder
+        outraster (str): Path to store the output raster
+        road (str): Path to a road feature class
+        rail (str): Path to a railroad feature class
+        canal (str): Path to a canal feature class
+        flow_dir (str): Path to an existing TauDEM D8 flow direction raster for the pit-filled DEM. d8flowdir is run when this is None
+        threads (int): Threads for the accessibility kernel. Serial (1) is fastest unless there are many cores
+    """
+
+    log = Logger('Floodplain accessibility')
 
-    drv_tiff = gdal.GetDriverByName('GTiff')
-
-    channel_raster = os.path.join(intermediates_path, 'channel.tif')
-    chan_ras = drv_tiff.Create(channel_raster, dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_Int16)
-    chan_ras.SetProjection(srs.ExportToWkt())
-    chan_ras.SetGeoTransform(geo_transform)
-    road_raster = os.path.join(intermediates_path, 'road.tif')
-    road_ras = drv_tiff.Create(road_raster, dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_Int16)
-    road_ras.SetProjection(srs.ExportToWkt())
-    road_ras.SetGeoTransform(geo_transform)
-    rail_raster = os.path.join(intermediates_path, 'rail.tif')
-    rail_ras = drv_tiff.Create(rail_raster, dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_Int16)
-    rail_ras.SetProjection(srs.ExportToWkt())
-    rail_ras.SetGeoTransform(geo_transform)
-    canal_raster = os.path.join(intermediates_path, 'canal.tif')
-    canal_ras = drv_tiff.Create(canal_raster, dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_Int16)
-    canal_ras.SetProjection(srs.ExportToWkt())
-    canal_ras.SetGeoTransform(geo_transform)
-    vb_raster = os.path.join(intermediates_path, 'valley.tif')
-    vb_ras = drv_tiff.Create(vb_raster, dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_Int16)
-    vb_ras.SetProjection(srs.ExportToWkt())
-    vb_ras.SetGeoTransform(geo_transform)
-
-    gdal.RasterizeLayer(chan_ras, [1], chan_lyr)
-    chan_ras.GetRasterBand(1).SetNoDataValue(0.0)
-    chan_ras = None
-    gdal.RasterizeLayer(road_ras, [1], road_lyr)
-    road_ras.GetRasterBand(1).SetNoDataValue(0.0)
-    road_ras = None
-    gdal.RasterizeLayer(rail_ras, [1], rail_lyr)
-    rail_ras.GetRasterBand(1).SetNoDataValue(0.0)
-    rail_ras = None
-    gdal.RasterizeLayer(canal_ras, [1], canal_lyr)
-    canal_ras.GetRasterBand(1).SetNoDataValue(0.0)
-    canal_ras = None
-    gdal.RasterizeLayer(vb_ras, [1], vb_lyr)
-    vb_ras.GetRasterBand(1).SetNoDataValue(0.0)
-    vb_ras = None
+    NCORES = os.environ['TAUDEM_CORES'] if 'TAUDEM_CORES' in os.environ else '2'
+
+    # rasterize layers
+    infrastructure_raster = os.path.join(intermediates_path, 'infrastructure.tif')
+    rasterize_infrastructure(os.path.join(os.path.dirname(intermediates_path), 'inputs/inputs.gpkg'), filled_dem, infrastructure_raster,
+                             valley, reaches, road, rail, canal)
 
     # get d8 flow directions
-    log.info('Generating flow directions')
     fd_path = os.path.join(intermediates_path, 'd8_flow_dir.tif')
-    slp = os.path.join(intermediates_path, 'd8_slp.tif')
-    d8flowdir_status = run_subprocess(intermediates_path, ["mpiexec", "-n", NCORES, "d8flowdir", "-fel", filled_dem, "-p", fd_path, "-sd8", slp])
-    if d8flowdir_status != 0 or not os.path.isfile(fd_path):
-        raise Exception('TauDEM: d8flowdir failed')
+    if flow_dir is not None and os.path.isfile(flow_dir):
+        log.info(f'Using existing flow directions: {flow_dir}')
+        if os.path.abspath(flow_dir) != os.path.abspath(fd_path):
+            shutil.copyfile(flow_dir, fd_path)
+    else:
+        log.info('Generating flow directions')
+        slp = os.path.join(intermediates_path, 'd8_slp.tif')
+        d8flowdir_status = run_subprocess(intermediates_path, ["mpiexec", "-n", NCORES, "d8flowdir", "-fel", filled_dem, "-p", fd_path, "-sd8", slp])
+        if d8flowdir_status != 0 or not os.path.isfile(fd_path):
+            raise Exception('TauDEM: d8flowdir failed')
 
     # accessibility algorithm
     log.info('Performing floodplain accessibility analysis')
-    with rasterio.open(fd_path) as src, rasterio.open(channel_raster) as chan, rasterio.open(road_raster) as road, \
-            rasterio.open(rail_raster) as rail, rasterio.open(canal_raster) as canal, rasterio.open(vb_raster) as vb:
-        transform = src.transform
+    with rasterio.open(fd_path) as src, rasterio.open(infrastructure_raster) as infra:
         array = np.asarray(src.read()[0, :, :], dtype=np.int32)
         src_nd = np.int32(src.nodata)
         meta = src.profile
-        chan_a = np.asarray(chan.read()[0, :, :], dtype=np.int32)
-        chan_nd = np.int32(chan.nodata)
-        r_a = np.asarray(road.read()[0, :, :], dtype=np.int32)
-        road_nd = np.int32(road.nodata)
-        rr_a = np.asarray(rail.read()[0, :, :], dtype=np.int32)
-        rail_nd = np.int32(rail.nodata)
-        c_a = np.asarray(canal.read()[0, :, :], dtype=np.int32)
-        canal_nd = np.int32(canal.nodata)
-        vb_a = np.asarray(vb.read()[0, :, :], dtype=np.int32)
-        vb_nd = np.int32(vb.nodata)
+        codes = infra.read(1)
 
     st = datetime.datetime.now()
-    out = access.access_algorithm(array, src_nd, chan_a, chan_nd, r_a, road_nd, rr_a, rail_nd, c_a, canal_nd, vb_a, vb_nd)
+    out = access.access_codes(array, src_nd, codes, VALLEY, CHANNEL, ROAD | RAIL | CANAL, threads)
 
     end = datetime.datetime.now()
-    print(f'ellapsed: {end-st}')
+    log.debug(f'ellapsed: {end-st}')
 
     with rasterio.open(outraster, 'w', **meta) as outfile:
         outfile.write(out, 1)
 
-    safe_remove_dir(temp_dir)
-
 
 def main():
 
@@ -171,11 +171,13 @@ def main():
     parser.add_argument('road', help='', type=str)
     parser.add_argument('rail', help='', type=str)
     parser.add_argument('canal', help='', type=str)
+    parser.add_argument('--flow_dir', help='(optional) existing TauDEM D8 flow direction raster', type=str)
+    parser.add_argument('--threads', help='(optional) threads for the accessibility kernel. Defaults to 1', type=int, default=1)
 
     args = dotenv.parse_args_env(parser)
 
     flooplain_access(args.pit_filled, args.valley, args.reaches, args.intermediates_path, args.out_raster,
-                     args.road, args.rail, args.canal)
+                     args.road, args.rail, args.canal, args.flow_dir, args.threads)
 
 
 if __name__ == '__main__':
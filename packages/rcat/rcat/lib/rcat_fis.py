@@ -9,16 +9,19 @@ import argparse
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
-from rscommons.database import load_attributes, load_igo_attributes, load_dgo_attributes, write_db_attributes, write_db_igo_attributes, write_db_dgo_attributes
-from rscommons import Logger, ProgressBar, dotenv
+from rscommons.database import load_table_columns, write_db_attributes, write_db_igo_attributes, write_db_dgo_attributes
+from rscommons import Logger, dotenv
+from rscommons.fis_surface import evaluate_fis
 
 
-def rcat_fis(database: str, igos: bool):
+def rcat_fis(database: str, igos: bool, fis_surface: bool = False, validate_fis: bool = False):
     """Run the RCAT FIS
 
     Arguments:
         database (str): Path to the RCAT database
         igos (bool): True if the FIS is being run for the IGO output 
+        fis_surface (bool): Interpolate the FIS from its cached response surface instead of computing it exactly
+        validate_fis (bool): Log the maximum error of the response surface against the exact FIS
     """
 
     log = Logger('RCAT FIS')
@@ -26,56 +29,41 @@ def rcat_fis(database: str, igos: bool):
 
     if igos is True:
         fields = ['RiparianDeparture', 'LUI', 'FloodplainAccess']
-        features = load_igo_attributes(database, fields, ' AND '.join(['({} IS NOT NULL)'.format(f) for f in fields]))
-        calculate_fis(features, igos)
-        write_db_igo_attributes(database, features, ['Condition'], summarize=False)
-        dgo_features = load_dgo_attributes(database, fields, ' AND '.join(['({} IS NOT NULL)'.format(f) for f in fields]))
-        calculate_fis(dgo_features, igos)
-        write_db_dgo_attributes(database, dgo_features, ['Condition'], summarize=False)
+        where_clause = ' AND '.join(['({} IS NOT NULL)'.format(f) for f in fields])
+        ids, columns = load_table_columns(database, 'vwIgos', 'IGOID', fields, where_clause)
+        results = fis_condition(*[columns[field] for field in fields], fis_surface, validate_fis)
+        write_db_igo_attributes(database, {igo_id: {'Condition': value} for igo_id, value in zip(ids.tolist(), results.tolist())}, ['Condition'], summarize=False)
+        ids, columns = load_table_columns(database, 'vwDgos', 'DGOID', fields, where_clause)
+        results = fis_condition(*[columns[field] for field in fields], fis_surface, validate_fis)
+        write_db_dgo_attributes(database, {dgo_id: {'Condition': value} for dgo_id, value in zip(ids.tolist(), results.tolist())}, ['Condition'], summarize=False)
     else:
         fields = ['RiparianDeparture', 'iPC_LU', 'FloodplainAccess']
-        features = load_attributes(database, fields, ' AND '.join(['({} IS NOT NULL)'.format(f) for f in fields]))
-        calculate_fis(features, igos)
-        write_db_attributes(database, features, ['Condition'], log)
+        where_clause = ' AND '.join(['({} IS NOT NULL)'.format(f) for f in fields])
+        ids, columns = load_table_columns(database, 'vwReaches', 'ReachID', fields, where_clause)
+        results = fis_condition(*[columns[field] for field in fields], fis_surface, validate_fis)
+        write_db_attributes(database, {reach_id: {'Condition': value} for reach_id, value in zip(ids.tolist(), results.tolist())}, ['Condition'], log)
 
 
-def calculate_fis(feature_values: dict, igos: bool):
-    """The fuzzy inference system
+def fis_condition(rvd_values: np.ndarray, lui_values: np.ndarray, fpaccess_values: np.ndarray, surface: bool = False, validate: bool = False) -> np.ndarray:
+    """The fuzzy inference system for whole columns of inputs
 
     Arguments:
-        feature_values (dict): FIS input values associated with each reach
-        igos (bool): True if the FIS is being run for the IGO output
+        rvd_values (np.ndarray): riparian vegetation departure
+        lui_values (np.ndarray): land use intensity
+        fpaccess_values (np.ndarray): floodplain accessibility
+        surface (bool): Interpolate the FIS from its cached response surface instead of computing it exactly
+        validate (bool): Log the maximum error of the response surface against the exact FIS
+
+    Returns:
+        np.ndarray: condition for each feature, rounded to 2 decimal places
     """
 
     log = Logger('RCAT FIS')
 
-    if igos is True:
-        lui_field = 'LUI'
-    else:
-        lui_field = 'iPC_LU'
-
-    # get arrays for fields of interest
-    feature_count = len(feature_values)
-    id_array = np.zeros(feature_count, np.int64)
-    rvd_array = np.zeros(feature_count, np.float64)
-    lui_array = np.zeros(feature_count, np.float64)
-    fpaccess_array = np.zeros(feature_count, np.float64)
-
-    counter = 0
-    for id, values in feature_values.items():
-        id_array[counter] = id
-        rvd_array[counter] = values['RiparianDeparture']
-        lui_array[counter] = values[lui_field]
-        fpaccess_array[counter] = values['FloodplainAccess']
-        counter += 1
-
     # adjust inputs to be within FIS membership range
-    rvd_array[rvd_array < 0] = 0
-    rvd_array[rvd_array > 1] = 1
-    lui_array[lui_array < 0] = 0
-    lui_array[lui_array > 100] = 100
-    fpaccess_array[fpaccess_array < 0] = 0
-    fpaccess_array[fpaccess_array > 1] = 1
+    rvd_array = np.clip(np.asarray(rvd_values, dtype=np.float64), 0, 1)
+    lui_array = np.clip(np.asarray(lui_values, dtype=np.float64), 0, 100)
+    fpaccess_array = np.clip(np.asarray(fpaccess_values, dtype=np.float64), 0, 1)
 
     # set up FIS
     rvd = ctrl.Antecedent(np.arange(0, 1, 0.01), "input1")
@@ -130,28 +118,12 @@ def calculate_fis(feature_values: dict, igos: bool):
         ctrl.Rule(rvd['negligible'] & lui['moderate'] & fpaccess['high'], condition['good'])
     ])
 
-    rcat_fis = ctrl.ControlSystemSimulation(rcat_ctrl)
-
-    progbar = ProgressBar(len(id_array), 50, "RCAT FIS")
-    counter = 0
-
-    for i, id in enumerate(id_array):
-
-        condition = 0
-
-        rcat_fis.input['input1'] = rvd_array[i]
-        rcat_fis.input['input2'] = lui_array[i]
-        rcat_fis.input['input3'] = fpaccess_array[i]
-        rcat_fis.compute()
-        condition = rcat_fis.output['result']
-
-        feature_values[id]['Condition'] = round(condition, 2)
-
-        counter += 1
-        progbar.update(counter)
+    log.info('Running RCAT FIS on {:,} features'.format(len(rvd_array)))
+    results = evaluate_fis(rcat_ctrl, {'input1': rvd_array, 'input2': lui_array, 'input3': fpaccess_array}, 'result', 'rcat_condition', surface, validate)
+    results = np.round(results, 2)
 
-    progbar.finish()
     log.info('Done')
+    return results
 
 
 def main():
@@ -159,10 +131,12 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('database', help='The RCAT database (output geopackage)', type=str)
     parser.add_argument('igos', help='True if the FIS is being run for the IGO output', type=bool)
+    parser.add_argument('--fis_surface', help='(optional) interpolate the FIS from cached response surfaces instead of computing every feature exactly', action='store_true', default=False)
+    parser.add_argument('--validate_fis', help='(optional) log the largest response surface error against the exact FIS', action='store_true', default=False)
 
     args = dotenv.parse_args_env(parser)
 
-    rcat_fis(args.database, args.igos)
+    rcat_fis(args.database, args.igos, args.fis_surface, args.validate_fis)
 
 
 if __name__ == '__main__':
@@ -12,6 +12,7 @@ import numpy as np
 import os
 
 from rscommons import Logger, dotenv
+from rscommons.reclassify import LookupTable, reclassify_rasters
 
 
 def rcat_rasters(existing_veg: str, historic_veg: str, database: str, out_folder: str):
@@ -53,36 +54,31 @@ def rcat_rasters(existing_veg: str, historic_veg: str, database: str, out_folder
         hvegetated_vals[row[0]] = row[2]
         hconv_vals[row[0]] = row[3]
 
-    with rasterio.open(existing_veg) as ex, rasterio.open(historic_veg) as hist:
-        meta = ex.profile
+    with rasterio.open(existing_veg) as ex:
         ndval = ex.nodata
-        exveg_arr = ex.read()[0, :, :]
-        histveg_arr = hist.read()[0, :, :]
-
-        ex_riparian_arr = np.full(exveg_arr.shape, ndval)
-        hist_riparian_arr = np.full(histveg_arr.shape, ndval)
-        ex_vegetated_arr = np.full(exveg_arr.shape, ndval)
-        hist_vegetated_arr = np.full(histveg_arr.shape, ndval)
-        conv_arr = np.full(exveg_arr.shape, ndval)
-
-        for j in range(exveg_arr.shape[0]):
-            for i in range(exveg_arr.shape[1]):
-                if exveg_arr[j, i] != ndval and exveg_arr[j, i] != -9999:
-                    ex_riparian_arr[j, i] = int(exriparian_vals[exveg_arr[j, i]])
-                    hist_riparian_arr[j, i] = int(hriparian_vals[histveg_arr[j, i]])
-                    ex_vegetated_arr[j, i] = int(exvegetated_vals[exveg_arr[j, i]])
-                    hist_vegetated_arr[j, i] = int(hvegetated_vals[histveg_arr[j, i]])
-                    conv_arr[j, i] = hconv_vals[histveg_arr[j, i]] - exconv_vals[exveg_arr[j, i]]
-
-    out_arrays = [ex_riparian_arr, hist_riparian_arr, ex_vegetated_arr, hist_vegetated_arr, conv_arr]
-    out_raster_paths = [os.path.join(out_folder, 'ex_riparian.tif'), os.path.join(out_folder, 'hist_riparian.tif'),
-                        os.path.join(out_folder, 'ex_vegetated.tif'), os.path.join(out_folder, 'hist_vegetated.tif'),
-                        os.path.join(out_folder, 'conversion.tif')]
-
-    for i, array in enumerate(out_arrays):
-        log.info(f'writing raster')
-        with rasterio.open(out_raster_paths[i], 'w', **meta) as dst:
-            dst.write(array, 1)
+
+    ex_riparian = LookupTable(exriparian_vals)
+    hist_riparian = LookupTable(hriparian_vals)
+    ex_vegetated = LookupTable(exvegetated_vals)
+    hist_vegetated = LookupTable(hvegetated_vals)
+    ex_conv = LookupTable(exconv_vals)
+    hist_conv = LookupTable(hconv_vals)
+
+    def valid(blocks):
+        return (blocks[0] != ndval) & (blocks[0] != -9999)
+
+    # All five rasters are written from a single windowed read of the existing and historic vegetation.
+    # Riparian and vegetated values are truncated to integers as before
+    outputs = {
+        os.path.join(out_folder, 'ex_riparian.tif'): lambda blocks: np.trunc(ex_riparian.apply(blocks[0], valid(blocks), ndval)),
+        os.path.join(out_folder, 'hist_riparian.tif'): lambda blocks: np.trunc(hist_riparian.apply(blocks[1], valid(blocks), ndval)),
+        os.path.join(out_folder, 'ex_vegetated.tif'): lambda blocks: np.trunc(ex_vegetated.apply(blocks[0], valid(blocks), ndval)),
+        os.path.join(out_folder, 'hist_vegetated.tif'): lambda blocks: np.trunc(hist_vegetated.apply(blocks[1], valid(blocks), ndval)),
+        os.path.join(out_folder, 'conversion.tif'): lambda blocks: np.where(valid(blocks), hist_conv.apply(blocks[1], valid(blocks)) - ex_conv.apply(blocks[0], valid(blocks)), ndval)
+    }
+
+    log.info('writing rasters')
+    reclassify_rasters([existing_veg, historic_veg], outputs, label='RCAT Vegetation Rasters')
 
 
 def main():
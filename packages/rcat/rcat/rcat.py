@@ -82,7 +82,8 @@ LayerTypes = {
 
 def rcat(huc: int, existing_veg: Path, historic_veg: Path, hillshade: Path, pitfilled: Path, igo: Path, dgo: Path,
          reaches: Path, roads: Path, rails: Path, canals: Path, valley: Path, output_folder: Path,
-         flow_areas: Path, waterbodies: Path, meta: Dict[str, str]):
+         flow_areas: Path, waterbodies: Path, meta: Dict[str, str], flow_dir: Path = None, fis_surface: bool = False, validate_fis: bool = False,
+         access_threads: int = 1):
 
     log = Logger('RCAT')
     log.info(f'HUC: {huc}')
@@ -303,7 +304,7 @@ def rcat(huc: int, existing_veg: Path, historic_veg: Path, hillshade: Path, pitf
     # floodplain accessibility raster
     fp_access = os.path.join(output_folder, LayerTypes['FPACCESS'].rel_path)
     flooplain_access(pitfilled, input_layers['VALLEYBOTTOM'], input_layers['ANTHROREACHES'], intermediates, fp_access,
-                     input_layers['ROADS'], input_layers['RAILS'], input_layers['CANALS'])
+                     input_layers['ROADS'], input_layers['RAILS'], input_layers['CANALS'], flow_dir, access_threads)
 
     # Add intermediate rasters to xml
     exrip_node, exrip_ras = project.add_project_raster(proj_nodes['Intermediates'], LayerTypes['EXRIPARIAN'])
@@ -328,9 +329,9 @@ def rcat(huc: int, existing_veg: Path, historic_veg: Path, hillshade: Path, pitf
     reach_attributes(outputs_gpkg_path)
 
     # Calculate FIS for IGOs
-    rcat_fis(outputs_gpkg_path, igos=True)
+    rcat_fis(outputs_gpkg_path, igos=True, fis_surface=fis_surface, validate_fis=validate_fis)
     # Calculate FIS for reaches
-    rcat_fis(outputs_gpkg_path, igos=False)
+    rcat_fis(outputs_gpkg_path, igos=False, fis_surface=fis_surface, validate_fis=validate_fis)
 
     ellapsed = time.time() - start_time
 
@@ -373,6 +374,10 @@ def main():
     parser.add_argument('output_folder', help='Output folder', type=str)
     parser.add_argument('--flow_areas', help='(optional) path to the flow area polygon feature class containing artificial paths', type=str)
     parser.add_argument('--waterbodies', help='(optional) waterbodies input', type=str)
+    parser.add_argument('--flow_dir', help='(optional) TauDEM D8 flow direction raster for the pit filled DEM. Generated when not provided', type=str)
+    parser.add_argument('--fis_surface', help='(optional) interpolate the FIS from cached response surfaces instead of computing every feature exactly', action='store_true', default=False)
+    parser.add_argument('--validate_fis', help='(optional) log the largest response surface error against the exact FIS', action='store_true', default=False)
+    parser.add_argument('--access_threads', help='(optional) threads for the floodplain accessibility kernel. Defaults to 1', type=int, default=1)
     parser.add_argument('--meta', help='riverscapes project metadata as comma separated key=value pairs', type=str)
     parser.add_argument('--verbose', help='(optional) a little extra logging ', action='store_true', default=False)
     parser.add_argument('--debug', help="(optional) save intermediate outputs for debugging", action='store_true', default=False)
@@ -394,13 +399,15 @@ def main():
                                          args.existing_veg, args.historic_veg, args.hillshade, args.pitfilled, args.igo,
                                          args.dgo, args.reaches, args.roads, args.rails, args.canals,
                                          args.valley, args.output_folder, args.flow_areas, args.waterbodies,
-                                         meta=meta)
+                                         meta=meta, flow_dir=args.flow_dir, fis_surface=args.fis_surface, validate_fis=args.validate_fis,
+                                         access_threads=args.access_threads)
             log.debug(f'Return code: {retcode}, [Max process usage] {max_obj}')
 
         else:
             rcat(args.huc, args.existing_veg, args.historic_veg, args.hillshade, args.pitfilled, args.igo, args.dgo,
                  args.reaches, args.roads, args.rails, args.canals, args.valley, args.output_folder, args.flow_areas,
-                 args.waterbodies, meta=meta)
+                 args.waterbodies, meta=meta, flow_dir=args.flow_dir, fis_surface=args.fis_surface, validate_fis=args.validate_fis,
+                 access_threads=args.access_threads)
 
     except Exception as e:
         log.error(e)
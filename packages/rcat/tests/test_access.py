@@ -0,0 +1,123 @@
+""" Testing for the floodplain accessibility kernel
+
+"""
+import unittest
+
+import numpy as np
+
+from rcat.lib.accessibility.access import access_algorithm, access_codes
+
+FD_ND = -32768
+VALLEY = 1
+CHANNEL = 2
+BARRIER = 4
+
+# Row and column offsets of TauDEM D8 flow directions 1 (east) to 8 (south east)
+D8 = {1: (0, 1), 2: (-1, 1), 3: (-1, 0), 4: (-1, -1), 5: (0, -1), 6: (1, -1), 7: (1, 0), 8: (1, 1)}
+
+
+def previous_access(fdarray, fd_nd, chan_a, chan_nd, r_a, road_nd, rr_a, rail_nd, c_a, canal_nd, vb_a, vb_nd):
+    """Python port of the kernel before it resolved each cell once (without the printing)
+
+    The checks run in the same order so later ones win: barriers over the channel and both over
+    a cell that is already resolved.
+    """
+    out = np.full(fdarray.shape, fd_nd, dtype=np.int32)
+    for row in range(fdarray.shape[0]):
+        for col in range(fdarray.shape[1]):
+            if vb_a[row, col] == vb_nd or out[row, col] != fd_nd:
+                continue
+
+            subprocessed = [(row, col)]
+            next_cell = fdarray[row, col]
+            rowa, cola = row, col
+            while next_cell is not None:
+                if next_cell == fd_nd:
+                    next_cell = None
+                for done, value in [(out[rowa, cola] != fd_nd, out[rowa, cola]),
+                                    (chan_a[rowa, cola] != chan_nd, 1),
+                                    (r_a[rowa, cola] != road_nd, 0),
+                                    (rr_a[rowa, cola] != rail_nd, 0),
+                                    (c_a[rowa, cola] != canal_nd, 0)]:
+                    if done:
+                        for coord in subprocessed:
+                            out[coord] = value
+                        next_cell = None
+
+                if next_cell is not None:
+                    drow, dcol = D8.get(int(next_cell), (0, 0))
+                    rowa, cola = rowa + drow, cola + dcol
+                    if (rowa, cola) in subprocessed:
+                        for coord in subprocessed:
+                            out[coord] = 2
+                        next_cell = None
+                    else:
+                        subprocessed.append((rowa, cola))
+                        next_cell = fdarray[rowa, cola]
+    return out
+
+
+def random_grid(rng):
+    """Random flow directions with invalid directions, nodata and overlapping infrastructure
+
+    The border is nodata so that no flow path steps off the raster (the previous kernel read out of
+    bounds there).
+    """
+    height, width = rng.integers(5, 40, 2)
+    fdarray = rng.integers(1, 9, (height, width)).astype(np.int32)
+    fdarray[rng.random((height, width)) < 0.03] = 0
+    fdarray[rng.random((height, width)) < 0.05] = FD_ND
+    fdarray[0, :] = fdarray[-1, :] = fdarray[:, 0] = fdarray[:, -1] = FD_ND
+
+    layers = [(rng.random((height, width)) < p).astype(np.int32) for p in [0.05, 0.03, 0.02, 0.02, 0.7]]
+    return fdarray, layers
+
+
+class AccessTest(unittest.TestCase):
+    """The kernel gives the same accessibility as the previous one, serial and threaded
+    """
+
+    def test_random_grids(self):
+        """Random grids at 1, 2, 3 and 8 threads
+        """
+        rng = np.random.default_rng(0)
+        for _trial in range(150):
+            fdarray, (chan, road, rail, canal, valley) = random_grid(rng)
+            expected = previous_access(fdarray, FD_ND, chan, 0, road, 0, rail, 0, canal, 0, valley, 0)
+
+            codes = valley.astype(np.uint8) | (chan.astype(np.uint8) * CHANNEL) | (((road | rail | canal) > 0).astype(np.uint8) * BARRIER)
+            for threads in [1, 2, 3, 8]:
+                np.testing.assert_array_equal(access_codes(fdarray, FD_ND, codes, VALLEY, CHANNEL, BARRIER, threads), expected)
+                np.testing.assert_array_equal(access_algorithm(fdarray, FD_ND, chan, 0, road, 0, rail, 0, canal, 0, valley, 0, threads), expected)
+
+    def test_paths(self):
+        """Cycles, nodata and barriers on the channel
+        """
+        # Row 1 flows east, row 2 flows west and row 3 is a two cell cycle
+        fdarray = np.full((5, 6), FD_ND, dtype=np.int32)
+        fdarray[1, 1:5] = 1
+        fdarray[2, 1:5] = 5
+        fdarray[3, 1:3] = [1, 5]
+        fdarray[3, 3] = 0
+        codes = np.zeros(fdarray.shape, dtype=np.uint8)
+        codes[1:4, 1:5] = VALLEY
+        # Channel at the end of row 1, a road on the channel at the end of row 2
+        codes[1, 4] |= CHANNEL
+        codes[2, 1] |= CHANNEL | BARRIER
+
+        expected = np.full(fdarray.shape, FD_ND, dtype=np.int32)
+        expected[1, 1:5] = 1
+        expected[2, 1:5] = 0
+        expected[3, 1:4] = 2
+        for threads in [1, 2, 8]:
+            np.testing.assert_array_equal(access_codes(fdarray, FD_ND, codes, VALLEY, CHANNEL, BARRIER, threads), expected)
+
+        # A path that runs into nodata stays nodata
+        fdarray[1, 3] = FD_ND
+        expected[1, 1:4] = FD_ND
+        for threads in [1, 2, 8]:
+            np.testing.assert_array_equal(access_codes(fdarray, FD_ND, codes, VALLEY, CHANNEL, BARRIER, threads), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
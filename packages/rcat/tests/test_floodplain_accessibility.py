@@ -0,0 +1,166 @@
+""" Testing for the coded floodplain accessibility infrastructure raster
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+from shapely.geometry import LineString, MultiPolygon, box
+
+from rscommons import GeopackageLayer
+from rcat.lib.floodplain_accessibility import CANAL, CHANNEL, RAIL, ROAD, VALLEY, rasterize_infrastructure
+
+ORIGIN = (500000.0, 4100000.0)
+CELL_SIZE = 10.0
+CELLS = 40
+BARRIERS = ROAD | RAIL | CANAL
+
+
+def previous_masks(inputs_gpkg: str, template_raster: str, valley: str, reaches: str, road: str, rail: str, canal: str) -> dict:
+    """The five separate rasterizations flooplain_access made before the coded raster (in memory
+    instead of temporary shapefiles and GeoTIFFs)
+
+    Returns:
+        dict: {'channel', 'road', 'rail', 'canal', 'valley': boolean mask of the burned cells}
+    """
+    dataset = gdal.Open(template_raster)
+    geo_transform = dataset.GetGeoTransform()
+    cell_res = abs(geo_transform[1])
+    srs = osr.SpatialReference()
+    srs.ImportFromWkt(dataset.GetProjectionRef())
+
+    inputs_ds = gdal.OpenEx(inputs_gpkg)
+    mem_ds = ogr.GetDriverByName('Memory').CreateDataSource('previous')
+    chan_lyr = inputs_ds.GetLayer(os.path.basename(reaches))
+    chan_lyr.SetAttributeFilter('ReachCode != 33600')
+    layers = {'channel': chan_lyr}
+    for name, vec in [('road', road), ('rail', rail), ('canal', canal)]:
+        inlyr = inputs_ds.GetLayer(os.path.basename(vec))
+        bufferlyr = mem_ds.CreateLayer(name, srs, geom_type=ogr.wkbPolygon)
+        for feature in inlyr:
+            out_feature = ogr.Feature(bufferlyr.GetLayerDefn())
+            out_feature.SetGeometry(feature.GetGeometryRef().Buffer(cell_res))
+            bufferlyr.CreateFeature(out_feature)
+        layers[name] = bufferlyr
+    layers['valley'] = inputs_ds.GetLayer(os.path.basename(valley))
+
+    masks = {}
+    for name, lyr in layers.items():
+        ras = gdal.GetDriverByName('MEM').Create('', dataset.RasterXSize, dataset.RasterYSize, 1, gdal.GDT_Int16)
+        ras.SetProjection(srs.ExportToWkt())
+        ras.SetGeoTransform(geo_transform)
+        gdal.RasterizeLayer(ras, [1], lyr)
+        masks[name] = ras.GetRasterBand(1).ReadAsArray() != 0
+    return masks
+
+
+def read_codes(raster: str) -> np.ndarray:
+    """Values of the coded raster
+    """
+    dataset = gdal.Open(raster)
+    return dataset.GetRasterBand(1).ReadAsArray()
+
+
+class RasterizeInfrastructureTest(unittest.TestCase):
+    """The coded raster decodes to the masks of the previous separate rasterizations
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.gpkg = os.path.join(self.tmp_dir, 'inputs.gpkg')
+        self.template = os.path.join(self.tmp_dir, 'dem.tif')
+        self.layers = {name: os.path.join(self.gpkg, name) for name in ['valley', 'reaches', 'road', 'rail', 'canal']}
+
+        srs = osr.SpatialReference()
+        srs.ImportFromEPSG(26912)
+        dem = gdal.GetDriverByName('GTiff').Create(self.template, CELLS, CELLS, 1, gdal.GDT_Float32)
+        dem.SetProjection(srs.ExportToWkt())
+        dem.SetGeoTransform([ORIGIN[0], CELL_SIZE, 0, ORIGIN[1], 0, -CELL_SIZE])
+        dem = None
+
+        def xy(x, y):
+            return ORIGIN[0] + x, ORIGIN[1] - y
+
+        # A main stem and a tributary, plus a reach of the excluded ReachCode
+        with GeopackageLayer(self.layers['reaches'], write=True) as lyr:
+            lyr.create_layer(ogr.wkbLineString, epsg=26912, fields={'ReachCode': ogr.OFTInteger})
+            lyr.create_feature(LineString([xy(205, 5), xy(195, 200), xy(203, 395)]), {'ReachCode': 46006})
+            lyr.create_feature(LineString([xy(55, 100), xy(195, 200)]), {'ReachCode': 46003})
+            lyr.create_feature(LineString([xy(355, 20), xy(355, 380)]), {'ReachCode': 33600})
+
+        # The road and rail run side by side across the channel and the canal crosses them both,
+        # the channel and the edge of the valley
+        for name, lines in [('road', [[xy(0, 250), xy(400, 250)]]),
+                            ('rail', [[xy(0, 262), xy(400, 243)]]),
+                            ('canal', [[xy(95, 355), xy(305, 145)], [xy(20, 20), xy(60, 40)]])]:
+            with GeopackageLayer(self.layers[name], write=True) as lyr:
+                lyr.create_layer(ogr.wkbLineString, epsg=26912)
+                for line in lines:
+                    lyr.create_feature(LineString(line))
+
+        # Overlapping valley bottom polygons so that cells covered twice still only get the valley bit once
+        with GeopackageLayer(self.layers['valley'], write=True) as lyr:
+            lyr.create_layer(ogr.wkbMultiPolygon, epsg=26912)
+            for polys in [[box(ORIGIN[0] + 100, ORIGIN[1] - 380, ORIGIN[0] + 300, ORIGIN[1] - 20)],
+                          [box(ORIGIN[0] + 150, ORIGIN[1] - 300, ORIGIN[0] + 250, ORIGIN[1] - 5)],
+                          [box(ORIGIN[0] + 35, ORIGIN[1] - 130, ORIGIN[0] + 145, ORIGIN[1] - 70), box(ORIGIN[0] + 10, ORIGIN[1] - 395, ORIGIN[0] + 60, ORIGIN[1] - 330)]]:
+                lyr.create_feature(MultiPolygon(polys))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_codes(self):
+        """Barriers win over the channel, overlapping barriers stay barriers and the valley bit decodes to the old valley mask
+        """
+        out_raster = os.path.join(self.tmp_dir, 'infrastructure.tif')
+        layers = self.layers
+        rasterize_infrastructure(self.gpkg, self.template, out_raster, layers['valley'], layers['reaches'], layers['road'], layers['rail'], layers['canal'])
+        codes = read_codes(out_raster)
+        masks = previous_masks(self.gpkg, self.template, layers['valley'], layers['reaches'], layers['road'], layers['rail'], layers['canal'])
+        barrier = masks['road'] | masks['rail'] | masks['canal']
+
+        # The fixture covers every overlap the codes have to resolve
+        self.assertGreater((masks['channel'] & barrier).sum(), 0)
+        self.assertGreater((masks['road'] & masks['rail']).sum(), 0)
+        self.assertGreater((masks['road'] & masks['canal']).sum(), 0)
+        self.assertGreater((masks['valley'] & barrier & masks['channel']).sum(), 0)
+        self.assertGreater((barrier & ~masks['valley']).sum(), 0)
+
+        # Only the five bits are used so the valley bottom was added once per cell
+        self.assertLess(int(codes.max()), 32)
+        np.testing.assert_array_equal((codes & VALLEY) > 0, masks['valley'])
+
+        # Every old barrier cell is a barrier, and the channel survives only where there is no barrier
+        # (the accessibility algorithm gave barriers precedence over the channel)
+        np.testing.assert_array_equal((codes & BARRIERS) > 0, barrier)
+        np.testing.assert_array_equal((codes & CHANNEL) > 0, masks['channel'] & ~barrier)
+        self.assertTrue(np.all(((codes & CHANNEL) == 0) | ((codes & BARRIERS) == 0)))
+
+        # Cells under a single barrier carry its own code
+        for name, code in [('road', ROAD), ('rail', RAIL), ('canal', CANAL)]:
+            others = [mask for other, mask in masks.items() if other in ['road', 'rail', 'canal'] and other != name]
+            only = masks[name] & ~others[0] & ~others[1]
+            self.assertGreater(only.sum(), 0)
+            np.testing.assert_array_equal(codes[only] & BARRIERS, np.full(only.sum(), code))
+
+    def test_missing_layer(self):
+        """A missing barrier layer is skipped and the others decode the same
+        """
+        out_raster = os.path.join(self.tmp_dir, 'infrastructure.tif')
+        layers = self.layers
+        rasterize_infrastructure(self.gpkg, self.template, out_raster, layers['valley'], layers['reaches'], layers['road'], layers['rail'], None)
+        codes = read_codes(out_raster)
+        masks = previous_masks(self.gpkg, self.template, layers['valley'], layers['reaches'], layers['road'], layers['rail'], layers['canal'])
+        barrier = masks['road'] | masks['rail']
+
+        self.assertFalse(np.any(codes & CANAL))
+        np.testing.assert_array_equal((codes & VALLEY) > 0, masks['valley'])
+        np.testing.assert_array_equal((codes & BARRIERS) > 0, barrier)
+        np.testing.assert_array_equal((codes & CHANNEL) > 0, masks['channel'] & ~barrier)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,254 @@
+""" RME Metric Context
+
+    Purpose:    Layers, geometries and window summaries shared by every metric in a metric engine run.
+                The junction and ecoregion layers stay open for the whole run, the line network is
+                loaded once into a spatial index and the vbet segments of the current level path are
+                held in memory so that window polygons and window attribute sums no longer need an
+                OGR query per metric per point. The engine keeps the window polygons of each point.
+    Author:     North Arrow Research
+    Date:       Oct 2026
+"""
+from contextlib import ExitStack
+from typing import Dict, List, Tuple
+
+import numpy as np
+from osgeo import ogr
+
+from rscommons import GeopackageLayer, VectorBase
+from rscommons.spatial_index import IndexedSTRtree
+from rscommons.vector_ops import collect_linestring
+
+# Line network attributes used by the metrics
+NETWORK_FIELDS = ['StreamOrde', 'STARTFLAG', 'FCode', 'TotDASqKm']
+# vbet segment attributes that can be summed over a window
+SEGMENT_FIELDS = ['active_floodplain_area', 'active_channel_area', 'centerline_length', 'segment_area', 'floodplain_area']
+
+
+class MetricContext():
+    """Per run cache for the metric engine
+
+        with MetricContext(line_network, segments, centerlines, junctions, ecoregions) as context:
+            context.set_level_path(level_path)
+            geom_window = context.window(level_path, window, segment_distance)
+    """
+
+    def __init__(self, line_network: str, segments: str, centerlines: str, junctions: str, ecoregions: str):
+        """
+        Args:
+            line_network (str): path to the line network layer
+            segments (str): path to the vbet segment polygon layer
+            centerlines (str): path to the vbet centerline layer
+            junctions (str): path to the junction points layer
+            ecoregions (str): path to the ecoregions polygon layer
+        """
+        self.line_network = line_network
+        self.segments = segments
+        self.centerlines = centerlines
+        self.junctions = junctions
+        self.ecoregions = ecoregions
+
+        self.lyr_segments = None
+        self.lyr_junctions = None
+        self.lyr_ecoregions = None
+        self._stack = None
+
+        self.network_geoms = []
+        self.network_attributes = []
+        self.network_index = None
+
+        self.level_path = None
+        self._segment_distances = np.zeros(0)
+        self._segment_geoms = []
+        self._segment_values = {}
+        self._linestrings = {}
+        self._window_sums = {}
+
+    def __enter__(self) -> 'MetricContext':
+        self._stack = ExitStack()
+        self.lyr_segments = self._stack.enter_context(GeopackageLayer(self.segments))
+        self.lyr_junctions = self._stack.enter_context(GeopackageLayer(self.junctions))
+        self.lyr_ecoregions = self._stack.enter_context(GeopackageLayer(self.ecoregions))
+        self._load_network()
+        return self
+
+    def __exit__(self, _type, _value, _traceback):
+        self._stack.close()
+        self.lyr_segments = None
+        self.lyr_junctions = None
+        self.lyr_ecoregions = None
+
+    def _load_network(self):
+        """Read the line network once into memory and index it with an IndexedSTRtree
+        """
+        shapes = []
+        with GeopackageLayer(self.line_network) as lyr_lines:
+            fields = [field for field in NETWORK_FIELDS if lyr_lines.ogr_layer_def.GetFieldIndex(field) >= 0]
+            for feat, *_ in lyr_lines.iterate_features():
+                geom = feat.GetGeometryRef()
+                if geom is None:
+                    continue
+                geom = geom.Clone()
+                self.network_geoms.append(geom)
+                self.network_attributes.append({field: feat.GetField(field) for field in fields})
+                shapes.append(VectorBase.ogr2shapely(geom))
+
+        self.network_index = IndexedSTRtree(shapes)
+
+    def set_level_path(self, level_path: str):
+        """Load the vbet segments of a level path into memory and drop everything cached for the previous one
+
+        Args:
+            level_path (str): level path about to be processed
+        """
+        self.level_path = level_path
+        self._linestrings = {}
+        self._window_sums = {}
+
+        distances = []
+        self._segment_geoms = []
+        fields = [field for field in SEGMENT_FIELDS if self.lyr_segments.ogr_layer_def.GetFieldIndex(field) >= 0]
+        values = {field: [] for field in fields}
+        for feat, *_ in self.lyr_segments.iterate_features(attribute_filter=f'LevelPathI = {level_path}'):
+            geom = feat.GetGeometryRef()
+            distances.append(feat.GetField('seg_distance'))
+            self._segment_geoms.append(geom.Clone() if geom is not None else None)
+            for field in fields:
+                values[field].append(feat.GetField(field))
+
+        self._segment_distances = np.array(distances, dtype=np.float64)
+        self._segment_values = values
+
+    def _segments_in_window(self, level_path: str, window: float, segment_dist: float) -> List[int]:
+        """Indexes (in layer order) of the level path segments within half a window of the segment distance
+        """
+        if level_path != self.level_path:
+            self.set_level_path(level_path)
+        min_dist = segment_dist - 0.5 * window
+        max_dist = segment_dist + 0.5 * window
+        return np.flatnonzero((self._segment_distances >= min_dist) & (self._segment_distances <= max_dist)).tolist()
+
+    def linestring(self, layer: str, attribute_filter: str, precision: int = None) -> ogr.Geometry:
+        """Merged linestring of a layer subset, collected once per level path
+
+        Args:
+            layer (str): path to the line layer
+            attribute_filter (str): attribute filter selecting the lines
+            precision (int, optional): coordinate decimal precision. Defaults to None.
+
+        Returns:
+            ogr.Geometry: merged linestring or multilinestring
+        """
+        key = (layer, attribute_filter, precision)
+        if key not in self._linestrings:
+            self._linestrings[key] = collect_linestring(layer, attribute_filter, precision=precision)
+        return self._linestrings[key]
+
+    def window(self, level_path: str, window: float, segment_dist: float, buffer: float = 0) -> ogr.Geometry:
+        """Polygon of the analysis window from the level path segments held in memory
+
+        Args:
+            level_path (str): level path of window
+            window (float): size of window
+            segment_dist (float): vbet segment point of window (identifed by segment distance)
+            buffer (float, optional): buffer the window polygon. Defaults to 0.
+
+        Returns:
+            ogr.Geometry: polygon of window
+        """
+        geom_window_sections = ogr.Geometry(ogr.wkbMultiPolygon)
+        for idx in self._segments_in_window(level_path, window, segment_dist):
+            geom = self._segment_geoms[idx]
+            if geom is None:
+                continue
+            if geom.GetGeometryName() in ['MULTIPOLYGON', 'GEOMETRYCOLLECTION']:
+                for i in range(0, geom.GetGeometryCount()):
+                    geo = geom.GetGeometryRef(i)
+                    if geo.GetGeometryName() == 'POLYGON':
+                        geom_window_sections.AddGeometry(geo)
+            else:
+                geom_window_sections.AddGeometry(geom)
+        geom_window = geom_window_sections.Buffer(buffer)
+
+        return geom_window
+
+    def sum_window_attributes(self, level_path: str, window: float, segment_dist: float, fields: list) -> dict:
+        """summerize window attributes from a list. Every segment field is summed on the first request
+        for a window and reused for later metrics.
+
+        Args:
+            level_path (str): level path to summeize
+            window (float): size of window
+            segment_dist (float): distance of segment
+            fields (list): attribute fields to summerize
+
+        Raises:
+            KeyError: when a field is not one of the SEGMENT_FIELDS in the vbet segments layer
+
+        Returns:
+            dict: field name: attribute value (fields are missing when there are no segments in the window)
+        """
+        key = (level_path, window, segment_dist)
+        if key not in self._window_sums:
+            sums = {}
+            for idx in self._segments_in_window(level_path, window, segment_dist):
+                for field, values in self._segment_values.items():
+                    result = values[idx]
+                    result = result if result is not None else 0.0
+                    sums[field] = sums.get(field, 0) + result
+            self._window_sums[key] = sums
+
+        missing = [field for field in fields if field not in self._segment_values]
+        if len(missing) > 0:
+            raise KeyError(f'Fields {missing} are not in the vbet segments layer {self.segments} (or not in SEGMENT_FIELDS)')
+
+        sums = self._window_sums[key]
+        return {field: sums[field] for field in fields if field in sums}
+
+    def network_features(self, geom_window: ogr.Geometry) -> List[Tuple[ogr.Geometry, Dict]]:
+        """Line network features that intersect a window, in layer order
+
+        Args:
+            geom_window (ogr.Geometry): window polygon
+
+        Returns:
+            List[Tuple[ogr.Geometry, Dict]]: (line geometry, {field: value}) for each intersecting line
+        """
+        if geom_window is None or geom_window.IsEmpty():
+            return []
+
+        shape_window = VectorBase.ogr2shapely(geom_window)
+        return [(self.network_geoms[idx], self.network_attributes[idx]) for idx in self.network_index.intersecting(shape_window)]
+
+    def count_junctions(self, geom_window: ogr.Geometry, junction_type: str) -> int:
+        """Number of junctions of one type within a window
+
+        Args:
+            geom_window (ogr.Geometry): window polygon
+            junction_type (str): Confluence, Diffluence or Tributary
+
+        Returns:
+            int: junction count
+        """
+        count = 0
+        for _feat, *_ in self.lyr_junctions.iterate_features(clip_shape=geom_window, attribute_filter=f""""JunctionType" = '{junction_type}'"""):
+            count += 1
+        return count
+
+    def ecoregion_areas(self, geom_window: ogr.Geometry, field: str) -> dict:
+        """Area of each ecoregion within a window
+
+        Args:
+            geom_window (ogr.Geometry): window polygon
+            field (str): ecoregion code field (US_L3CODE or US_L4CODE)
+
+        Returns:
+            dict: ecoregion code: area
+        """
+        attributes = {}
+        for feat, *_ in self.lyr_ecoregions.iterate_features(clip_shape=geom_window):
+            geom_ecoregion = feat.GetGeometryRef()
+            attribute = str(feat.GetField(field))
+            geom_section = geom_window.Intersection(geom_ecoregion)
+            area = geom_section.GetArea()
+            attributes[attribute] = attributes.get(attribute, 0) + area
+        return attributes
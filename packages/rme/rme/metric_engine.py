@@ -30,12 +30,13 @@ from rscommons.classes.vector_base import get_utm_zone_epsg
 from rscommons.util import safe_makedirs, parse_metadata
 from rscommons.database import load_lookup_data
 from rscommons.geometry_ops import reduce_precision, get_endpoints
-from rscommons.vector_ops import copy_feature_class, collect_linestring
+from rscommons.vector_ops import copy_feature_class
 from rscommons.vbet_network import copy_vaa_attributes, join_attributes
 from rscommons.augment_lyr_meta import augment_layermeta, add_layer_descriptions
 
 from rme.__version__ import __version__
 from rme.analysis_window import AnalysisLine
+from rme.metric_context import MetricContext
 
 Path = str
 
@@ -207,7 +208,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
         buffer_distance[stream_size] = buffer
 
     with GeopackageLayer(points) as lyr_points, \
-            GeopackageLayer(segments) as lyr_segments,\
+            MetricContext(line_network, segments, centerlines, junctions, ecoregions) as context, \
             sqlite3.connect(outputs_gpkg) as conn, \
             rasterio.open(dem) as src_dem:
 
@@ -227,12 +228,13 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
         for level_path in level_paths_to_run:
             progbar.update(counter)
             counter += 1
-            geom_flowline = collect_linestring(line_network, f'LevelPathI = {level_path}')
+            context.set_level_path(level_path)
+            geom_flowline = context.linestring(line_network, f'LevelPathI = {level_path}')
             if geom_flowline.IsEmpty():
                 log.error(f'Flowline for level path {level_path} is empty geometry')
                 continue
 
-            geom_centerline = collect_linestring(centerlines, f'LevelPathI = {level_path}', precision=8)
+            geom_centerline = context.linestring(centerlines, f'LevelPathI = {level_path}', precision=8)
 
             for feat_seg_pt, *_ in lyr_points.iterate_features(attribute_filter=f'LevelPathI = {level_path}'):
                 # Gather common components for metric calcuations
@@ -251,7 +253,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['STRMGRAD']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance, buffer_size_clip)
+                        window_geoms[window] = context.window(level_path, window, segment_distance, buffer_size_clip)
 
                     stream_length, min_elev, max_elev = get_segment_measurements(geom_flowline, src_dem, window_geoms[window], buffer_distance[stream_size], transform)
                     measurements_output[measurements['STRMMINELEV']['measurement_id']] = min_elev
@@ -265,7 +267,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['VALGRAD']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance, buffer_size_clip)
+                        window_geoms[window] = context.window(level_path, window, segment_distance, buffer_size_clip)
 
                     centerline_length, *_ = get_segment_measurements(geom_centerline, src_dem, window_geoms[window], buffer_distance[stream_size], transform)
                     measurements_output[measurements['VALLENG']['measurement_id']] = centerline_length
@@ -282,13 +284,9 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['STRMORDR']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance, buffer_size_clip)
+                        window_geoms[window] = context.window(level_path, window, segment_distance, buffer_size_clip)
 
-                    results = []
-                    with GeopackageLayer(line_network) as lyr_lines:
-                        for feat, *_ in lyr_lines.iterate_features(clip_shape=window_geoms[window]):
-                            results.append(feat.GetField('StreamOrde'))
-                        lyr_lines.ogr_layer.SetSpatialFilter(None)
+                    results = [attributes['StreamOrde'] for _geom, attributes in context.network_features(window_geoms[window])]
                     if len(results) > 0:
                         stream_order = max(results)
                     else:
@@ -300,20 +298,16 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['HEDWTR']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
                     sum_attributes = {}
-                    with GeopackageLayer(line_network) as lyr_lines:
-                        for feat, *_ in lyr_lines.iterate_features(clip_shape=window_geoms[window]):
-                            line_geom = feat.GetGeometryRef()
-                            attribute = str(feat.GetField('STARTFLAG'))
-                            if attribute not in ['1', '0']:
-                                continue
-                            geom_section = window_geoms[window].Intersection(line_geom)
-                            length = geom_section.Length()
-                            sum_attributes[attribute] = sum_attributes.get(attribute, 0) + length
-                        lyr_lines.ogr_layer.SetSpatialFilter(None)
-                        lyr_lines = None
+                    for line_geom, line_attributes in context.network_features(window_geoms[window]):
+                        attribute = str(line_attributes['STARTFLAG'])
+                        if attribute not in ['1', '0']:
+                            continue
+                        geom_section = window_geoms[window].Intersection(line_geom)
+                        length = geom_section.Length()
+                        sum_attributes[attribute] = sum_attributes.get(attribute, 0) + length
                     if sum(sum_attributes.values()) == 0:
                         is_headwater = None
                     else:
@@ -324,18 +318,14 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['STRMTYPE']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
                     attributes = {}
-                    with GeopackageLayer(line_network) as lyr_lines:
-                        for feat, *_ in lyr_lines.iterate_features(clip_shape=window_geoms[window]):
-                            line_geom = feat.GetGeometryRef()
-                            attribute = str(feat.GetField('FCode'))
-                            geom_section = window_geoms[window].Intersection(line_geom)
-                            length = geom_section.Length()
-                            attributes[attribute] = attributes.get(attribute, 0) + length
-                        lyr_lines.ogr_layer.SetSpatialFilter(None)
-                        lyr_lines = None
+                    for line_geom, line_attributes in context.network_features(window_geoms[window]):
+                        attribute = str(line_attributes['FCode'])
+                        geom_section = window_geoms[window].Intersection(line_geom)
+                        length = geom_section.Length()
+                        attributes[attribute] = attributes.get(attribute, 0) + length
                     if len(attributes) == 0:
                         majority_fcode = None
                     else:
@@ -346,7 +336,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['ACTFLDAREA']
                     window = metric[stream_size]
 
-                    values = sum_window_attributes(lyr_segments, window, level_path, segment_distance, ['active_floodplain_area'])
+                    values = context.sum_window_attributes(level_path, window, segment_distance, ['active_floodplain_area'])
                     afp_area = values.get('active_floodplain_area', 0.0)
                     metrics_output[metric['metric_id']] = afp_area
 
@@ -354,7 +344,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['ACTCHANAREA']
                     window = metric[stream_size]
 
-                    values = sum_window_attributes(lyr_segments, window, level_path, segment_distance, ['active_channel_area'])
+                    values = context.sum_window_attributes(level_path, window, segment_distance, ['active_channel_area'])
                     ac_area = values.get('active_channel_area', 0.0)
                     metrics_output[metric['metric_id']] = ac_area
 
@@ -362,7 +352,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['INTGWDTH']
                     window = metric[stream_size]
 
-                    values = sum_window_attributes(lyr_segments, window, level_path, segment_distance, ['centerline_length', 'segment_area'])
+                    values = context.sum_window_attributes(level_path, window, segment_distance, ['centerline_length', 'segment_area'])
                     ig_width = values.get('segment_area', 0.0) / values['centerline_length'] if 'centerline_length' in values else None
                     metrics_output[metric['metric_id']] = ig_width
 
@@ -370,7 +360,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['CHANVBRAT']
                     window = metric[stream_size]
 
-                    values = sum_window_attributes(lyr_segments, window, level_path, segment_distance, ['active_channel_area', 'segment_area'])
+                    values = context.sum_window_attributes(level_path, window, segment_distance, ['active_channel_area', 'segment_area'])
                     ac_area = values.get('active_channel_area', 0.0)
                     vbet_area = values.get('segment_area', 0.0)
                     ac_ratio = ac_area / vbet_area if vbet_area > 0.0 else None
@@ -380,7 +370,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['FLDVBRAT']
                     window = metric[stream_size]
 
-                    values = sum_window_attributes(lyr_segments, window, level_path, segment_distance, ['floodplain_area', 'segment_area'])
+                    values = context.sum_window_attributes(level_path, window, segment_distance, ['floodplain_area', 'segment_area'])
                     fp_area = values.get('floodplain_area', 0.0)
                     vbet_area = values.get('segment_area', 0.0)
                     fp_ratio = fp_area / vbet_area if vbet_area > 0.0 else None
@@ -390,9 +380,9 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['RELFLWLNGTH']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
-                    geom_flowline_full = collect_linestring(line_network, f'vbet_level_path = {level_path}')
+                    geom_flowline_full = context.linestring(line_network, f'vbet_level_path = {level_path}')
                     stream_length_total, *_ = get_segment_measurements(geom_flowline_full, src_dem, window_geoms[window], buffer_distance[stream_size], transform)
                     centerline_length, *_ = get_segment_measurements(geom_centerline, src_dem, window_geoms[window], buffer_distance[stream_size], transform)
 
@@ -403,9 +393,9 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['STRMSIZE']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
-                    values = sum_window_attributes(lyr_segments, window, level_path, segment_distance, ['active_channel_area', 'active_floodplain_area'])
+                    values = context.sum_window_attributes(level_path, window, segment_distance, ['active_channel_area', 'active_floodplain_area'])
                     stream_length, *_ = get_segment_measurements(geom_flowline, src_dem, window_geoms[window], buffer_distance[stream_size], transform)
                     ac_area = values.get('active_channel_area', 0.0)
 
@@ -416,17 +406,9 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['ECORGIII']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
-                    attributes = {}
-                    with GeopackageLayer(ecoregions) as lyr_ecoregions:
-                        for feat, *_ in lyr_ecoregions.iterate_features(clip_shape=window_geoms[window]):
-                            geom_ecoregion = feat.GetGeometryRef()
-                            attribute = str(feat.GetField('US_L3CODE'))
-                            geom_section = window_geoms[window].Intersection(geom_ecoregion)
-                            area = geom_section.GetArea()
-                            attributes[attribute] = attributes.get(attribute, 0) + area
-                        lyr_ecoregions = None
+                    attributes = context.ecoregion_areas(window_geoms[window], 'US_L3CODE')
                     if len(attributes) == 0:
                         log.warning(f'Unable to find majority ecoregion III for pt {point_id} in level path {level_path}')
                         majority_attribute = None
@@ -438,17 +420,9 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['ECORGIV']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
-                    attributes = {}
-                    with GeopackageLayer(ecoregions) as lyr_ecoregions:
-                        for feat, *_ in lyr_ecoregions.iterate_features(clip_shape=window_geoms[window]):
-                            geom_ecoregion = feat.GetGeometryRef()
-                            attribute = str(feat.GetField('US_L4CODE'))
-                            geom_section = window_geoms[window].Intersection(geom_ecoregion)
-                            area = geom_section.GetArea()
-                            attributes[attribute] = attributes.get(attribute, 0) + area
-                        lyr_ecoregions = None
+                    attributes = context.ecoregion_areas(window_geoms[window], 'US_L4CODE')
                     if len(attributes) == 0:
                         log.warning(f'Unable to find majority ecoregion III for pt {point_id} in level path {level_path}')
                         majority_attribute = None
@@ -460,43 +434,31 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['CONF']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
-                    with GeopackageLayer(junctions) as lyr_pts:
-                        count = 0
-                        for feat, *_ in lyr_pts.iterate_features(clip_shape=window_geoms[window], attribute_filter=""""JunctionType" = 'Confluence'"""):
-                            count += 1
-                        metrics_output[metric['metric_id']] = count
+                    metrics_output[metric['metric_id']] = context.count_junctions(window_geoms[window], 'Confluence')
 
                 if 'DIFF' in metrics:
                     metric = metrics['DIFF']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
-                    with GeopackageLayer(junctions) as lyr_pts:
-                        count = 0
-                        for feat, *_ in lyr_pts.iterate_features(clip_shape=window_geoms[window], attribute_filter=""""JunctionType" = 'Diffluence'"""):
-                            count += 1
-                        metrics_output[metric['metric_id']] = count
+                    metrics_output[metric['metric_id']] = context.count_junctions(window_geoms[window], 'Diffluence')
 
                 if 'TRIBS' in metrics:
                     metric = metrics['TRIBS']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
-                    with GeopackageLayer(junctions) as lyr_pts:
-                        count = 0
-                        for feat, *_ in lyr_pts.iterate_features(clip_shape=window_geoms[window], attribute_filter=""""JunctionType" = 'Tributary'"""):
-                            count += 1
-                        metrics_output[metric['metric_id']] = count
+                    metrics_output[metric['metric_id']] = context.count_junctions(window_geoms[window], 'Tributary')
 
                 if 'CHANSIN' in metrics:
                     metric = metrics['CHANSIN']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
                     line = AnalysisLine(geom_flowline, window_geoms[window])
                     measurements_output[measurements['STRMSTRLENG']['measurement_id']] = line.endpoint_distance
@@ -506,12 +468,9 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['DRAINAREA']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance, buffer_size_clip)
+                        window_geoms[window] = context.window(level_path, window, segment_distance, buffer_size_clip)
 
-                    results = []
-                    with GeopackageLayer(line_network) as lyr_lines:
-                        for feat, *_ in lyr_lines.iterate_features(clip_shape=window_geoms[window]):
-                            results.append(feat.GetField('TotDASqKm'))
+                    results = [attributes['TotDASqKm'] for _geom, attributes in context.network_features(window_geoms[window])]
                     if len(results) > 0:
                         drainage_area = max(results)
                     else:
@@ -523,7 +482,7 @@ def metric_engine(huc: int, in_flowlines: Path, in_vaa_table: Path, in_segments:
                     metric = metrics['VALAZMTH']
                     window = metric[stream_size]
                     if window not in window_geoms:
-                        window_geoms[window] = generate_window(lyr_segments, window, level_path, segment_distance)
+                        window_geoms[window] = context.window(level_path, window, segment_distance)
 
                     cline = AnalysisLine(geom_centerline, window_geoms[window])
                     metrics_output[metric['metric_id']] = cline.azimuth()
@@ -621,38 +580,6 @@ def generate_metric_list(database: Path, source_table: str = 'metrics') -> dict:
     return metrics
 
 
-def generate_window(lyr: GeopackageLayer, window: float, level_path: str, segment_dist: float, buffer: float = 0) -> ogr.Geometry:
-    """generate the window polygon geometry
-
-    Args:
-        lyr (GeopackageLayer): vbet segments polygon layer
-        window (float): size of window
-        level_path (str): level path of window
-        segment_dist (float): vbet segment point of window (identifed by segment distance)
-        buffer (float, optional): buffer the window polygon. Defaults to 0.
-
-    Returns:
-        ogr.Geometry: polygon of window
-    """
-
-    min_dist = segment_dist - 0.5 * window
-    max_dist = segment_dist + 0.5 * window
-    sql = f'LevelPathI = {level_path} AND seg_distance >= {min_dist} AND seg_distance <={max_dist}'
-    geom_window_sections = ogr.Geometry(ogr.wkbMultiPolygon)
-    for feat, *_ in lyr.iterate_features(attribute_filter=sql):
-        geom = feat.GetGeometryRef()
-        if geom.GetGeometryName() in ['MULTIPOLYGON', 'GEOMETRYCOLLECTION']:
-            for i in range(0, geom.GetGeometryCount()):
-                geo = geom.GetGeometryRef(i)
-                if geo.GetGeometryName() == 'POLYGON':
-                    geom_window_sections.AddGeometry(geo)
-        else:
-            geom_window_sections.AddGeometry(geom)
-    geom_window = geom_window_sections.Buffer(buffer)  # ogr.ForceToPolygon(geom_window_sections)
-
-    return geom_window
-
-
 def get_segment_measurements(geom_line: ogr.Geometry, src_raster: rasterio.DatasetReader, geom_window: ogr.Geometry, buffer: float, transform) -> tuple:
     """ return length of segment and endpoint elevations of a line
 
@@ -690,33 +617,6 @@ def get_segment_measurements(geom_line: ogr.Geometry, src_raster: rasterio.Datas
     return stream_length, elevations[0], elevations[1]
 
 
-def sum_window_attributes(lyr: GeopackageLayer, window: float, level_path: str, segment_dist: float, fields: list) -> dict:
-    """summerize window attributes from a list
-
-    Args:
-        lyr (GeopackageLayer): vbet segmented polygons layer
-        window (float): size of window
-        level_path (str): level path to summeize
-        segment_dist (float): distance of segment
-        fields (list): attribute fields to summerize
-
-    Returns:
-        dict: field name: attribute value
-    """
-
-    results = {}
-    min_dist = segment_dist - 0.5 * window
-    max_dist = segment_dist + 0.5 * window
-    sql = f'LevelPathI = {level_path} AND seg_distance >= {min_dist} AND seg_distance <={max_dist}'
-    for feat, *_ in lyr.iterate_features(attribute_filter=sql):
-        for field in fields:
-            result = feat.GetField(field)
-            result = result if result is not None else 0.0
-            results[field] = results.get(field, 0) + result
-
-    return results
-
-
 def main():
     """Run Riverscapes Metric Engine"""
 
@@ -0,0 +1,154 @@
+""" Testing for the RME metric context
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from osgeo import ogr
+from shapely.geometry import LineString, MultiPolygon, box
+
+from rscommons import GeopackageLayer
+from rscommons.gpkg_writer import write_features
+from rme.metric_context import NETWORK_FIELDS, MetricContext
+
+SEGMENT_AREA_FIELDS = ['active_floodplain_area', 'active_channel_area', 'centerline_length', 'segment_area', 'floodplain_area']
+
+
+def previous_window(lyr: GeopackageLayer, window: float, level_path: str, segment_dist: float, buffer: float = 0) -> ogr.Geometry:
+    """generate_window from the metric engine before the metric context
+    """
+    min_dist = segment_dist - 0.5 * window
+    max_dist = segment_dist + 0.5 * window
+    sql = f'LevelPathI = {level_path} AND seg_distance >= {min_dist} AND seg_distance <={max_dist}'
+    geom_window_sections = ogr.Geometry(ogr.wkbMultiPolygon)
+    for feat, *_ in lyr.iterate_features(attribute_filter=sql):
+        geom = feat.GetGeometryRef()
+        if geom.GetGeometryName() in ['MULTIPOLYGON', 'GEOMETRYCOLLECTION']:
+            for i in range(0, geom.GetGeometryCount()):
+                geo = geom.GetGeometryRef(i)
+                if geo.GetGeometryName() == 'POLYGON':
+                    geom_window_sections.AddGeometry(geo)
+        else:
+            geom_window_sections.AddGeometry(geom)
+    return geom_window_sections.Buffer(buffer)
+
+
+def previous_sums(lyr: GeopackageLayer, window: float, level_path: str, segment_dist: float, fields: list) -> dict:
+    """sum_window_attributes from the metric engine before the metric context
+    """
+    results = {}
+    min_dist = segment_dist - 0.5 * window
+    max_dist = segment_dist + 0.5 * window
+    sql = f'LevelPathI = {level_path} AND seg_distance >= {min_dist} AND seg_distance <={max_dist}'
+    for feat, *_ in lyr.iterate_features(attribute_filter=sql):
+        for field in fields:
+            result = feat.GetField(field)
+            result = result if result is not None else 0.0
+            results[field] = results.get(field, 0) + result
+    return results
+
+
+def previous_network(line_network: str, geom_window: ogr.Geometry) -> list:
+    """Line network features found by reopening the layer with the window as a spatial filter
+    """
+    features = []
+    with GeopackageLayer(line_network) as lyr_lines:
+        for feat, *_ in lyr_lines.iterate_features(clip_shape=geom_window):
+            features.append((feat.GetGeometryRef().ExportToWkt(), {field: feat.GetField(field) for field in NETWORK_FIELDS}))
+    return features
+
+
+class MetricContextTest(unittest.TestCase):
+    """Windows, window sums and network features match the per-call OGR queries they replaced
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        gpkg = os.path.join(self.tmp_dir, 'rme.gpkg')
+        self.segments = os.path.join(gpkg, 'vbet_segments')
+        self.line_network = os.path.join(gpkg, 'network')
+        self.junctions = os.path.join(gpkg, 'junctions')
+        self.ecoregions = os.path.join(gpkg, 'ecoregions')
+        self.centerlines = os.path.join(gpkg, 'centerlines')
+
+        with GeopackageLayer(self.segments, write=True) as lyr:
+            lyr.create_layer(ogr.wkbMultiPolygon, epsg=26912, fields={'LevelPathI': ogr.OFTReal, 'seg_distance': ogr.OFTReal, **{field: ogr.OFTReal for field in SEGMENT_AREA_FIELDS}})
+        with GeopackageLayer(self.line_network, write=True) as lyr:
+            lyr.create_layer(ogr.wkbLineString, epsg=26912, fields={'StreamOrde': ogr.OFTInteger, 'STARTFLAG': ogr.OFTInteger, 'FCode': ogr.OFTInteger, 'TotDASqKm': ogr.OFTReal})
+        with GeopackageLayer(self.junctions, write=True) as lyr:
+            lyr.create_layer(ogr.wkbPoint, epsg=26912, fields={'JunctionType': ogr.OFTString})
+        with GeopackageLayer(self.ecoregions, write=True) as lyr:
+            lyr.create_layer(ogr.wkbMultiPolygon, epsg=26912, fields={'US_L3CODE': ogr.OFTString})
+
+        # Level path 10 runs east along y = 0 to 200, level path 20 sits to the north. Every third
+        # segment is in two parts and some area fields are null
+        geoms = []
+        attributes = {'LevelPathI': [], 'seg_distance': [], **{field: [] for field in SEGMENT_AREA_FIELDS}}
+        for level_path, count, y_min in [(10, 20, 0), (20, 6, 1000)]:
+            for idx in range(count):
+                x_min = idx * 100
+                if idx % 3 == 0:
+                    geoms.append(MultiPolygon([box(x_min, y_min, x_min + 50, y_min + 200), box(x_min + 50, y_min + 20, x_min + 100, y_min + 180)]))
+                else:
+                    geoms.append(MultiPolygon([box(x_min, y_min, x_min + 100, y_min + 200)]))
+                attributes['LevelPathI'].append(level_path)
+                attributes['seg_distance'].append(x_min + 50.0)
+                for field_idx, field in enumerate(SEGMENT_AREA_FIELDS):
+                    attributes[field].append(None if (idx + field_idx) % 5 == 0 else geoms[-1].area * (field_idx + 1) / 10)
+        write_features(gpkg, 'vbet_segments', geoms, attributes)
+
+        # The main stem in 250m pieces, tributaries crossing the valley and lines well outside it
+        lines = [LineString([(x, 100), (x + 250, 100)]) for x in range(-50, 2000, 250)]
+        lines += [LineString([(x, 150), (x + 40, 400)]) for x in range(30, 2000, 170)]
+        lines += [LineString([(x, 600), (x + 100, 700)]) for x in range(0, 2000, 400)]
+        write_features(gpkg, 'network', lines, {
+            'StreamOrde': [idx % 4 + 1 for idx in range(len(lines))],
+            'STARTFLAG': [idx % 2 for idx in range(len(lines))],
+            'FCode': [46006 if idx % 3 else 46003 for idx in range(len(lines))],
+            'TotDASqKm': [None if idx % 7 == 0 else idx * 1.5 for idx in range(len(lines))]
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_windows(self):
+        """Windows, window sums and the network features in each window
+        """
+        with MetricContext(self.line_network, self.segments, self.centerlines, self.junctions, self.ecoregions) as context, \
+                GeopackageLayer(self.segments) as lyr_segments:
+            for level_path, distances in [(10, range(50, 2000, 100)), (20, range(50, 600, 100))]:
+                context.set_level_path(level_path)
+                for segment_distance in distances:
+                    for window in [100, 300, 550, 1000]:
+                        for buffer in [0, 25]:
+                            expected = previous_window(lyr_segments, window, level_path, segment_distance, buffer)
+                            geom_window = context.window(level_path, window, segment_distance, buffer)
+                            self.assertEqual(geom_window.ExportToWkt(), expected.ExportToWkt())
+
+                            features = [(geom.ExportToWkt(), attributes) for geom, attributes in context.network_features(geom_window)]
+                            self.assertEqual(features, previous_network(self.line_network, expected))
+
+                        for fields in [['active_floodplain_area'], ['centerline_length', 'segment_area'], ['floodplain_area', 'segment_area']]:
+                            sums = context.sum_window_attributes(level_path, window, segment_distance, fields)
+                            expected = previous_sums(lyr_segments, window, level_path, segment_distance, fields)
+                            self.assertEqual(sorted(sums.keys()), sorted(expected.keys()))
+                            for field, value in expected.items():
+                                self.assertAlmostEqual(sums[field], value, places=6)
+
+            # Windows with no segments have no sums
+            self.assertEqual(context.sum_window_attributes(20, 100, 5000, ['segment_area']), {})
+
+    def test_missing_fields(self):
+        """Asking for a field that isn't summed raises instead of leaving it out
+        """
+        with MetricContext(self.line_network, self.segments, self.centerlines, self.junctions, self.ecoregions) as context:
+            with self.assertRaises(KeyError):
+                context.sum_window_attributes(10, 300, 550, ['segment_area', 'not_a_field'])
+            with self.assertRaises(KeyError):
+                context.sum_window_attributes(10, 300, 5000, ['LevelPathI'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,9 +15,10 @@ import traceback
 import datetime
 import time
 import sqlite3
-from typing import List, Dict
+from typing import List, Dict, Tuple
 import rasterio
 from rasterio import features
+from rasterio.windows import Window
 from osgeo import ogr, gdal, osr
 import numpy as np
 from rscommons.classes.rs_project import RSMeta, RSMetaTypes
@@ -332,28 +333,22 @@ def rvd(huc: int, flowlines_orig: Path, existing_veg_orig: Path, historic_veg_or
             raw_values_unique = {}
             change_values_mean = {}
             riparian_values_mean = {}
-            reach_raster = np.ma.masked_invalid(
-                features.rasterize(
-                    [poly],
-                    out_shape=dataset.shape,
-                    transform=dataset.transform,
-                    all_touched=True,
-                    fill=np.nan))
+            window, outside = polygon_window(dataset, poly)
             for raster_name, raster in raw_arrays.items():
                 if raster is not None:
-                    current_raster = np.ma.masked_array(raster, mask=reach_raster.mask)
+                    current_raster = np.ma.masked_array(raster[window], mask=outside)
                     raw_values_unique[raster_name] = np.unique(np.ma.filled(current_raster, fill_value=0), return_counts=True)
                 else:
                     raw_values_unique[raster_name] = []
             for raster_name, raster in riparian_arrays.items():
                 if raster is not None:
-                    current_raster = np.ma.masked_array(raster, mask=reach_raster.mask)
+                    current_raster = np.ma.masked_array(raster[window], mask=outside)
                     riparian_values_mean[raster_name] = np.ma.mean(current_raster)
                 else:
                     riparian_values_mean[raster_name] = 0.0
             for raster_name, raster in vegetation_change_arrays.items():
                 if raster is not None:
-                    current_raster = np.ma.masked_array(raster, mask=reach_raster.mask)
+                    current_raster = np.ma.masked_array(raster[window], mask=outside)
                     change_values_mean[raster_name] = np.ma.mean(current_raster)
                 else:
                     change_values_mean[raster_name] = 0.0
@@ -517,6 +512,43 @@ def rvd(huc: int, flowlines_orig: Path, existing_veg_orig: Path, historic_veg_or
     log.info('RVD complete')
 
 
+def polygon_window(dataset, poly) -> Tuple[Tuple[slice, slice], np.ndarray]:
+    """Rasterize a polygon into just the part of the raster it covers
+
+    Rasterizing into a window padded by a cell marks exactly the same cells (all_touched) as rasterizing
+    over the whole raster, so each reach costs the size of its polygon rather than the size of the raster.
+    Zero counts from np.unique only cover the window but zero (nodata) is never stored.
+
+    Args:
+        dataset: open rasterio dataset that the arrays were read from
+        poly: shapely polygon in the raster's spatial reference
+
+    Returns:
+        Tuple[Tuple[slice, slice], np.ndarray]: (row slice, column slice) of the window and a mask of the
+            window that is True for cells the polygon does not touch
+    """
+    inverse = ~dataset.transform
+    minx, miny, maxx, maxy = poly.bounds
+    cols, rows = zip(*[inverse * (x, y) for x in (minx, maxx) for y in (miny, maxy)])
+    row_start = max(int(np.floor(min(rows))) - 1, 0)
+    row_stop = min(int(np.ceil(max(rows))) + 1, dataset.height)
+    col_start = max(int(np.floor(min(cols))) - 1, 0)
+    col_stop = min(int(np.ceil(max(cols))) + 1, dataset.width)
+    if row_stop <= row_start or col_stop <= col_start:
+        return (slice(0, 0), slice(0, 0)), np.ones((0, 0), dtype=bool)
+
+    window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+    touched = features.rasterize(
+        [poly],
+        out_shape=(window.height, window.width),
+        transform=dataset.window_transform(window),
+        all_touched=True,
+        fill=0,
+        default_value=1,
+        dtype='uint8')
+    return window.toslices(), touched == 0
+
+
 def extract_mean_values_by_polygon(polys, rasters, reference_raster):
     log = Logger('extract_mean_values_by_polygon')
 
@@ -533,17 +565,11 @@ def extract_mean_values_by_polygon(polys, rasters, reference_raster):
             if poly.geom_type in ["Polygon", "MultiPolygon"] and poly.area > 0:
                 values_mean = {}
                 values_unique = {}
-                reach_raster = np.ma.masked_invalid(
-                    features.rasterize(
-                        [poly],
-                        out_shape=dataset.shape,
-                        transform=dataset.transform,
-                        all_touched=True,
-                        fill=np.nan))
+                window, outside = polygon_window(dataset, poly)
 
                 for key, raster in rasters.items():
                     if raster is not None:
-                        current_raster = np.ma.masked_array(raster, mask=reach_raster.mask)
+                        current_raster = np.ma.masked_array(raster[window], mask=outside)
                         values_mean[key] = np.ma.mean(current_raster)
                         values_unique[key] = np.unique(np.ma.filled(current_raster, fill_value=0), return_counts=True)
                     else:
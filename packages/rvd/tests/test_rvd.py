@@ -0,0 +1,141 @@
+""" Testing for the RVD reach summaries
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio import features
+from rasterio.transform import from_origin
+from shapely.affinity import rotate
+from shapely.geometry import MultiPolygon, Point, Polygon, box
+
+from rvd.rvd import extract_mean_values_by_polygon, polygon_window
+
+ORIGIN = (1000.0, 2000.0)
+CELL_SIZE = 10.0
+ROWS = 30
+COLS = 40
+
+
+def previous_mask(dataset, poly) -> np.ndarray:
+    """Mask of the cells a polygon doesn't touch from rasterizing it over the whole raster, as before the windows
+    """
+    return np.ma.masked_invalid(
+        features.rasterize(
+            [poly],
+            out_shape=dataset.shape,
+            transform=dataset.transform,
+            all_touched=True,
+            fill=np.nan,
+            dtype='float64')).mask
+
+
+def previous_summaries(polys: dict, rasters: dict, reference_raster: str):
+    """extract_mean_values_by_polygon before the windows
+    """
+    output_mean = {}
+    output_unique = {}
+    with rasterio.open(reference_raster) as dataset:
+        for reachid, poly in polys.items():
+            if poly.geom_type in ["Polygon", "MultiPolygon"] and poly.area > 0:
+                mask = previous_mask(dataset, poly)
+                output_mean[reachid] = {}
+                output_unique[reachid] = {}
+                for key, raster in rasters.items():
+                    current_raster = np.ma.masked_array(raster, mask=mask)
+                    output_mean[reachid][key] = np.ma.mean(current_raster)
+                    output_unique[reachid][key] = np.unique(np.ma.filled(current_raster, fill_value=0), return_counts=True)
+    return output_mean, output_unique
+
+
+class PolygonWindowTest(unittest.TestCase):
+    """Rasterizing each reach polygon into its window gives the same cells and reach summaries as the whole raster
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.raster = os.path.join(self.tmp_dir, 'existing.tif')
+        rng = np.random.default_rng(11)
+
+        # Vegetation codes with nodata (0) cells, riparian as 0 / 1 and a conversion that is mostly empty
+        self.rasters = {
+            'Existing': rng.choice([0, 3011, 3012, 9021, 9326], (ROWS, COLS)).astype(np.int16),
+            'ExistingRiparianMean': (rng.random((ROWS, COLS)) < 0.4).astype(np.float64),
+            'FromConifer': (rng.random((ROWS, COLS)) < 0.05).astype(np.int64),
+        }
+        with rasterio.open(self.raster, 'w', driver='GTiff', height=ROWS, width=COLS, count=1, dtype='int16', nodata=0,
+                           crs='EPSG:26912', transform=from_origin(ORIGIN[0], ORIGIN[1], CELL_SIZE, CELL_SIZE)) as dst:
+            dst.write(self.rasters['Existing'], 1)
+
+        minx, maxy = ORIGIN
+        maxx = minx + COLS * CELL_SIZE
+        miny = maxy - ROWS * CELL_SIZE
+        self.polys = {
+            # Inside the raster, on and off cell edges
+            1: box(minx + 52, miny + 41, minx + 118, miny + 97),
+            2: box(minx + 100, miny + 100, minx + 150, miny + 150),
+            3: rotate(box(minx + 200, miny + 60, minx + 290, miny + 75), 35),
+            4: Point(minx + 210, miny + 220).buffer(33),
+            5: MultiPolygon([box(minx + 10, miny + 10, minx + 25, miny + 25), box(minx + 300, miny + 200, minx + 333, miny + 247)]),
+            6: Polygon([(minx + 120, miny + 180), (minx + 260, miny + 175), (minx + 150, miny + 280), (minx + 170, miny + 210)]),
+            # Touching each edge of the raster from inside
+            7: box(minx, miny + 100, minx + 35, miny + 160),
+            8: box(maxx - 45, miny + 5, maxx, miny + 55),
+            9: box(minx + 150, maxy - 25, minx + 222, maxy),
+            10: box(minx + 250, miny, minx + 285, miny + 18),
+            # Partly outside the raster
+            11: box(minx - 40, miny + 200, minx + 33, miny + 255),
+            12: box(maxx - 27, maxy - 31, maxx + 80, maxy + 60),
+            13: Point(minx + 200, miny - 5).buffer(40),
+            14: box(minx - 100, miny - 100, maxx + 100, maxy + 100),
+            # Outside the raster, only touching its edge and with no area
+            15: box(maxx + 10, miny + 10, maxx + 60, miny + 60),
+            16: box(minx - 30, miny + 50, minx, miny + 90),
+            17: Polygon([(minx + 50, miny + 50), (minx + 60, miny + 50), (minx + 55, miny + 50)]),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_masks(self):
+        """The window mask matches the whole raster mask inside the window and nothing outside it is touched
+        """
+        with rasterio.open(self.raster) as dataset:
+            for reachid, poly in self.polys.items():
+                if poly.area == 0:
+                    continue
+                expected = previous_mask(dataset, poly)
+                window, outside = polygon_window(dataset, poly)
+                np.testing.assert_array_equal(outside, expected[window], err_msg=f'Reach {reachid}')
+                remainder = expected.copy()
+                remainder[window] = True
+                self.assertTrue(remainder.all(), f'Reach {reachid} touches cells outside its window')
+
+    def test_summaries(self):
+        """Vegetation counts (except the unstored zero) and means match the whole raster summaries
+        """
+        means, uniques = extract_mean_values_by_polygon(self.polys, self.rasters, self.raster)
+        expected_means, expected_uniques = previous_summaries(self.polys, self.rasters, self.raster)
+        self.assertEqual(sorted(means.keys()), sorted(expected_means.keys()))
+        self.assertNotIn(17, means)
+
+        for reachid, values in expected_means.items():
+            for key, expected in values.items():
+                if expected is np.ma.masked:
+                    self.assertIs(means[reachid][key], np.ma.masked, f'Reach {reachid} {key}')
+                else:
+                    self.assertAlmostEqual(means[reachid][key], expected, 12, f'Reach {reachid} {key}')
+
+                codes, counts = uniques[reachid][key]
+                expected_codes, expected_counts = expected_uniques[reachid][key]
+                self.assertEqual(dict(zip(codes[codes != 0].tolist(), counts[codes != 0].tolist())),
+                                 dict(zip(expected_codes[expected_codes != 0].tolist(), expected_counts[expected_codes != 0].tolist())),
+                                 f'Reach {reachid} {key}')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,143 @@
+""" Testing for the corridor least cost path
+
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from scipy.ndimage import distance_transform_edt
+from skimage.graph import route_through_array
+
+from vbet.lib.cost_path import CORRIDOR_BUFFER_CELLS, CostPathRouter, NoPathError, least_cost_path
+from vbet.vbet_raster_ops import OUTSIDE_VALLEY_COST
+
+ORIGIN = (1000.0, 9000.0)
+CELL_SIZE = 2.0
+
+
+def previous_least_cost_path(cost_raster: str, start_coord, stop_coord) -> np.ndarray:
+    """least_cost_path before the corridor: route_through_array over the whole cost surface
+
+    Returns:
+        np.ndarray: path raster (1 on the path) the size of the cost surface
+    """
+    with rasterio.open(cost_raster) as src:
+        costs = src.read(1)
+        transform = src.transform
+
+    def offset(coord):
+        # coord2pixelOffset
+        return int((coord[1] - transform.f) / transform.e), int((coord[0] - transform.c) / transform.a)
+
+    indices, _weight = route_through_array(costs, offset(start_coord), offset(stop_coord), geometric=True, fully_connected=True)
+    path = np.zeros(costs.shape, dtype=np.uint8)
+    path[tuple(np.array(indices).T)] = 1
+    return path
+
+
+def cell_coord(row: int, col: int) -> tuple:
+    """Coordinate of a cell centre
+    """
+    return ORIGIN[0] + (col + 0.5) * CELL_SIZE, ORIGIN[1] - (row + 0.5) * CELL_SIZE
+
+
+class CostPathTest(unittest.TestCase):
+    """Routing within the corridor gives the same paths as routing over the whole cost surface
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_surface(self, valley: np.ndarray, name: str) -> tuple:
+        """Valley bottom raster and its centerline cost surface (as generate_centerline_surface builds it)
+        """
+        proximity = distance_transform_edt(valley)
+        rescaled = np.interp(proximity, (proximity.min(), proximity.max()), (0.0, 10.0))
+        costs = np.full(valley.shape, OUTSIDE_VALLEY_COST)
+        costs[rescaled > 0] = 10**((rescaled[rescaled > 0] * -1) + 10)
+
+        profile = {'driver': 'GTiff', 'count': 1, 'height': valley.shape[0], 'width': valley.shape[1], 'crs': 'EPSG:26912',
+                   'transform': from_origin(ORIGIN[0], ORIGIN[1], CELL_SIZE, CELL_SIZE)}
+        paths = []
+        for suffix, array in [('valley', valley.astype(np.int32)), ('cost', costs.astype(np.float32))]:
+            paths.append(os.path.join(self.tmp_dir, f'{name}_{suffix}.tif'))
+            with rasterio.open(paths[-1], 'w', dtype=array.dtype, **profile) as dst:
+                dst.write(array, 1)
+        return tuple(paths)
+
+    def read_path(self, path_raster: str, cost_raster: str) -> np.ndarray:
+        """A path raster placed back on the whole cost surface grid
+        """
+        with rasterio.open(cost_raster) as cost_src, rasterio.open(path_raster) as src:
+            full = np.zeros(cost_src.shape, dtype=np.uint8)
+            window = rasterio.windows.from_bounds(*src.bounds, transform=cost_src.transform)
+            row_off, col_off = int(round(window.row_off)), int(round(window.col_off))
+            self.assertEqual(src.transform, cost_src.window_transform(rasterio.windows.Window(col_off, row_off, src.width, src.height)))
+            full[row_off:row_off + src.height, col_off:col_off + src.width] = src.read(1)
+        return full
+
+    def test_paths(self):
+        """Meandering valleys with several flowline parts routed by one router, plus end points outside the corridor
+        """
+        rng = np.random.default_rng(8)
+        for trial in range(4):
+            height, width = 260 + 20 * trial, 220
+            valley = np.zeros((height, width), dtype=bool)
+            rows = np.arange(30, height - 30)
+            centre = (width / 2 + 50 * np.sin(rows / (25 + 5 * trial)) + rng.normal(0, 2, len(rows)).cumsum() / 10).astype(int)
+            for row, col in zip(rows, centre):
+                valley[row, col - rng.integers(6, 14):col + rng.integers(6, 14)] = True
+            valley_raster, cost_raster = self.write_surface(valley, f'trial{trial}')
+
+            router = CostPathRouter(cost_raster, valley_raster)
+            self.assertLess(router.window.width * router.window.height, height * width)
+            ends = [(0, len(rows) - 1), (10, 120), (len(rows) - 1, 0), (60, 61), (100, 100)]
+            for part, (start, stop) in enumerate(ends):
+                start_coord = cell_coord(rows[start], centre[start])
+                stop_coord = cell_coord(rows[stop], centre[stop])
+                path_raster = os.path.join(self.tmp_dir, f'path_{trial}_{part}.tif')
+                router.write_path(path_raster, start_coord, stop_coord)
+                np.testing.assert_array_equal(self.read_path(path_raster, cost_raster), previous_least_cost_path(cost_raster, start_coord, stop_coord))
+
+            # From a corner well outside the corridor the whole cost surface is used
+            start_coord = cell_coord(2, 2)
+            stop_coord = cell_coord(rows[-1], centre[-1])
+            self.assertFalse(router.contains(start_coord))
+            path_raster = os.path.join(self.tmp_dir, f'path_{trial}_outside.tif')
+            least_cost_path(cost_raster, path_raster, start_coord, stop_coord, valley_raster)
+            with rasterio.open(path_raster) as src:
+                self.assertEqual(src.shape, valley.shape)
+            np.testing.assert_array_equal(self.read_path(path_raster, cost_raster), previous_least_cost_path(cost_raster, start_coord, stop_coord))
+
+    def test_disconnected(self):
+        """End points in parts of the corridor that don't connect raise NoPathError
+        """
+        valley = np.zeros((200, 120), dtype=bool)
+        valley[20:80, 40:80] = True
+        # More than two buffers below the first part so their buffered corridors don't touch
+        valley[80 + 2 * CORRIDOR_BUFFER_CELLS + 5:180, 40:80] = True
+        valley_raster, cost_raster = self.write_surface(valley, 'disconnected')
+
+        start_coord = cell_coord(30, 60)
+        stop_coord = cell_coord(170, 60)
+        router = CostPathRouter(cost_raster, valley_raster)
+        self.assertTrue(router.contains(start_coord) and router.contains(stop_coord))
+        with self.assertRaises(NoPathError):
+            router.route(start_coord, stop_coord)
+        with self.assertRaises(NoPathError):
+            router.write_path(os.path.join(self.tmp_dir, 'no_path.tif'), start_coord, stop_coord)
+
+        # Within one part the router still works and the whole surface always had a path
+        self.assertEqual(router.route(start_coord, cell_coord(70, 50)).shape[0], 2)
+        self.assertGreater(previous_least_cost_path(cost_raster, start_coord, stop_coord).sum(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
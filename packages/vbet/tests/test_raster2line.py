@@ -0,0 +1,95 @@
+""" Testing for the raster path to polyline conversion
+
+"""
+import itertools
+import os
+import shutil
+import tempfile
+import unittest
+from math import sqrt
+
+import numpy as np
+from osgeo import gdal, ogr
+
+from vbet.lib.raster2line import array2geom, pixelOffset2coord
+
+
+def pairwise_array2geom(array, rasterfn, pixelValue, precision=13):
+    """The original array2geom that compared every pair of path pixels
+    """
+    raster = gdal.Open(rasterfn)
+    geotransform = raster.GetGeoTransform()
+    pixelWidth = geotransform[1]
+    pixelHeight = geotransform[5]
+    maxDistance = sqrt((pixelHeight ** 2 + pixelWidth ** 2))
+    maxDistance = maxDistance + maxDistance * 0.01
+
+    count = 0
+    roadList = np.where(array == pixelValue)
+    pointDict = {}
+    for indexY in roadList[0]:
+        indexX = roadList[1][count]
+        Xcoord, Ycoord = pixelOffset2coord(rasterfn, indexX, indexY)
+        pointDict[count] = (round(Xcoord, precision), round(Ycoord, precision))
+        count += 1
+
+    multiline = ogr.Geometry(ogr.wkbMultiLineString)
+    for i in itertools.combinations(pointDict.values(), 2):
+        point1 = ogr.Geometry(ogr.wkbPoint)
+        point1.AddPoint(i[0][0], i[0][1])
+        point2 = ogr.Geometry(ogr.wkbPoint)
+        point2.AddPoint(i[1][0], i[1][1])
+
+        if point1.Distance(point2) < maxDistance:
+            line = ogr.Geometry(ogr.wkbLineString)
+            line.AddPoint(i[0][0], i[0][1])
+            line.AddPoint(i[1][0], i[1][1])
+            multiline.AddGeometry(line)
+
+    return multiline
+
+
+def segments(multiline):
+    lines = [multiline.GetGeometryRef(i) for i in range(multiline.GetGeometryCount())]
+    return [(line.GetPoint_2D(0), line.GetPoint_2D(1)) for line in lines]
+
+
+class Raster2LineTest(unittest.TestCase):
+    """The neighbour lookup gives exactly the segments of the pairwise comparison
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def create_raster(self, geotransform):
+        path = os.path.join(self.tmp_dir, 'path.tif')
+        raster = gdal.GetDriverByName('GTiff').Create(path, 80, 60, 1, gdal.GDT_Byte)
+        raster.SetGeoTransform(geotransform)
+        raster = None
+        return path
+
+    def test_same_segments(self):
+        """Same segments, in the same order, with the same rounded coordinates
+        """
+        rng = np.random.default_rng(7)
+        array = np.zeros((60, 80), dtype=np.uint8)
+        # A meandering path plus scattered pixels to get diagonal and isolated neighbours
+        row = 30
+        for col in range(80):
+            row = min(59, max(0, row + int(rng.integers(-1, 2))))
+            array[row, col] = 1
+        array[rng.random(array.shape) > 0.93] = 1
+
+        # Degree (10m DEM) and metre pixels
+        for geotransform in [(-116.123456789, 1 / 10800, 0, 44.987654321, 0, -1 / 10800), (412345.5, 10.0, 0, 4987654.25, 0, -10.0)]:
+            rasterfn = self.create_raster(geotransform)
+            expected = segments(pairwise_array2geom(array, rasterfn, 1))
+            self.assertGreater(len(expected), 80)
+            self.assertEqual(segments(array2geom(array, rasterfn, 1)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+""" Testing for the compiled VBET evidence transforms
+
+"""
+import pickle
+import unittest
+
+import numpy as np
+
+from vbet.vbet_database import TRANSFORM_PROBE, EvidenceTransform, compile_interpolation, compile_transform_function
+
+
+class EvidenceTransformTest(unittest.TestCase):
+    """Transforms give the same values as eval() and survive being sent to worker processes
+    """
+
+    def test_functions(self):
+        """Compiled and eval() fallback functions match eval() and pickle
+        """
+        for function in ['2.71828**(-0.12*a)', '1/(1+2.71828**(-3.653 + 1.04*a))', 'a % 50']:
+            transform = EvidenceTransform(compile_transform_function(function), np.array([0.0, 5.0, 10.0]))
+            unpickled = pickle.loads(pickle.dumps(transform))
+
+            with np.errstate(over='ignore'):
+                expected = eval(function, {'__builtins__': None}, {'a': TRANSFORM_PROBE})
+                results = [transform(TRANSFORM_PROBE), unpickled(TRANSFORM_PROBE)]
+            for actual in results:
+                np.testing.assert_allclose(actual, expected, rtol=1e-6, err_msg=function)
+                self.assertEqual(actual.dtype, expected.dtype)
+            np.testing.assert_array_equal(unpickled.x, transform.x)
+            np.testing.assert_array_equal(unpickled.y, transform.y)
+
+    def test_interpolations(self):
+        """Inflection tables transform to 0 outside the table and pickle
+        """
+        x = np.array([0.0, 10.0, 20.0])
+        y = np.array([1.0, 0.5, 0.0])
+        values = np.array([-1.0, 0.0, 5.0, 15.0, 20.0, 25.0], dtype=np.float32)
+
+        for kind, expected in [('linear', [0.0, 1.0, 0.75, 0.25, 0.0, 0.0]), ('nearest', [0.0, 1.0, 1.0, 0.5, 0.0, 0.0])]:
+            transform = EvidenceTransform(compile_interpolation(x, y, kind), x, y)
+            unpickled = pickle.loads(pickle.dumps(transform))
+            np.testing.assert_allclose(transform(values), expected, err_msg=kind)
+            np.testing.assert_allclose(unpickled(values), expected, err_msg=kind)
+
+
+if __name__ == '__main__':
+    unittest.main()
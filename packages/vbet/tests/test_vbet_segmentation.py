@@ -0,0 +1,251 @@
+""" Testing for the VBET DGO and window metrics
+
+"""
+import math
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from osgeo import ogr
+from shapely.geometry import LineString, Point, Polygon, box
+
+from rscommons import GeopackageLayer, VectorBase
+from rscommons.classes.vector_base import get_utm_zone_epsg
+from rscommons.gpkg_writer import write_features
+from vbet.vbet_segmentation import calculate_dgo_metrics, calculate_vbet_window_metrics
+
+METRICS = ['active_channel', 'active_floodplain', 'inactive_floodplain']
+LEVEL_PATHS = {1001: (0.0, 30, 200), 1002: (0.01, 12, 400)}  # level path: (latitude offset, dgo count, window distance)
+LON, LAT, STEP = -112.0, 41.0, 0.001
+
+
+def previous_dgo_metrics(vbet_dgos: str, vbet_centerline: str, dict_layers: dict, attrib_filter: str = None):
+    """calculate_dgo_metrics before the spatial index: a spatial filter query per DGO and metric layer
+    """
+    with GeopackageLayer(vbet_dgos, write=True) as lyr_dgos, \
+            GeopackageLayer(vbet_centerline) as centerline_lyr:
+
+        exist_fields = lyr_dgos.get_fields()
+        metric_field_names = []
+        for metric_layer_name in dict_layers.keys():
+            metric_field_names.extend([f"{metric_layer_name}_{metric_type}" for metric_type in ['area', 'prop']])
+        metric_field_names.extend(['centerline_length', 'segment_area'])
+        fields = {field_name: ogr.OFTReal for field_name in metric_field_names if field_name not in exist_fields}
+        if len(fields) > 0:
+            lyr_dgos.create_fields(fields)
+
+        for feat_dgo, *_ in lyr_dgos.iterate_features(attribute_filter=attrib_filter, write_layers=[lyr_dgos]):
+            dgo_geom_unproj = feat_dgo.GetGeometryRef()
+            centroid = dgo_geom_unproj.Centroid()
+            utm_epsg = get_utm_zone_epsg(centroid.GetX())
+            _transform_ref, transform = VectorBase.get_transform_from_epsg(lyr_dgos.spatial_ref, utm_epsg)
+            vbet_geom_transform = dgo_geom_unproj.Clone()
+            vbet_geom_transform.Transform(transform)
+            vbet_geom_transform_clean = vbet_geom_transform.MakeValid()
+            if not vbet_geom_transform_clean.IsValid():
+                continue
+            vbet_area = vbet_geom_transform_clean.GetArea()
+            if vbet_area == 0.0:
+                continue
+
+            length = 0.0
+            for feat_cl, *_ in centerline_lyr.iterate_features(clip_shape=dgo_geom_unproj):
+                geom_cl = feat_cl.GetGeometryRef()
+                geom_cl.Transform(transform)
+                length += vbet_geom_transform_clean.Intersection(geom_cl).Length()
+
+            feat_dgo.SetField('centerline_length', length)
+            feat_dgo.SetField('segment_area', vbet_area)
+
+            for metric_layer_name, metric_layer_path in dict_layers.items():
+                with GeopackageLayer(metric_layer_path) as metric_lyr:
+                    metric_area = 0.0
+                    for metric_feat, *_ in metric_lyr.iterate_features(clip_shape=dgo_geom_unproj):
+                        in_metric_geom = metric_feat.GetGeometryRef()
+                        in_metric_geom.Transform(transform)
+                        metric_geom = in_metric_geom.MakeValid()
+                        if not metric_geom.IsValid():
+                            continue
+                        delta_geom = vbet_geom_transform_clean.Intersection(metric_geom)
+                        delta_geom.MakeValid()
+                        if not delta_geom.IsValid() or delta_geom.GetGeometryType() not in VectorBase.POLY_TYPES + VectorBase.COLLECTION_TYPES:
+                            continue
+                        metric_area = metric_area + delta_geom.GetArea()
+                    feat_dgo.SetField(f'{metric_layer_name}_area', metric_area)
+                    feat_dgo.SetField(f'{metric_layer_name}_prop', metric_area / vbet_area)
+            lyr_dgos.ogr_layer.SetFeature(feat_dgo)
+            feat_dgo = None
+
+
+def previous_window_metrics(vbet_igos: str, vbet_dgos: str, level_paths: list, distance_lookup: dict, metric_names: list):
+    """calculate_vbet_window_metrics before the running totals: an attribute filter query per IGO
+    """
+    with GeopackageLayer(vbet_igos, write=True) as lyr_igos, \
+            GeopackageLayer(vbet_dgos) as lyr_dgos:
+
+        metric_fields = {'window_size': ogr.OFTReal, 'centerline_length': ogr.OFTReal, 'window_area': ogr.OFTReal, 'integrated_width': ogr.OFTReal}
+        for metric in metric_names:
+            metric_fields[f'{metric}_area'] = ogr.OFTReal
+            metric_fields[f'{metric}_proportion'] = ogr.OFTReal
+            metric_fields[f'{metric}_itgr_width'] = ogr.OFTReal
+        for field in ['vb_acreage_per_mile', 'vb_hectares_per_km', 'active_acreage_per_mile', 'active_hectares_per_km', 'inactive_acreage_per_mile', 'inactive_hectares_per_km']:
+            metric_fields[field] = ogr.OFTReal
+        lyr_igos.create_fields(metric_fields)
+
+        for level_path in level_paths:
+            if level_path is None or level_path not in distance_lookup.keys():
+                continue
+            window_distance = distance_lookup[level_path]
+            window_addon = {200: 100, 400: 200, 1200: 300, 2000: 500, 8000: 2000}
+            for feat_igo, *_ in lyr_igos.iterate_features(attribute_filter=f"LevelPathI = {level_path}"):
+                igo_distance = feat_igo.GetField('seg_distance')
+                min_dist = igo_distance - 0.5 * window_distance
+                max_dist = igo_distance + 0.5 * window_distance
+                sql_igo_window = f"LevelPathI = {level_path} AND seg_distance >= {min_dist} AND seg_distance <= {max_dist}"
+
+                window_measurements = dict.fromkeys(metric_names, 0.0)
+                window_cl_length_m = 0.0
+                window_area_m2 = 0.0
+                for feat_dgo, *_ in lyr_dgos.iterate_features(attribute_filter=sql_igo_window):
+                    window_cl_length_m += feat_dgo.GetField('centerline_length')
+                    window_area_m2 += feat_dgo.GetField('segment_area')
+                    for metric in metric_names:
+                        metric_area = feat_dgo.GetField(f'{metric}_area')
+                        window_measurements[metric] += metric_area if metric_area is not None else 0.0
+
+                for metric, area in window_measurements.items():
+                    feat_igo.SetField(f'{metric}_area', area)
+                    feat_igo.SetField(f'{metric}_proportion', area / window_area_m2 if window_area_m2 != 0.0 else 0.0)
+                    feat_igo.SetField(f'{metric}_itgr_width', area / window_cl_length_m if window_cl_length_m != 0.0 else 0.0)
+
+                window_cl_length_mi = window_cl_length_m / 1609.344
+                window_cl_length_km = window_cl_length_m / 1000
+                active = window_measurements['active_floodplain'] + window_measurements['active_channel']
+                inactive = window_measurements['inactive_floodplain']
+                has_length = window_cl_length_m != 0.0
+
+                feat_igo.SetField('integrated_width', window_area_m2 / window_cl_length_m if has_length else 0.0)
+                feat_igo.SetField('window_size', window_distance + window_addon[int(window_distance)])
+                feat_igo.SetField('window_area', window_area_m2)
+                feat_igo.SetField('centerline_length', window_cl_length_m)
+                feat_igo.SetField('vb_acreage_per_mile', window_area_m2 / 4046.86 / window_cl_length_mi if has_length else 0.0)
+                feat_igo.SetField('vb_hectares_per_km', window_area_m2 / 10000 / window_cl_length_km if has_length else 0.0)
+                feat_igo.SetField('active_acreage_per_mile', active / 4046.86 / window_cl_length_mi if has_length else 0.0)
+                feat_igo.SetField('active_hectares_per_km', active / 10000 / window_cl_length_km if has_length else 0.0)
+                feat_igo.SetField('inactive_acreage_per_mile', inactive / 4046.86 / window_cl_length_mi if has_length else 0.0)
+                feat_igo.SetField('inactive_hectares_per_km', inactive / 10000 / window_cl_length_km if has_length else 0.0)
+                lyr_igos.ogr_layer.SetFeature(feat_igo)
+                feat_igo = None
+
+
+def read_fields(path: str) -> dict:
+    """{fid: {field: value}} for every feature of a layer
+    """
+    with GeopackageLayer(path) as lyr:
+        fields = list(lyr.get_fields().keys())
+        return {feat.GetFID(): {field: feat.GetField(field) for field in fields} for feat, *_ in lyr.iterate_features()}
+
+
+class SegmentationMetricsTest(unittest.TestCase):
+    """DGO and window metrics match the per-feature spatial and attribute filter queries they replaced
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.gpkgs = [os.path.join(self.tmp_dir, name) for name in ['previous.gpkg', 'indexed.gpkg']]
+        for gpkg in self.gpkgs:
+            self.create_fixture(gpkg)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    @staticmethod
+    def create_fixture(gpkg: str):
+        """Two level paths of DGOs (one with a notch, one with no area) and IGOs in geographic coordinates,
+        a winding centerline in several parts and metric polygons that cross the DGO boundaries
+        """
+        for name, geom_type, fields in [
+            ('dgos', ogr.wkbPolygon, {'LevelPathI': ogr.OFTReal, 'seg_distance': ogr.OFTReal}),
+            ('igos', ogr.wkbPoint, {'LevelPathI': ogr.OFTReal, 'seg_distance': ogr.OFTReal}),
+            ('centerlines', ogr.wkbLineString, {'LevelPathI': ogr.OFTReal}),
+        ] + [(metric, ogr.wkbPolygon, {}) for metric in METRICS]:
+            with GeopackageLayer(os.path.join(gpkg, name), write=True) as lyr:
+                lyr.create_layer(geom_type, epsg=4326, fields=fields)
+
+        dgos, igos, attributes, centerlines, cl_level_paths = [], [], {'LevelPathI': [], 'seg_distance': []}, [], []
+        metrics = {metric: [] for metric in METRICS}
+        for level_path, (lat_offset, count, _window) in LEVEL_PATHS.items():
+            south = LAT + lat_offset
+            for idx in range(count):
+                west = LON + idx * STEP
+                dgo = box(west, south, west + STEP, south + 3 * STEP)
+                if idx == 4:
+                    dgo = dgo.difference(box(west + 0.3 * STEP, south, west + 0.6 * STEP, south + STEP))
+                if idx == 7:
+                    dgo = Polygon([(west, south), (west + STEP, south), (west + 2 * STEP, south)])
+                dgos.append(dgo)
+                igos.append(Point(west + 0.5 * STEP, south + 1.5 * STEP))
+                attributes['LevelPathI'].append(level_path)
+                attributes['seg_distance'].append(idx * 84.0 + 42.0)
+
+            coords = [(LON + x * STEP / 4, south + 1.5 * STEP + 0.8 * STEP * math.sin(x / 3)) for x in range(count * 4 + 1)]
+            for part in range(0, len(coords) - 1, 10):
+                centerlines.append(LineString(coords[part:part + 11]))
+                cl_level_paths.append(level_path)
+            channel = LineString(coords).buffer(0.15 * STEP)
+            metrics['active_channel'].append(channel)
+            for idx in range(0, count, 3):
+                west = LON + (idx + 0.5) * STEP
+                metrics['active_floodplain'].append(box(west, south + 0.5 * STEP, west + 1.7 * STEP, south + 2.5 * STEP).difference(channel))
+                metrics['inactive_floodplain'].append(box(west, south + 2.2 * STEP, west + 2.3 * STEP, south + 3.4 * STEP))
+
+        write_features(gpkg, 'dgos', dgos, attributes)
+        write_features(gpkg, 'igos', igos, attributes)
+        write_features(gpkg, 'centerlines', centerlines, {'LevelPathI': cl_level_paths})
+        for metric, geoms in metrics.items():
+            write_features(gpkg, metric, geoms)
+
+    def assert_same_values(self, expected: dict, actual: dict):
+        self.assertEqual(sorted(actual.keys()), sorted(expected.keys()))
+        for fid, values in expected.items():
+            self.assertEqual(sorted(actual[fid].keys()), sorted(values.keys()))
+            for field, value in values.items():
+                if value is None or isinstance(value, str):
+                    self.assertEqual(actual[fid][field], value, f'{fid} {field}')
+                else:
+                    np.testing.assert_allclose(actual[fid][field], value, rtol=1e-9, atol=1e-9, err_msg=f'{fid} {field}')
+
+    def test_metrics(self):
+        """DGO metrics, then the IGO window metrics from them
+        """
+        level_paths = list(LEVEL_PATHS.keys()) + [None]
+        distance_lookup = {level_path: window for level_path, (_lat, _count, window) in LEVEL_PATHS.items()}
+        attrib_filter = f"LevelPathI IN ({', '.join(str(level_path) for level_path in LEVEL_PATHS)})"
+
+        previous, indexed = self.gpkgs
+        previous_dgo_metrics(os.path.join(previous, 'dgos'), os.path.join(previous, 'centerlines'),
+                             {metric: os.path.join(previous, metric) for metric in METRICS}, attrib_filter)
+        calculate_dgo_metrics(os.path.join(indexed, 'dgos'), os.path.join(indexed, 'centerlines'),
+                              {metric: os.path.join(indexed, metric) for metric in METRICS}, attrib_filter)
+
+        expected = read_fields(os.path.join(previous, 'dgos'))
+        self.assertGreater(sum(values['active_channel_area'] > 0 for values in expected.values() if values['active_channel_area'] is not None), 30)
+        self.assert_same_values(expected, read_fields(os.path.join(indexed, 'dgos')))
+
+        # The DGO with no area has no metrics, which the previous window metrics can't sum
+        with GeopackageLayer(os.path.join(previous, 'dgos'), write=True) as lyr:
+            for feat, *_ in lyr.iterate_features(write_layers=[lyr]):
+                if feat.GetField('segment_area') is None:
+                    feat.SetField('centerline_length', 0.0)
+                    feat.SetField('segment_area', 0.0)
+                    lyr.ogr_layer.SetFeature(feat)
+
+        previous_window_metrics(os.path.join(previous, 'igos'), os.path.join(previous, 'dgos'), level_paths, distance_lookup, METRICS)
+        calculate_vbet_window_metrics(os.path.join(indexed, 'igos'), os.path.join(indexed, 'dgos'), level_paths, distance_lookup, METRICS)
+        self.assert_same_values(read_fields(os.path.join(previous, 'igos')), read_fields(os.path.join(indexed, 'igos')))
+
+
+if __name__ == '__main__':
+    unittest.main()
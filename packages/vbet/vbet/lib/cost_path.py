@@ -14,55 +14,188 @@ import sys
 import os
 import argparse
 
-from osgeo import gdal
-
-from skimage.graph import route_through_array
+from skimage.graph import MCP_Geometric
 import numpy as np
+import rasterio
+from rasterio.windows import Window
+from scipy.ndimage import binary_dilation, generate_binary_structure
 
-from rscommons import dotenv
+from rscommons import dotenv, Logger
+from rscommons.raster_tiles import iter_raster_tiles, iter_rows, process_memory
 from rscommons.util import safe_makedirs
 
-from vbet.vbet_raster_ops import raster2array, array2raster
-
-
-def coord2pixelOffset(rasterfn, x, y):
-    raster = gdal.Open(rasterfn)
-    geotransform = raster.GetGeoTransform()
-    originX = geotransform[0]
-    originY = geotransform[3]
-    pixelWidth = geotransform[1]
-    pixelHeight = geotransform[5]
-    xOffset = int((x - originX) / pixelWidth)
-    yOffset = int((y - originY) / pixelHeight)
-    return xOffset, yOffset
-
-
-def createPath(CostSurfacefn, costSurfaceArray, startCoord, stopCoord):
-
-    # coordinates to array index
-    startCoordX = startCoord[0]
-    startCoordY = startCoord[1]
-    startIndexX, startIndexY = coord2pixelOffset(CostSurfacefn, startCoordX, startCoordY)
-
-    stopCoordX = stopCoord[0]
-    stopCoordY = stopCoord[1]
-    stopIndexX, stopIndexY = coord2pixelOffset(CostSurfacefn, stopCoordX, stopCoordY)
-
-    # create path
-    indices, _weight = route_through_array(costSurfaceArray, (startIndexY, startIndexX), (stopIndexY, stopIndexX), geometric=True, fully_connected=True)
-    indices = np.array(indices).T
-    path = np.zeros_like(costSurfaceArray)
-    path[indices[0], indices[1]] = 1
-    return path
-
-
-def least_cost_path(CostSurfacefn, outputPathfn, startCoord, stopCoord):
-
-    costSurfaceArray = raster2array(CostSurfacefn)  # creates array from cost surface raster
-
-    pathArray = createPath(CostSurfacefn, costSurfaceArray, startCoord, stopCoord)  # creates path array
-
-    array2raster(outputPathfn, CostSurfacefn, pathArray)  # converts path array to raster
+# Cells around the corridor (valley bottom and flowline) that the least cost path may still use
+CORRIDOR_BUFFER_CELLS = 10
+
+
+class NoPathError(Exception):
+    """Raised when the start and end of a path are in parts of the corridor that don't connect
+    """
+
+
+def corridor_window(corridor_raster: str, buffer_cells: int = CORRIDOR_BUFFER_CELLS) -> Window:
+    """Window around the corridor cells (value 1) of a raster, grown by a buffer and clipped to the raster
+
+    Args:
+        corridor_raster (str): raster with 1 in the corridor (e.g. valley bottom and flowline)
+        buffer_cells (int, optional): cells to grow the window by. Defaults to CORRIDOR_BUFFER_CELLS.
+
+    Returns:
+        Window: corridor window, or None when there are no corridor cells
+    """
+    memory = process_memory()
+    row_min = row_max = col_min = col_max = None
+    with rasterio.open(corridor_raster) as src:
+        width, height = src.width, src.height
+    for tile, values, _core in iter_raster_tiles(corridor_raster, memory.tile_rows((width, np.float64))):
+        rows = np.flatnonzero((values == 1).any(axis=1))
+        if len(rows) == 0:
+            continue
+        cols = np.flatnonzero((values[rows[0]:rows[-1] + 1] == 1).any(axis=0))
+        row_min = tile.start + rows[0] if row_min is None else row_min
+        row_max = tile.start + rows[-1]
+        col_min = cols[0] if col_min is None else min(col_min, cols[0])
+        col_max = cols[-1] if col_max is None else max(col_max, cols[-1])
+
+    if row_min is None:
+        return None
+    row_off = max(0, int(row_min) - buffer_cells)
+    col_off = max(0, int(col_min) - buffer_cells)
+    return Window(col_off, row_off, min(width, int(col_max) + buffer_cells + 1) - col_off, min(height, int(row_max) + buffer_cells + 1) - row_off)
+
+
+class CostPathRouter():
+    """Least cost paths through a cost surface, restricted to a buffered corridor
+
+    The cost surface is only read within the corridor window, cells more than the buffer away from
+    the corridor are impassable and the geotransform and MCP graph are reused for every start/end
+    pair (e.g. the flowline parts of one level path). Start or end points that fall outside the
+    corridor are routed through the whole cost surface instead.
+    """
+
+    def __init__(self, cost_raster: str, corridor_raster: str = None, buffer_cells: int = CORRIDOR_BUFFER_CELLS):
+        """
+        Args:
+            cost_raster (str): cost surface raster
+            corridor_raster (str, optional): raster with 1 in the corridor. Defaults to None (the whole surface).
+            buffer_cells (int, optional): cells around the corridor the path may use. Defaults to CORRIDOR_BUFFER_CELLS.
+        """
+        self.log = Logger('Cost Path')
+        self.cost_raster = cost_raster
+        with rasterio.open(cost_raster) as src:
+            self.transform = src.transform
+            self.window = Window(0, 0, src.width, src.height)
+
+        self.corridor = None
+        if corridor_raster is not None:
+            window = corridor_window(corridor_raster, buffer_cells)
+            if window is not None:
+                self.window = window
+                with rasterio.open(corridor_raster) as src:
+                    self.corridor = binary_dilation(src.read(1, window=window) == 1, generate_binary_structure(2, 2), iterations=buffer_cells)
+
+        self._mcp = None
+        self._full_surface = None
+
+    def cell(self, coord) -> tuple:
+        """Row and column (within the corridor window) of a coordinate
+
+        Args:
+            coord: x, y coordinate
+
+        Returns:
+            tuple: (row, column)
+        """
+        return int((coord[1] - self.transform.f) / self.transform.e) - int(self.window.row_off), \
+            int((coord[0] - self.transform.c) / self.transform.a) - int(self.window.col_off)
+
+    def contains(self, coord) -> bool:
+        """Is a coordinate on a passable cell of the corridor
+
+        Args:
+            coord: x, y coordinate
+
+        Returns:
+            bool: True when the coordinate can be routed within the corridor
+        """
+        row, col = self.cell(coord)
+        if not (0 <= row < self.window.height and 0 <= col < self.window.width):
+            return False
+        return self.corridor is None or bool(self.corridor[row, col])
+
+    def route(self, start_coord, stop_coord) -> np.ndarray:
+        """Cells on the least cost path between two coordinates
+
+        Args:
+            start_coord: x, y of the start
+            stop_coord: x, y of the end
+
+        Raises:
+            NoPathError: when the end can't be reached from the start without leaving the corridor
+
+        Returns:
+            np.ndarray: (2, n) array of the row and column indices of the path cells within the corridor window
+        """
+        if self._mcp is None:
+            with rasterio.open(self.cost_raster) as src:
+                costs = src.read(1, window=self.window)
+            if self.corridor is not None:
+                # MCP ignores infinite costs
+                costs[~self.corridor] = np.inf
+            self._mcp = MCP_Geometric(costs, fully_connected=True)
+
+        start = self.cell(start_coord)
+        stop = self.cell(stop_coord)
+        cumulative_costs, _traceback = self._mcp.find_costs([start], [stop])
+        if not np.isfinite(cumulative_costs[stop]):
+            raise NoPathError(f'No path within the corridor from {start_coord} to {stop_coord}')
+        return np.array(self._mcp.traceback(stop)).T
+
+    def write_path(self, out_raster: str, start_coord, stop_coord):
+        """Write the least cost path between two coordinates as a raster of 1s on 0s
+
+        The raster covers the corridor window (or the whole cost surface if either point is outside the corridor)
+
+        Args:
+            out_raster (str): output path raster
+            start_coord: x, y of the start
+            stop_coord: x, y of the end
+
+        Raises:
+            NoPathError: when the end can't be reached from the start without leaving the corridor
+        """
+        router = self
+        if self.corridor is not None and not (self.contains(start_coord) and self.contains(stop_coord)):
+            self.log.debug('Path end points are outside the corridor. Routing through the whole cost surface')
+            if self._full_surface is None:
+                self._full_surface = CostPathRouter(self.cost_raster)
+            router = self._full_surface
+        path_indices = router.route(start_coord, stop_coord)
+
+        with rasterio.open(self.cost_raster) as src:
+            profile = {'driver': 'GTiff', 'count': 1, 'dtype': 'uint8', 'width': router.window.width, 'height': router.window.height,
+                       'crs': src.crs, 'transform': src.window_transform(router.window), 'nodata': None, 'compress': 'deflate'}
+
+        # Stream the path raster out a tile at a time instead of building a whole raster array of zeros
+        with rasterio.open(out_raster, 'w', **profile) as dst:
+            for tile in iter_rows(dst.height, process_memory().tile_rows((dst.width, np.uint8))):
+                path = np.zeros((tile.stop - tile.start, dst.width), dtype=np.uint8)
+                in_tile = (path_indices[0] >= tile.start) & (path_indices[0] < tile.stop)
+                path[path_indices[0][in_tile] - tile.start, path_indices[1][in_tile]] = 1
+                dst.write(path, 1, window=Window(0, tile.start, dst.width, tile.stop - tile.start))
+
+
+def least_cost_path(CostSurfacefn, outputPathfn, startCoord, stopCoord, corridor_raster=None):
+    """Least cost path between two points through a cost surface
+
+    Args:
+        CostSurfacefn (str): cost surface raster
+        outputPathfn (str): output raster with 1 on the path (cropped to the corridor window when there is one)
+        startCoord: x, y of the start
+        stopCoord: x, y of the end
+        corridor_raster (str, optional): raster with 1 in the corridor to route through. Defaults to None (the whole surface).
+    """
+    CostPathRouter(CostSurfacefn, corridor_raster).write_path(outputPathfn, startCoord, stopCoord)
 
 
 def main():
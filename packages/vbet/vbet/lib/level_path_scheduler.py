@@ -0,0 +1,90 @@
+""" Level Path Scheduler
+
+    Purpose:  Run independent per-level-path work concurrently in a process pool while
+              handing results back in submission order so that anything merged into
+              HUC-wide outputs happens in the same deterministic order as a serial run.
+    Author:   North Arrow Research
+    Date:     Oct 2026
+"""
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterable, Iterator, Tuple, Any
+
+from rscommons import Logger, TimerBuckets
+
+
+def get_worker_count(requested: int = None) -> int:
+    """Resolve how many level path workers to use
+
+    Args:
+        requested (int, optional): number of workers asked for. None or < 1 means use the VBET_WORKERS env var (default 1)
+
+    Returns:
+        int: number of worker processes
+    """
+    if requested is None or requested < 1:
+        requested = int(os.environ['VBET_WORKERS']) if 'VBET_WORKERS' in os.environ else 1
+    return max(1, min(requested, os.cpu_count() or 1))
+
+
+def _init_worker(log_folder: str, verbose: bool):
+    """Every spawned worker gets its own log file so processes never fight over the main one
+    """
+    log = Logger('LevelPathWorker')
+    log_path = os.path.join(log_folder, f'worker_{os.getpid()}.log') if log_folder is not None else None
+    log.setup(logPath=log_path, verbose=verbose)
+
+
+def _run_job(args: Tuple[Callable, Tuple]) -> Any:
+    """Entry point inside the pool. Each job starts with fresh timer buckets so that the
+    timings returned belong to that job only.
+    """
+    func, job_args = args
+    TimerBuckets(reset=True)
+    return func(*job_args)
+
+
+class LevelPathScheduler():
+    """Schedule level path jobs either serially (workers=1) or over a process pool
+
+        scheduler = LevelPathScheduler(4, log_folder)
+        for result in scheduler.run(process_level_path, jobs):
+            MERGE RESULT (always in job order)
+    """
+
+    def __init__(self, workers: int = 1, log_folder: str = None, verbose: bool = False):
+        """
+        Args:
+            workers (int, optional): number of processes. 1 runs everything in this process. Defaults to 1.
+            log_folder (str, optional): folder for per-worker log files. Defaults to None.
+            verbose (bool, optional): verbose logging in the workers. Defaults to False.
+        """
+        self.log = Logger('LevelPathScheduler')
+        self.workers = get_worker_count(workers)
+        self.log_folder = log_folder
+        self.verbose = verbose
+
+    def run(self, func: Callable, jobs: Iterable[Tuple]) -> Iterator[Any]:
+        """Run func(*job) for every job and yield the results in job order
+
+        Args:
+            func (Callable): module-level (picklable) function
+            jobs (Iterable[Tuple]): argument tuples, one per job
+
+        Yields:
+            Iterator[Any]: results in the same order as jobs
+        """
+        if self.workers == 1:
+            for job_args in jobs:
+                yield func(*job_args)
+            return
+
+        self.log.info(f'Running level paths on {self.workers} worker processes')
+        # GDAL does not play nicely with forked file handles so always start clean interpreters
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, initializer=_init_worker, initargs=(self.log_folder, self.verbose)) as executor:
+            # executor.map yields in submission order even when jobs finish out of order.
+            # chunksize=1 keeps the large level paths (sorted first) from blocking a whole chunk
+            for result in executor.map(_run_job, ((func, job_args) for job_args in jobs), chunksize=1):
+                yield result
@@ -7,13 +7,13 @@
 """
 
 import os
-import itertools
 from math import sqrt
+from typing import List, Tuple
 
 from osgeo import gdal, ogr
 import numpy as np
 
-from vbet. vbet_raster_ops import raster2array
+from vbet.vbet_raster_ops import raster2array
 
 
 def pixelOffset2coord(rasterfn, xOffset, yOffset):
@@ -44,43 +44,96 @@ def array2shp(array, outSHPfn, rasterfn, pixelValue):
     outLayer.CreateFeature(outFeature)
 
 
+def get_neighbour_offsets(pixel_width: float, pixel_height: float, max_distance: float) -> List[Tuple[int, int]]:
+    """Find the (row, col) offsets of every pixel closer than max_distance that comes later in row-major order
+
+    For square pixels these are just the 4 "forward" neighbours of the 8-connected neighbourhood.
+    They are returned in row-major order which is the order itertools.combinations would have
+    visited them.
+    """
+    max_cols = int(max_distance // abs(pixel_width)) + 1
+    max_rows = int(max_distance // abs(pixel_height)) + 1
+    offsets = []
+    for row_off in range(0, max_rows + 1):
+        for col_off in range(-max_cols, max_cols + 1):
+            if row_off == 0 and col_off <= 0:
+                continue
+            if sqrt((col_off * pixel_width) ** 2 + (row_off * pixel_height) ** 2) < max_distance:
+                offsets.append((row_off, col_off))
+    return offsets
+
+
 def array2geom(array, rasterfn, pixelValue, precision=13):
+    """Connect every pair of neighbouring path pixels with a line segment
 
-    # max distance between points
+    Pixels are only ever joined to their immediate neighbours so instead of comparing every
+    pair of pixels we look up each pixel's forward neighbours. The segments come out in the
+    same order as the old pairwise comparison so the geometry is identical.
+
+    Args:
+        array (np.array): raster array
+        rasterfn (str): path to the raster (for the geotransform)
+        pixelValue (int): value of the path pixels
+        precision (int, optional): decimal places to round coordinates to. Defaults to 13.
+
+    Returns:
+        ogr.Geometry: MultiLineString of pixel-to-pixel segments
+    """
+
+    # Read the geotransform just once
     raster = gdal.Open(rasterfn)
     geotransform = raster.GetGeoTransform()
+    raster = None
+    originX = geotransform[0]
+    originY = geotransform[3]
     pixelWidth = geotransform[1]
     pixelHeight = geotransform[5]
+
+    # max distance between points
     maxDistance = sqrt((pixelHeight ** 2 + pixelWidth ** 2))  # sqrt(2 * pixelWidth * pixelWidth)  # ceil() # pixelwidth * sqrt(2)
     maxDistance = maxDistance + maxDistance * 0.01
-    # print(maxDistance)
-
-    # array2dict
-    count = 0
-    roadList = np.where(array == pixelValue)
-    # multipoint = ogr.Geometry(ogr.wkbMultiLineString)
-    pointDict = {}
-    for indexY in roadList[0]:
-        indexX = roadList[1][count]
-        Xcoord, Ycoord = pixelOffset2coord(rasterfn, indexX, indexY)
-        pointDict[count] = (round(Xcoord, precision), round(Ycoord, precision))
-        count += 1
+
+    # np.where returns the pixels in row-major order so the linear index is already sorted
+    rows, cols = np.where(array == pixelValue)
+    ncols = array.shape[1]
+    linear_index = rows.astype(np.int64) * ncols + cols
+
+    # Convert all the offsets to coordinates in one pass. The offsets from np.where were always numpy
+    # integers, so the per-pixel round() was numpy's float64 rounding and np.round gives the same values.
+    # (Python's round() on plain floats differs in the last digit for some coordinates.)
+    coords_x = np.round(originX + pixelWidth * cols + pixelWidth / 2, precision).tolist()
+    coords_y = np.round(originY + pixelHeight * rows + pixelHeight / 2, precision).tolist()
+
+    # Find every (from, to) pixel pair for each forward neighbour offset
+    pairs_from = []
+    pairs_to = []
+    for row_off, col_off in get_neighbour_offsets(pixelWidth, pixelHeight, maxDistance):
+        n_rows = rows + row_off
+        n_cols = cols + col_off
+        in_bounds = (n_rows < array.shape[0]) & (n_cols >= 0) & (n_cols < ncols)
+        candidates = np.nonzero(in_bounds)[0]
+        n_linear = n_rows[candidates].astype(np.int64) * ncols + n_cols[candidates]
+        found = np.searchsorted(linear_index, n_linear)
+        found[found >= len(linear_index)] = 0
+        is_pixel = linear_index[found] == n_linear
+        pairs_from.append(candidates[is_pixel])
+        pairs_to.append(found[is_pixel])
+
+    # Sort the pairs the way itertools.combinations would have produced them
+    if len(pairs_from) > 0:
+        pairs_from = np.concatenate(pairs_from)
+        pairs_to = np.concatenate(pairs_to)
+    else:
+        pairs_from = pairs_to = np.array([], dtype=np.int64)
+    order = np.lexsort((pairs_to, pairs_from))
 
     # dict2wkbMultiLineString
     multiline = ogr.Geometry(ogr.wkbMultiLineString)
-    for i in itertools.combinations(pointDict.values(), 2):
-        point1 = ogr.Geometry(ogr.wkbPoint)
-        point1.AddPoint(i[0][0], i[0][1])
-        point2 = ogr.Geometry(ogr.wkbPoint)
-        point2.AddPoint(i[1][0], i[1][1])
-
-        distance = point1.Distance(point2)
-
-        if distance < maxDistance:
-            line = ogr.Geometry(ogr.wkbLineString)
-            line.AddPoint(i[0][0], i[0][1])
-            line.AddPoint(i[1][0], i[1][1])
-            multiline.AddGeometry(line)
+    for idx_from, idx_to in zip(pairs_from[order].tolist(), pairs_to[order].tolist()):
+        line = ogr.Geometry(ogr.wkbLineString)
+        line.AddPoint(coords_x[idx_from], coords_y[idx_from])
+        line.AddPoint(coords_x[idx_to], coords_y[idx_to])
+        multiline.AddGeometry(line)
 
     return multiline
 
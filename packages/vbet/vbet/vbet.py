@@ -38,15 +38,16 @@ from rscommons import TimerBuckets, TimerWaypoints
 from rscommons.augment_lyr_meta import augment_layermeta, add_layer_descriptions, raster_resolution_meta
 
 from vbet.vbet_database import build_vbet_database, load_configuration
-from vbet.vbet_raster_ops import rasterize, raster_logic_mask, raster_update_multiply, raster_remove_zone, get_endpoints_on_raster, generate_vbet_polygon, generate_centerline_surface, clean_raster_regions, proximity_raster
+from vbet.vbet_raster_ops import rasterize, raster_logic_mask, raster_update_multiply, raster_remove_zone, get_endpoints_on_raster, generate_vbet_polygon, generate_centerline_surface, clean_raster_regions, proximity_raster, raster_window
 from vbet.vbet_outputs import clean_up_centerlines
 from vbet.vbet_report import VBETReport
 from vbet.vbet_segmentation import calculate_dgo_metrics, generate_igo_points, split_vbet_polygons, calculate_vbet_window_metrics
 from vbet.lib.CompositeRaster import CompositeRaster
 from vbet.__version__ import __version__
 
-from .lib.cost_path import least_cost_path
+from .lib.cost_path import CostPathRouter, NoPathError
 from .lib.raster2line import raster2line_geom
+from .lib.level_path_scheduler import LevelPathScheduler
 
 Path = str
 
@@ -116,8 +117,11 @@ LayerTypes = {
 
 def vbet_centerlines(in_line_network, in_dem, in_slope, in_hillshade, in_catchments, in_channel_area, vaa_table, project_folder, huc,
                      level_paths=None, in_pitfill_dem=None, in_dinfflowdir_ang=None, in_dinfflowdir_slp=None, in_twi_raster=None, meta=None, debug=False,
-                     reach_codes=None, mask=None, temp_folder=None):
-    """Run VBET"""
+                     reach_codes=None, mask=None, temp_folder=None, workers=1):
+    """Run VBET
+
+    workers is the number of processes used to run level paths concurrently (1 runs them serially)
+    """
 
     thresh_vals = {'VBET_IA': 0.85, 'VBET_FULL': 0.65}
     _tmr_waypt = TimerWaypoints()
@@ -319,8 +323,6 @@ def vbet_centerlines(in_line_network, in_dem, in_slope, in_hillshade, in_catchme
     # Generate max extent based on dem size
     with rasterio.open(dem) as raster:
         raster_bounds = raster.bounds
-    bbox = box(*raster_bounds)
-    raster_envelope_geom = VectorBase.shapely2ogr(bbox)
     vbet_clip_buffer_size = VectorBase.rough_convert_metres_to_raster_units(dem, 0.25)
 
     _tmr_waypt.timer_break('InputPrep')  # this is where input prep ends
@@ -356,339 +358,100 @@ def vbet_centerlines(in_line_network, in_dem, in_slope, in_hillshade, in_catchme
     ####################################################################################
     # Level path Loop
     ####################################################################################
-    for level_path_key, level_path in enumerate(level_paths_to_run, 1):
+    # Everything inside process_level_path is independent of the other level paths so it can run
+    # concurrently. Anything that touches the HUC-wide outputs happens below, in level path key order,
+    # so that the result is identical no matter how many workers we use.
+    scheduler = LevelPathScheduler(workers, temp_folder, log.isverbose())
+    level_path_params = {
+        'project_folder': project_folder,
+        'temp_folder': temp_folder,
+        'temp_rasters_folder': temp_rasters_folder,
+        'channel_area': channel_area,
+        'catchments': catchments,
+        'line_network': line_network,
+        'pitfill_dem': pitfill_dem,
+        'dinfflowdir_ang': dinfflowdir_ang,
+        'in_rasters': in_rasters,
+        'raster_bounds': tuple(raster_bounds),
+        'pixel_x': pixel_x,
+        'vbet_run': vbet_run,
+        'level_paths_drainage': level_paths_drainage,
+        'level_path_count': len(level_paths_to_run),
+        # Share the TauDEM cores between the workers so we don't oversubscribe the machine
+        'taudem_cores': str(max(1, int(NCORES) // scheduler.workers))
+    }
+    level_path_jobs = [(level_path_key, level_path, level_path_params) for level_path_key, level_path in enumerate(level_paths_to_run, 1)]
+
+    for result in scheduler.run(process_level_path, level_path_jobs):
+        level_path_key = result['level_path_key']
+        level_path = result['level_path']
         level_path_keys[level_path_key] = level_path
 
-        _tmtbuckets.tick({
+        _tmtbuckets.meta = {
             "level_path": level_path,
             "drainage": level_paths_drainage[level_path] if level_path in level_paths_drainage else 0,
             "code": None,
             "msg": None,
             "has_centerline": None,
-        })
+        }
+        # Timings from worker processes need to be brought back into this process
+        if scheduler.workers > 1 and _tmtbuckets.active is True:
+            _tmtbuckets.timers.update(result['timers'])
+            _tmtbuckets.tick_total += sum(result['timers'].values())
 
-        log.title(f'Processing Level Path: {level_path} {level_path_key}/{len(level_paths_to_run)}')
-        temp_folder_lpath = os.path.join(temp_folder, f'levelpath_{level_path}')
-        safe_makedirs(temp_folder_lpath)
-
-        # Gather the channel area polygon for the level path
-        sql = f"LevelPathI = {level_path}" if level_path is not None else "LevelPathI is NULL"
-        level_path_polygons = os.path.join(temp_folder_lpath, 'channel_polygons.gpkg', f'level_path_{level_path}')
-        with TimerBuckets('ogr'):
-            copy_feature_class(channel_area, level_path_polygons, attribute_filter=sql)
-
-        # Generate the buffered channel area extent to minimize raster processing area
-        if level_path is not None:
-            with TimerBuckets('ogr'):
-                with GeopackageLayer(level_path_polygons) as lyr_polygons:
-                    if lyr_polygons.ogr_layer.GetFeatureCount() == 0:
-                        err_msg = f"No channel area features found for Level Path {level_path}."
-                        log.warning(err_msg)
-                        _tmterr("NO_CHANNEL_AREA", err_msg)
-                        continue
-                    # Hack to check if any channel geoms are empty
-                    check_empty = False
-                    for feat, *_ in lyr_polygons.iterate_features():
-                        geom_test = feat.GetGeometryRef()
-                        if geom_test.IsEmpty():
-                            check_empty = True
-                    if check_empty is True:
-                        err_msg = f"Empty channel area geometry found for Level Path {level_path}."
-                        log.warning(err_msg)
-                        _tmterr("EMPTY_CHANNEL_AREA", err_msg)
-                        continue
-                    channel_bbox = lyr_polygons.ogr_layer.GetExtent()
-                    channel_buffer_size = lyr_polygons.rough_convert_metres_to_vector_units(400)
-
-                channel_envelope_geom = get_rectangle_as_geom(channel_bbox)
-                log.debug(f'channel_envelope_geom area: {channel_envelope_geom.Area}')
-
-                if not raster_envelope_geom.Intersects(channel_envelope_geom):
-                    log.warning(f'Channel Area Envelope does not intersect DEM Extent for level path {level_path}')
-                    continue
+        if result['err_code'] is not None:
+            _tmterr(result['err_code'], result['err_msg'])
 
-                with GeopackageLayer(catchments) as lyr_catchments:
-                    geom_envelope = channel_envelope_geom.Clone()
-                    for feat_catchment, *_ in lyr_catchments.iterate_features(clip_shape=channel_envelope_geom):
-                        geom_catchment = feat_catchment.GetGeometryRef()
-                        geom_catchment_envelope = get_extent_as_geom(geom_catchment)
-                        geom_envelope = geom_envelope.Union(geom_catchment_envelope)
-                        geom_envelope = get_extent_as_geom(geom_envelope)
-
-            with TimerBuckets('ogr'):
-                geom_channel_buffer = geom_envelope.Buffer(channel_buffer_size)
-                envelope_geom = raster_envelope_geom.Intersection(geom_channel_buffer)
-                if envelope_geom.IsEmpty():
-                    err_msg = f'Empty processing envelope for level path {level_path}'
-                    log.error(err_msg)
-                    _tmterr("EMPTY_ENVELOPE", err_msg)
-                    continue
-        else:
-            envelope_geom = raster_envelope_geom
+        if result['status'] != 'complete':
+            _tmtbuckets.tick()
+            continue
 
-        envelope = os.path.join(temp_folder_lpath, 'envelope_polygon.gpkg', f'level_path_{level_path}')
-        with TimerBuckets('ogr'):
-            with GeopackageLayer(envelope, write=True) as lyr_envelope:
-                lyr_envelope.create_layer(ogr.wkbPolygon, 4326)
-                lyr_envelope_dfn = lyr_envelope.ogr_layer_def
-                feat = ogr.Feature(lyr_envelope_dfn)
-                feat.SetGeometry(envelope_geom)
-                lyr_envelope.ogr_layer.CreateFeature(feat)
-
-        # use the channel extent to mask all hand input raster and channel area extents
-        local_dinfflowdir_ang = os.path.join(temp_folder_lpath, f'dinfflowdir_ang_{level_path}.tif')
-        local_pitfill_dem = os.path.join(temp_folder_lpath, f'pitfill_dem_{level_path}.tif')
-        with TimerBuckets('gdal'):
-            raster_warp(dinfflowdir_ang, local_dinfflowdir_ang, 4326, clip=envelope)
-            raster_warp(pitfill_dem, local_pitfill_dem, 4326, clip=envelope)
-
-        rasterized_channel = os.path.join(temp_folder_lpath, f'rasterized_channel_{level_path}.tif')
-        prox_raster_path = os.path.join(temp_folder_lpath, f'chan_proximity_{level_path}.tif')
-        with TimerBuckets('rasterize'):
-            rasterize(level_path_polygons, rasterized_channel, local_pitfill_dem, all_touched=True)
-            in_rasters['Channel'] = rasterized_channel
-            # distance weighting for Slope evidence
-            proximity_raster(rasterized_channel, prox_raster_path)
-            in_rasters['Proximity'] = prox_raster_path
-            with rasterio.open(prox_raster_path) as prox:
-                prox_arr = prox.read(1)
-                max_prox = np.max(prox_arr)
-
-        with TimerBuckets('flowline'):
-            if level_path is not None:
-                # Generate and add rasterized version of level path flowline to make sure endpoint coords are on the raster.
-                level_path_flowlines = os.path.join(temp_folder_lpath, 'flowlines.gpkg', f'level_path_{level_path}')
-                copy_feature_class(line_network, level_path_flowlines, attribute_filter=f'LevelPathI = {level_path}')
-                rasterized_level_path = os.path.join(temp_folder_lpath, f'rasterized_flowline_{level_path}.tif')
-                rasterize(level_path_flowlines, rasterized_level_path, rasterized_channel, all_touched=True)
-            else:
-                rasterized_level_path = None
-
-        with TimerBuckets('HAND'):
-            hand_raster = os.path.join(temp_rasters_folder, f'local_hand_{level_path}.tif')
-            hand_raster_interior = os.path.join(temp_rasters_folder, f'local_hand_interior_{level_path}.tif')
-            dinfdistdown_status = run_subprocess(project_folder, ["mpiexec", "-n", NCORES, "dinfdistdown",
-                                                                  "-ang", local_dinfflowdir_ang,
-                                                                  "-fel", local_pitfill_dem,
-                                                                  "-src", rasterized_channel,
-                                                                  "-dd", hand_raster, "-m", "ave", "v"])
-            if dinfdistdown_status != 0 or not os.path.isfile(hand_raster):
-                err_msg = f'Error generating HAND for level path {level_path}'
-                log.error(err_msg)
-                _tmterr("HAND_ERROR", err_msg)
-                continue
-            in_rasters['HAND'] = hand_raster
+        temp_folder_lpath = result['temp_folder']
 
+        log.info(f'Add VBET Raster to Output for Level Path: {level_path} {level_path_key}/{len(level_paths_to_run)}')
         with TimerBuckets('rasterio'):
-            # Open evidence rasters concurrently. We're looping over windows so this shouldn't affect
-            # memory consumption too much
-            read_rasters = {name: rasterio.open(raster) for name, raster in in_rasters.items()}
-            out_meta = read_rasters['HAND'].meta
-            out_meta['driver'] = 'GTiff'
-            out_meta['count'] = 1
-            out_meta['compress'] = 'deflate'
-
-            use_big_tiff_interior = os.path.getsize(in_rasters['HAND']) > BIG_TIFF_THRESH
-            if use_big_tiff_interior:
-                out_meta['BIGTIFF'] = 'YES'
-
-            evidence_raster = os.path.join(temp_rasters_folder, f'vbet_evidence_{level_path}.tif')
-            evidence_raster_interior = os.path.join(temp_rasters_folder, f'vbet_evidence_interior_{level_path}.tif')
-            transformed_hand = os.path.join(temp_rasters_folder, f'transformed_hand_{level_path}.tif')
-            transformed_hand_interior = os.path.join(temp_rasters_folder, f'transformed_hand_interior_{level_path}.tif')
-            transformed_slope = os.path.join(temp_rasters_folder, f'transformed_slope_{level_path}.tif')
-            transformed_slope_interior = os.path.join(temp_rasters_folder, f'transformed_slope_interior_{level_path}.tif')
-
-            write_rasters = {}  # {name: rasterio.open(raster, 'w', **out_meta) for name, raster in out_rasters.items()}
-            write_rasters['VBET_EVIDENCE'] = rasterio.open(evidence_raster, 'w', **out_meta)
-            write_rasters['TRANSFORMED_HAND'] = rasterio.open(transformed_hand, 'w', **out_meta)
-            write_rasters['TRANSFORMED_SLOPE'] = rasterio.open(transformed_slope, 'w', **out_meta)
-            write_rasters['topo_evidence'] = rasterio.open(os.path.join(temp_folder_lpath, f'topo_evidence_{level_path}.tif'), 'w', **out_meta)
-
-            progbar = ProgressBar(len(list(read_rasters['Slope'].block_windows(1))), 50, "Calculating evidence layer")
-            counter = 0
-            # Again, these rasters should be orthogonal so their windows should also line up
-            in_transform = read_rasters['HAND'].get_transform()
-            out_transform = read_rasters['Slope'].get_transform()
-            col_off_delta = round((in_transform[0] - out_transform[0]) / out_transform[1])
-            row_off_delta = round((in_transform[3] - out_transform[3]) / out_transform[5])
-
-            for _ji, window in read_rasters['HAND'].block_windows(1):
-                progbar.update(counter)
-                counter += 1
-                modified_window = Window(window.col_off + col_off_delta, window.row_off + row_off_delta, window.width, window.height)
-                block = {}
-                for block_name, raster in read_rasters.items():
-                    out_window = window if block_name in ['HAND', 'Channel', 'TRANSFORM_ZONE_HAND', 'Proximity'] else modified_window
-                    block[block_name] = raster.read(1, window=out_window, masked=True)
-
-                transformed = {}
-                for name in vbet_run['Inputs']:
-                    if name in vbet_run['Zones']:
-                        zone = get_zone(vbet_run, name, level_paths_drainage[level_path])
-                        transform = vbet_run['Transforms'][name][zone]
-                        if isinstance(transform, str):
-                            locs = {'a': block[name].data}
-                            trans_ds = eval(transform, {'__builtins__': None}, locs)
-                            transformed[name] = np.ma.MaskedArray(trans_ds, mask=block['HAND'].mask)
-
-                        else:
-                            transformed[name] = np.ma.MaskedArray(transform(block[name].data), mask=block['HAND'].mask)
-                    else:
-                        transformed[name] = np.ma.MaskedArray(vbet_run['Transforms'][name][0](block[name].data), mask=block['HAND'].mask)
-
-                    masked_prox = np.ma.MaskedArray(block['Proximity'].data, mask=block['HAND'].mask)
-                    if name == 'Slope' and zone < 3:
-                        # transformed[name] = transformed[name] - ((np.log(masked_prox + 0.1) + 2.303) / np.log(max_prox + 2.303))
-                        transformed[name] = transformed[name] - (np.sqrt(masked_prox) / np.sqrt(max_prox))
-
-                fvals_topo = vbet_run['Inputs']['HAND']['weight'] * transformed['HAND'] + vbet_run['Inputs']['Slope']['weight'] * transformed['Slope']
-                fvals_channel = 0.995 * block['Channel']
-                fvals_evidence = np.maximum(fvals_topo, fvals_channel)
-
-                write_rasters['topo_evidence'].write(np.ma.filled(np.float32(fvals_topo), out_meta['nodata']), window=window, indexes=1)
-                write_rasters['VBET_EVIDENCE'].write(np.ma.filled(np.float32(fvals_evidence), out_meta['nodata']), window=window, indexes=1)
-                write_rasters['TRANSFORMED_HAND'].write(np.ma.filled(np.float32(transformed['HAND']), out_meta['nodata']), window=window, indexes=1)
-                write_rasters['TRANSFORMED_SLOPE'].write(np.ma.filled(np.float32(transformed['Slope']), out_meta['nodata']), window=window, indexes=1)
-            write_rasters['VBET_EVIDENCE'].close()
-            write_rasters['TRANSFORMED_HAND'].close()
-            write_rasters['TRANSFORMED_SLOPE'].close()
-            write_rasters['topo_evidence'].close()
-
-        # Generate VBET Polygon
-        with TimerBuckets('gdal'):
-            valley_bottom_raster = os.path.join(temp_folder_lpath, f'valley_bottom_{level_path}.tif')
-            generate_vbet_polygon(evidence_raster, rasterized_channel, hand_raster, valley_bottom_raster, temp_folder_lpath, rasterized_level_path, thresh_value=0.65)
-
-        log.info('Add VBET Raster to Output')
-        with TimerBuckets('rasterio'):
-            raster_update_multiply(vbet_zone_raster, valley_bottom_raster, value=level_path_key)
+            raster_update_multiply(vbet_zone_raster, result['valley_bottom_raster'], value=level_path_key)
 
         if level_path is not None:
             with TimerBuckets('scipy'):
-                region_raster = os.path.join(temp_folder_lpath, f'region_cleaning_{level_path}.tif')
-                clean_raster_regions(vbet_zone_raster, level_path_key, vbet_zone_raster, region_raster)
-
-        # Generate the Active Floodplain Polygon
-        with TimerBuckets('gdal'):
-            active_valley_bottom_raster = os.path.join(temp_folder_lpath, f'active_valley_bottom_{level_path}.tif')
-            generate_vbet_polygon(evidence_raster, rasterized_channel, hand_raster, active_valley_bottom_raster, temp_folder_lpath, rasterized_level_path, thresh_value=0.85)
+                # The level path key can only have been written inside the valley bottom raster extent
+                # so only the HUC zone raster blocks it covers need cleaning
+                level_path_window = raster_window(vbet_zone_raster, result['valley_bottom_raster'])
+                if level_path_window is not None:
+                    region_raster = os.path.join(temp_folder_lpath, f'region_cleaning_{level_path}.tif')
+                    clean_raster_regions(vbet_zone_raster, level_path_key, vbet_zone_raster, region_raster, window=level_path_window)
 
         with TimerBuckets('rasterio'):
-            raster_update_multiply(active_zone_raster, active_valley_bottom_raster, value=level_path_key)
-
-        # Generate centerline for level paths only
-        with TimerBuckets('centerline'):
-            if level_path is not None:
-                # Generate and add rasterized version of level path flowline to make sure endpoint coords are on the raster.
-                valley_bottom_flowline_raster = os.path.join(temp_folder_lpath, f'valley_bottom_and_flowline_{level_path}.tif')
-                with rasterio.open(valley_bottom_raster, 'r') as rio_vbet, \
-                        rasterio.open(rasterized_level_path, 'r') as rio_flowline:
-                    out_meta = rio_vbet.meta
-
-                    use_big_tiff_cline = os.path.getsize(valley_bottom_raster) > BIG_TIFF_THRESH
-                    if use_big_tiff_cline:
-                        out_meta['BIGTIFF'] = 'YES'
-
-                    out_meta['compress'] = 'deflate'
-                    with rasterio.open(valley_bottom_flowline_raster, 'w', **out_meta) as rio_out:
-                        for _ji, window in rio_vbet.block_windows(1):
-                            array_vbet = np.ma.MaskedArray(rio_vbet.read(1, window=window).data)
-                            array_flowline = np.ma.MaskedArray(rio_flowline.read(1, window=window).data)
-                            array_logic = array_vbet + array_flowline
-                            array_out = np.greater_equal(array_logic, 1)
-                            array_out_format = array_out if out_meta['dtype'] == 'int32' else np.float32(array_out)
-                            rio_out.write(np.ma.filled(array_out_format, out_meta['nodata']), window=window, indexes=1)
-
-                # Generate Centerline from Cost Path
-                log.info('Generating Centerline from cost path')
-                cost_path_raster = os.path.join(temp_folder_lpath, f'cost_path_{level_path}.tif')
-                generate_centerline_surface(valley_bottom_flowline_raster, cost_path_raster, temp_folder_lpath)
-                geom_flowline = collect_linestring(level_path_flowlines)
-
-                geom_flowline = ogr.ForceToMultiLineString(geom_flowline)
+            raster_update_multiply(active_zone_raster, result['active_valley_bottom_raster'], value=level_path_key)
+
+        if len(result['centerlines']) > 0:
+            with TimerBuckets('centerline'):
                 with GeopackageLayer(temp_centerlines, write=True) as lyr_cl:
-                    cl_index = 0
-                    for g_flowline in geom_flowline:
-                        coords = get_endpoints_on_raster(cost_path_raster, g_flowline, pixel_x)
-                        if len(coords) != 2:
-                            err_msg = f'Unable to generate centerline for part {cl_index} of level path {level_path}: found {len(coords)} target coordinates instead of expected 2.'
-                            log.error(err_msg)
-                            _tmterr("CENTERLINE_ERROR", err_msg)
-                            continue
-                        log.info('Find least cost path for centerline')
-                        try:
-                            centerline_raster = os.path.join(temp_folder_lpath, f'centerline_{level_path}_part_{cl_index}.tif')
-                            least_cost_path(cost_path_raster, centerline_raster, coords[0], coords[1])
-                        except Exception as err:
-                            # print(err)
-                            err_msg = f'Unable to generate centerline for part {cl_index} of level path {level_path}: end points must all be within the costs array.'
-                            log.error(err_msg)
-                            log.debug(err)
-                            _tmterr("CENTERLINE_COST_ERROR", err_msg)
-                            cl_index += 1
-                            continue
-
-                        log.info('Vectorize centerline from Raster')
-                        geom_centerline = raster2line_geom(centerline_raster, 1)
-                        geom_centerline = ogr.ForceToLineString(geom_centerline)
-
-                        geom_centerline = ogr.ForceToMultiLineString(geom_centerline)
+                    for cl_index, centerline_wkb in result['centerlines']:
                         out_feature = ogr.Feature(lyr_cl.ogr_layer_def)
-                        out_feature.SetGeometry(geom_centerline)
+                        out_feature.SetGeometry(ogr.CreateGeometryFromWkb(centerline_wkb))
                         out_feature.SetField('LevelPathI', str(level_path))
                         out_feature.SetField('CL_Part_Index', cl_index)
                         lyr_cl.ogr_layer.CreateFeature(out_feature)
                         out_feature = None
-                        cl_index += 1
-
-        # Mask the raster and create the inner versions of itself
-        raster_logic_mask(hand_raster, hand_raster_interior, valley_bottom_raster)
-        raster_logic_mask(transformed_hand, transformed_hand_interior, valley_bottom_raster)
-        raster_logic_mask(evidence_raster, evidence_raster_interior, valley_bottom_raster)
-        raster_logic_mask(transformed_slope, transformed_slope_interior, valley_bottom_raster)
 
         # Add these to arrays so that we can use them later
-        if os.path.isfile(hand_raster):
-            if level_path is None:
-                raster_lookup['hand_raster'] = [hand_raster] + raster_lookup['hand_raster']
-            else:
-                raster_lookup['hand_raster'].append(hand_raster)
-
-        if os.path.isfile(evidence_raster):
-            if level_path is None:
-                raster_lookup['evidence_raster'] = [evidence_raster] + raster_lookup['evidence_raster']
-            else:
-                raster_lookup['evidence_raster'].append(evidence_raster)
-
-        if os.path.isfile(transformed_hand):
-            if level_path is None:
-                raster_lookup['transformed_hand'] = [transformed_hand] + raster_lookup['transformed_hand']
-            else:
-                raster_lookup['transformed_hand'].append(transformed_hand)
-
-        if os.path.isfile(transformed_slope):
+        for raster_name in ['hand_raster', 'evidence_raster', 'transformed_hand', 'transformed_slope']:
+            if result['rasters'][raster_name] is None:
+                continue
             if level_path is None:
-                raster_lookup['transformed_slope'] = [transformed_slope] + raster_lookup['transformed_slope']
+                raster_lookup[raster_name] = [result['rasters'][raster_name]] + raster_lookup[raster_name]
             else:
-                raster_lookup['transformed_slope'].append(transformed_slope)
-
-        # Add these to arrays so that we can use them later
-        if os.path.isfile(hand_raster_interior):
-            raster_lookup['hand_raster_interior'].append(hand_raster_interior)
-
-        if os.path.isfile(evidence_raster_interior):
-            raster_lookup['evidence_raster_interior'].append(evidence_raster_interior)
+                raster_lookup[raster_name].append(result['rasters'][raster_name])
 
-        if os.path.isfile(transformed_hand_interior):
-            raster_lookup['transformed_hand_interior'].append(transformed_hand_interior)
-
-        if os.path.isfile(transformed_slope_interior):
-            raster_lookup['transformed_slope_interior'].append(transformed_slope_interior)
+        for raster_name in ['hand_raster_interior', 'evidence_raster_interior', 'transformed_hand_interior', 'transformed_slope_interior']:
+            if result['rasters'][raster_name] is not None:
+                raster_lookup[raster_name].append(result['rasters'][raster_name])
 
+        _tmtfinish()
+        _tmtbuckets.tick()
         # End of level path for loop
 
-    _tmtfinish()
     # Final tick to trigger writing the last row
     _tmtbuckets.tick()
     _tmtbuckets.write_csv()
@@ -785,10 +548,10 @@ def vbet_centerlines(in_line_network, in_dem, in_slope, in_hillshade, in_catchme
 
     log.info('Calculating Segment Metrics')
     metric_layers = {'active_floodplain': output_active_fp, 'active_channel': channel_area, 'inactive_floodplain': output_inactive_fp, 'floodplain': output_floodplain}
-    for level_path in level_paths_to_run:
-        if level_path is None:
-            continue
-        calculate_dgo_metrics(segmentation_polygons, output_centerlines, metric_layers, f"LevelPathI = {level_path}")
+    # The centerlines and metric layers are loaded once so run every level path in a single pass
+    level_path_list = ', '.join(str(level_path) for level_path in level_paths_to_run if level_path is not None)
+    if len(level_path_list) > 0:
+        calculate_dgo_metrics(segmentation_polygons, output_centerlines, metric_layers, f"LevelPathI IN ({level_path_list})")
     _tmr_waypt.timer_break('CalcSegmentMetrics')
 
     log.info('Summerizing VBET Metrics')
@@ -891,6 +654,338 @@ def vbet_centerlines(in_line_network, in_dem, in_slope, in_hillshade, in_catchme
     log.info('VBET Completed Successfully')
 
 
+def process_level_path(level_path_key: int, level_path: str, params: Dict) -> Dict:
+    """Run all the level path work that doesn't touch the HUC-wide outputs.
+
+    Everything is written into an isolated scratch folder for the level path so this can
+    safely run in a worker process. The caller is responsible for merging the results
+    into the zone rasters and centerline layer (in level path key order).
+
+    Args:
+        level_path_key (int): 1-based key of the level path. This is the value burned into the zone rasters
+        level_path (str): level path id (None for the features that aren't on a level path)
+        params (Dict): paths and configuration shared by all level paths (see vbet_centerlines)
+
+    Returns:
+        Dict: status, error code/message, paths of the rasters to merge and the centerline geometries as WKB
+    """
+    log = Logger('VBET')
+
+    result = {
+        'level_path_key': level_path_key,
+        'level_path': level_path,
+        'status': 'skipped',
+        'err_code': None,
+        'err_msg': None,
+        'temp_folder': None,
+        'valley_bottom_raster': None,
+        'active_valley_bottom_raster': None,
+        'centerlines': [],
+        'rasters': {},
+        'timers': {}
+    }
+
+    def _tmterr(err_code: str, err_msg: str):
+        result['err_code'] = err_code
+        result['err_msg'] = err_msg
+
+    def _finish():
+        result['timers'] = dict(TimerBuckets().timers)
+        return result
+
+    vbet_run = params['vbet_run']
+    level_paths_drainage = params['level_paths_drainage']
+    channel_area = params['channel_area']
+    line_network = params['line_network']
+    temp_rasters_folder = params['temp_rasters_folder']
+    # Each level path gets its own copy so the per-level-path rasters never leak between jobs
+    in_rasters = dict(params['in_rasters'])
+
+    raster_envelope_geom = VectorBase.shapely2ogr(box(*params['raster_bounds']))
+
+    log.title(f'Processing Level Path: {level_path} {level_path_key}/{params["level_path_count"]}')
+    temp_folder_lpath = os.path.join(params['temp_folder'], f'levelpath_{level_path}')
+    safe_makedirs(temp_folder_lpath)
+    result['temp_folder'] = temp_folder_lpath
+
+    # Gather the channel area polygon for the level path
+    sql = f"LevelPathI = {level_path}" if level_path is not None else "LevelPathI is NULL"
+    level_path_polygons = os.path.join(temp_folder_lpath, 'channel_polygons.gpkg', f'level_path_{level_path}')
+    with TimerBuckets('ogr'):
+        copy_feature_class(channel_area, level_path_polygons, attribute_filter=sql)
+
+    # Generate the buffered channel area extent to minimize raster processing area
+    if level_path is not None:
+        with TimerBuckets('ogr'):
+            with GeopackageLayer(level_path_polygons) as lyr_polygons:
+                if lyr_polygons.ogr_layer.GetFeatureCount() == 0:
+                    err_msg = f"No channel area features found for Level Path {level_path}."
+                    log.warning(err_msg)
+                    _tmterr("NO_CHANNEL_AREA", err_msg)
+                    return _finish()
+                # Hack to check if any channel geoms are empty
+                check_empty = False
+                for feat, *_ in lyr_polygons.iterate_features():
+                    geom_test = feat.GetGeometryRef()
+                    if geom_test.IsEmpty():
+                        check_empty = True
+                if check_empty is True:
+                    err_msg = f"Empty channel area geometry found for Level Path {level_path}."
+                    log.warning(err_msg)
+                    _tmterr("EMPTY_CHANNEL_AREA", err_msg)
+                    return _finish()
+                channel_bbox = lyr_polygons.ogr_layer.GetExtent()
+                channel_buffer_size = lyr_polygons.rough_convert_metres_to_vector_units(400)
+
+            channel_envelope_geom = get_rectangle_as_geom(channel_bbox)
+            log.debug(f'channel_envelope_geom area: {channel_envelope_geom.Area}')
+
+            if not raster_envelope_geom.Intersects(channel_envelope_geom):
+                log.warning(f'Channel Area Envelope does not intersect DEM Extent for level path {level_path}')
+                return _finish()
+
+            with GeopackageLayer(params['catchments']) as lyr_catchments:
+                geom_envelope = channel_envelope_geom.Clone()
+                for feat_catchment, *_ in lyr_catchments.iterate_features(clip_shape=channel_envelope_geom):
+                    geom_catchment = feat_catchment.GetGeometryRef()
+                    geom_catchment_envelope = get_extent_as_geom(geom_catchment)
+                    geom_envelope = geom_envelope.Union(geom_catchment_envelope)
+                    geom_envelope = get_extent_as_geom(geom_envelope)
+
+        with TimerBuckets('ogr'):
+            geom_channel_buffer = geom_envelope.Buffer(channel_buffer_size)
+            envelope_geom = raster_envelope_geom.Intersection(geom_channel_buffer)
+            if envelope_geom.IsEmpty():
+                err_msg = f'Empty processing envelope for level path {level_path}'
+                log.error(err_msg)
+                _tmterr("EMPTY_ENVELOPE", err_msg)
+                return _finish()
+    else:
+        envelope_geom = raster_envelope_geom
+
+    envelope = os.path.join(temp_folder_lpath, 'envelope_polygon.gpkg', f'level_path_{level_path}')
+    with TimerBuckets('ogr'):
+        with GeopackageLayer(envelope, write=True) as lyr_envelope:
+            lyr_envelope.create_layer(ogr.wkbPolygon, 4326)
+            lyr_envelope_dfn = lyr_envelope.ogr_layer_def
+            feat = ogr.Feature(lyr_envelope_dfn)
+            feat.SetGeometry(envelope_geom)
+            lyr_envelope.ogr_layer.CreateFeature(feat)
+
+    # use the channel extent to mask all hand input raster and channel area extents
+    local_dinfflowdir_ang = os.path.join(temp_folder_lpath, f'dinfflowdir_ang_{level_path}.tif')
+    local_pitfill_dem = os.path.join(temp_folder_lpath, f'pitfill_dem_{level_path}.tif')
+    with TimerBuckets('gdal'):
+        raster_warp(params['dinfflowdir_ang'], local_dinfflowdir_ang, 4326, clip=envelope)
+        raster_warp(params['pitfill_dem'], local_pitfill_dem, 4326, clip=envelope)
+
+    rasterized_channel = os.path.join(temp_folder_lpath, f'rasterized_channel_{level_path}.tif')
+    prox_raster_path = os.path.join(temp_folder_lpath, f'chan_proximity_{level_path}.tif')
+    with TimerBuckets('rasterize'):
+        rasterize(level_path_polygons, rasterized_channel, local_pitfill_dem, all_touched=True)
+        in_rasters['Channel'] = rasterized_channel
+        # distance weighting for Slope evidence
+        proximity_raster(rasterized_channel, prox_raster_path)
+        in_rasters['Proximity'] = prox_raster_path
+        with rasterio.open(prox_raster_path) as prox:
+            prox_arr = prox.read(1)
+            max_prox = np.max(prox_arr)
+
+    with TimerBuckets('flowline'):
+        if level_path is not None:
+            # Generate and add rasterized version of level path flowline to make sure endpoint coords are on the raster.
+            level_path_flowlines = os.path.join(temp_folder_lpath, 'flowlines.gpkg', f'level_path_{level_path}')
+            copy_feature_class(line_network, level_path_flowlines, attribute_filter=f'LevelPathI = {level_path}')
+            rasterized_level_path = os.path.join(temp_folder_lpath, f'rasterized_flowline_{level_path}.tif')
+            rasterize(level_path_flowlines, rasterized_level_path, rasterized_channel, all_touched=True)
+        else:
+            rasterized_level_path = None
+
+    with TimerBuckets('HAND'):
+        hand_raster = os.path.join(temp_rasters_folder, f'local_hand_{level_path}.tif')
+        hand_raster_interior = os.path.join(temp_rasters_folder, f'local_hand_interior_{level_path}.tif')
+        dinfdistdown_status = run_subprocess(params['project_folder'], ["mpiexec", "-n", params['taudem_cores'], "dinfdistdown",
+                                                                        "-ang", local_dinfflowdir_ang,
+                                                                        "-fel", local_pitfill_dem,
+                                                                        "-src", rasterized_channel,
+                                                                        "-dd", hand_raster, "-m", "ave", "v"])
+        if dinfdistdown_status != 0 or not os.path.isfile(hand_raster):
+            err_msg = f'Error generating HAND for level path {level_path}'
+            log.error(err_msg)
+            _tmterr("HAND_ERROR", err_msg)
+            return _finish()
+        in_rasters['HAND'] = hand_raster
+
+    with TimerBuckets('rasterio'):
+        # Open evidence rasters concurrently. We're looping over windows so this shouldn't affect
+        # memory consumption too much
+        read_rasters = {name: rasterio.open(raster) for name, raster in in_rasters.items()}
+        out_meta = read_rasters['HAND'].meta
+        out_meta['driver'] = 'GTiff'
+        out_meta['count'] = 1
+        out_meta['compress'] = 'deflate'
+
+        use_big_tiff_interior = os.path.getsize(in_rasters['HAND']) > BIG_TIFF_THRESH
+        if use_big_tiff_interior:
+            out_meta['BIGTIFF'] = 'YES'
+
+        evidence_raster = os.path.join(temp_rasters_folder, f'vbet_evidence_{level_path}.tif')
+        evidence_raster_interior = os.path.join(temp_rasters_folder, f'vbet_evidence_interior_{level_path}.tif')
+        transformed_hand = os.path.join(temp_rasters_folder, f'transformed_hand_{level_path}.tif')
+        transformed_hand_interior = os.path.join(temp_rasters_folder, f'transformed_hand_interior_{level_path}.tif')
+        transformed_slope = os.path.join(temp_rasters_folder, f'transformed_slope_{level_path}.tif')
+        transformed_slope_interior = os.path.join(temp_rasters_folder, f'transformed_slope_interior_{level_path}.tif')
+
+        write_rasters = {}  # {name: rasterio.open(raster, 'w', **out_meta) for name, raster in out_rasters.items()}
+        write_rasters['VBET_EVIDENCE'] = rasterio.open(evidence_raster, 'w', **out_meta)
+        write_rasters['TRANSFORMED_HAND'] = rasterio.open(transformed_hand, 'w', **out_meta)
+        write_rasters['TRANSFORMED_SLOPE'] = rasterio.open(transformed_slope, 'w', **out_meta)
+        write_rasters['topo_evidence'] = rasterio.open(os.path.join(temp_folder_lpath, f'topo_evidence_{level_path}.tif'), 'w', **out_meta)
+
+        progbar = ProgressBar(len(list(read_rasters['Slope'].block_windows(1))), 50, "Calculating evidence layer")
+        counter = 0
+        # Again, these rasters should be orthogonal so their windows should also line up
+        in_transform = read_rasters['HAND'].get_transform()
+        out_transform = read_rasters['Slope'].get_transform()
+        col_off_delta = round((in_transform[0] - out_transform[0]) / out_transform[1])
+        row_off_delta = round((in_transform[3] - out_transform[3]) / out_transform[5])
+
+        # The transforms were compiled by load_configuration and only depend on the level path drainage area
+        block_zones = {name: get_zone(vbet_run, name, level_paths_drainage[level_path]) if name in vbet_run['Zones'] else 0 for name in vbet_run['Inputs']}
+        block_transforms = {name: vbet_run['Transforms'][name][zone] for name, zone in block_zones.items()}
+
+        for _ji, window in read_rasters['HAND'].block_windows(1):
+            progbar.update(counter)
+            counter += 1
+            modified_window = Window(window.col_off + col_off_delta, window.row_off + row_off_delta, window.width, window.height)
+            block = {}
+            for block_name, raster in read_rasters.items():
+                out_window = window if block_name in ['HAND', 'Channel', 'TRANSFORM_ZONE_HAND', 'Proximity'] else modified_window
+                block[block_name] = raster.read(1, window=out_window, masked=True)
+
+            transformed = {}
+            for name, transform in block_transforms.items():
+                transformed[name] = np.ma.MaskedArray(transform(block[name].data), mask=block['HAND'].mask)
+
+                masked_prox = np.ma.MaskedArray(block['Proximity'].data, mask=block['HAND'].mask)
+                if name == 'Slope' and block_zones[name] < 3:
+                    # transformed[name] = transformed[name] - ((np.log(masked_prox + 0.1) + 2.303) / np.log(max_prox + 2.303))
+                    transformed[name] = transformed[name] - (np.sqrt(masked_prox) / np.sqrt(max_prox))
+
+            fvals_topo = vbet_run['Inputs']['HAND']['weight'] * transformed['HAND'] + vbet_run['Inputs']['Slope']['weight'] * transformed['Slope']
+            fvals_channel = 0.995 * block['Channel']
+            fvals_evidence = np.maximum(fvals_topo, fvals_channel)
+
+            write_rasters['topo_evidence'].write(np.ma.filled(np.float32(fvals_topo), out_meta['nodata']), window=window, indexes=1)
+            write_rasters['VBET_EVIDENCE'].write(np.ma.filled(np.float32(fvals_evidence), out_meta['nodata']), window=window, indexes=1)
+            write_rasters['TRANSFORMED_HAND'].write(np.ma.filled(np.float32(transformed['HAND']), out_meta['nodata']), window=window, indexes=1)
+            write_rasters['TRANSFORMED_SLOPE'].write(np.ma.filled(np.float32(transformed['Slope']), out_meta['nodata']), window=window, indexes=1)
+        write_rasters['VBET_EVIDENCE'].close()
+        write_rasters['TRANSFORMED_HAND'].close()
+        write_rasters['TRANSFORMED_SLOPE'].close()
+        write_rasters['topo_evidence'].close()
+
+    # Generate VBET Polygon
+    with TimerBuckets('gdal'):
+        valley_bottom_raster = os.path.join(temp_folder_lpath, f'valley_bottom_{level_path}.tif')
+        generate_vbet_polygon(evidence_raster, rasterized_channel, hand_raster, valley_bottom_raster, temp_folder_lpath, rasterized_level_path, thresh_value=0.65)
+
+    # Generate the Active Floodplain Polygon
+    with TimerBuckets('gdal'):
+        active_valley_bottom_raster = os.path.join(temp_folder_lpath, f'active_valley_bottom_{level_path}.tif')
+        generate_vbet_polygon(evidence_raster, rasterized_channel, hand_raster, active_valley_bottom_raster, temp_folder_lpath, rasterized_level_path, thresh_value=0.85)
+
+    # Generate centerline for level paths only
+    with TimerBuckets('centerline'):
+        if level_path is not None:
+            # Generate and add rasterized version of level path flowline to make sure endpoint coords are on the raster.
+            valley_bottom_flowline_raster = os.path.join(temp_folder_lpath, f'valley_bottom_and_flowline_{level_path}.tif')
+            with rasterio.open(valley_bottom_raster, 'r') as rio_vbet, \
+                    rasterio.open(rasterized_level_path, 'r') as rio_flowline:
+                out_meta = rio_vbet.meta
+
+                use_big_tiff_cline = os.path.getsize(valley_bottom_raster) > BIG_TIFF_THRESH
+                if use_big_tiff_cline:
+                    out_meta['BIGTIFF'] = 'YES'
+
+                out_meta['compress'] = 'deflate'
+                with rasterio.open(valley_bottom_flowline_raster, 'w', **out_meta) as rio_out:
+                    for _ji, window in rio_vbet.block_windows(1):
+                        array_vbet = np.ma.MaskedArray(rio_vbet.read(1, window=window).data)
+                        array_flowline = np.ma.MaskedArray(rio_flowline.read(1, window=window).data)
+                        array_logic = array_vbet + array_flowline
+                        array_out = np.greater_equal(array_logic, 1)
+                        array_out_format = array_out if out_meta['dtype'] == 'int32' else np.float32(array_out)
+                        rio_out.write(np.ma.filled(array_out_format, out_meta['nodata']), window=window, indexes=1)
+
+            # Generate Centerline from Cost Path
+            log.info('Generating Centerline from cost path')
+            cost_path_raster = os.path.join(temp_folder_lpath, f'cost_path_{level_path}.tif')
+            generate_centerline_surface(valley_bottom_flowline_raster, cost_path_raster, temp_folder_lpath)
+            geom_flowline = collect_linestring(level_path_flowlines)
+
+            geom_flowline = ogr.ForceToMultiLineString(geom_flowline)
+            # One router per level path so the corridor costs and routing graph are shared by all of its parts
+            router = CostPathRouter(cost_path_raster, valley_bottom_flowline_raster)
+            cl_index = 0
+            for g_flowline in geom_flowline:
+                coords = get_endpoints_on_raster(cost_path_raster, g_flowline, params['pixel_x'])
+                if len(coords) != 2:
+                    err_msg = f'Unable to generate centerline for part {cl_index} of level path {level_path}: found {len(coords)} target coordinates instead of expected 2.'
+                    log.error(err_msg)
+                    _tmterr("CENTERLINE_ERROR", err_msg)
+                    continue
+                log.info('Find least cost path for centerline')
+                try:
+                    centerline_raster = os.path.join(temp_folder_lpath, f'centerline_{level_path}_part_{cl_index}.tif')
+                    router.write_path(centerline_raster, coords[0], coords[1])
+                except NoPathError as err:
+                    err_msg = f'Unable to generate centerline for part {cl_index} of level path {level_path}: its end points are in parts of the valley bottom that do not connect.'
+                    log.error(err_msg)
+                    log.debug(err)
+                    _tmterr("CENTERLINE_COST_ERROR", err_msg)
+                    cl_index += 1
+                    continue
+                except Exception as err:
+                    # print(err)
+                    err_msg = f'Unable to generate centerline for part {cl_index} of level path {level_path}: end points must all be within the costs array.'
+                    log.error(err_msg)
+                    log.debug(err)
+                    _tmterr("CENTERLINE_COST_ERROR", err_msg)
+                    cl_index += 1
+                    continue
+
+                log.info('Vectorize centerline from Raster')
+                geom_centerline = raster2line_geom(centerline_raster, 1)
+                geom_centerline = ogr.ForceToLineString(geom_centerline)
+
+                geom_centerline = ogr.ForceToMultiLineString(geom_centerline)
+                # Geometries go back to the caller as WKB so they can cross the process boundary
+                result['centerlines'].append((cl_index, bytes(geom_centerline.ExportToWkb())))
+                cl_index += 1
+
+    # Mask the raster and create the inner versions of itself
+    raster_logic_mask(hand_raster, hand_raster_interior, valley_bottom_raster)
+    raster_logic_mask(transformed_hand, transformed_hand_interior, valley_bottom_raster)
+    raster_logic_mask(evidence_raster, evidence_raster_interior, valley_bottom_raster)
+    raster_logic_mask(transformed_slope, transformed_slope_interior, valley_bottom_raster)
+
+    result['status'] = 'complete'
+    result['valley_bottom_raster'] = valley_bottom_raster
+    result['active_valley_bottom_raster'] = active_valley_bottom_raster
+    for raster_name, raster_path in [('hand_raster', hand_raster),
+                                     ('evidence_raster', evidence_raster),
+                                     ('transformed_hand', transformed_hand),
+                                     ('transformed_slope', transformed_slope),
+                                     ('hand_raster_interior', hand_raster_interior),
+                                     ('evidence_raster_interior', evidence_raster_interior),
+                                     ('transformed_hand_interior', transformed_hand_interior),
+                                     ('transformed_slope_interior', transformed_slope_interior)]:
+        result['rasters'][raster_name] = raster_path if os.path.isfile(raster_path) else None
+
+    return _finish()
+
+
 def get_zone(run, zone_type, drain_area):
     """get the max zone of the drainage area
 
@@ -937,6 +1032,7 @@ def main():
     parser.add_argument('--flowline_type', type=str, default='NHD')
     parser.add_argument('--temp_folder', help='(optional) cache folder for downloading files ', type=str)
     parser.add_argument('--mask', type=str, default=None)
+    parser.add_argument('--workers', help='(optional) number of processes used to run level paths concurrently. Defaults to VBET_WORKERS env var or 1', type=int, default=None)
     parser.add_argument('--meta', help='riverscapes project metadata as comma separated key=value pairs', type=str)
     parser.add_argument('--verbose', help='(optional) a little extra logging ', action='store_true', default=False)
     parser.add_argument('--debug', help='Add debug tools for tracing things like memory usage at a performance cost.', action='store_true', default=False)
@@ -967,7 +1063,7 @@ def main():
                 vbet_centerlines, memfile,
                 args.flowline_network, args.dem, args.slope, args.hillshade, args.catchments, args.channel_area, args.vaa_table, args.output_dir,
                 args.huc, level_paths, args.pitfill, args.dinfflowdir_ang, args.dinfflowdir_slp, args.twi_raster, meta=meta, reach_codes=reach_codes, mask=args.mask,
-                debug=args.debug, temp_folder=temp_folder
+                debug=args.debug, temp_folder=temp_folder, workers=args.workers
             )
             log.debug(f'Return code: {retcode}, [Max process usage] {max_obj}')
             # Zip up a copy of the temp folder for debugging purposes
@@ -976,7 +1072,7 @@ def main():
             vbet_centerlines(
                 args.flowline_network, args.dem, args.slope, args.hillshade, args.catchments, args.channel_area, args.vaa_table, args.output_dir,
                 args.huc, level_paths, args.pitfill, args.dinfflowdir_ang, args.dinfflowdir_slp, args.twi_raster, meta=meta, reach_codes=reach_codes, mask=args.mask,
-                debug=args.debug, temp_folder=args.temp_folder
+                debug=args.debug, temp_folder=args.temp_folder, workers=args.workers
             )
 
         safe_remove_dir(temp_folder)
@@ -6,12 +6,134 @@
 """
 import os
 import sqlite3
+from typing import Callable
 
 import numpy as np
 from scipy import interpolate
 
 from rscommons import Logger
 from rscommons.database import load_lookup_data
+from rscommons.math import compile_equation
+
+# Evidence values used to check compiled transform functions against eval()
+TRANSFORM_PROBE = np.linspace(-10, 500, 1021, dtype=np.float32)
+
+
+class EvidenceTransform():
+    """An evidence transform from the configuration, compiled once so that it can be applied to every block
+
+    Attributes:
+        x (np.ndarray): inflection table input values (empty for functions without inflections)
+        y (np.ndarray): transformed values at x
+    """
+
+    def __init__(self, transform: Callable[[np.ndarray], np.ndarray], x: np.ndarray, y: np.ndarray = None):
+        self.transform = transform
+        self.x = x
+        self.y = y if y is not None else np.asarray(transform(x), dtype=np.float64)
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        return self.transform(values)
+
+
+class TransformFunction():
+    """A transform function of the evidence value 'a' (e.g. '2.71828**(-0.12*a)'), compiled once
+
+    Only the function text is pickled. It is compiled again when a worker process unpickles it.
+
+    Attributes:
+        function (str): transform function from the functions table
+        use_eval (bool): evaluate the compiled code like eval() instead of using compile_equation
+    """
+
+    def __init__(self, function: str, use_eval: bool = False):
+        self.function = function
+        self.use_eval = use_eval
+        self._compile()
+
+    def _compile(self):
+        if self.use_eval:
+            self.code = compile(self.function.strip(), '<transform>', 'eval')
+            self.equation = None
+        else:
+            self.code = None
+            self.equation = compile_equation(self.function)
+
+    def __getstate__(self):
+        return {'function': self.function, 'use_eval': self.use_eval}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compile()
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        if self.use_eval:
+            return eval(self.code, {'__builtins__': None}, {'a': values})
+        return self.equation({'a': values})
+
+
+class LinearInterpolation():
+    """Linear interpolation of an inflection table with 0 outside the table
+
+    The same as interp1d(kind='linear', bounds_error=False, fill_value=0.0) without the overhead.
+    """
+
+    def __init__(self, x: np.ndarray, y: np.ndarray):
+        self.x = x
+        self.y = y
+
+    def __call__(self, values: np.ndarray) -> np.ndarray:
+        return np.interp(values, self.x, self.y, left=0.0, right=0.0)
+
+
+def compile_transform_function(function: str) -> TransformFunction:
+    """Compile a transform function of the evidence value 'a' (e.g. '2.71828**(-0.12*a)') into a numpy callable
+
+    Arithmetic functions are compiled with rscommons.math.compile_equation and checked against
+    eval() over a range of evidence values. Anything else (or a mismatch) falls back to evaluating
+    the code, compiled once, the same way eval() always has.
+
+    Args:
+        function (str): transform function from the functions table
+
+    Returns:
+        TransformFunction: function of the evidence values
+    """
+    log = Logger('VBET Transforms')
+
+    legacy = TransformFunction(function, use_eval=True)
+
+    try:
+        compiled = TransformFunction(function)
+    except (SyntaxError, ValueError) as err:
+        log.debug(f'Transform "{function}" evaluated with eval: {err}')
+        return legacy
+
+    with np.errstate(all='ignore'):
+        expected = np.asarray(legacy(TRANSFORM_PROBE), dtype=np.float64)
+        actual = np.asarray(compiled(TRANSFORM_PROBE), dtype=np.float64)
+    if expected.shape != actual.shape or not np.allclose(actual, expected, rtol=1e-6, atol=1e-9, equal_nan=True):
+        log.warning(f'Compiled transform "{function}" does not match eval. Using eval instead')
+        return legacy
+
+    return compiled
+
+
+def compile_interpolation(x: np.ndarray, y: np.ndarray, kind: str) -> Callable[[np.ndarray], np.ndarray]:
+    """Build the interpolation for an inflection table once. Values outside the table transform to 0
+
+    Args:
+        x (np.ndarray): sorted input values
+        y (np.ndarray): output values
+        kind (str): scipy interp1d kind
+
+    Returns:
+        Callable[[np.ndarray], np.ndarray]: function of the evidence values
+    """
+    if kind == 'linear':
+        return LinearInterpolation(x, y)
+
+    return interpolate.interp1d(x, y, kind=kind, bounds_error=False, fill_value=0.0)
 
 
 def build_vbet_database(database: str):
@@ -75,17 +197,19 @@ def load_configuration(database: str):
             # log.info(f'transform id: {transform_id}, is int: {isinstance(transform_id, int)}')
             transform_type = curs.execute("""SELECT transform_types.name from transforms INNER JOIN transform_types ON transform_types.type_id = transforms.type_id where transforms.transform_id = ?""", [transform_id]).fetchone()[0]
 
+            values = curs.execute("""SELECT input_value, output_value FROM inflections WHERE transform_id = ? ORDER BY input_value """, [transform_id]).fetchall()
+            x_values = np.array([v[0] for v in values], dtype=np.float64)
+
             if transform_type == 'function':
                 func = curs.execute("""SELECT transform_function FROM functions WHERE transform_id = ?""", [transform_id]).fetchone()[0]
-                input_transforms.append(func)
+                input_transforms.append(EvidenceTransform(compile_transform_function(func), x_values))
             else:
-                values = curs.execute("""SELECT input_value, output_value FROM inflections WHERE transform_id = ? ORDER BY input_value """, [transform_id]).fetchall()
-
                 if transform_type == "Polynomial":
                     # add polynomial function
                     transforms_dict[transform_id] = None
 
-                input_transforms.append(interpolate.interp1d(np.array([v[0] for v in values]), np.array([v[1] for v in values]), kind=transform_type, bounds_error=False, fill_value=0.0))
+                y_values = np.array([v[1] for v in values], dtype=np.float64)
+                input_transforms.append(EvidenceTransform(compile_interpolation(x_values, y_values, transform_type), x_values, y_values))
             transforms_dict[input_name] = input_transforms
 
     configuration['Transforms'] = transforms_dict
@@ -14,13 +14,16 @@ from rasterio.windows import Window
 
 import numpy as np
 from scipy.ndimage import label, generate_binary_structure, binary_closing
-from scipy import ndimage
 
 from rscommons import ProgressBar, Logger, VectorBase, Timer, TempRaster
 from rscommons.classes.raster import deleteRaster
+from rscommons.raster_tiles import RasterMemory, apply_tiles, iter_array_tiles, iter_raster_tiles, iter_rows, open_raster_like, process_memory, read_array
 
 Path = str
 
+# Centerline cost of cells outside the valley bottom (rescaled proximity of 0)
+OUTSIDE_VALLEY_COST = 10**10.0 + 1000000000000
+
 
 def get_raster_meta(template_raster: str):
     """Extract the Rasterio meta we need to write a raster from a template raster
@@ -408,16 +411,13 @@ def rasterize_attribute(in_lyr_path: Path, out_raster_path: Path, template_path:
         mask_rasters_nodata(tempfile.filepath, template_path, out_raster_path)
 
 
-def raster2array(rasterfn: Path) -> np.array:
-    """Open raster as np array"""
-    log = Logger('raster2array')
-    raster = gdal.Open(rasterfn)
-    band = raster.GetRasterBand(1)
-    array = band.ReadAsArray()
-    if array.nbytes > 1e+8 * 200:
-        nMBytes = array.nbytes / 1e+8 * 200
-        log.warning(f'Reading large array: {nMBytes:,} Mb')
-    return array
+def raster2array(rasterfn: Path, memory: RasterMemory = None) -> np.array:
+    """Open raster as np array
+
+    The array is read a tile at a time and is memory mapped to a scratch file when it does not fit in the
+    memory budget (see rscommons.raster_tiles)
+    """
+    return read_array(rasterfn, memory)
 
 
 def create_empty_raster(raster_path: Path, template_raster: Path, compress: bool = True):
@@ -452,7 +452,10 @@ def create_empty_raster(raster_path: Path, template_raster: Path, compress: bool
 
 
 def array2raster(newRasterfn: Path, rasterfn: Path, array: np.array, data_type: int = gdal.GDT_Byte, no_data=None):
-    """write array to new raster file"""
+    """write array to new raster file
+
+    The array is written a tile of rows at a time so that memory mapped arrays are never pulled into memory whole
+    """
 
     raster = gdal.Open(rasterfn)
     geotransform = raster.GetGeoTransform()
@@ -467,7 +470,8 @@ def array2raster(newRasterfn: Path, rasterfn: Path, array: np.array, data_type:
     outRaster = driver.Create(newRasterfn, cols, rows, 1, data_type, options=["COMPRESS=DEFLATE"])
     outRaster.SetGeoTransform((originX, pixelWidth, 0, originY, 0, pixelHeight))
     outband = outRaster.GetRasterBand(1)
-    outband.WriteArray(array)
+    for tile in iter_rows(rows, process_memory().tile_rows(array)):
+        outband.WriteArray(np.asarray(array[tile]), 0, tile.start)
     outRasterSRS = osr.SpatialReference()
     outRasterSRS.ImportFromWkt(raster.GetProjectionRef())
     outRaster.SetProjection(outRasterSRS.ExportToWkt())
@@ -671,6 +675,9 @@ def get_endpoints_on_raster(raster: Path, geom_line: ogr.Geometry(), dist):
 def generate_vbet_polygon(vbet_evidence_raster: Path, rasterized_channel: Path, channel_hand: Path, out_valley_bottom: Path, temp_folder: Path, rasterized_flowline: Path = None, thresh_value: float = 0.68):
     """generate the vbet raster for a thresholded value
 
+    Only the region labels need whole-raster arrays (allocated within the memory budget, see
+    rscommons.raster_tiles). Everything else is streamed a tile at a time.
+
     Args:
         vbet_evidence_raster (Path): vbet evidience raster
         rasterized_channel (Path): raster of channel area (for filtering vbet regions)
@@ -697,38 +704,58 @@ def generate_vbet_polygon(vbet_evidence_raster: Path, rasterized_channel: Path,
     gdal.SieveFilter(srcBand=band_valley_bottom, maskBand=None, dstBand=band_valley_bottom, threshold=10, connectedness=8, callback=gdal.TermProgress_nocb)
     band_valley_bottom.SetNoDataValue(0)
     band_valley_bottom.FlushCache()
-    valley_bottom_sieved = band_valley_bottom.ReadAsArray()
+    band_valley_bottom = None
+    ds_valley_bottom = None
+
+    memory = process_memory()
+    valley_bottom_sieved = raster2array(valley_bottom_raw, memory)
 
     log.info('Generate regions')
     # Region Tool to find only connected areas
     struct = generate_binary_structure(2, 2)
-    regions, _num = label(valley_bottom_sieved, structure=struct)
+    regions = memory.allocate(valley_bottom_sieved.shape, np.int32)
+    label(valley_bottom_sieved, structure=struct, output=regions)
     valley_bottom_sieved = None
 
-    chan = raster2array(rasterized_channel)
-    selection = regions * chan
-    chan = None
+    # Regions that touch the channel
+    rows = memory.tile_rows(regions, halo=0)
+    values = set()
+    for tile, chan, _core in iter_raster_tiles(rasterized_channel, rows):
+        values.update(np.unique(regions[tile] * chan).tolist())
+    non_zero_values = [v for v in sorted(values) if v != 0]
 
-    values = np.unique(selection)
-    non_zero_values = [v for v in values if v != 0]
-    valley_bottom_region = np.isin(regions, non_zero_values)
+    valley_bottom_region = memory.allocate(regions.shape, bool)
+    apply_tiles(lambda regions_tile: np.isin(regions_tile, non_zero_values), valley_bottom_region, regions, memory=memory)
     array2raster(os.path.join(temp_folder, f'regions_{thresh_value}.tif'), vbet_evidence_raster, regions, data_type=gdal.GDT_Int32)
-    array2raster(os.path.join(temp_folder, f'valley_bottom_region_{thresh_value}.tif'), vbet_evidence_raster, valley_bottom_region.astype(int), data_type=gdal.GDT_Int32)
+    array2raster(os.path.join(temp_folder, f'valley_bottom_region_{thresh_value}.tif'), vbet_evidence_raster, valley_bottom_region, data_type=gdal.GDT_Int32)
 
     # Clean Raster Edges
     log.info('Cleaning Raster edges')
-    valley_bottom_clean = binary_closing(valley_bottom_region.astype(int), iterations=2)
-    donuts = np.invert(valley_bottom_clean)
-    donut_regions, num_donuts = label(donuts, struct)
-    sizes = ndimage.sum(donuts, donut_regions, range(num_donuts + 1))
+    # Two iterations of dilation then erosion reach 4 cells so a halo of 4 rows gives the whole raster result
+    donuts = memory.allocate(regions.shape, bool)
+    apply_tiles(lambda region_tile: np.invert(binary_closing(region_tile.astype(int), iterations=2)), donuts, valley_bottom_region, halo=4, memory=memory)
+    valley_bottom_region = None
+
+    donut_regions = regions
+    num_donuts = label(donuts, struct, output=donut_regions)
+    # Cells in each donut (label 0 is everything that isn't a donut so it sums to 0)
+    sizes = np.zeros(num_donuts + 1)
+    for _tile, (donut_tile,), _core in iter_array_tiles(donut_regions, memory=memory):
+        sizes += np.bincount(donut_tile.ravel(), minlength=num_donuts + 1)
+    sizes[0] = 0
     donut_mask = sizes < 350
-    final_valley_array = donut_mask[donut_regions]
-
-    if rasterized_flowline:
-        network_array = raster2array(rasterized_flowline)
-        final_valley_array = np.maximum(final_valley_array, network_array)
-
-    array2raster(out_valley_bottom, vbet_evidence_raster, final_valley_array, data_type=gdal.GDT_Int32)
+    donuts = None
+
+    with open_raster_like(out_valley_bottom, vbet_evidence_raster, np.int32) as dst:
+        network = rasterio.open(rasterized_flowline) if rasterized_flowline else None
+        for tile in iter_rows(dst.height, rows):
+            window = Window(0, tile.start, dst.width, tile.stop - tile.start)
+            final_valley_array = donut_mask[donut_regions[tile]]
+            if network is not None:
+                final_valley_array = np.maximum(final_valley_array, network.read(1, window=window))
+            dst.write(final_valley_array.astype(np.int32), 1, window=window)
+        if network is not None:
+            network.close()
 
     log.debug(f'Timer: {_timer.toString()}')
 
@@ -743,32 +770,48 @@ def generate_centerline_surface(vbet_raster: Path, out_cost_path: Path, temp_fol
     """
 
     log = Logger('Generate Centerline Surface')
-    vbet = raster2array(vbet_raster)
     _timer = Timer()
+    memory = process_memory()
+    with rasterio.open(vbet_raster) as src:
+        rows = memory.tile_rows((src.width, np.float64), (src.width, np.float64))
 
     # Generate Inverse Raster for Proximity
-    valley_bottom_inverse = (vbet != 1)
     inverse_mask_raster = os.path.join(temp_folder, 'inverse_mask.tif')
-    array2raster(inverse_mask_raster, vbet_raster, valley_bottom_inverse)
+    with open_raster_like(inverse_mask_raster, vbet_raster, np.uint8) as dst:
+        for tile, vbet, _core in iter_raster_tiles(vbet_raster, rows):
+            dst.write((vbet != 1).astype(np.uint8), 1, window=Window(0, tile.start, dst.width, tile.stop - tile.start))
 
     # Proximity Raster
     ds_valley_bottom_inverse = gdal.Open(inverse_mask_raster)
     band_valley_bottom_inverse = ds_valley_bottom_inverse.GetRasterBand(1)
     proximity_raster = os.path.join(temp_folder, 'proximity.tif')
-    _ds_proximity, band_proximity = new_raster(proximity_raster, vbet_raster, data_type=gdal.GDT_Int32)
+    ds_proximity, band_proximity = new_raster(proximity_raster, vbet_raster, data_type=gdal.GDT_Int32)
     gdal.ComputeProximity(band_valley_bottom_inverse, band_proximity, ['VALUES=1', "DISTUNITS=PIXEL", "COMPRESS=DEFLATE"])
     band_proximity.SetNoDataValue(0)
     band_proximity.FlushCache()
-    proximity = band_proximity.ReadAsArray()
+    # Close the rasters so the proximity values can be streamed back from disk
+    del band_proximity, ds_proximity, band_valley_bottom_inverse, ds_valley_bottom_inverse
 
     # Rescale Raster
-    rescaled = np.interp(proximity, (proximity.min(), proximity.max()), (0.0, 10.0))
-    rescaled_raster = os.path.join(temp_folder, 'rescaled.tif')
-    array2raster(rescaled_raster, vbet_raster, rescaled, data_type=gdal.GDT_Float32)
+    prox_min = None
+    prox_max = None
+    for _tile, proximity, _core in iter_raster_tiles(proximity_raster, rows):
+        prox_min = proximity.min() if prox_min is None else min(prox_min, proximity.min())
+        prox_max = proximity.max() if prox_max is None else max(prox_max, proximity.max())
 
     # Centerline Cost Path
-    cost_path = 10**((rescaled * -1) + 10) + (rescaled <= 0) * 1000000000000  # 10** (((A) * -1) + 10) + (A <= 0) * 1000000000000
-    array2raster(out_cost_path, vbet_raster, cost_path, data_type=gdal.GDT_Float32)
+    rescaled_raster = os.path.join(temp_folder, 'rescaled.tif')
+    with open_raster_like(rescaled_raster, vbet_raster, np.float32) as dst_rescaled, \
+            open_raster_like(out_cost_path, vbet_raster, np.float32) as dst_cost:
+        for tile, proximity, _core in iter_raster_tiles(proximity_raster, rows):
+            window = Window(0, tile.start, dst_rescaled.width, tile.stop - tile.start)
+            rescaled = np.interp(proximity, (prox_min, prox_max), (0.0, 10.0))
+            dst_rescaled.write(rescaled.astype(np.float32), 1, window=window)
+            # 10** (((A) * -1) + 10) + (A <= 0) * 1000000000000, only raising to a power inside the valley bottom
+            inside = rescaled > 0
+            cost_path = np.full(rescaled.shape, OUTSIDE_VALLEY_COST)
+            cost_path[inside] = 10**((rescaled[inside] * -1) + 10)
+            dst_cost.write(cost_path.astype(np.float32), 1, window=window)
 
     log.debug(f'Timer: {_timer.toString()}')
 
@@ -809,7 +852,37 @@ def threshold(evidence_raster_path: Path, thr_val: float, thresh_raster_path: Pa
     log.debug(f'Timer: {_timer.toString()}')
 
 
-def clean_raster_regions(raster: Path, target_value: int, out_raster: Path, out_regions: Path = None):
+def raster_window(raster: Path, window_raster: Path) -> Window:
+    """Window of raster covered by the extent of window_raster, expanded out to whole blocks of raster
+
+    The rasters must be orthogonal (same cell size and aligned). Offsets are rounded the same way
+    as raster_update_multiply.
+
+    Args:
+        raster (Path): raster to get the window on (e.g. a HUC extent zone raster)
+        window_raster (Path): raster whose extent defines the window (e.g. a level path raster)
+
+    Returns:
+        Window: block aligned window, or None when the rasters do not overlap
+    """
+    with rasterio.open(raster) as rio_dest, rasterio.open(window_raster) as rio_window:
+        in_transform = rio_window.get_transform()
+        out_transform = rio_dest.get_transform()
+        col_off = round((in_transform[0] - out_transform[0]) / out_transform[1])
+        row_off = round((in_transform[3] - out_transform[3]) / out_transform[5])
+
+        block_height, block_width = rio_dest.block_shapes[0]
+        col_start = max(0, col_off) // block_width * block_width
+        row_start = max(0, row_off) // block_height * block_height
+        col_end = min(rio_dest.width, -(-(col_off + rio_window.width) // block_width) * block_width)
+        row_end = min(rio_dest.height, -(-(row_off + rio_window.height) // block_height) * block_height)
+
+    if col_end <= col_start or row_end <= row_start:
+        return None
+    return Window(col_start, row_start, col_end - col_start, row_end - row_start)
+
+
+def clean_raster_regions(raster: Path, target_value: int, out_raster: Path, out_regions: Path = None, window: Window = None):
     """keep only the largest region of a raster by area
 
     Args:
@@ -817,9 +890,16 @@ def clean_raster_regions(raster: Path, target_value: int, out_raster: Path, out_
         target_value (int): value to keep
         out_raster (Path): output raster path 
         out_regions (Path, optional): path of output regions raster. Defaults to None.
+        window (Window, optional): only clean this window of the raster, updating out_raster in place (it is
+            copied from raster first if they differ). Every target_value cell must be inside it (see raster_window).
+            The regions raster covers just the window. Defaults to None.
     """
     log = Logger('Clean Raster Regions')
 
+    if window is not None:
+        clean_raster_regions_window(raster, target_value, out_raster, window, out_regions)
+        return
+
     array = raster2array(raster)
     if not np.any(array == target_value):
         log.info(f'Raster {raster} does not contain target value of {target_value}. No raster cleaning required.')
@@ -848,3 +928,53 @@ def clean_raster_regions(raster: Path, target_value: int, out_raster: Path, out_
     array2raster(out_raster, raster, out_array, data_type=gdal.GDT_Int32, no_data=-9999)
     if out_regions:
         array2raster(out_regions, raster, regions, data_type=gdal.GDT_Int32)
+
+
+def clean_raster_regions_window(raster: Path, target_value: int, out_raster: Path, window: Window, out_regions: Path = None):
+    """clean_raster_regions restricted to one window, written back in place to just the blocks it covers
+
+    The result is identical to cleaning the whole raster as long as every target_value cell is inside
+    the window, which holds for a level path key written by raster_update_multiply into raster_window.
+
+    Args:
+        raster (Path): path of raster to clean
+        target_value (int): value to keep
+        out_raster (Path): output raster path. Updated in place
+        window (Window): window of the raster containing all the target_value cells
+        out_regions (Path, optional): path of output regions raster for the window. Defaults to None.
+    """
+    log = Logger('Clean Raster Regions')
+
+    with rasterio.open(raster) as rio_src:
+        array = rio_src.read(1, window=window)
+    if not np.any(array == target_value):
+        log.info(f'Raster {raster} does not contain target value of {target_value}. No raster cleaning required.')
+        return
+
+    if os.path.abspath(out_raster) != os.path.abspath(raster):
+        shutil.copy(raster, out_raster)
+
+    log.info('Generate regions')
+    # Region Tool to find only connected areas
+    struct = generate_binary_structure(2, 2)
+    regions, _num_labels = label(array == target_value, structure=struct)
+
+    size = np.bincount(regions.ravel())
+    biggest_label = size[1:].argmax() + 1
+    regions = (regions == biggest_label).astype(np.int32)
+
+    array[array == target_value] = -9999
+    out_array = np.choose(regions, [array, target_value]).astype(np.int32)
+
+    with rasterio.open(out_raster, 'r+') as rio_dest:
+        # Match the nodata value that writing out the whole raster would have set
+        if rio_dest.nodata != -9999:
+            rio_dest.nodata = -9999
+        rio_dest.write(out_array, window=window, indexes=1)
+
+        if out_regions:
+            out_meta = rio_dest.meta
+            out_meta.update({'driver': 'GTiff', 'dtype': 'int32', 'nodata': None, 'compress': 'deflate',
+                             'width': window.width, 'height': window.height, 'transform': rio_dest.window_transform(window)})
+            with rasterio.open(out_regions, 'w', **out_meta) as rio_regions:
+                rio_regions.write(regions, 1)
@@ -9,15 +9,17 @@ import os
 import sys
 import argparse
 
+import numpy as np
 from osgeo import ogr, osr
 from shapely.ops import linemerge, voronoi_diagram
-from shapely.geometry import MultiLineString, MultiPoint
+from shapely.geometry import MultiLineString, MultiPoint, box
 from shapely.topology import TopologicalError
 
-from rscommons import GeopackageLayer, Logger, VectorBase, dotenv
+from rscommons import GeopackageLayer, Logger, ProgressBar, VectorBase, dotenv
 from rscommons.util import parse_metadata
 from rscommons.classes.vector_base import get_utm_zone_epsg
 from rscommons.geometry_ops import get_rectangle_as_geom
+from rscommons.spatial_index import IndexedSTRtree
 
 Path = str
 
@@ -50,7 +52,7 @@ def generate_igo_points(line_network: Path, out_points_layer: Path, stream_size_
         utm_epsg = get_utm_zone_epsg(extent_centroid.GetX())
         transform_ref, transform = VectorBase.get_transform_from_epsg(line_lyr.spatial_ref, utm_epsg)
         # In order to get accurate lengths we are going to need to project into some coordinate system
-        transform_back = osr.CoordinateTransformation(transform_ref, line_lyr.spatial_ref)
+        transform_back = VectorBase.get_transform(transform_ref, line_lyr.spatial_ref)
 
         for feat, *_ in line_lyr.iterate_features(write_layers=[out_lyr]):
             level_path = feat.GetField('LevelPathI')
@@ -161,9 +163,69 @@ def split_vbet_polygons(vbet_polygons: Path, segmentation_points: Path, out_spli
     log.info('VBET polygon successfully segmented')
 
 
+class IndexedLayer():
+    """Features of a layer held in memory with a spatial index over their envelopes. Projected copies of the
+    geometries are made once per UTM zone and reused by every DGO in that zone.
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path (Path): path to the layer
+        """
+        self.geoms = []
+        envelopes = []
+        with GeopackageLayer(path) as lyr:
+            for feat, *_ in lyr.iterate_features():
+                geom = feat.GetGeometryRef()
+                if geom is None:
+                    continue
+                geom = geom.Clone()
+                minx, maxx, miny, maxy = geom.GetEnvelope()
+                self.geoms.append(geom)
+                envelopes.append(box(minx, miny, maxx, maxy))
+
+        self.index = IndexedSTRtree(envelopes)
+        self._projected = {}
+
+    def intersecting(self, geom: ogr.Geometry) -> list:
+        """Indexes (in layer order) of the features that intersect a geometry in the layer's own coordinates
+
+        Args:
+            geom (ogr.Geometry): geometry to test against
+
+        Returns:
+            list: feature indexes
+        """
+        minx, maxx, miny, maxy = geom.GetEnvelope()
+        return [idx for idx in self.index.query(box(minx, miny, maxx, maxy)) if self.geoms[idx].Intersects(geom)]
+
+    def projected(self, idx: int, epsg: int, transform: osr.CoordinateTransformation, make_valid: bool = False) -> ogr.Geometry:
+        """Feature geometry transformed to a UTM zone, transformed once per zone
+
+        Args:
+            idx (int): feature index
+            epsg (int): epsg of the UTM zone
+            transform (osr.CoordinateTransformation): transform to the UTM zone
+            make_valid (bool, optional): run MakeValid on the transformed geometry. Defaults to False.
+
+        Returns:
+            ogr.Geometry: projected geometry
+        """
+        key = (idx, epsg)
+        if key not in self._projected:
+            geom = self.geoms[idx].Clone()
+            geom.Transform(transform)
+            self._projected[key] = geom.MakeValid() if make_valid else geom
+        return self._projected[key]
+
+
 def calculate_dgo_metrics(vbet_dgos: Path, vbet_centerline: Path, dict_layers: dict, attrib_filter: str = None):
     """calculate the basic metrics on the dgos, later used with moving window for igos
 
+    The centerlines and metric layers are read once into memory and every DGO is measured against
+    the features found with a spatial index. Results are written back in a single transaction.
+
     Args:
         vbet_dgo (Path): vbet dgo layer
         vbet_centerline (Path): centerline layer
@@ -173,8 +235,11 @@ def calculate_dgo_metrics(vbet_dgos: Path, vbet_centerline: Path, dict_layers: d
 
     log = Logger('Segmentation Metrics')
 
-    with GeopackageLayer(vbet_dgos, write=True) as lyr_dgos, \
-            GeopackageLayer(vbet_centerline) as centerline_lyr:
+    log.info('Loading centerlines and metric layers')
+    centerlines = IndexedLayer(vbet_centerline)
+    metric_layers = {metric_layer_name: IndexedLayer(metric_layer_path) for metric_layer_name, metric_layer_path in dict_layers.items()}
+
+    with GeopackageLayer(vbet_dgos, write=True) as lyr_dgos:
 
         # Check fields and create if they don't exist
         exist_fields = lyr_dgos.get_fields()
@@ -186,29 +251,40 @@ def calculate_dgo_metrics(vbet_dgos: Path, vbet_centerline: Path, dict_layers: d
         if len(fields) > 0:
             lyr_dgos.create_fields(fields)
 
-        for feat_dgo, *_ in lyr_dgos.iterate_features('Calculating dgo metrics', attribute_filter=attrib_filter, write_layers=[lyr_dgos]):
-            dgo_geom_unproj = feat_dgo.GetGeometryRef()
+        dgos = []
+        for feat_dgo, *_ in lyr_dgos.iterate_features('Loading dgos', attribute_filter=attrib_filter):
+            dgo_geom = feat_dgo.GetGeometryRef()
+            if dgo_geom is not None:
+                dgos.append((feat_dgo.GetFID(), dgo_geom.Clone()))
+
+        # One transform per UTM zone rather than one per DGO
+        transforms = {}
+        results = {}
+        progbar = ProgressBar(len(dgos), 50, 'Calculating dgo metrics')
+        for counter, (dgo_fid, dgo_geom_unproj) in enumerate(dgos):
+            progbar.update(counter)
             centroid = dgo_geom_unproj.Centroid()
             utm_epsg = get_utm_zone_epsg(centroid.GetX())
-            _transform_ref, transform = VectorBase.get_transform_from_epsg(lyr_dgos.spatial_ref, utm_epsg)
+            if utm_epsg not in transforms:
+                _transform_ref, transforms[utm_epsg] = VectorBase.get_transform_from_epsg(lyr_dgos.spatial_ref, utm_epsg)
+            transform = transforms[utm_epsg]
+
             vbet_geom_transform = dgo_geom_unproj.Clone()
             vbet_geom_transform.Transform(transform)
             vbet_geom_transform_clean = vbet_geom_transform.MakeValid()
             if not vbet_geom_transform_clean.IsValid():
-                log.warning(f'Unable to generate metrics for vbet segment {feat_dgo.GetFID()}: Invalid VBET Segment Geometry')
+                log.warning(f'Unable to generate metrics for vbet segment {dgo_fid}: Invalid VBET Segment Geometry')
                 continue
             vbet_area = vbet_geom_transform_clean.GetArea()
             if vbet_area == 0.0:
-                log.warning(f'Unable to generate metrics for vbet segment {feat_dgo.GetFID()}: VBET Segment has no area')
+                log.warning(f'Unable to generate metrics for vbet segment {dgo_fid}: VBET Segment has no area')
                 continue
 
             length = 0.0
-            for feat_cl, *_ in centerline_lyr.iterate_features(clip_shape=dgo_geom_unproj):
-                geom_cl = feat_cl.GetGeometryRef()
-                # _transform_ref, transform = VectorBase.get_transform_from_epsg(centerline_lyr.spatial_ref, utm_epsg)
-                geom_cl.Transform(transform)
+            for idx in centerlines.intersecting(dgo_geom_unproj):
+                geom_cl = centerlines.projected(idx, utm_epsg, transform)
                 if not geom_cl.IsValid():
-                    log.warning(f'Invalid centerline geometry found for vbet segment {feat_dgo.GetFID()}')
+                    log.warning(f'Invalid centerline geometry found for vbet segment {dgo_fid}')
                 try:
                     intersect_geom = vbet_geom_transform_clean.Intersection(geom_cl)
                 except IOError:
@@ -216,35 +292,39 @@ def calculate_dgo_metrics(vbet_dgos: Path, vbet_centerline: Path, dict_layers: d
                     break
                 length += intersect_geom.Length()
 
-            feat_dgo.SetField('centerline_length', length)
-            feat_dgo.SetField('segment_area', vbet_area)
-
-            for metric_layer_name, metric_layer_path in dict_layers.items():
-                with GeopackageLayer(metric_layer_path) as metric_lyr:
-                    metric_area = 0.0
-                    for metric_feat, *_ in metric_lyr.iterate_features(clip_shape=dgo_geom_unproj):
-                        in_metric_geom = metric_feat.GetGeometryRef()
-                        in_metric_geom.Transform(transform)
-                        metric_geom = in_metric_geom.MakeValid()
-                        if not metric_geom.IsValid():
-                            log.warning(f'Unable to generate metric for {metric_layer_name} for vbet segment {feat_dgo.GetFID()}. Invalid metric Geometry')
-                            continue
-                        try:
-                            delta_geom = vbet_geom_transform_clean.Intersection(metric_geom)
-                        except IOError:
-                            log.error(str(IOError))
-                            delta_geom = None
-                            continue
-                        delta_geom.MakeValid()
-                        if not delta_geom.IsValid() or delta_geom.GetGeometryType() not in VectorBase.POLY_TYPES + VectorBase.COLLECTION_TYPES:
-                            continue
-                        metric_area = metric_area + delta_geom.GetArea()
-                    metric_prop = metric_area / vbet_area
-                    feat_dgo.SetField(f'{metric_layer_name}_area', metric_area)
-                    feat_dgo.SetField(f'{metric_layer_name}_prop', metric_prop)
+            values = {'centerline_length': length, 'segment_area': vbet_area}
+
+            for metric_layer_name, metric_layer in metric_layers.items():
+                metric_area = 0.0
+                for idx in metric_layer.intersecting(dgo_geom_unproj):
+                    metric_geom = metric_layer.projected(idx, utm_epsg, transform, make_valid=True)
+                    if not metric_geom.IsValid():
+                        log.warning(f'Unable to generate metric for {metric_layer_name} for vbet segment {dgo_fid}. Invalid metric Geometry')
+                        continue
+                    try:
+                        delta_geom = vbet_geom_transform_clean.Intersection(metric_geom)
+                    except IOError:
+                        log.error(str(IOError))
+                        delta_geom = None
+                        continue
+                    delta_geom.MakeValid()
+                    if not delta_geom.IsValid() or delta_geom.GetGeometryType() not in VectorBase.POLY_TYPES + VectorBase.COLLECTION_TYPES:
+                        continue
+                    metric_area = metric_area + delta_geom.GetArea()
+                values[f'{metric_layer_name}_area'] = metric_area
+                values[f'{metric_layer_name}_prop'] = metric_area / vbet_area
+            results[dgo_fid] = values
+        progbar.finish()
+
+        log.info(f'Writing metrics for {len(results)} dgos')
+        lyr_dgos.ogr_layer.StartTransaction()
+        for dgo_fid, values in results.items():
+            feat_dgo = lyr_dgos.ogr_layer.GetFeature(dgo_fid)
+            for field_name, value in values.items():
+                feat_dgo.SetField(field_name, value)
             lyr_dgos.ogr_layer.SetFeature(feat_dgo)
             feat_dgo = None
-            dgo_geom_unproj = None
+        lyr_dgos.ogr_layer.CommitTransaction()
 
 
 def clean_linestring(in_geom: ogr.Geometry) -> MultiLineString:
@@ -281,6 +361,8 @@ def calculate_vbet_window_metrics(vbet_igos: Path, vbet_dgos: Path, level_paths:
         metric_names (list): list of metric names to generate summary attributes on
     """
 
+    log = Logger('Segmentation Window Metrics')
+
     with GeopackageLayer(vbet_igos, write=True) as lyr_igos, \
             GeopackageLayer(vbet_dgos) as lyr_dgos:
 
@@ -303,37 +385,67 @@ def calculate_vbet_window_metrics(vbet_igos: Path, vbet_dgos: Path, level_paths:
 
         lyr_igos.create_fields(metric_fields)
 
+        # Read the dgo measurements once, sorted by level path and segment distance
+        dgo_fields = ['centerline_length', 'segment_area'] + [f'{metric}_area' for metric in metric_names]
+        dgo_level_paths = []
+        dgo_distances = []
+        dgo_values = []
+        for feat_dgo, *_ in lyr_dgos.iterate_features('Loading dgo metrics'):
+            level_path = feat_dgo.GetField('LevelPathI')
+            distance = feat_dgo.GetField('seg_distance')
+            if level_path is None or distance is None:
+                continue
+            dgo_level_paths.append(level_path)
+            dgo_distances.append(distance)
+            dgo_values.append([feat_dgo.GetField(field) for field in dgo_fields])
+
+        dgo_level_paths = np.array(dgo_level_paths, dtype=np.float64)
+        dgo_distances = np.array(dgo_distances, dtype=np.float64)
+        dgo_values = np.array([[value if value is not None else 0.0 for value in values] for values in dgo_values], dtype=np.float64).reshape(-1, len(dgo_fields))
+        order = np.lexsort((dgo_distances, dgo_level_paths))
+        dgo_level_paths = dgo_level_paths[order]
+        dgo_distances = dgo_distances[order]
+        dgo_values = dgo_values[order]
+
+        igos = {}
+        for feat_igo, *_ in lyr_igos.iterate_features('Loading igos'):
+            level_path = feat_igo.GetField('LevelPathI')
+            igo_distance = feat_igo.GetField('seg_distance')
+            if level_path is None or igo_distance is None:
+                continue
+            igos.setdefault(float(level_path), []).append((feat_igo.GetFID(), igo_distance))
+
+        window_addon = {200: 100, 400: 200, 1200: 300, 2000: 500, 8000: 2000}
+        results = {}
         for level_path in level_paths:
             if level_path is None or level_path not in distance_lookup.keys():
                 continue
             window_distance = distance_lookup[level_path]
-            window_addon = {200: 100, 400: 200, 1200: 300, 2000: 500, 8000: 2000}
-            for feat_igo, *_ in lyr_igos.iterate_features(f'Summerizing vbet metrics for {level_path}', attribute_filter=f"LevelPathI = {level_path}"):
-                # Construct the igo window selection logic
-                igo_distance = feat_igo.GetField('seg_distance')
-                min_dist = igo_distance - 0.5 * window_distance
-                max_dist = igo_distance + 0.5 * window_distance
-                sql_igo_window = f"LevelPathI = {level_path} AND seg_distance >= {min_dist} AND seg_distance <= {max_dist}"
-
-                # Gather Window Measurements from the dgos
-                window_measurements = dict.fromkeys(metric_names, 0.0)
-                window_cl_length_m = 0.0
-                window_area_m2 = 0.0
-                for feat_dgo, *_ in lyr_dgos.iterate_features(attribute_filter=sql_igo_window):
-                    window_cl_length_m += feat_dgo.GetField('centerline_length')
-                    window_area_m2 += feat_dgo.GetField('segment_area')
-                    for metric in metric_names:
-                        metric_area = feat_dgo.GetField(f'{metric}_area')
-                        metric_area = metric_area if metric_area is not None else 0.0
-                        window_measurements[metric] += metric_area
+            level_path_igos = igos.get(float(level_path), [])
+            if len(level_path_igos) == 0:
+                continue
+
+            # Running totals along the level path turn every window into a difference of two sums
+            start, end = np.searchsorted(dgo_level_paths, float(level_path), 'left'), np.searchsorted(dgo_level_paths, float(level_path), 'right')
+            totals = np.concatenate([np.zeros((1, len(dgo_fields))), np.cumsum(dgo_values[start:end], axis=0)])
+            igo_distances = np.array([igo[1] for igo in level_path_igos], dtype=np.float64)
+            min_pos = np.searchsorted(dgo_distances[start:end], igo_distances - 0.5 * window_distance, 'left')
+            max_pos = np.searchsorted(dgo_distances[start:end], igo_distances + 0.5 * window_distance, 'right')
+            window_sums = totals[np.maximum(min_pos, max_pos)] - totals[min_pos]
+
+            for (igo_fid, _igo_distance), sums in zip(level_path_igos, window_sums.tolist()):
+                window_cl_length_m = sums[0]
+                window_area_m2 = sums[1]
+                window_measurements = dict(zip(metric_names, sums[2:]))
+                values = {}
 
                 # Calculate the floodplain metrics
                 for metric, area in window_measurements.items():
                     area_per_length = area / window_cl_length_m if window_cl_length_m != 0.0 else 0.0
                     area_porportion = area / window_area_m2 if window_area_m2 != 0.0 else 0.0
-                    feat_igo.SetField(f'{metric}_area', area)
-                    feat_igo.SetField(f'{metric}_proportion', area_porportion)
-                    feat_igo.SetField(f'{metric}_itgr_width', area_per_length)
+                    values[f'{metric}_area'] = area
+                    values[f'{metric}_proportion'] = area_porportion
+                    values[f'{metric}_itgr_width'] = area_per_length
 
                 # Measurement Conversions
                 window_cl_length_mi = window_cl_length_m / 1609.344
@@ -354,20 +466,28 @@ def calculate_vbet_window_metrics(vbet_igos: Path, vbet_dgos: Path, level_paths:
                 inactive_hectares_per_km = inactive_hectares / window_cl_length_km if window_cl_length_m != 0.0 else 0.0
                 integrated_width = window_area_m2 / window_cl_length_m if window_cl_length_m != 0.0 else 0.0
 
-                # Write to fields
-                feat_igo.SetField('integrated_width', integrated_width)
-                feat_igo.SetField('window_size', window_distance + window_addon[int(window_distance)])
-                feat_igo.SetField('window_area', window_area_m2)
-                feat_igo.SetField('centerline_length', window_cl_length_m)
-                feat_igo.SetField('vb_acreage_per_mile', vb_acreage_per_mile)
-                feat_igo.SetField('vb_hectares_per_km', vb_hectares_per_km)
-                feat_igo.SetField('active_acreage_per_mile', active_acreage_per_mile)
-                feat_igo.SetField('active_hectares_per_km', active_hectares_per_km)
-                feat_igo.SetField('inactive_acreage_per_mile', inactive_acreage_per_mile)
-                feat_igo.SetField('inactive_hectares_per_km', inactive_hectares_per_km)
-
-                lyr_igos.ogr_layer.SetFeature(feat_igo)
-                feat_igo = None
+                values['integrated_width'] = integrated_width
+                values['window_size'] = window_distance + window_addon[int(window_distance)]
+                values['window_area'] = window_area_m2
+                values['centerline_length'] = window_cl_length_m
+                values['vb_acreage_per_mile'] = vb_acreage_per_mile
+                values['vb_hectares_per_km'] = vb_hectares_per_km
+                values['active_acreage_per_mile'] = active_acreage_per_mile
+                values['active_hectares_per_km'] = active_hectares_per_km
+                values['inactive_acreage_per_mile'] = inactive_acreage_per_mile
+                values['inactive_hectares_per_km'] = inactive_hectares_per_km
+                results[igo_fid] = values
+
+        # Write to fields
+        log.info(f'Writing window metrics for {len(results)} igos')
+        lyr_igos.ogr_layer.StartTransaction()
+        for igo_fid, values in results.items():
+            feat_igo = lyr_igos.ogr_layer.GetFeature(igo_fid)
+            for field_name, value in values.items():
+                feat_igo.SetField(field_name, value)
+            lyr_igos.ogr_layer.SetFeature(feat_igo)
+            feat_igo = None
+        lyr_igos.ogr_layer.CommitTransaction()
 
 
 def vbet_segmentation(in_centerlines: str, vbet_polygons: str, metric_layers: dict, out_gpkg: str, ss_lookup: dict):